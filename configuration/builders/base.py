@@ -1,25 +1,26 @@
 import os
-from functools import partial
-from typing import Callable, Iterable
+from typing import Callable, Iterable, Optional
 
 from buildbot.plugins import util
 from buildbot.process.builder import Builder
 from buildbot.process.buildrequest import BuildRequest
 from buildbot.process.factory import BuildFactory
 from buildbot.process.workerforbuilder import AbstractWorkerForBuilder
-from configuration.builders.callables import canStartBuild, nextBuild
-from configuration.builders.infra.runtime import BuildSequence, Sidecar
-from configuration.steps.processors import (
-    processor_docker_cleanup,
-    processor_docker_commit,
-    processor_docker_fetch,
-    processor_docker_tag,
-    processor_docker_workdirs,
-    processor_set_docker_runtime_environment,
-    processor_sidecar,
-    processor_worker_cleanup,
+from configuration.builders.callables import canStartBuild, nextBuildShortestJob
+from configuration.builders.infra.runtime import (
+    BuildSequence,
+    BuildTree,
+    InContainer,
+    ParallelGroup,
+    Sidecar,
 )
+from configuration.steps.processors import process_steps
 from configuration.workers.base import WorkerBase
+from configuration.workers.memory import (
+    DEFAULT_MEMORY_BASELINE,
+    memory_claim,
+    parse_memory,
+)
 
 
 class BaseBuilder:
@@ -35,10 +36,15 @@ class BaseBuilder:
             with the builder.
 
     Methods:
-        __init__(name: str, sidecar: Sidecar):
+        __init__(name: str, sidecar: Sidecar, persistent_container: bool = False,
+                 build_tree: Optional[BuildTree] = None):
             Initializes the BaseBuilder instance with a name, a sidecar, and an empty list of
             build sequences.
             A sidecar is an optional background companion containerized service that can run alongside the main build.
+            With persistent_container, the InContainer steps run through docker exec in one
+            long-lived container instead of a docker run (and commit) each.
+            With a build_tree, the builds of its branches build incrementally over the
+            tree the previous build of the branch left on the worker host.
 
         add_sequence(sequence: BuildSequence):
             Adds a build sequence to the builder.
@@ -53,10 +59,18 @@ class BaseBuilder:
             worker names, tags, build properties, and factory steps.
     """
 
-    def __init__(self, name: str, sidecar: Sidecar):
+    def __init__(
+        self,
+        name: str,
+        sidecar: Sidecar,
+        persistent_container: bool = False,
+        build_tree: Optional[BuildTree] = None,
+    ):
         self.name = name
         self.build_sequences: list[BuildSequence] = []
         self.sidecar = sidecar
+        self.persistent_container = persistent_container
+        self.build_tree = build_tree
 
     def add_sequence(self, sequence: BuildSequence):
         self.build_sequences.append(sequence)
@@ -64,61 +78,55 @@ class BaseBuilder:
     def get_factory(self) -> BuildFactory:
         factory = BuildFactory()
 
-        prepare_steps = []
         active_steps = []
-        cleanup_steps = []
-
-        POST_PROCESSING_FUNCTIONS = [
-            processor_worker_cleanup,
-            partial(processor_docker_cleanup, sidecar=self.sidecar),
-            processor_docker_fetch,
-            processor_docker_workdirs,
-            processor_docker_tag,
-            processor_docker_commit,
-        ]
 
         # Get steps from all sequences
         for seq in self.build_sequences:
             active_steps.extend(seq.get_steps())
 
-        # Step Pre-Processing
-        active_steps = processor_set_docker_runtime_environment(
+        # Step Pre and Post-Processing
+        prepare_steps, active_steps, cleanup_steps = process_steps(
             builder_name=self.name,
             environment=os.environ["ENVIRON"],
             active_steps=active_steps,
+            sidecar=self.sidecar,
+            persistent_container=self.persistent_container,
+            build_tree=self.build_tree,
         )
 
-        # Step Post-Processing
-        for func in POST_PROCESSING_FUNCTIONS:
-            prepare_steps, active_steps, cleanup_steps = func(
-                prepare_steps,
-                active_steps,
-                cleanup_steps,
-            )
-
-        if self.sidecar:
-            prepare_steps, active_steps = processor_sidecar(
-                builder_name=self.name,
-                environment=os.environ["ENVIRON"],
-                sidecar=self.sidecar,
-                prepare_steps=prepare_steps,
-                active_steps=active_steps,
-            )
-
-        # // end of Post-Processing
-
         # Generating factory steps
         steps = prepare_steps + active_steps + cleanup_steps
         factory.addSteps(step.generate() for step in steps)
 
         return factory
 
+    def memory_claim(self, baseline: str = DEFAULT_MEMORY_BASELINE) -> int:
+        """
+        Returns the memory (MiB) a build of this builder claims on its worker.
+        """
+        return memory_claim(self._shm_sizes(), baseline)
+
+    def _shm_sizes(self) -> Iterable[Optional[str]]:
+        for seq in self.build_sequences:
+            for step in seq.get_steps():
+                if isinstance(step, InContainer):
+                    yield step.docker_environment.shm_size
+                elif isinstance(step, ParallelGroup):
+                    shm_size = step.docker_environment.shm_size
+                    # The branches run in containers of their own, at the same time
+                    if shm_size and not self.persistent_container:
+                        yield parse_memory(shm_size) * len(step.branches)
+                    else:
+                        yield shm_size
+
     def get_config(
         self,
         workers: Iterable[WorkerBase],
         jobs: int,
         tags: list[str] = [],
         properties: dict[str, str] = None,
+        next_build: Callable = nextBuildShortestJob,
+        memory_baseline: str = DEFAULT_MEMORY_BASELINE,
     ) -> util.BuilderConfig:
         """
         Generates a BuilderConfig object for the builder, including worker names,
@@ -133,6 +141,12 @@ class BaseBuilder:
                 Defaults to an empty list.
             properties (dict[str, str], optional): Additional properties for the builder.
                 Defaults to an empty dictionary.'
+            next_build (Callable, optional): Selects the next build request. Defaults to
+                nextBuildShortestJob, favoring the shortest expected builds of a branch
+                priority tier. Pass nextBuild for first come, first serve.
+            memory_baseline (str, optional): Memory used by the build outside of /dev/shm.
+                The memory claim of the builder is the largest shm_size of its containers,
+                summed for the containers of a ParallelGroup, plus this baseline. Defaults to DEFAULT_MEMORY_BASELINE.
         Mention on the jobs parameter:
             - jobs is a measure of how many CPU's are used for the build, for commands that support parallel execution (e.g. make, mtr).
             - provide a value greater or equal to 1
@@ -145,16 +159,20 @@ class BaseBuilder:
         if not properties:
             properties = {}
         properties["jobs"] = jobs
+        memory = self.memory_claim(memory_baseline)
+        properties["memory"] = memory
 
         # Update worker metadata
         for worker in workers:
             worker.requested_jobs += jobs
             worker.builders[self.name] = jobs
+            worker.requested_memory += memory
+            worker.builders_memory[self.name] = memory
         return util.BuilderConfig(
             name=self.name,
             workernames=[worker.name for worker in workers],
             tags=tags,
-            nextBuild=nextBuild,
+            nextBuild=next_build,
             canStartBuild=canStartBuild,
             factory=self.get_factory(),
             properties=properties,
@@ -162,7 +180,14 @@ class BaseBuilder:
 
 
 class GenericBuilder(BaseBuilder):
-    def __init__(self, name, sequences, sidecar=None):
-        super().__init__(name, sidecar)
+    def __init__(
+        self,
+        name,
+        sequences,
+        sidecar=None,
+        persistent_container=False,
+        build_tree=None,
+    ):
+        super().__init__(name, sidecar, persistent_container, build_tree)
         for sequence in sequences:
             self.add_sequence(sequence)
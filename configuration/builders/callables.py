@@ -1,25 +1,45 @@
-import fnmatch
+from typing import Generator
+
+from twisted.internet import defer
 
 from buildbot.buildrequest import BuildRequest
 from buildbot.process.builder import Builder
 from buildbot.process.workerforbuilder import AbstractWorkerForBuilder
+from configuration.builders.priority import (
+    BranchClassifier,
+    PriorityNextBuild,
+    ShortestJobNextBuild,
+    glob_match_any,
+)
+from configuration.workers.ledger import free_worker_memory, scan_reserved_jobs
 from constants import RELEASE_BRANCHES, SAVED_PACKAGE_BRANCHES
 
+# Booleans are sorted False first.
+# Priority is given to releaseBranches, savePackageBranches
+# then it's first come, first serve.
+BRANCH_PRIORITY = BranchClassifier(RELEASE_BRANCHES, SAVED_PACKAGE_BRANCHES)
+_priority_next_build = PriorityNextBuild(BRANCH_PRIORITY)
+_shortest_job_next_build = ShortestJobNextBuild(BRANCH_PRIORITY)
+
 
 def fnmatch_any(branch: str, patterns: list[str]) -> bool:
-    return any(fnmatch.fnmatch(branch, pattern) for pattern in patterns)
+    return glob_match_any(branch, patterns)
 
 
 # This function is crucial in build to worker assignment logic.
 # It's based on the assumption that the worker has a total_jobs property
 # and the builder has a jobs property. Please modify with care.
+# Memory is admitted too when the worker has a total_memory property.
+@defer.inlineCallbacks
 def canStartBuild(
     builder: Builder, wfb: AbstractWorkerForBuilder, request: BuildRequest
-) -> bool:
+) -> Generator[defer.Deferred, None, bool]:
     """
     Check if the builder can start a build on the given worker for the given request.
     This function checks if the worker has enough jobs available for the builder
     based on the builder's job claim and the total jobs available on the worker.
+    Workers declaring their total memory must also have enough unclaimed memory for
+    the builder's memory claim (largest shm_size plus a baseline, in MiB).
     Args:
         builder (Builder): The builder instance.
         wfb (AbstractWorkerForBuilder): The worker for the builder instance.
@@ -27,7 +47,6 @@ def canStartBuild(
     Returns:
         bool: True if the builder can start a build on the worker, False otherwise.
     """
-    reserved_jobs = 0
     total_worker_jobs = wfb.worker.properties[
         "total_jobs"
     ]  # This property (config-time) must exist at worker level
@@ -36,24 +55,33 @@ def canStartBuild(
     if current_builder_job_claim > total_worker_jobs:
         return False
 
-    for (
-        bfw
-    ) in (
-        wfb.worker.workerforbuilders.values()
-    ):  # iterate through builders assigned to current worker
-        if (
-            bfw.isBusy()
-        ):  # isBusy means another builder is running on the current worker so we need to calculate how many jobs were claimed
-            other_builder_job_claim = bfw.builder.config.properties[
-                "jobs"
-            ]  # This property (config-time) must exist at Builder level
-            reserved_jobs = reserved_jobs + other_builder_job_claim
+    # LedgerWorker keeps the claims of running builds up to date on build start/finish,
+    # other workers need a scan of the builders assigned to them
+    job_ledger = getattr(wfb.worker, "job_ledger", None)
+    if job_ledger is not None:
+        reserved_jobs = job_ledger.reserved
+    else:
+        reserved_jobs = scan_reserved_jobs(wfb.worker.workerforbuilders.values())
 
     available_jobs = total_worker_jobs - reserved_jobs
 
     if current_builder_job_claim > available_jobs:
         return False
 
+    available_memory = free_worker_memory(wfb.worker)
+    if available_memory is not None:
+        if builder.config.properties.get("memory", 0) > available_memory:
+            return False
+
+    # Physical host shared with other masters, total_jobs is a global cap
+    if getattr(wfb.worker, "shared_host", None):
+        claimed = yield wfb.worker.claim_shared_jobs(
+            builder_name=builder.name,
+            jobs=current_builder_job_claim,
+            total_jobs=total_worker_jobs,
+        )
+        return claimed
+
     return True  # True if there are enough jobs for this builder on current worker
 
 
@@ -67,15 +95,22 @@ def nextBuild(builder: Builder, requests: list[BuildRequest]) -> BuildRequest:
         BuildRequest: The next build request to be processed.
     """
 
-    def build_request_sort_key(request: BuildRequest):
-        branch = request.sources[""].branch
-        # Booleans are sorted False first.
-        # Priority is given to releaseBranches, savePackageBranches
-        # then it's first come, first serve.
-        return (
-            not fnmatch_any(branch, RELEASE_BRANCHES),
-            not fnmatch_any(branch, SAVED_PACKAGE_BRANCHES),
-            request.getSubmitTime(),
-        )
+    return _priority_next_build(builder, requests)
+
 
-    return min(requests, key=build_request_sort_key)
+def nextBuildShortestJob(
+    builder: Builder, requests: list[BuildRequest]
+) -> BuildRequest:
+    """
+    Select the next build request like nextBuild(), but inside a branch priority tier
+    requests expected to finish sooner (historical median of the builder on that branch)
+    go first. Waiting time is credited against the expected duration, so long builds
+    are not starved. The medians come from the BuildDurationHistory service of the
+    master, without it this is nextBuild().
+    Args:
+        builder (Builder): The builder instance.
+        requests (list[BuildRequest]): A list of build requests for the builder.
+    Returns:
+        BuildRequest: The next build request to be processed.
+    """
+    return _shortest_job_next_build(builder, requests)
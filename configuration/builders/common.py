@@ -1,46 +1,15 @@
 import os
-from pathlib import PurePath
 from typing import Union
 
 from configuration.builders.base import GenericBuilder
-from configuration.builders.infra.runtime import DockerConfig
+from configuration.builders.infra.docker import (
+    DEFAULT_MEMLOCK_LIMIT,
+    DEFAULT_SHM_SIZE,
+    docker_config,
+)
 from configuration.builders.sequences.release import deb_autobake, rpm_autobake
 
-DEFAULT_SHM_SIZE = "15g"
 DEFAULT_BUILDER_JOBS = 7
-DEFAULT_MEMLOCK_LIMIT = 51200000
-
-
-def docker_config(
-    image: str,
-    shm_size: str = DEFAULT_SHM_SIZE,
-    memlock_limit: int = DEFAULT_MEMLOCK_LIMIT,
-    additional_bind_mounts: list[tuple[str, str]] = None,
-    additional_env_vars: list[tuple[str, str]] = None,
-    platform: str = None,
-    artifacts_url: str = os.environ["ARTIFACTS_URL"],
-    packages_dir: str = os.environ["MASTER_PACKAGES_DIR"],
-) -> DockerConfig:
-    bind_mounts = [
-        (f"{packages_dir}/", "/packages"),
-        ("/srv/buildbot/ccache", "/mnt/ccache"),
-    ] + (additional_bind_mounts if additional_bind_mounts else [])
-
-    env_vars = [
-        ("ARTIFACTS_URL", artifacts_url),
-        ("CCACHE_DIR", "/mnt/ccache"),
-    ] + (additional_env_vars if additional_env_vars else [])
-
-    return DockerConfig(
-        repository=os.environ["CONTAINER_REGISTRY_URL"],
-        image_tag=image,
-        workdir=PurePath("/home/buildbot"),
-        bind_mounts=bind_mounts,
-        shm_size=shm_size,
-        env_vars=env_vars,
-        memlock_limit=memlock_limit,
-        platform=platform,
-    )
 
 
 def deb_release_builder(
@@ -50,12 +19,18 @@ def deb_release_builder(
     test_galera: bool = True,
     test_rocksdb: bool = True,
     test_s3: bool = True,
+    persistent_container: bool = False,
+    parallel_tests: bool = False,
+    ccache_remote_storage: str = None,
 ) -> GenericBuilder:
     """Create a Debian-based release builder
     Args:
         name: The name of the builder.
         image: The Docker image to use, can be a string or a tuple of (image, platform). Platform is to be used with --platform flag when pulling the image.
         worker_pool: The list of workers to assign the builder to.
+        persistent_container: Run the steps through docker exec in one long-lived container instead of a docker run (and commit) per step.
+        parallel_tests: Run the MTR suites at the same time, each in a container of its own. The suites share the jobs of the builder, the memory claim grows with the number of suites.
+        ccache_remote_storage: ccache remote storage of the builds, see docker_config.
 
     """
     if isinstance(image, tuple):
@@ -69,13 +44,19 @@ def deb_release_builder(
         sequences=[
             deb_autobake(
                 jobs=DEFAULT_BUILDER_JOBS,
-                config=docker_config(image=image_name, platform=image_platform),
+                config=docker_config(
+                    image=image_name,
+                    platform=image_platform,
+                    ccache_remote_storage=ccache_remote_storage,
+                ),
                 artifacts_url=os.environ["ARTIFACTS_URL"],
                 test_galera=test_galera,
                 test_rocksdb=test_rocksdb,
                 test_s3=test_s3,
+                parallel_tests=parallel_tests,
             ),
         ],
+        persistent_container=persistent_container,
     ).get_config(
         workers=worker_pool,
         tags=["release_packages", "autobake", "deb"],
@@ -96,6 +77,8 @@ def rpm_release_builder(
     test_galera: bool = True,
     test_rocksdb: bool = True,
     test_s3: bool = True,
+    parallel_tests: bool = False,
+    ccache_remote_storage: str = None,
 ) -> GenericBuilder:
     """Create an RPM-based release builder
     Args:
@@ -108,13 +91,20 @@ def rpm_release_builder(
         test_galera: Whether to test Galera.
         test_rocksdb: Whether to test RocksDB.
         test_s3: Whether to test S3.
+        parallel_tests: Run the MTR suites at the same time, each in a container of
+            its own. The suites share the jobs of the builder, the memory claim
+            grows with the number of suites.
+        ccache_remote_storage: ccache remote storage of the builds, see
+            docker_config.
     """
     return GenericBuilder(
         name=name,
         sequences=[
             rpm_autobake(
                 jobs=DEFAULT_BUILDER_JOBS,
-                config=docker_config(image=image),
+                config=docker_config(
+                    image=image, ccache_remote_storage=ccache_remote_storage
+                ),
                 srpm_config=docker_config(
                     image=f"{image}-srpm",
                     memlock_limit=DEFAULT_MEMLOCK_LIMIT,
@@ -138,6 +128,7 @@ def rpm_release_builder(
                 test_galera=test_galera,
                 test_rocksdb=test_rocksdb,
                 test_s3=test_s3,
+                parallel_tests=parallel_tests,
             ),
         ],
     ).get_config(
@@ -37,6 +37,7 @@ SIDECAR = Sidecar(
     image_tag="mariadb:lts",
     env_vars=[("MARIADB_ALLOW_EMPTY_ROOT_PASSWORD", "1"), ("MARIADB_DATABASE", "test")],
     tmpfs=PurePath("/var/lib/mysql"),
+    pool_size=4,
 )
 
 
@@ -0,0 +1,157 @@
+import statistics
+import time
+from collections import defaultdict
+from typing import Optional
+
+from twisted.internet import defer, task
+from twisted.python import log
+
+from buildbot.process.results import SUCCESS, WARNINGS
+from buildbot.util import service
+from configuration.db import select_columns
+
+BUILD_HISTORY_NAME = "build_history"
+# Seconds between two refreshes of the build durations
+BUILD_HISTORY_REFRESH_INTERVAL = 600
+# Only builds started in this window (seconds) are used
+BUILD_HISTORY_WINDOW = 14 * 24 * 3600
+
+
+def build_durations(conn, model, since: int) -> dict[tuple[str, str], list[int]]:
+    """
+    Fetches the durations of the successful builds started after `since`.
+    Args:
+        conn: A SQLAlchemy connection to the Buildbot database.
+        model: The Buildbot database model (master.db.model).
+        since (int): Epoch timestamp.
+    Returns:
+        dict: The build durations in seconds, keyed by (builder name, branch).
+    """
+    builds = model.builds
+    br = model.buildrequests
+    bs_ss = model.buildset_sourcestamps
+    ss = model.sourcestamps
+    builders = model.builders
+
+    query = (
+        select_columns(
+            builders.c.name, ss.c.branch, builds.c.started_at, builds.c.complete_at
+        )
+        .select_from(
+            builds.join(builders, builders.c.id == builds.c.builderid)
+            .join(br, br.c.id == builds.c.buildrequestid)
+            .join(bs_ss, bs_ss.c.buildsetid == br.c.buildsetid)
+            .join(ss, ss.c.id == bs_ss.c.sourcestampid)
+        )
+        .where(
+            (builds.c.started_at >= since)
+            & (builds.c.complete_at.isnot(None))
+            & (builds.c.results.in_([SUCCESS, WARNINGS]))
+        )
+    )
+    with conn.begin():
+        rows = conn.execute(query).fetchall()
+
+    durations = defaultdict(list)
+    for row in rows:
+        durations[(row.name, row.branch)].append(row.complete_at - row.started_at)
+    return dict(durations)
+
+
+class BuildDurationHistory(service.BuildbotService):
+    """
+    In-memory cache of the median build duration per (builder, branch), refreshed
+    periodically from the Buildbot database while the service runs. The nextBuild
+    and prioritizeBuilders callables find it in the services of the master.
+    Args:
+        refresh_interval (int, optional): Seconds between two refreshes.
+        window (int, optional): Only builds started in this many seconds are used.
+    Attributes:
+        generation (int): Incremented on every refresh, so users of the medians can
+            tell when values they derived from them are outdated.
+    """
+
+    name = BUILD_HISTORY_NAME
+
+    def __init__(self, *args, **kwargs):
+        self.refresh_interval = BUILD_HISTORY_REFRESH_INTERVAL
+        self.window = BUILD_HISTORY_WINDOW
+        self.generation = 0
+        self._medians: dict[tuple[str, str], float] = {}
+        self._builder_medians: dict[str, float] = {}
+        self._poller: Optional[task.LoopingCall] = None
+        super().__init__(*args, **kwargs)
+
+    def reconfigService(
+        self,
+        refresh_interval: int = BUILD_HISTORY_REFRESH_INTERVAL,
+        window: int = BUILD_HISTORY_WINDOW,
+    ):
+        self.refresh_interval = refresh_interval
+        self.window = window
+        if self._poller is not None and self._poller.running:
+            self._poller.stop()
+        if self.running:
+            self._start_poller()
+
+    @defer.inlineCallbacks
+    def startService(self):
+        yield super().startService()
+        self._start_poller()
+
+    def stopService(self):
+        if self._poller is not None and self._poller.running:
+            self._poller.stop()
+        return super().stopService()
+
+    def _start_poller(self):
+        self._poller = task.LoopingCall(self._refresh)
+        self._poller.clock = self.master.reactor
+        d = self._poller.start(self.refresh_interval, now=True)
+        d.addErrback(log.err, "while refreshing the build duration history")
+
+    def update(self, durations: dict[tuple[str, str], list[int]]):
+        by_builder = defaultdict(list)
+        for (builder_name, _), samples in durations.items():
+            by_builder[builder_name].extend(samples)
+        self._medians = {
+            key: statistics.median(samples) for key, samples in durations.items()
+        }
+        self._builder_medians = {
+            name: statistics.median(samples) for name, samples in by_builder.items()
+        }
+        self.generation += 1
+
+    def expected(self, builder_name: str, branch: str) -> Optional[float]:
+        """
+        Returns the median duration of the builder on this branch, falling back to the
+        median of the builder on all branches, None without history.
+        """
+        median = self._medians.get((builder_name, branch))
+        if median is None:
+            median = self.expected_builder(builder_name)
+        return median
+
+    def expected_builder(self, builder_name: str) -> Optional[float]:
+        """Returns the median duration of the builder on all branches, None without history."""
+        return self._builder_medians.get(builder_name)
+
+    @defer.inlineCallbacks
+    def _refresh(self):
+        try:
+            durations = yield self.master.db.pool.do(
+                build_durations,
+                self.master.db.model,
+                int(time.time()) - self.window,
+            )
+        except Exception as e:
+            log.err(e, "while fetching the build duration history")
+            return
+        self.update(durations)
+
+
+def build_history(master) -> Optional[BuildDurationHistory]:
+    """Returns the BuildDurationHistory service of the master, None if it has none."""
+    if master is None:
+        return None
+    return master.namedServices.get(BUILD_HISTORY_NAME)
@@ -0,0 +1,62 @@
+import os
+from pathlib import PurePath
+from typing import Optional
+
+from configuration.builders.infra.runtime import DockerConfig
+
+DEFAULT_SHM_SIZE = "15g"
+DEFAULT_MEMLOCK_LIMIT = 51200000
+
+
+def docker_config(
+    image: str,
+    shm_size: str = DEFAULT_SHM_SIZE,
+    memlock_limit: int = DEFAULT_MEMLOCK_LIMIT,
+    additional_bind_mounts: list[tuple[str, str]] = None,
+    additional_env_vars: list[tuple[str, str]] = None,
+    platform: str = None,
+    artifacts_url: Optional[str] = None,
+    packages_dir: Optional[str] = None,
+    ccache_remote_storage: Optional[str] = None,
+) -> DockerConfig:
+    """Create the Docker configuration of a builder
+    Args:
+        artifacts_url: ARTIFACTS_URL of the master environment by default.
+        packages_dir: MASTER_PACKAGES_DIR of the master environment by default.
+        ccache_remote_storage: ccache remote storage shared by the hosts of the
+            worker pool, e.g. http://ccache.example.org:8080/pool|connect-timeout=500,
+            passed to the containers as CCACHE_REMOTE_STORAGE. ccache (4.8 or later)
+            looks up the local cache of the host first, then the remote storage,
+            and keeps a copy of the remote hits in the local cache.
+            CCACHE_REMOTE_STORAGE of the master environment by default, without
+            it the cache stays local to the host.
+    """
+    if artifacts_url is None:
+        artifacts_url = os.environ["ARTIFACTS_URL"]
+    if packages_dir is None:
+        packages_dir = os.environ["MASTER_PACKAGES_DIR"]
+    if ccache_remote_storage is None:
+        ccache_remote_storage = os.environ.get("CCACHE_REMOTE_STORAGE")
+
+    bind_mounts = [
+        (f"{packages_dir}/", "/packages"),
+        ("/srv/buildbot/ccache", "/mnt/ccache"),
+    ] + (additional_bind_mounts if additional_bind_mounts else [])
+
+    env_vars = [
+        ("ARTIFACTS_URL", artifacts_url),
+        ("CCACHE_DIR", "/mnt/ccache"),
+    ] + (additional_env_vars if additional_env_vars else [])
+    if ccache_remote_storage:
+        env_vars.append(("CCACHE_REMOTE_STORAGE", ccache_remote_storage))
+
+    return DockerConfig(
+        repository=os.environ["CONTAINER_REGISTRY_URL"],
+        image_tag=image,
+        workdir=PurePath("/home/buildbot"),
+        bind_mounts=bind_mounts,
+        shm_size=shm_size,
+        env_vars=env_vars,
+        memlock_limit=memlock_limit,
+        platform=platform,
+    )
@@ -1,18 +1,30 @@
 import copy
 from dataclasses import dataclass, field
 from pathlib import Path, PurePath
-from typing import Iterable, Optional
+from typing import Iterable, Optional, Union
 
 from buildbot.interfaces import IBuildStep
-from buildbot.plugins import steps, util
-from configuration.steps.base import BaseStep
-from configuration.steps.remote import ShellStep
+from buildbot.plugins import steps
+from buildbot.process.properties import Interpolate
+from configuration.steps.base import BaseStep, StepOptions
+from configuration.steps.commands.base import (
+    ParallelShellCommands,
+    interpolate,
+    load_script,
+)
+from configuration.steps.remote import (
+    PropFromShellStep,
+    PropsFromShellStep,
+    ShellStep,
+)
 
 
 class BuildSequence:
     """
     A class to manage a sequence of build steps.
     This class allows you to add steps to a sequence and retrieve them as an iterable.
+    Independent InContainer steps can run at the same time by adding them as the
+    branches of a ParallelGroup step.
     Attributes:
         steps (list[BaseStep]): A list of build steps in the sequence.
     Methods:
@@ -72,8 +84,15 @@ class DockerConfig(ContainerBase):
     bind_mounts: list[tuple[Path, Path]] = field(default_factory=list)
     workdir: Optional[PurePath] = field(default=PurePath("/home/buildbot"))
 
+    _build_tree: bool = field(init=False, default=False)
+
     @property
-    def volume_mount(self) -> str:
+    def volume_mount(self) -> Union[str, Interpolate]:
+        # The build tree volume is only known once AcquireBuildTree ran
+        if self._build_tree:
+            return interpolate(
+                f"type=volume,src=%(prop:build_tree)s,dst={self.workdir}"
+            )
         return f"type=volume,src={self.container_name},dst={self.workdir}"
 
     @property
@@ -83,10 +102,36 @@ class DockerConfig(ContainerBase):
 
 @dataclass
 class Sidecar(ContainerBase):
-    """Sidecar container configuration"""
+    """Sidecar container configuration
+
+    With a pool_size, the builds lease one of pool_size warm sidecars of the image
+    kept on each worker host, reset between builds, instead of starting a fresh
+    container, see LeaseDockerSidecar. Only MariaDB Server images can be pooled.
+    """
 
     __hash__ = ContainerBase.__hash__
     tmpfs: PurePath = field(default=PurePath("/tmp"))
+    pool_size: int = field(default=0)
+
+
+@dataclass
+class BuildTree:
+    """Incremental build tree configuration
+
+    The builds of a branch matching one of branches keep their workdir volume on the
+    worker host, the next build of the branch on the host applies its source over
+    the tree the last one left and rebuilds what changed, see AcquireBuildTree. A
+    build failing over a reused tree is retried from a clean tree before its result
+    is reported. The trees of a host are removed, least recently used first, beyond
+    quota.
+    Attributes:
+        quota (str): Disk space of the trees of the host, in the format of docker
+            --shm-size, e.g. "300g".
+        branches (list[str]): fnmatch patterns of the branches keeping a tree.
+    """
+
+    quota: str
+    branches: list[str] = field(default_factory=lambda: ["main"])
 
 
 class InContainer(BaseStep):
@@ -103,12 +148,25 @@ class InContainer(BaseStep):
             environment variables, volume mounts, and runtime settings.
         container_commit (bool): Whether to commit the container after execution. Defaults to False.
         workdir (PurePath): The working directory for the step command.
+        persistent (bool): Whether the step runs through docker exec in the long-lived
+            container of the builder instead of a docker run of its own. Set by
+            process_steps(persistent_container=True), container_commit is then not
+            needed. Interrupting the step kills its processes in the container, see
+            persistent_exec.sh.
+        The command runs through container_usage.sh, which prints the CPU time and
+        peak memory of the container for StepMetrics, unless the step sets properties
+        from its output.
+        container_suffix (Optional[str]): Appended to the container name of the docker
+            run, for steps running at the same time in a ParallelGroup. The volume
+            and the runtime image stay those of the builder.
 
     Methods:
         generate() -> IBuildStep:
             Generates the build step with the Docker container configuration applied.
             This includes setting up the Docker command prefix, environment variables,
             volume mounts, and working directory.
+        wrapped_step() -> ShellStep:
+            Applies the same Docker configuration and returns the wrapped ShellStep.
     """
 
     def __init__(
@@ -125,9 +183,19 @@ class InContainer(BaseStep):
         self.container_commit = container_commit
         self.docker_environment = docker_environment
         self.workdir = step.command.workdir
+        self.persistent = False
+        self.container_suffix = None
 
     def generate(self) -> IBuildStep:
+        return self.wrapped_step().generate()
+
+    def wrapped_step(self) -> ShellStep:
+        if self.persistent:
+            return self._wrap_exec()
         step = self.step
+        container_name = self.docker_environment.container_name
+        if self.container_suffix:
+            container_name = f"{container_name}--{self.container_suffix}"
         cmd_prefix = []
         cmd_prefix.append(
             [
@@ -135,7 +203,7 @@ class InContainer(BaseStep):
                 "run",
                 "--init",
                 "--name",
-                f"{self.docker_environment.container_name}",
+                container_name,
                 "-u",
                 f"{step.command.user}",
             ]
@@ -168,7 +236,7 @@ class InContainer(BaseStep):
         # Step variables override global variables
         env_vars.update(step.env_vars)
         for variable, value in env_vars.items():
-            cmd_prefix.append(["-e", util.Interpolate(f"{variable}={value}")])
+            cmd_prefix.append(["-e", interpolate(f"{variable}={value}")])
 
         step.env_vars = []  # Reset env_vars in the step as they are now set by docker
 
@@ -177,15 +245,171 @@ class InContainer(BaseStep):
             ["--ulimit", f"memlock={self.docker_environment.memlock_limit}"]
         )
 
-        path = self.docker_environment.workdir / step.command.workdir
-        # Absolute command workdir overrides basedir.
-        if step.command.workdir.is_absolute():
-            path = step.command.workdir
-
-        cmd_prefix.append(["-w", path.as_posix()])
+        cmd_prefix.append(["-w", self._container_workdir().as_posix()])
         cmd_prefix.append([self.docker_environment.runtime_tag])
+        cmd_prefix.extend(self._container_usage_prefix())
+
+        step.prefix_cmd.extend(cmd_prefix)
+
+        step.command.workdir = PurePath(".")
+        return step
+
+    def _wrap_exec(self) -> ShellStep:
+        step = self.step
+        cmd_prefix = []
+        # docker exec through a wrapper killing the step processes on interrupt
+        cmd_prefix.append(
+            [
+                "bash",
+                "-c",
+                load_script(script_name="persistent_exec.sh"),
+                "--",
+                self.docker_environment.container_name,
+            ]
+        )
+        cmd_prefix.append(["-u", f"{step.command.user}"])
+        cmd_prefix.append(["-w", self._container_workdir().as_posix()])
+
+        # Global variables were set when the container started, step variables override them
+        for variable, value in step.env_vars:
+            cmd_prefix.append(["-e", interpolate(f"{variable}={value}")])
+
+        step.env_vars = []  # Reset env_vars in the step as they are now set by docker
+
+        cmd_prefix.append(["--"])
+        cmd_prefix.extend(self._container_usage_prefix())
 
         step.prefix_cmd.extend(cmd_prefix)
 
         step.command.workdir = PurePath(".")
-        return step.generate()
+        return step
+
+    def _container_usage_prefix(self) -> list[list[str]]:
+        # The output of the steps setting properties is parsed, keep it as is
+        if isinstance(self.step, (PropFromShellStep, PropsFromShellStep)):
+            return []
+        self.step.container_usage = True
+        return [["bash", "-c", load_script(script_name="container_usage.sh"), "--"]]
+
+    def _container_workdir(self) -> PurePath:
+        # Absolute command workdir overrides basedir.
+        if self.step.command.workdir.is_absolute():
+            return self.step.command.workdir
+        return self.docker_environment.workdir / self.step.command.workdir
+
+
+class ParallelGroup(BaseStep):
+    """
+    InContainer steps of a sequence running at the same time, as a single build step.
+
+    The steps are added in named branches. The steps of a branch run one after the
+    other and a branch starts once the branches it depends on are done, branches can
+    only depend on branches added before them. Each branch runs its steps in a
+    container of its own, named after the branch, from the runtime image of the
+    builder and with the builder volume mounted. With a persistent container, the
+    steps of all branches run through docker exec in that container.
+    The result of the group is the worst result of its steps, each step logs to its
+    own log and the timeline log shows when the steps ran. A step failing with
+    haltOnFailure stops its branch and the branches depending on it, the other step
+    options and URLs are not used.
+
+    Attributes:
+        branches (dict[str, tuple[list[InContainer], tuple[str, ...]]]): The steps and
+            the dependencies of each branch, in the order they were added.
+        docker_environment (DockerConfig): The configuration shared by all the steps,
+            that of the first step added.
+        container_commit (bool): Always False, the group runs after the image of the
+            builder is committed and its containers are removed when done.
+        persistent (bool): Whether the steps run through docker exec in the long-lived
+            container of the builder, set on all the steps of the group.
+
+    Methods:
+        add_branch(name, steps, depends_on=()):
+            Adds a branch running once the branches in depends_on are done.
+        generate() -> IBuildStep:
+            Generates a ParallelShellCommands step running all the branches.
+    """
+
+    container_commit = False
+
+    def __init__(self, name: str, options: Optional[StepOptions] = None):
+        super().__init__(name=name, options=options)
+        self.branches = {}
+        self.docker_environment = None
+        self._persistent = False
+
+    @property
+    def steps(self) -> list[InContainer]:
+        return [step for steps, _ in self.branches.values() for step in steps]
+
+    @property
+    def persistent(self) -> bool:
+        return self._persistent
+
+    @persistent.setter
+    def persistent(self, persistent: bool):
+        self._persistent = persistent
+        for step in self.steps:
+            step.persistent = persistent
+
+    def add_branch(
+        self, name: str, steps: list[InContainer], depends_on: Iterable[str] = ()
+    ):
+        depends_on = tuple(depends_on)
+        if not steps:
+            raise ValueError(f"Branch {name} has no steps.")
+        if name in self.branches:
+            raise ValueError(f"Branch {name} already exists.")
+        if not name.replace("-", "").replace("_", "").isalnum():
+            raise ValueError(f"Branch name {name} cannot be part of a container name.")
+        for dependency in depends_on:
+            if dependency not in self.branches:
+                raise ValueError(
+                    f"Branch {name} depends on {dependency}, add {dependency} first."
+                )
+        names = {step.name for step in self.steps}
+        for step in steps:
+            if not isinstance(step, InContainer) or isinstance(
+                step.step, PropFromShellStep
+            ):
+                raise ValueError(
+                    f"Step {step.name}: branches only run InContainer shell steps."
+                )
+            if step.container_commit:
+                raise ValueError(
+                    f"Step {step.name}: branches cannot commit containers."
+                )
+            if self.docker_environment is None:
+                self.docker_environment = step.docker_environment
+            elif step.docker_environment != self.docker_environment:
+                raise ValueError(
+                    f"Step {step.name}: the steps of a group share their DockerConfig."
+                )
+            # Every step has a log named after it
+            if step.name in names:
+                raise ValueError(f"Step {step.name} is already in the group.")
+            names.add(step.name)
+            step.persistent = self._persistent
+        self.branches[name] = (list(steps), depends_on)
+
+    def generate(self) -> IBuildStep:
+        branches = []
+        for name, (steps, depends_on) in self.branches.items():
+            commands = []
+            for step in steps:
+                step.container_suffix = name
+                wrapped_step = step.wrapped_step()
+                commands.append(
+                    {
+                        "name": step.name,
+                        "haltOnFailure": step.options.haltOnFailure,
+                        "container_usage": wrapped_step.container_usage,
+                        **wrapped_step.remote_command_args(),
+                    }
+                )
+            branches.append(
+                {"name": name, "depends_on": list(depends_on), "commands": commands}
+            )
+        return ParallelShellCommands(
+            name=self.name, branches=branches, **self.options.getopt
+        )
@@ -0,0 +1,328 @@
+import fnmatch
+import heapq
+import re
+import time
+from functools import lru_cache
+from typing import Callable, Hashable, Iterable, Optional
+
+import sqlalchemy as sa
+from twisted.internet import defer
+from twisted.python import log
+
+from buildbot.buildrequest import BuildRequest
+from buildbot.process import metrics
+from configuration.builders.history import BuildDurationHistory, build_history
+from configuration.db import select_columns
+from configuration.workers.ledger import free_worker_memory
+
+
+@lru_cache(maxsize=256)
+def compile_globs(patterns: tuple[str, ...]) -> Optional[re.Pattern]:
+    """
+    Compiles a list of fnmatch glob patterns into a single regex.
+    Args:
+        patterns (tuple[str, ...]): The glob patterns.
+    Returns:
+        re.Pattern: A regex matching a string if any pattern matches it, None if there are no patterns.
+    """
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(p) for p in patterns))
+
+
+def glob_match_any(value: str, patterns: Iterable[str]) -> bool:
+    regex = compile_globs(tuple(patterns))
+    return regex is not None and regex.match(value) is not None
+
+
+class BranchClassifier:
+    """
+    Classifies branches into priority tiers.
+    Each tier is a list of glob patterns, compiled once into a single regex, and the
+    classification of a branch is memoized since the same branches are queued over and over.
+    The tier of a branch is a tuple of booleans, one per tier, False when the branch matches it.
+    Sorting on it gives the same order as sorting on `not fnmatch_any(branch, tier)` for each tier.
+    Attributes:
+        tiers (list[list[str]]): The glob patterns of each tier, highest priority first.
+    """
+
+    def __init__(self, *tiers: list[str], cache_size: int = 4096):
+        self.tiers = [list(patterns) for patterns in tiers]
+        self._regexes = [compile_globs(tuple(patterns)) for patterns in self.tiers]
+        self.tier = lru_cache(maxsize=cache_size)(self._tier)
+
+    def _tier(self, branch: str) -> tuple[bool, ...]:
+        return tuple(
+            regex is None or regex.match(branch) is None for regex in self._regexes
+        )
+
+
+class BuildRequestQueue:
+    """
+    Priority queue of the build requests of one builder.
+    Buildbot passes the full list of unclaimed requests to nextBuild() on every selection.
+    The queue keeps the requests it has already seen in a heap, so a selection only computes
+    the sort key of the new requests and drops the ones that were claimed or cancelled meanwhile.
+    Attributes:
+        key (Callable[[BuildRequest], Hashable]): The sort key, smallest first. Must not change
+            during the lifetime of a request.
+    """
+
+    def __init__(self, key: Callable[[BuildRequest], Hashable]):
+        self.key = key
+        self._heap: list[tuple[Hashable, int]] = []
+        self._queued: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def select(self, requests: list[BuildRequest]) -> Optional[BuildRequest]:
+        """
+        Returns the request with the smallest key among the given pending requests.
+        Args:
+            requests (list[BuildRequest]): The pending requests of the builder.
+        Returns:
+            BuildRequest: The selected request, None if there are no requests.
+        """
+        pending = {request.id: request for request in requests}
+
+        # Requests handled elsewhere pile up below the top of the heap, rebuild when it grows
+        if len(self._heap) > 2 * len(pending) + 64:
+            self._heap = [entry for entry in self._heap if entry[1] in pending]
+            heapq.heapify(self._heap)
+            self._queued = {brid for _, brid in self._heap}
+
+        for brid, request in pending.items():
+            if brid not in self._queued:
+                heapq.heappush(self._heap, (self.key(request), brid))
+                self._queued.add(brid)
+
+        while self._heap:
+            brid = self._heap[0][1]
+            if brid in pending:
+                return pending[brid]
+            heapq.heappop(self._heap)
+            self._queued.discard(brid)
+        return None
+
+
+class PriorityNextBuild:
+    """
+    nextBuild callable selecting requests by branch priority tier, then submission time.
+    One BuildRequestQueue is kept per builder.
+    Attributes:
+        classifier (BranchClassifier): Gives the priority tier of a branch.
+    """
+
+    def __init__(self, classifier: BranchClassifier):
+        self.classifier = classifier
+        self._queues: dict[str, BuildRequestQueue] = {}
+
+    def sort_key(self, request: BuildRequest) -> tuple:
+        branch = request.sources[""].branch
+        return (*self.classifier.tier(branch), request.getSubmitTime())
+
+    def queue_key(self, builder_name: str) -> Callable[[BuildRequest], Hashable]:
+        return self.sort_key
+
+    def __call__(self, builder, requests: list[BuildRequest]) -> BuildRequest:
+        queue = self._queues.get(builder.name)
+        if queue is None:
+            queue = BuildRequestQueue(self.queue_key(builder.name))
+            self._queues[builder.name] = queue
+        return queue.select(requests)
+
+
+class ShortestJobNextBuild(PriorityNextBuild):
+    """
+    nextBuild callable applying shortest-expected-job-first inside each branch priority tier.
+    The expected duration of a request is the historical median of its (builder, branch).
+    Aging keeps long jobs from starving: every second a request waits takes `aging` seconds
+    off its expected duration. The score is thus expected + aging * submit time, the current
+    time being the same for all requests. Requests without history are expected to take 0s,
+    which gives first come, first serve until the history is loaded.
+    Attributes:
+        classifier (BranchClassifier): Gives the priority tier of a branch.
+        history (BuildDurationHistory): The median build durations, None for the
+            BuildDurationHistory service of the builder's master.
+        aging (float): Seconds of expected duration forgiven per second of waiting.
+    """
+
+    def __init__(
+        self,
+        classifier: BranchClassifier,
+        history: Optional[BuildDurationHistory] = None,
+        aging: float = 1.0,
+    ):
+        super().__init__(classifier)
+        self.history = history
+        self.aging = aging
+        self._current: Optional[BuildDurationHistory] = history
+        self._generation = history.generation if history is not None else 0
+
+    def queue_key(self, builder_name: str) -> Callable[[BuildRequest], Hashable]:
+        history = self._current
+
+        def sort_key(request: BuildRequest) -> tuple:
+            branch = request.sources[""].branch
+            expected = 0
+            if history is not None:
+                expected = history.expected(builder_name, branch) or 0
+            submitted_at = request.getSubmitTime()
+            return (
+                *self.classifier.tier(branch),
+                expected + self.aging * submitted_at,
+                submitted_at,
+            )
+
+        return sort_key
+
+    def __call__(self, builder, requests: list[BuildRequest]) -> BuildRequest:
+        history = self.history
+        if history is None:
+            history = build_history(getattr(builder, "master", None))
+        generation = history.generation if history is not None else 0
+        # Queued keys were computed from the previous medians
+        if history is not self._current or generation != self._generation:
+            self._queues.clear()
+            self._current = history
+            self._generation = generation
+        return super().__call__(builder, requests)
+
+
+def oldest_pending_requests(conn, model) -> dict[str, int]:
+    """
+    Fetches the submission time of the oldest unclaimed buildrequest of every builder,
+    in a single grouped query.
+    Args:
+        conn: A SQLAlchemy connection to the Buildbot database.
+        model: The Buildbot database model (master.db.model).
+    Returns:
+        dict[str, int]: Epoch timestamps keyed by builder name. Builders without
+            unclaimed buildrequests are missing.
+    """
+    br = model.buildrequests
+    claims = model.buildrequest_claims
+    builders = model.builders
+
+    query = (
+        select_columns(builders.c.name, sa.func.min(br.c.submitted_at))
+        .select_from(
+            br.join(builders, builders.c.id == br.c.builderid).outerjoin(
+                claims, claims.c.brid == br.c.id
+            )
+        )
+        .where((br.c.complete == 0) & (claims.c.claimed_at.is_(None)))
+        .group_by(builders.c.name)
+    )
+    with conn.begin():
+        rows = conn.execute(query).fetchall()
+    return {name: submitted_at for name, submitted_at in rows}
+
+
+def free_workers(builder) -> int:
+    """
+    Counts the workers of a builder that could start one of its builds right now.
+    Workers with a job ledger must also have enough free jobs for the builder, and
+    workers declaring their total memory enough free memory.
+    """
+    jobs = builder.config.properties.get("jobs", 1)
+    memory = builder.config.properties.get("memory", 0)
+    count = 0
+    for wfb in builder.getAvailableWorkers():
+        job_ledger = getattr(wfb.worker, "job_ledger", None)
+        if job_ledger is not None:
+            if job_ledger.free(wfb.worker.properties["total_jobs"]) < jobs:
+                continue
+        available_memory = free_worker_memory(wfb.worker)
+        if available_memory is not None and available_memory < memory:
+            continue
+        count += 1
+    return count
+
+
+class BuilderPrioritizer:
+    """
+    prioritizeBuilders callable, ordering the builders the botmaster visits on each pass.
+    Builders with a worker able to start a build go first, by score: the age of their
+    oldest unclaimed request, plus `status_boost` seconds for builders reporting status to
+    GitHub, minus the median duration of their builds when the master has a
+    BuildDurationHistory service. Like ShortestJobNextBuild within a builder, this starts
+    the shortest expected builds first while every second of waiting makes up for a second
+    of expected duration. Builders without a free worker are visited last, since they
+    cannot start anything during this pass.
+    The oldest request of every builder is fetched with a single query and reused for
+    `refresh_interval` seconds, the botmaster running several passes per second when busy.
+    A builder missing from the last fetch got its requests since, they count as submitted
+    now rather than sending the builder to the back of the pass.
+    Attributes:
+        status_builders (frozenset[str]): The builders reporting status to GitHub.
+        status_boost (int): Seconds of waiting credited to status builders.
+        refresh_interval (int): Seconds the oldest requests are cached.
+        passes (int): Number of prioritization passes.
+        last_pass_duration (float): Seconds spent in the last pass.
+    """
+
+    def __init__(
+        self,
+        status_builders: Iterable[str],
+        status_boost: int = 3600,
+        refresh_interval: int = 5,
+    ):
+        self.status_builders = frozenset(status_builders)
+        self.status_boost = status_boost
+        self.refresh_interval = refresh_interval
+        self.passes = 0
+        self.last_pass_duration = 0.0
+        self._oldest: dict[str, int] = {}
+        self._fetched_at: Optional[float] = None
+        self._history: Optional[BuildDurationHistory] = None
+
+    def score(self, builder_name: str, now: float) -> float:
+        """
+        Returns the score of a builder, higher first. Builders without unclaimed request
+        in the last fetch are scored as if their oldest request was submitted now.
+        """
+        score = now - self._oldest.get(builder_name, now)
+        if builder_name in self.status_builders:
+            score += self.status_boost
+        if self._history is not None:
+            score -= self._history.expected_builder(builder_name) or 0
+        return score
+
+    def sort_key(self, builder, now: float) -> tuple:
+        if not free_workers(builder):
+            return (True, 0, builder.name)
+        return (False, -self.score(builder.name, now), builder.name)
+
+    @defer.inlineCallbacks
+    def refresh(self, master, now: float):
+        if (
+            self._fetched_at is not None
+            and now - self._fetched_at < self.refresh_interval
+        ):
+            return
+        # Also on failure, not to hammer a struggling database on every pass
+        self._fetched_at = now
+        try:
+            self._oldest = yield master.db.pool.do(
+                oldest_pending_requests, master.db.model
+            )
+        except Exception as e:
+            log.err(e, "while fetching the oldest pending buildrequests")
+
+    @defer.inlineCallbacks
+    def __call__(self, master, builders: list) -> list:
+        timer = metrics.Timer("BuilderPrioritizer.__call__()")
+        timer.start()
+        start = time.perf_counter()
+        try:
+            now = master.reactor.seconds()
+            self._history = build_history(master)
+            yield self.refresh(master, now)
+            builders.sort(key=lambda builder: self.sort_key(builder, now))
+        finally:
+            timer.stop()
+            self.passes += 1
+            self.last_pass_duration = time.perf_counter() - start
+        return builders
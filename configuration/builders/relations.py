@@ -0,0 +1,114 @@
+from typing import Callable, Iterable, Optional
+
+
+def builders_from_os_info(os_info: dict) -> tuple[list, list, list, set]:
+    """
+    Generates the autobake, install and upgrade builder names from os_info.yaml.
+    Args:
+        os_info (dict): The content of os_info.yaml.
+    Returns:
+        tuple: BUILDERS_AUTOBAKE, BUILDERS_INSTALL, BUILDERS_UPGRADE and ALL_PLATFORMS.
+    """
+    builders_install = []
+    builders_upgrade = []
+    builders_autobake = []
+    all_platforms = set()
+    for os_i in os_info:
+        for arch in os_info[os_i]["arch"]:
+            builder_name_autobake = (
+                arch + "-" + os_i + "-" + os_info[os_i]["type"] + "-autobake"
+            )
+            if not ("install_only" in os_info[os_i] and os_info[os_i]["install_only"]):
+                all_platforms.add(arch)
+                builders_autobake.append(builder_name_autobake)
+            # No VM install for opensuse16.0.0 yet
+            if os_i == "opensuse-1600":
+                continue
+            # Currently there are no VMs for x86 and s390x
+            if arch not in ["s390x", "x86"]:
+                builders_install.append(builder_name_autobake + "-install")
+                builders_upgrade.append(builder_name_autobake + "-minor-upgrade-all")
+                builders_upgrade.append(builder_name_autobake + "-major-upgrade")
+                builders_upgrade.append(builder_name_autobake + "-distro-upgrade")
+
+            if arch in ["amd64", "aarch64"]:
+                builders_upgrade.append(
+                    builder_name_autobake + "-minor-upgrade-columnstore"
+                )
+    return builders_autobake, builders_install, builders_upgrade, all_platforms
+
+
+def rhel_clones(builder_name: str) -> list[str]:
+    """RHEL packages are also tested on its AlmaLinux and Rocky Linux clones."""
+    return [
+        builder_name.replace("rhel", "almalinux"),
+        builder_name.replace("rhel", "rockylinux"),
+    ]
+
+
+def first_match(parent: str, matches: list[str]) -> list[str]:
+    return matches[:1]
+
+
+def first_match_with_rhel_clones(parent: str, matches: list[str]) -> list[str]:
+    builders = matches[:1]
+    if builders and "rhel" in parent:
+        builders += rhel_clones(builders[0])
+    return builders
+
+
+def matches_with_rhel_clones(parent: str, matches: list[str]) -> list[str]:
+    builders = []
+    for b in matches:
+        if "rhel" in parent:
+            builders += rhel_clones(b)
+        builders.append(b)
+    return builders
+
+
+class BuilderMap:
+    """
+    Maps a parent builder name to the child builders whose name contains it.
+    The map is precomputed for every dash-separated prefix of the child names, which
+    covers the parent builders (e.g. amd64-debian-12 for amd64-debian-12-deb-autobake),
+    so triggers and doStepIf callables are dictionary lookups. Any other name is matched
+    with the same substring semantics on its first lookup, then memoized.
+    Attributes:
+        children (list[str]): The child builder names, in trigger order.
+        expand (Callable[[str, list[str]], list[str]]): Turns the parent name and the
+            matching children into the triggered builders. Defaults to all matches.
+    """
+
+    def __init__(
+        self,
+        children: Iterable[str],
+        expand: Optional[Callable[[str, list[str]], list[str]]] = None,
+    ):
+        self.children = list(children)
+        self.expand = expand
+        self._map: dict[str, tuple[str, ...]] = {}
+        for child in self.children:
+            parts = child.split("-")
+            for i in range(1, len(parts) + 1):
+                prefix = "-".join(parts[:i])
+                if prefix not in self._map:
+                    self._compute(prefix)
+
+    def _compute(self, parent: str) -> tuple[str, ...]:
+        matches = [b for b in self.children if parent in b]
+        if self.expand is not None:
+            matches = self.expand(parent, matches)
+        self._map[parent] = tuple(matches)
+        return self._map[parent]
+
+    def _lookup(self, parent: str) -> tuple[str, ...]:
+        builders = self._map.get(parent)
+        if builders is None:
+            builders = self._compute(parent)
+        return builders
+
+    def get(self, parent: str) -> list[str]:
+        return list(self._lookup(parent))
+
+    def has(self, parent: str) -> bool:
+        return len(self._lookup(parent)) > 0
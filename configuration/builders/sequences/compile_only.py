@@ -5,11 +5,17 @@ from configuration.builders.infra.runtime import (
     DockerConfig,
     InContainer,
 )
-from configuration.steps.commands.compile import MAKE, CompileMakeCommand
+from configuration.builders.sequences.helpers import ninja_log_report
+from configuration.steps.commands.compile import (
+    MAKE,
+    CompileCMakeCommand,
+    CompileMakeCommand,
+)
 from configuration.steps.commands.configure import ConfigureMariaDBCMake
 from configuration.steps.commands.download import GitInitFromCommit
 from configuration.steps.generators.cmake.generator import CMakeGenerator
 from configuration.steps.generators.cmake.options import (
+    BUILDTOOLS,
     CMAKE,
     OTHER,
     PLUGIN,
@@ -24,6 +30,7 @@ from configuration.steps.remote import ShellStep
 def nopart_debug(
     config,
     jobs,
+    build_tool: BUILDTOOLS = None,
 ):
     ### INIT
     sequence = BuildSequence()
@@ -31,6 +38,7 @@ def nopart_debug(
     for step in steps_compile_only(
         config,
         jobs,
+        build_tool=build_tool,
         cmake_step_name="Debug - No Partition",
         cmake_flags=[
             CMakeOption(CMAKE.BUILD_TYPE, BuildType.DEBUG),
@@ -45,6 +53,7 @@ def nopart_debug(
 def minimal(
     config,
     jobs,
+    build_tool: BUILDTOOLS = None,
 ):
     ### INIT
     sequence = BuildSequence()
@@ -52,6 +61,7 @@ def minimal(
     for step in steps_compile_only(
         config,
         jobs,
+        build_tool=build_tool,
         cmake_step_name="Minimal",
         cmake_flags=[
             CMakeOption(WITH.NONE, True),
@@ -73,6 +83,7 @@ def minimal(
 def no_perf_schema(
     config,
     jobs,
+    build_tool: BUILDTOOLS = None,
 ):
     ### INIT
     sequence = BuildSequence()
@@ -80,6 +91,7 @@ def no_perf_schema(
     for step in steps_compile_only(
         config,
         jobs,
+        build_tool=build_tool,
         cmake_step_name="No Perf Schema",
         cmake_flags=[
             CMakeOption(CMAKE.INSTALL_PREFIX, PurePath("/usr/local/mysql")),
@@ -97,6 +109,7 @@ def no_perf_schema(
 def without_server(
     config,
     jobs,
+    build_tool: BUILDTOOLS = None,
 ):
     ### INIT
     sequence = BuildSequence()
@@ -104,6 +117,7 @@ def without_server(
     for step in steps_compile_only(
         config,
         jobs,
+        build_tool=build_tool,
         cmake_step_name="Without Server",
         cmake_flags=[
             CMakeOption(WITHOUT.SERVER, True),
@@ -119,7 +133,14 @@ def steps_compile_only(
     jobs: int,
     cmake_flags: list[CMakeOption],
     cmake_step_name: str,
+    build_tool: BUILDTOOLS = None,
 ):
+    """
+    Checkout, configure and compile steps of the compile only builders.
+    Args:
+        build_tool: The CMake generator, e.g. BUILDTOOLS.NINJA, built with
+            cmake --build. Default is None, Makefiles built with make.
+    """
     ### INIT
     steps = []
 
@@ -142,23 +163,36 @@ def steps_compile_only(
                         cmake_generator=CMakeGenerator(
                             use_ccache=True,
                             flags=cmake_flags,
+                            build_tool=build_tool,
                         ),
                     ),
                 ),
                 docker_environment=config,
             ),
-            InContainer(
-                ShellStep(
-                    command=CompileMakeCommand(
-                        option=MAKE.COMPILE,
-                        jobs=jobs,
-                        output_sync=True,
-                        verbose=True,
-                    )
-                ),
-                docker_environment=config,
-            ),
         ]
     )
+    if build_tool:
+        compile_command = CompileCMakeCommand(jobs=jobs, verbose=True)
+    else:
+        compile_command = CompileMakeCommand(
+            option=MAKE.COMPILE,
+            jobs=jobs,
+            output_sync=True,
+            verbose=True,
+        )
+    steps.append(
+        InContainer(
+            ShellStep(command=compile_command),
+            docker_environment=config,
+        )
+    )
+    if build_tool == BUILDTOOLS.NINJA:
+        steps.append(
+            ninja_log_report(
+                step_wrapping_fn=lambda step: InContainer(
+                    docker_environment=config, step=step, container_commit=False
+                ),
+            )
+        )
 
     return steps
@@ -16,6 +16,7 @@ from configuration.steps.commands.util import (
 from configuration.steps.generators.cmake.generator import CMakeGenerator
 from configuration.steps.generators.cmake.options import (
     CMAKE,
+    LINKER,
     PLUGIN,
     WITH,
     BuildType,
@@ -31,6 +32,7 @@ MTR_PATH_TO_SAVE_LOGS = PurePath("/home/buildbot/mtr/logs")
 def openssl_fips(
     config,
     jobs,
+    linker: LINKER = None,
 ):
     ### INIT
     sequence = BuildSequence()
@@ -81,6 +83,7 @@ def openssl_fips(
                             CMakeOption(PLUGIN.COLUMNSTORE_STORAGE_ENGINE, False),
                             CMakeOption(PLUGIN.CONNECT_STORAGE_ENGINE, False),
                         ],
+                        linker=linker,
                     ),
                 ),
                 options=StepOptions(descriptionDone="Configure"),
@@ -1,9 +1,10 @@
 import os
 from pathlib import PurePath
 
-from configuration.builders.infra.runtime import InContainer
+from configuration.builders.infra.runtime import InContainer, ParallelGroup
 from configuration.steps.base import StepOptions
 from configuration.steps.commands.base import URL
+from configuration.steps.commands.compile import NinjaLogReport, parse_ninja_report
 from configuration.steps.commands.mtr import MTRReporter, MTRTest
 from configuration.steps.commands.util import (
     CreateS3Bucket,
@@ -18,7 +19,7 @@ from configuration.steps.generators.mtr.options import (
     TestSuiteCollection,
 )
 from configuration.steps.master import MasterShellStep
-from configuration.steps.remote import ShellStep
+from configuration.steps.remote import PropsFromShellStep, ShellStep
 from utils import hasFailed
 
 MTR_PATH_TO_SAVE_LOGS = PurePath("/home/buildbot/mtr/logs")
@@ -285,67 +286,74 @@ def add_test_suites_steps(
     test_galera=False,
     test_rocksdb=False,
     test_s3=False,
+    parallel=False,
 ):
-    steps = []
-    steps.extend(
-        get_mtr_normal_steps(
+    """
+    The MTR suites of a release builder, followed by saving the logs of failed tests
+    and reporting the results.
+    With parallel, the suites run at the same time, each in a container of its own,
+    as the branches of a ParallelGroup. The jobs of the builder are then split
+    between the suites, so they stay within the jobs claimed by the build. The S3
+    bucket is created before the group and deleted after it.
+    """
+
+    def wrap(step):
+        return InContainer(docker_environment=config, step=step)
+
+    if parallel:
+        jobs = max(1, jobs // (1 + test_s3 + test_rocksdb + test_galera))
+
+    suites = {
+        "normal": get_mtr_normal_steps(
             jobs=jobs,
             path_to_test_runner=MTR_RUNNER_PATH,
             halt_on_failure=False,
-            step_wrapping_fn=lambda step: InContainer(
-                docker_environment=config, step=step
-            ),
+            step_wrapping_fn=wrap,
         )
-    )
+    }
     if test_s3:
-        steps.extend(
-            get_mtr_s3_steps(
-                jobs=jobs,
-                path_to_test_runner=MTR_RUNNER_PATH,
-                halt_on_failure=False,
-                step_wrapping_fn=lambda step: InContainer(
-                    docker_environment=config, step=step
-                ),
-            )
+        suites["s3"] = get_mtr_s3_steps(
+            jobs=jobs,
+            path_to_test_runner=MTR_RUNNER_PATH,
+            halt_on_failure=False,
+            step_wrapping_fn=wrap,
         )
     if test_rocksdb:
-        steps.extend(
-            get_mtr_rocksdb_steps(
-                jobs=jobs,
-                path_to_test_runner=MTR_RUNNER_PATH,
-                halt_on_failure=False,
-                step_wrapping_fn=lambda step: InContainer(
-                    docker_environment=config, step=step
-                ),
-            )
+        suites["rocksdb"] = get_mtr_rocksdb_steps(
+            jobs=jobs,
+            path_to_test_runner=MTR_RUNNER_PATH,
+            halt_on_failure=False,
+            step_wrapping_fn=wrap,
         )
     if test_galera:
-        steps.extend(
-            get_mtr_galera_steps(
-                jobs=jobs,
-                path_to_test_runner=MTR_RUNNER_PATH,
-                halt_on_failure=False,
-                step_wrapping_fn=lambda step: InContainer(
-                    docker_environment=config, step=step
-                ),
-            )
+        suites["galera"] = get_mtr_galera_steps(
+            jobs=jobs,
+            path_to_test_runner=MTR_RUNNER_PATH,
+            halt_on_failure=False,
+            step_wrapping_fn=wrap,
         )
 
-    steps.append(
-        save_mtr_logs(
-            step_wrapping_fn=lambda step: InContainer(
-                docker_environment=config, step=step
-            ),
+    steps = []
+    if parallel:
+        group = ParallelGroup(
+            name="MTR suites",
+            options=StepOptions(haltOnFailure=False, descriptionDone="MTR suites"),
         )
-    )
+        steps_after = []
+        for name, suite_steps in suites.items():
+            container_steps = [s for s in suite_steps if isinstance(s, InContainer)]
+            first = suite_steps.index(container_steps[0])
+            steps.extend(suite_steps[:first])
+            group.add_branch(name, container_steps)
+            steps_after.extend(suite_steps[first + len(container_steps) :])
+        steps.append(group)
+        steps.extend(steps_after)
+    else:
+        for suite_steps in suites.values():
+            steps.extend(suite_steps)
 
-    steps.append(
-        mtr_reporter(
-            step_wrapping_fn=lambda step: InContainer(
-                docker_environment=config, step=step
-            ),
-        )
-    )
+    steps.append(save_mtr_logs(step_wrapping_fn=wrap))
+    steps.append(mtr_reporter(step_wrapping_fn=wrap))
 
     return steps
 
@@ -391,3 +399,21 @@ def mtr_reporter(
             warn_on_fail=True,
         ),
     )
+
+
+def ninja_log_report(
+    builddir: str = ".",
+    step_wrapping_fn=lambda step: step,
+):
+    """
+    Report the targets built by the last ninja run of builddir, the slowest first.
+    The report is in the step log and in the ninja_* build properties, see
+    parse_ninja_report. Only for builds configured with BUILDTOOLS.NINJA.
+    """
+    return step_wrapping_fn(
+        PropsFromShellStep(
+            command=NinjaLogReport(builddir=builddir),
+            extract_fn=parse_ninja_report,
+            options=StepOptions(alwaysRun=True, haltOnFailure=False),
+        ),
+    )
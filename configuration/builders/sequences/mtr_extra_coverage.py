@@ -1,15 +1,24 @@
 from pathlib import PurePath
 
 from configuration.builders.infra.runtime import BuildSequence, InContainer
-from configuration.builders.sequences.helpers import mtr_reporter, save_mtr_logs
+from configuration.builders.sequences.helpers import (
+    mtr_reporter,
+    ninja_log_report,
+    save_mtr_logs,
+)
 from configuration.steps.base import StepOptions
-from configuration.steps.commands.compile import MAKE, CompileMakeCommand
+from configuration.steps.commands.compile import (
+    MAKE,
+    CompileCMakeCommand,
+    CompileMakeCommand,
+)
 from configuration.steps.commands.configure import ConfigureMariaDBCMake
 from configuration.steps.commands.download import FetchTarball
 from configuration.steps.commands.mtr import MTRTest
 from configuration.steps.commands.util import PrintEnvironmentDetails
 from configuration.steps.generators.cmake.generator import CMakeGenerator
 from configuration.steps.generators.cmake.options import (
+    BUILDTOOLS,
     CMAKE,
     PLUGIN,
     BuildType,
@@ -22,7 +31,7 @@ from configuration.steps.remote import ShellStep
 MTR_PATH_TO_SAVE_LOGS = PurePath("/home/buildbot/mtr/logs")
 
 
-def big_test(config, jobs):
+def big_test(config, jobs, build_tool: BUILDTOOLS = None):
     sequence = BuildSequence()
     sequence.add_step(ShellStep(command=PrintEnvironmentDetails()))
     sequence.add_step(
@@ -52,6 +61,7 @@ def big_test(config, jobs):
                             CMakeOption(PLUGIN.SPIDER_STORAGE_ENGINE, False),
                             CMakeOption(PLUGIN.SPHINX_STORAGE_ENGINE, False),
                         ],
+                        build_tool=build_tool,
                     ),
                 ),
                 options=StepOptions(
@@ -61,23 +71,37 @@ def big_test(config, jobs):
             ),
         )
     )
+    if build_tool:
+        tool = "CMake build"
+        compile_command = CompileCMakeCommand(jobs=jobs, verbose=True)
+    else:
+        tool = "MAKE"
+        compile_command = CompileMakeCommand(
+            option=MAKE.COMPILE,
+            jobs=jobs,
+            verbose=True,
+            output_sync=True,
+        )
     sequence.add_step(
         InContainer(
             docker_environment=config,
             step=ShellStep(
-                command=CompileMakeCommand(
-                    option=MAKE.COMPILE,
-                    jobs=jobs,
-                    verbose=True,
-                    output_sync=True,
-                ),
+                command=compile_command,
                 options=StepOptions(
-                    description="Running MAKE compile",
-                    descriptionDone="MAKE compile done",
+                    description=f"Running {tool} compile",
+                    descriptionDone=f"{tool} compile done",
                 ),
             ),
         )
     )
+    if build_tool == BUILDTOOLS.NINJA:
+        sequence.add_step(
+            ninja_log_report(
+                step_wrapping_fn=lambda step: InContainer(
+                    docker_environment=config, step=step, container_commit=False
+                ),
+            )
+        )
 
     sequence.add_step(
         InContainer(
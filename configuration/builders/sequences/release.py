@@ -40,6 +40,7 @@ def deb_autobake(
     test_galera=False,
     test_rocksdb=False,
     test_s3=False,
+    parallel_tests=False,
 ):
     ### INIT
     MTR_RUNNER_PATH = PurePath("/usr/share/mariadb/mariadb-test")
@@ -119,6 +120,7 @@ def deb_autobake(
         test_galera=test_galera,
         test_rocksdb=test_rocksdb,
         test_s3=test_s3,
+        parallel=parallel_tests,
     ):
         sequence.add_step(step)
 
@@ -166,6 +168,7 @@ def rpm_autobake(
     test_rocksdb=False,
     test_s3=False,
     srpm_config=None,
+    parallel_tests=False,
 ):
 
     ### INIT
@@ -305,6 +308,7 @@ def rpm_autobake(
         test_galera=test_galera,
         test_rocksdb=test_rocksdb,
         test_s3=test_s3,
+        parallel=parallel_tests,
     ):
         sequence.add_step(step)
 
@@ -10,6 +10,7 @@ from configuration.builders.sequences.helpers import (
     get_mtr_s3_steps,
     get_mtr_spider_steps,
     mtr_reporter,
+    ninja_log_report,
     save_mtr_logs,
 )
 from configuration.steps.base import StepOptions
@@ -20,7 +21,9 @@ from configuration.steps.commands.util import PrintEnvironmentDetails
 from configuration.steps.generators.cmake.compilers import ClangCompiler
 from configuration.steps.generators.cmake.generator import CMakeGenerator
 from configuration.steps.generators.cmake.options import (
+    BUILDTOOLS,
     CMAKE,
+    LINKER,
     PLUGIN,
     WITH,
     BuildType,
@@ -34,6 +37,8 @@ def asan_ubsan(
     config: DockerConfig,
     jobs: int,
     isDebugBuildType: bool,
+    build_tool: BUILDTOOLS = None,
+    linker: LINKER = None,
 ):
     sequence = BuildSequence()
 
@@ -90,6 +95,8 @@ def asan_ubsan(
                         flags=flags,
                         source_path="../src",
                         compiler=ClangCompiler(),
+                        build_tool=build_tool,
+                        linker=linker,
                     ),
                 ),
                 options=StepOptions(descriptionDone="Configure"),
@@ -110,6 +117,15 @@ def asan_ubsan(
             ),
         )
     )
+    if build_tool == BUILDTOOLS.NINJA:
+        sequence.add_step(
+            ninja_log_report(
+                builddir="bld",
+                step_wrapping_fn=lambda step: InContainer(
+                    docker_environment=config, step=step, container_commit=False
+                ),
+            )
+        )
 
     env_vars = [
         (
@@ -186,6 +202,8 @@ def msan(
     config: DockerConfig,
     jobs: int,
     isDebugBuildType: bool,
+    build_tool: BUILDTOOLS = None,
+    linker: LINKER = None,
 ):
     sequence = BuildSequence()
 
@@ -234,6 +252,8 @@ def msan(
                         flags=flags,
                         source_path="../src",
                         compiler=ClangCompiler(),
+                        build_tool=build_tool,
+                        linker=linker,
                     ),
                 ),
                 options=StepOptions(descriptionDone="Configure"),
@@ -254,6 +274,15 @@ def msan(
             ),
         )
     )
+    if build_tool == BUILDTOOLS.NINJA:
+        sequence.add_step(
+            ninja_log_report(
+                builddir="bld",
+                step_wrapping_fn=lambda step: InContainer(
+                    docker_environment=config, step=step, container_commit=False
+                ),
+            )
+        )
 
     env_vars = [
         (
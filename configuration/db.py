@@ -0,0 +1,8 @@
+import sqlalchemy as sa
+
+
+def select_columns(*columns):
+    # SQLAlchemy 1.3 takes a list of columns, 2.x only positional columns
+    if sa.__version__.startswith("1.3"):
+        return sa.select(list(columns))
+    return sa.select(*columns)
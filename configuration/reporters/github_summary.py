@@ -1,13 +1,21 @@
+from typing import Optional
+
 from configuration.workers.worker import WorkerPool
 
 SUMMARY_FILE_NAME = "checkconfig_summary.md"
 
 
+def format_memory(memory: Optional[int]) -> str:
+    if memory is None:
+        return "-"
+    return f"{memory / 1024:g}G"
+
+
 def workers_load(worker_pool: WorkerPool) -> None:
     """
-    Shows allocated and total jobs (CPU's) for each worker in the pool.
-    Then a detail is shown with each builder and the jobs it has requested from
-    the worker.
+    Shows allocated and total jobs (CPU's) and memory for each worker in the pool.
+    Then a detail is shown with each builder and the jobs and memory it has requested
+    from the worker.
     The output is written in markdown format to SUMMARY_FILE_NAME.
     """
     with open(SUMMARY_FILE_NAME, "a") as f:
@@ -15,27 +23,43 @@ def workers_load(worker_pool: WorkerPool) -> None:
         for arch in worker_pool.workers:
 
             f.write(f"### Arch: {arch}\n")
-            f.write("| Worker | Total Jobs | Requested Jobs |\n")
-            f.write("|-------------|------------|----------------|\n")
+            f.write(
+                "| Worker | Total Jobs | Requested Jobs | Total Memory | Requested Memory |\n"
+            )
+            f.write(
+                "|-------------|------------|----------------|--------------|------------------|\n"
+            )
             for worker in worker_pool.workers[arch]:
                 requested_jobs = worker.requested_jobs
                 total_jobs = worker.total_jobs
+                requested_memory = worker.requested_memory
+                total_memory = worker.total_memory
 
                 # Add warning if requested_jobs exceeds total_jobs
                 warning = "⚠️ " if requested_jobs > total_jobs else ""
+                # Same for memory, when the worker declares it
+                memory_warning = (
+                    "⚠️ "
+                    if total_memory is not None and requested_memory > total_memory
+                    else ""
+                )
 
                 f.write(
-                    f"| {worker.name} | {total_jobs} | {warning}{requested_jobs} |\n"
+                    f"| {worker.name} | {total_jobs} | {warning}{requested_jobs} "
+                    f"| {format_memory(total_memory)} "
+                    f"| {memory_warning}{format_memory(requested_memory)} |\n"
                 )
 
             f.write("\n### Builders Assigned\n")
-            f.write("| Worker | Builder | Requested Jobs |\n")
-            f.write("|-------------|---------|----------------|\n")
+            f.write("| Worker | Builder | Requested Jobs | Requested Memory |\n")
+            f.write("|-------------|---------|----------------|------------------|\n")
             for worker in worker_pool.workers[arch]:
                 if worker.builders:
                     for builder_name, requested_jobs in worker.builders.items():
+                        requested_memory = worker.builders_memory.get(builder_name)
                         f.write(
-                            f"| {worker.name} | {builder_name} | {requested_jobs} |\n"
+                            f"| {worker.name} | {builder_name} | {requested_jobs} "
+                            f"| {format_memory(requested_memory)} |\n"
                         )
                 else:
-                    f.write(f"| {worker.name} | None | None |\n")
+                    f.write(f"| {worker.name} | None | None | None |\n")
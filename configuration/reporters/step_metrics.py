@@ -0,0 +1,251 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from twisted.internet import defer
+from twisted.python import log
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+from buildbot import config
+from buildbot.util import service
+from configuration.workers.base import worker_host
+
+try:
+    from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+    from prometheus_client.twisted import MetricsResource
+except ImportError:
+    CollectorRegistry = None
+
+STEP_METRICS_NAME = "step_metrics"
+STEP_METRICS_PORT = 9101
+
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400)
+MEMORY_BUCKETS = tuple(2**power * 1024**2 for power in range(6, 17))
+LABELS = ("builder", "step", "worker")
+# Build properties set by processor_ccache_stats, as counters by builder and host
+CCACHE_COUNTERS = {
+    "ccache_hits": "Compilations found in ccache",
+    "ccache_misses": "Compilations not found in ccache",
+    "ccache_remote_hits": "Compilations found in the ccache remote storage",
+    "ccache_cleanups": "ccache cleanups, evicting files over the cache size limit",
+}
+
+
+def _epoch(value) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+@dataclass
+class RunningStep:
+    """
+    A step between its start and finish.
+    Attributes:
+        started_at (float): Start of the step, epoch.
+        labels (dict): builder, step and worker, once looked up.
+        complete_at (float): End of the step, epoch, once finished.
+    """
+
+    started_at: float
+    labels: Optional[dict] = None
+    complete_at: Optional[float] = None
+
+
+class StepMetrics(service.BuildbotService):
+    """
+    Exports the duration of every build step as a Prometheus histogram on
+    http://<master>:<port>/metrics, labelled by builder, step name and worker.
+    The share of a step in the builds of a builder, e.g.:
+        sum by (step) (buildbot_step_duration_seconds_sum{builder="amd64-compile-only"})
+        / ignoring(step) group_left
+        sum(buildbot_step_duration_seconds_sum{builder="amd64-compile-only"})
+    The InContainer steps report the CPU time and the peak memory of their container,
+    read from its cgroup on the worker (see container_usage.sh), whatever the kind of
+    worker and container. The steps of a ParallelGroup report under their own name.
+    The ccache statistics of the finished builds (see processor_ccache_stats) are
+    counted by builder and worker host, with the size of the cache of each host, for
+    the ccache hit rates:
+        sum by (builder, host) (rate(buildbot_ccache_hits_total[1d]))
+        / (sum by (builder, host) (rate(buildbot_ccache_hits_total[1d]))
+          + sum by (builder, host) (rate(buildbot_ccache_misses_total[1d])))
+    The histograms are kept through reconfigs.
+    Args:
+        port (int, optional): Port of the /metrics endpoint.
+        interface (str, optional): Interface the endpoint listens on, all by default.
+    """
+
+    name = STEP_METRICS_NAME
+
+    def __init__(self, *args, **kwargs):
+        self.registry = None
+        self._steps: dict[int, RunningStep] = {}
+        self._consumers = []
+        self._server = None
+        self._listening = None
+        super().__init__(*args, **kwargs)
+
+    def checkConfig(self, port: int = STEP_METRICS_PORT, interface: str = ""):
+        if CollectorRegistry is None:
+            config.error("StepMetrics: prometheus_client is not installed")
+
+    @defer.inlineCallbacks
+    def reconfigService(self, port: int = STEP_METRICS_PORT, interface: str = ""):
+        if self.registry is None:
+            self._create_metrics()
+        if self.running and self._listening != (port, interface):
+            yield self._stop_listening()
+            self._listen(port, interface)
+        self.port, self.interface = port, interface
+
+    def _create_metrics(self):
+        self.registry = CollectorRegistry()
+        self.step_duration = Histogram(
+            "buildbot_step_duration_seconds",
+            "Duration of the build steps",
+            LABELS,
+            buckets=DURATION_BUCKETS,
+            registry=self.registry,
+        )
+        self.container_cpu = Histogram(
+            "buildbot_step_container_cpu_seconds",
+            "CPU time used by the container of the InContainer steps",
+            LABELS,
+            buckets=DURATION_BUCKETS,
+            registry=self.registry,
+        )
+        self.container_memory = Histogram(
+            "buildbot_step_container_memory_peak_bytes",
+            "Peak memory of the container of the InContainer steps",
+            LABELS,
+            buckets=MEMORY_BUCKETS,
+            registry=self.registry,
+        )
+        self.ccache_counters = {
+            prop: Counter(
+                f"buildbot_{prop}",
+                documentation,
+                ("builder", "host"),
+                registry=self.registry,
+            )
+            for prop, documentation in CCACHE_COUNTERS.items()
+        }
+        self.ccache_size = Gauge(
+            "buildbot_ccache_size_bytes",
+            "Size of the ccache of a host after the last build",
+            ("host",),
+            registry=self.registry,
+        )
+
+    @defer.inlineCallbacks
+    def startService(self):
+        yield super().startService()
+        for key, handler in (
+            (("steps", None, "started"), self._on_step_started),
+            (("steps", None, "finished"), self._on_step_finished),
+            (("builds", None, "finished"), self._on_build_finished),
+        ):
+            consumer = yield self.master.mq.startConsuming(handler, key)
+            self._consumers.append(consumer)
+        self._listen(self.port, self.interface)
+
+    @defer.inlineCallbacks
+    def stopService(self):
+        for consumer in self._consumers:
+            consumer.stopConsuming()
+        self._consumers = []
+        yield self._stop_listening()
+        yield super().stopService()
+
+    def _listen(self, port: int, interface: str):
+        root = Resource()
+        root.putChild(b"metrics", MetricsResource(registry=self.registry))
+        self._server = self.master.reactor.listenTCP(
+            port, Site(root), interface=interface
+        )
+        self._listening = (port, interface)
+
+    def _stop_listening(self):
+        server, self._server, self._listening = self._server, None, None
+        if server is None:
+            return defer.succeed(None)
+        return defer.maybeDeferred(server.stopListening)
+
+    @defer.inlineCallbacks
+    def _describe(self, step: dict):
+        """The builder, step and worker labels of a step."""
+        data = self.master.data
+        build = yield data.get(("builds", step["buildid"]))
+        builder = yield data.get(("builders", build["builderid"]))
+        worker = yield data.get(("workers", build["workerid"]))
+        return {
+            "builder": builder["name"],
+            "step": step["name"],
+            "worker": worker["name"],
+        }
+
+    @defer.inlineCallbacks
+    def _on_step_started(self, key: tuple, step: dict):
+        running = RunningStep(started_at=_epoch(step["started_at"]))
+        self._steps[step["stepid"]] = running
+        try:
+            running.labels = yield self._describe(step)
+        except Exception as e:
+            self._steps.pop(step["stepid"], None)
+            log.err(e, "while describing a step for its metrics")
+            return
+        if running.complete_at is not None:
+            # Finished while it was being described
+            self._steps.pop(step["stepid"], None)
+            self._record(running)
+
+    def _on_step_finished(self, key: tuple, step: dict):
+        running = self._steps.get(step["stepid"])
+        if running is None:
+            return
+        running.complete_at = _epoch(step["complete_at"])
+        if running.labels is not None:
+            del self._steps[step["stepid"]]
+            self._record(running)
+
+    def _record(self, running: RunningStep):
+        self.step_duration.labels(**running.labels).observe(
+            max(running.complete_at - running.started_at, 0)
+        )
+
+    def record_container_usage(
+        self,
+        builder: str,
+        step: str,
+        worker: str,
+        cpu_seconds: Optional[float] = None,
+        memory_peak_bytes: Optional[float] = None,
+    ):
+        """Observes the container usage reported by an InContainer step."""
+        labels = {"builder": builder, "step": step, "worker": worker}
+        if cpu_seconds is not None:
+            self.container_cpu.labels(**labels).observe(cpu_seconds)
+        if memory_peak_bytes is not None:
+            self.container_memory.labels(**labels).observe(memory_peak_bytes)
+
+    @defer.inlineCallbacks
+    def _on_build_finished(self, key: tuple, build: dict):
+        try:
+            properties = yield self.master.data.get(
+                ("builds", build["buildid"], "properties")
+            )
+            if "ccache_hits" not in properties:
+                return
+            builder = yield self.master.data.get(("builders", build["builderid"]))
+            worker = yield self.master.data.get(("workers", build["workerid"]))
+        except Exception as e:
+            log.err(e, "while reading the ccache statistics of a build")
+            return
+        host = worker_host(worker["name"])
+        for prop, counter in self.ccache_counters.items():
+            if prop in properties:
+                value, _ = properties[prop]
+                counter.labels(builder=builder["name"], host=host).inc(value)
+        if "ccache_size" in properties:
+            self.ccache_size.labels(host=host).set(properties["ccache_size"][0])
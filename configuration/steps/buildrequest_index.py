@@ -0,0 +1,225 @@
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from twisted.internet import defer
+from twisted.python import log
+
+from configuration.db import select_columns
+
+
+def pending_buildrequest_sourcestamps(
+    conn, model, builderid: Optional[int] = None
+) -> list[dict]:
+    """
+    Fetches the incomplete buildrequests with the sourcestamps of their buildset, in a
+    single query joining buildrequests, buildrequest_claims, buildset_sourcestamps and
+    sourcestamps.
+    Args:
+        conn: A SQLAlchemy connection to the Buildbot database.
+        model: The Buildbot database model (master.db.model).
+        builderid (int, optional): Only return the buildrequests of this builder.
+    Returns:
+        list[dict]: One dict per buildrequest with buildrequestid, buildsetid, builderid,
+            claimed, complete and sourcestamps (branch, repository, revision, codebase).
+    """
+    br = model.buildrequests
+    claims = model.buildrequest_claims
+    bs_ss = model.buildset_sourcestamps
+    ss = model.sourcestamps
+
+    query = (
+        select_columns(
+            br.c.id,
+            br.c.buildsetid,
+            br.c.builderid,
+            claims.c.claimed_at,
+            ss.c.branch,
+            ss.c.repository,
+            ss.c.revision,
+            ss.c.codebase,
+        )
+        .select_from(
+            br.outerjoin(claims, claims.c.brid == br.c.id)
+            .join(bs_ss, bs_ss.c.buildsetid == br.c.buildsetid)
+            .join(ss, ss.c.id == bs_ss.c.sourcestampid)
+        )
+        .where(br.c.complete == 0)
+        .order_by(br.c.id)
+    )
+    if builderid is not None:
+        query = query.where(br.c.builderid == builderid)
+
+    with conn.begin():
+        rows = conn.execute(query).fetchall()
+
+    buildrequests = {}
+    for row in rows:
+        br_dict = buildrequests.setdefault(
+            row.id,
+            {
+                "buildrequestid": row.id,
+                "buildsetid": row.buildsetid,
+                "builderid": row.builderid,
+                "claimed": row.claimed_at is not None,
+                "complete": False,
+                "sourcestamps": [],
+            },
+        )
+        br_dict["sourcestamps"].append(
+            {
+                "branch": row.branch,
+                "repository": row.repository,
+                "revision": row.revision,
+                "codebase": row.codebase,
+            }
+        )
+    return list(buildrequests.values())
+
+
+class RevisionIndex:
+    """
+    In-memory index of the incomplete buildrequests by sourcestamp revision.
+    It is seeded once from the database, then kept up to date from the buildrequests and
+    buildsets MQ events, which the multi-master MQ (wamp) delivers from every master.
+    Finding the pending duplicates of a revision on a builder then needs no database or
+    data API round trip.
+    Attributes:
+        ready (bool): True once the index is seeded and consuming events.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._master = None
+        self._seeding = False
+        self._completed_while_seeding: set[int] = set()
+        self._buildrequests: dict[int, dict] = {}
+        self._buildset_requests: dict[int, set[int]] = defaultdict(set)
+        self._sourcestamps: dict[int, list[dict]] = {}
+        self._by_revision: dict[str, set[int]] = defaultdict(set)
+
+    @defer.inlineCallbacks
+    def watch(self, master):
+        """Starts consuming events and seeds the index, once per master."""
+        if self._master is master:
+            return
+        self._master = master
+        self._seeding = True
+        consumers = []
+        try:
+            for callback, topic in (
+                (self._on_buildrequest, ("buildrequests", None, None)),
+                (self._on_buildset, ("buildsets", None, None)),
+            ):
+                consumer = yield master.mq.startConsuming(callback, topic)
+                consumers.append(consumer)
+            pending = yield master.db.pool.do(
+                pending_buildrequest_sourcestamps, master.db.model
+            )
+        except Exception as e:
+            log.err(e, "while seeding the buildrequest revision index")
+            for consumer in consumers:
+                consumer.stopConsuming()
+            self._master = None
+            return
+        finally:
+            self._seeding = False
+
+        for br in pending:
+            if br["buildrequestid"] not in self._completed_while_seeding:
+                self.add_buildrequest(br)
+                self.add_buildset(br["buildsetid"], br["sourcestamps"])
+        self._completed_while_seeding.clear()
+        self.ready = True
+
+    def _on_buildrequest(self, key: tuple, msg: dict):
+        event = key[-1]
+        if event == "new":
+            self.add_buildrequest(msg)
+        elif event == "complete":
+            self.remove_buildrequest(msg["buildrequestid"])
+        elif event in ("claimed", "unclaimed"):
+            br = self._buildrequests.get(msg["buildrequestid"])
+            if br is not None:
+                br["claimed"] = event == "claimed"
+
+    def _on_buildset(self, key: tuple, msg: dict):
+        event = key[-1]
+        if event == "new":
+            self.add_buildset(msg["bsid"], msg.get("sourcestamps", []))
+        elif event == "complete":
+            self.remove_buildset(msg["bsid"])
+
+    def add_buildrequest(self, br: dict):
+        brid = br["buildrequestid"]
+        self._buildrequests[brid] = {
+            "buildrequestid": brid,
+            "buildsetid": br["buildsetid"],
+            "builderid": br["builderid"],
+            "claimed": bool(br.get("claimed")),
+            "complete": False,
+        }
+        self._buildset_requests[br["buildsetid"]].add(brid)
+
+    def add_buildset(self, buildsetid: int, sourcestamps: Iterable[dict]):
+        # The buildset and buildrequests events of a new buildset come in any order,
+        # the sourcestamps wait for the buildrequests (or the buildset completion)
+        if buildsetid in self._sourcestamps:
+            return
+        self._sourcestamps[buildsetid] = [
+            {k: ss.get(k) for k in ("branch", "repository", "revision", "codebase")}
+            for ss in sourcestamps
+        ]
+        for ss in sourcestamps:
+            if ss.get("revision") is not None:
+                self._by_revision[ss["revision"]].add(buildsetid)
+
+    def remove_buildrequest(self, brid: int):
+        if self._seeding:
+            self._completed_while_seeding.add(brid)
+        br = self._buildrequests.pop(brid, None)
+        if br is None:
+            return
+        buildsetid = br["buildsetid"]
+        self._buildset_requests[buildsetid].discard(brid)
+        if not self._buildset_requests[buildsetid]:
+            self.remove_buildset(buildsetid)
+
+    def remove_buildset(self, buildsetid: int):
+        for brid in self._buildset_requests.pop(buildsetid, ()):
+            self._buildrequests.pop(brid, None)
+        for ss in self._sourcestamps.pop(buildsetid, []):
+            revision_buildsets = self._by_revision.get(ss["revision"])
+            if revision_buildsets is not None:
+                revision_buildsets.discard(buildsetid)
+                if not revision_buildsets:
+                    del self._by_revision[ss["revision"]]
+
+    def pending_count(self, builderid: int) -> int:
+        return sum(br["builderid"] == builderid for br in self._buildrequests.values())
+
+    def lookup(self, builderid: int, revisions: Iterable[str]) -> list[dict]:
+        """
+        Returns the incomplete buildrequests of a builder whose buildset has a
+        sourcestamp with one of the given revisions.
+        Args:
+            builderid (int): The builder id.
+            revisions (Iterable[str]): The revisions to look for.
+        Returns:
+            list[dict]: Same format as pending_buildrequest_sourcestamps().
+        """
+        buildsetids = set()
+        for revision in revisions:
+            buildsetids |= self._by_revision.get(revision, set())
+
+        matches = []
+        for buildsetid in sorted(buildsetids):
+            for brid in sorted(self._buildset_requests.get(buildsetid, ())):
+                br = self._buildrequests[brid]
+                if br["builderid"] == builderid:
+                    matches.append(
+                        {**br, "sourcestamps": self._sourcestamps[buildsetid]}
+                    )
+        return matches
+
+
+REVISION_INDEX = RevisionIndex()
@@ -1,21 +1,93 @@
+import os
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from pathlib import Path, PurePath
 
 from twisted.internet import defer
 
-from buildbot.plugins import steps, util
+from buildbot.plugins import steps
+from buildbot.process import buildstep, logobserver
 from buildbot.process.properties import Interpolate
+from buildbot.process.results import (
+    CANCELLED,
+    EXCEPTION,
+    FAILURE,
+    SKIPPED,
+    SUCCESS,
+    Results,
+    worst_status,
+)
+from configuration.reporters.step_metrics import STEP_METRICS_NAME
 
 # Use if you need to load script files to commands
 COMMAND_SCRIPT_BASE_DIR = Path(__file__).parent / "scripts"
+# Line printed by container_usage.sh at the end of the InContainer steps
+CONTAINER_USAGE_PREFIX = "buildbot-container-usage "
+
+
+class CommandCache:
+    """
+    Caches what the commands of every builder build again at each (re)config: the
+    content of the script files, keyed by path, and the Interpolate of identical
+    command strings, shared between the steps using them. base_master_config clears
+    the cache at the start of a (re)config, so the entries only live within one
+    load of master.cfg: a script edited on disk is read again at the next
+    (re)config, never in the middle of one.
+    Attributes:
+        reads (int): Script files read from disk since the last clear.
+        hits (int): Script reads served from the cache since the last clear.
+    """
+
+    def __init__(self):
+        self._scripts: dict[str, str] = {}
+        self._interpolations: dict[str, Interpolate] = {}
+        self.reads = 0
+        self.hits = 0
+
+    def read(self, path) -> str:
+        path = os.fspath(path)
+        content = self._scripts.get(path)
+        if content is not None:
+            self.hits += 1
+            return content
+        with open(path, "r") as f:
+            content = f.read()
+        self.reads += 1
+        self._scripts[path] = content
+        return content
+
+    def interpolate(self, fmtstring: str) -> Interpolate:
+        interpolation = self._interpolations.get(fmtstring)
+        if interpolation is None:
+            interpolation = self._interpolations[fmtstring] = Interpolate(fmtstring)
+        return interpolation
+
+    def clear(self):
+        self._scripts.clear()
+        self._interpolations.clear()
+        self.reads = 0
+        self.hits = 0
+
+
+COMMAND_CACHE = CommandCache()
 
 
 def load_script(script_name) -> str:
-    script_path = COMMAND_SCRIPT_BASE_DIR / script_name
-    with open(script_path, "r") as f:
-        script = f.read()
-    return script
+    return COMMAND_CACHE.read(COMMAND_SCRIPT_BASE_DIR / script_name)
+
+
+def read_script(path) -> str:
+    """Returns the content of a script file, read once per (re)config."""
+    return COMMAND_CACHE.read(path)
+
+
+def interpolate(fmtstring: str) -> Interpolate:
+    """
+    Returns an Interpolate of a format string without arguments, the same object
+    for identical strings. Interpolate is not modified by rendering, steps can
+    share it.
+    """
+    return COMMAND_CACHE.interpolate(fmtstring)
 
 
 class Command(ABC):
@@ -76,7 +148,7 @@ class BashCommand(Command):
         return [
             "bash",
             "-exc",
-            util.Interpolate(self.cmd),
+            interpolate(self.cmd),
         ]
 
 
@@ -95,7 +167,7 @@ class PowerShellCommand(Command):
         return [
             "powershell",
             "-Command",
-            util.Interpolate(self.cmd),
+            interpolate(self.cmd),
         ]
 
 
@@ -106,14 +178,49 @@ class URL:
 
     @property
     def _url(self) -> Interpolate:
-        return util.Interpolate(self.url)
+        return interpolate(self.url)
 
     @property
     def _url_text(self) -> Interpolate:
-        return (
-            util.Interpolate(self.url_text)
-            if self.url_text
-            else util.Interpolate(self.url)
+        return interpolate(self.url_text) if self.url_text else interpolate(self.url)
+
+
+class ContainerUsageObserver(logobserver.LogLineObserver):
+    """
+    Reads the CPU time and peak memory of the container of an InContainer step,
+    printed by container_usage.sh, and hands them to the StepMetrics service of the
+    master, if it has one.
+    Attributes:
+        usage (dict[str, float]): cpu_seconds and memory_peak_bytes, None until read.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.usage = None
+
+    def outLineReceived(self, line: str):
+        if not line.startswith(CONTAINER_USAGE_PREFIX):
+            return
+        usage = {}
+        for field in line[len(CONTAINER_USAGE_PREFIX) :].split():
+            key, _, value = field.partition("=")
+            try:
+                usage[key] = float(value)
+            except ValueError:
+                continue
+        self.usage = usage
+
+    def report(self, step, step_name: str):
+        if self.usage is None:
+            return
+        step_metrics = step.master.namedServices.get(STEP_METRICS_NAME)
+        if step_metrics is None:
+            return
+        step_metrics.record_container_usage(
+            builder=step.build.builder.name,
+            step=step_name,
+            worker=step.build.getWorkerName(),
+            **self.usage,
         )
 
 
@@ -122,16 +229,22 @@ class ShellCommandWithURL(steps.ShellCommand):
     This class extend's Buildbot's base ShellCommand, to allow rendering
     an additional url in the interface.
     The URL can point to relevant artifacts for developers to use.
+    With container_usage, the container usage the command prints is reported to
+    StepMetrics, see ContainerUsageObserver.
     """
 
     # Add URL and URL text to the renderables list (use with Interpolate)
     renderables = ["url", "urlText"]
 
-    def __init__(self, url: URL = None, **kwargs):
+    def __init__(self, url: URL = None, container_usage: bool = False, **kwargs):
         super().__init__(**kwargs)
         # Need to set the url and urlText so they can be rendered
         self.url = url._url if isinstance(url, URL) else None
         self.urlText = url._url_text if isinstance(url, URL) else None
+        self.container_usage = None
+        if container_usage:
+            self.container_usage = ContainerUsageObserver()
+            self.addLogObserver("stdio", self.container_usage)
 
     # FIXME Replace start() with run() when upgrading to Buildbot 4.x
     @defer.inlineCallbacks
@@ -142,3 +255,163 @@ class ShellCommandWithURL(steps.ShellCommand):
         # Return to the original method
         res = yield super().start()
         return res
+
+    @defer.inlineCallbacks
+    def run(self):
+        res = yield super().run()
+        if self.container_usage is not None:
+            self.container_usage.report(self, self.name)
+        return res
+
+
+def format_timeline(entries: list[tuple], width: int = 60) -> str:
+    """
+    Renders when the commands of a ParallelShellCommands step ran.
+    Args:
+        entries (list[tuple]): (branch, command name, start, end, result) of each
+            command, start and end in seconds from the start of the step.
+        width (int): Width of the bars.
+    Returns:
+        str: A line per command with its offsets, duration, result and a bar.
+    """
+    if not entries:
+        return ""
+    span = max(end for _, _, _, end, _ in entries) or 1
+    label_width = max(len(f"{branch}: {name}") for branch, name, *_ in entries)
+
+    def clock(seconds: float) -> str:
+        minutes, seconds = divmod(int(seconds), 60)
+        return f"{minutes // 60}:{minutes % 60:02d}:{seconds:02d}"
+
+    lines = []
+    for branch, name, start, end, result in entries:
+        first = min(int(start / span * width), width - 1)
+        last = max(int(end / span * width), first + 1)
+        bar = " " * first + "#" * (last - first) + " " * (width - last)
+        lines.append(
+            f"{f'{branch}: {name}':<{label_width}} {clock(start)} - {clock(end)} "
+            f"{clock(end - start)} {Results[result]:<9} |{bar}|"
+        )
+    return "\n".join(lines) + "\n"
+
+
+class ParallelShellCommands(buildstep.ShellMixin, buildstep.BuildStep):
+    """
+    Runs branches of shell commands at the same time, as a single step.
+    The commands of a branch run one after the other, a branch starts once the
+    branches it depends on are done. A command failing with haltOnFailure stops its
+    branch and the branches depending on it. An exception interrupts the commands
+    of the other branches, the step ends once every branch stopped. Each command
+    logs to a log named after it, the step result is the worst result of the
+    commands and the timeline log shows when each command ran.
+    Args:
+        branches (list[dict]): The branches, after the branches they depend on. A
+            branch has a name, depends_on (branch names) and commands, each command
+            a name, haltOnFailure, container_usage (see ShellCommandWithURL) and the
+            arguments of a RemoteShellCommand (command, workdir, env, timeout,
+            interruptSignal, decodeRC).
+    """
+
+    renderables = ["branches"]
+
+    def __init__(self, branches: list[dict], **kwargs):
+        kwargs = self.setupShellMixin(kwargs)
+        super().__init__(**kwargs)
+        self.branches = branches
+        self._remote_commands = set()
+        self._aborted = False
+
+    @defer.inlineCallbacks
+    def run(self):
+        started = self.master.reactor.seconds()
+        done = {}
+        halted = set()
+        timeline = []
+        results = []
+        for branch in self.branches:
+            done[branch["name"]] = self._run_branch(
+                branch, done, halted, timeline, results, started
+            )
+        # Wait for every branch, even after one of them raised
+        outcomes = yield defer.DeferredList(list(done.values()), consumeErrors=True)
+
+        timeline.sort(key=lambda entry: entry[2])
+        yield self.addCompleteLog("timeline", format_timeline(timeline))
+        for succeeded, failure in outcomes:
+            if not succeeded:
+                failure.raiseException()
+        if self.stopped:
+            return CANCELLED
+        if not results:
+            return SKIPPED
+        result = SUCCESS
+        for command_result in results:
+            result = worst_status(result, command_result)
+        return result
+
+    @defer.inlineCallbacks
+    def _run_branch(self, branch, done, halted, timeline, results, started):
+        depends_on = branch["depends_on"]
+        # DeferredList passes the results on, several branches can wait for one
+        yield defer.DeferredList([done[name] for name in depends_on])
+        if any(name in halted for name in depends_on):
+            halted.add(branch["name"])
+            return
+        for command in branch["commands"]:
+            if self.stopped or self._aborted:
+                return
+            args = {
+                key: value
+                for key, value in command.items()
+                if key not in ("name", "haltOnFailure", "container_usage")
+            }
+            container_usage = None
+            if command.get("container_usage"):
+                container_usage = ContainerUsageObserver()
+                self.addLogObserver(command["name"], container_usage)
+            cmd = yield self.makeRemoteShellCommand(
+                stdioLogName=command["name"], **args
+            )
+            cmd.worker = self.worker
+            start = self.master.reactor.seconds() - started
+            self._remote_commands.add(cmd)
+            try:
+                yield cmd.run(self, self.remote, self.build.builder.name)
+                result = cmd.results()
+            except Exception:
+                result = EXCEPTION
+                halted.add(branch["name"])
+                self._remote_commands.discard(cmd)
+                yield self._abort(f"exception in the {branch['name']} branch")
+                raise
+            finally:
+                self._remote_commands.discard(cmd)
+                results.append(result)
+                timeline.append(
+                    (
+                        branch["name"],
+                        command["name"],
+                        start,
+                        self.master.reactor.seconds() - started,
+                        result,
+                    )
+                )
+            if container_usage is not None:
+                container_usage.report(self, command["name"])
+            if command["haltOnFailure"] and result in (FAILURE, EXCEPTION):
+                halted.add(branch["name"])
+                return
+
+    @defer.inlineCallbacks
+    def _abort(self, reason):
+        # The step fails with the exception, no need to wait for the other branches
+        self._aborted = True
+        for cmd in list(self._remote_commands):
+            yield cmd.interrupt(reason)
+
+    @defer.inlineCallbacks
+    def interrupt(self, reason):
+        yield super().interrupt(reason)
+        # The base class only knows about a single running command
+        for cmd in list(self._remote_commands):
+            yield cmd.interrupt(reason)
@@ -2,7 +2,7 @@ from enum import Enum
 from pathlib import PurePath
 
 from buildbot.plugins import util
-from configuration.steps.commands.base import Command
+from configuration.steps.commands.base import Command, load_script
 from configuration.steps.generators.cmake.options import BuildType
 
 
@@ -129,6 +129,157 @@ class CompileDebAutobake(Command):
         return ["bash", "-exc", "debian/autobake-deb.sh"]
 
 
+# Printed between the baseline and the current ccache statistics
+CCACHE_STATS_SEPARATOR = "-- ccache statistics after compiling --"
+
+
+class CCacheStats(Command):
+    """
+    A command to read the ccache statistics around the compile steps of a build.
+    The baseline saves the counters of the cache before the first compile step, the
+    collection prints them with the current counters after the last one, for
+    parse_ccache_stats to subtract. The counters are not zeroed since the cache and
+    its counters are shared by the builders of the host, builds compiling at the
+    same time on the host count in each other's statistics.
+    Attributes:
+        baseline (bool): Save the counters instead of printing them.
+        stats_file (str): The file keeping the baseline, relative to the workdir.
+        workdir (PurePath): The working directory for the command.
+    """
+
+    def __init__(
+        self,
+        baseline: bool,
+        stats_file: str = ".ccache-stats",
+        workdir: PurePath = PurePath("."),
+    ):
+        name = "Save ccache statistics" if baseline else "Collect ccache statistics"
+        super().__init__(name=name, workdir=workdir)
+        self.baseline = baseline
+        self.stats_file = stats_file
+
+    def as_cmd_arg(self) -> list[str]:
+        stats_file = self.stats_file
+        if self.baseline:
+            # No baseline without ccache, or with one older than 3.7
+            script = f"ccache --print-stats >{stats_file} || rm -f {stats_file}"
+        else:
+            script = (
+                f"if [ -f {stats_file} ]; then cat {stats_file}; "
+                f'echo "{CCACHE_STATS_SEPARATOR}"; ccache --print-stats; fi'
+            )
+        return ["bash", "-c", f"{script} || true"]
+
+
+def parse_ccache_stats(rc: int, stdout: str, stderr: str) -> dict:
+    """
+    The ccache statistics of a build, from the output of CCacheStats.
+    Returns:
+        dict: The ccache_hits, ccache_misses, ccache_hit_rate (percent),
+            ccache_cleanups and ccache_remote_hits (when ccache has remote storage)
+            of the build, the ccache_size (bytes) and ccache_files of the cache after
+            it. Empty without a baseline or when the counters were zeroed meanwhile.
+    """
+    before, separator, after = stdout.partition(f"{CCACHE_STATS_SEPARATOR}\n")
+    if not separator:
+        return {}
+    before, after = _ccache_counters(before), _ccache_counters(after)
+
+    def delta(*names: str) -> int:
+        return sum(after.get(name, 0) - before.get(name, 0) for name in names)
+
+    counters = {
+        # ccache 4 names, then those of ccache 3
+        "ccache_hits": delta(
+            "direct_cache_hit",
+            "preprocessed_cache_hit",
+            "cache_hit_direct",
+            "cache_hit_preprocessed",
+        ),
+        "ccache_misses": delta("cache_miss"),
+        "ccache_cleanups": delta("cleanups_performed"),
+    }
+    if "remote_storage_hit" in after:
+        counters["ccache_remote_hits"] = delta("remote_storage_hit")
+    if any(value < 0 for value in counters.values()):
+        return {}
+    lookups = counters["ccache_hits"] + counters["ccache_misses"]
+    if lookups:
+        counters["ccache_hit_rate"] = round(counters["ccache_hits"] * 100 / lookups, 1)
+    counters["ccache_size"] = after.get("cache_size_kibibyte", 0) * 1024
+    counters["ccache_files"] = after.get("files_in_cache", 0)
+    return counters
+
+
+def _ccache_counters(stats: str) -> dict[str, int]:
+    counters = {}
+    for line in stats.splitlines():
+        name, _, value = line.partition("\t")
+        if value.strip().isdigit():
+            counters[name] = int(value)
+    return counters
+
+
+class NinjaLogReport(Command):
+    """
+    A command to report the last ninja build of a build directory from its
+    .ninja_log: the targets it built out of all those ninja knows, which shows how
+    much an incremental rebuild saved, its wall time and its slowest targets, the
+    translation units dominating the compile step.
+    Attributes:
+        builddir (str): The build directory holding the .ninja_log.
+        top (int): The number of slowest targets to report.
+        workdir (PurePath): The working directory for the command.
+    """
+
+    def __init__(
+        self,
+        builddir: str = ".",
+        top: int = 20,
+        workdir: PurePath = PurePath("."),
+    ):
+        super().__init__(name="Report slowest targets", workdir=workdir)
+        self.builddir = builddir
+        self.top = top
+
+    def as_cmd_arg(self) -> list[str]:
+        return [
+            "bash",
+            "-c",
+            load_script(script_name="ninja_log_report.sh"),
+            "--",
+            f"{self.builddir}/.ninja_log",
+            str(self.top),
+        ]
+
+
+def parse_ninja_report(rc: int, stdout: str, stderr: str) -> dict:
+    """
+    The last ninja build of a build directory, from the output of NinjaLogReport.
+    Returns:
+        dict: The ninja_targets_built and ninja_targets_known counts, the
+            ninja_build_seconds and the ninja_slowest_targets, a list of
+            [target, seconds], slowest first. Empty when the build did not run ninja.
+    """
+    report = {}
+    slowest = []
+    for line in stdout.splitlines():
+        if line.startswith("Targets built: "):
+            built, _, known = line.removeprefix("Targets built: ").partition(" of ")
+            report["ninja_targets_built"] = int(built)
+            report["ninja_targets_known"] = int(known)
+        elif line.startswith("Build time: "):
+            report["ninja_build_seconds"] = float(
+                line.removeprefix("Build time: ").rstrip("s")
+            )
+        elif report and line[:1].isdigit():
+            seconds, _, target = line.partition(" ")
+            slowest.append([target, float(seconds)])
+    if report:
+        report["ninja_slowest_targets"] = slowest
+    return report
+
+
 class InstallRPMFromProp(Command):
     """
     This class is used to install RPM packages from a property.
@@ -1,6 +1,6 @@
 from pathlib import PurePath
 
-from configuration.steps.commands.base import Command
+from configuration.steps.commands.base import Command, load_script
 from configuration.steps.generators.cmake.generator import CMakeGenerator
 
 
@@ -9,10 +9,16 @@ class ConfigureMariaDBCMake(Command):
     A command to configure MariaDB using CMake.
     This command generates the necessary build files for MariaDB
     based on the provided CMake generator.
+    With reuse_tree, the build directory may have been configured by a previous
+    build (an incremental build tree), CMake runs again only when its command or
+    its inputs (CMake scripts, templates, submodules) changed since, see
+    cmake_reconfigure.sh.
     Attributes:
         name (str): The name of the command.
         cmake_generator (CMakeGenerator): The CMake generator to use for configuration.
         workdir (PurePath): The working directory for the command.
+        reuse_tree (bool): Skip the configuration left in the build directory, if
+            still up to date.
     """
 
     def __init__(
@@ -20,10 +26,22 @@ class ConfigureMariaDBCMake(Command):
         name: str,
         cmake_generator: CMakeGenerator,
         workdir: PurePath = PurePath("."),
+        reuse_tree: bool = False,
     ):
         self.cmake_generator = cmake_generator
+        self.reuse_tree = reuse_tree
         super().__init__(name=f"Configure - {name}", workdir=workdir)
 
     def as_cmd_arg(self) -> list[str]:
         cmake_cmd = " ".join(self.cmake_generator.generate())
+        if self.reuse_tree:
+            return [
+                "bash",
+                "-c",
+                load_script(script_name="cmake_reconfigure.sh"),
+                "--",
+                self.cmake_generator.source_path,
+                self.cmake_generator.builddir or ".",
+                cmake_cmd,
+            ]
         return ["bash", "-exc", f"{cmake_cmd}"]
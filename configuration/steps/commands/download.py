@@ -1,7 +1,7 @@
 from pathlib import PurePath
 
 from buildbot.plugins import util
-from configuration.steps.commands.base import Command
+from configuration.steps.commands.base import Command, interpolate
 from utils import read_template
 
 
@@ -22,7 +22,7 @@ class FetchTarball(Command):
         return [
             "bash",
             "-exc",
-            util.Interpolate(read_template("get_tarball")),
+            interpolate(read_template("get_tarball")),
         ]
 
 
@@ -34,10 +34,17 @@ class GitInitFromCommit(Command):
     - Fetches the specified commit from the remote repository with a depth of 1
     - Fetches all submodules recursively
     - Checks out the fetched commit, making it the current HEAD of the repository.
+    With reuse_tree, the working directory may hold the repository of a previous
+    build (an incremental build tree), the commit is checked out over it. Files the
+    commit does not change keep their modification time and are not rebuilt.
+    Untracked files, e.g. submodules removed upstream, are then cleaned before the
+    configure step globs the tree. Ignored files are kept: the builds are in-source,
+    they are the objects of the previous build.
     Attributes:
         commit (str): The commit hash to fetch.
         repo_url (str): The URL of the repository from which to fetch the commit.
         workdir (PurePath): The working directory where the repository will be initialized.
+        reuse_tree (bool): Update the repository left in workdir, if any.
     """
 
     def __init__(
@@ -47,18 +54,39 @@ class GitInitFromCommit(Command):
         workdir: PurePath = PurePath("."),
         jobs: int = 1,
         depth: int = 1,
+        reuse_tree: bool = False,
     ):
         super().__init__(name="Git", workdir=workdir)
         self.commit = commit
         self.repo_url = repo_url
         self.jobs = jobs
         self.depth = depth
+        self.reuse_tree = reuse_tree
 
     def as_cmd_arg(self) -> list[str]:
         if self.depth != 0:
             depth = "--depth " + str(self.depth)
         else:
             depth = ""
+        if self.reuse_tree:
+            return [
+                "bash",
+                "-exc",
+                interpolate(
+                    (
+                        "git init && "
+                        f"(git remote add origin {self.repo_url} || "
+                        f"git remote set-url origin {self.repo_url}) && "
+                        f"git fetch {depth} origin {self.commit} && "
+                        "git checkout --force FETCH_HEAD && "
+                        "git clean -ffd && "
+                        "git submodule sync --recursive && "
+                        "git submodule update --init --recursive --force "
+                        f"{depth} --jobs={self.jobs} && "
+                        "git submodule foreach --recursive git clean -ffd"
+                    )
+                ),
+            ]
         return [
             "bash",
             "-exc",
@@ -1,8 +1,24 @@
 from pathlib import PurePath
-from typing import Optional
+from typing import Optional, Union
 
-from configuration.builders.infra.runtime import Sidecar
-from configuration.steps.commands.base import Command
+from twisted.internet import defer
+
+from buildbot.plugins import util
+from buildbot.process.properties import Interpolate
+from configuration.builders.infra.runtime import BuildTree, DockerConfig, Sidecar
+from configuration.steps.commands.base import Command, interpolate, load_script
+from configuration.workers.memory import parse_memory
+
+# Host-local pull state, shared by the workers of a docker host
+IMAGE_PULL_STATE_DIR = "/tmp/buildbot-image-pulls"
+# Seconds a registry digest is trusted before it is resolved again
+IMAGE_DIGEST_TTL = 300
+# Host-local lease state of the pooled sidecars
+SIDECAR_POOL_STATE_DIR = "/tmp/buildbot-sidecar-pools"
+# Seconds a build waits for a free pooled sidecar
+SIDECAR_LEASE_TIMEOUT = 1800
+# Host-local lease and size records of the incremental build trees
+BUILD_TREE_STATE_DIR = "/tmp/buildbot-build-trees"
 
 
 class CreateDockerWorkdirs(Command):
@@ -12,12 +28,17 @@ class CreateDockerWorkdirs(Command):
     in the mounted volume, ensuring that the necessary workspaces are
     available for subsequent steps in the build process.
     Attributes:
-        volume_mount (str): The Docker volume mount specification.
+        volume_mount (Union[str, Interpolate]): The Docker volume mount specification.
         image_url (str): The URL of the Docker image to use.
         workdirs (list[str]): A list of work directories to create in the container.
     """
 
-    def __init__(self, volume_mount: str, image_url: str, workdirs: list[str]):
+    def __init__(
+        self,
+        volume_mount: Union[str, Interpolate],
+        image_url: str,
+        workdirs: list[str],
+    ):
         name = "Create Docker Workdirs"
         super().__init__(name=name, workdir=PurePath("."))
         self.volume_mount = volume_mount
@@ -30,7 +51,7 @@ class CreateDockerWorkdirs(Command):
             "run",
             "--rm",
             "--mount",
-            f"{self.volume_mount}",
+            self.volume_mount,
             f"{self.image_url}",
             "bash",
             "-exc",
@@ -41,8 +62,9 @@ class CreateDockerWorkdirs(Command):
 class CleanupDockerResources(Command):
     """
     A command to clean up Docker resources after a build step.
-    This command removes the specified Docker container, its associated volume,
-    and the runtime Docker image used for the build, ensuring that no leftover resources
+    This command removes the specified Docker container, the containers of its
+    parallel steps (named <container>--<branch>), its associated volume, and the
+    runtime Docker image used for the build, ensuring that no leftover resources
     remain after the build process is complete.
 
     Attributes:
@@ -71,7 +93,8 @@ class CleanupDockerResources(Command):
         runtime_tag = self.runtime_tag
 
         sidecar_rm = ""
-        if self.sidecar is not None:
+        # Pooled sidecars are released by ReleaseDockerSidecar
+        if self.sidecar is not None and not self.sidecar.pool_size:
             sidecar_rm = f"docker rm --force {self.sidecar.container_name};"
 
         return [
@@ -80,6 +103,7 @@ class CleanupDockerResources(Command):
             f"""
             (
                 docker rm --force {main_container};
+                docker ps -aq --filter "name=^{main_container}--" | xargs -r docker rm --force;
                 {sidecar_rm}
                 docker volume rm {main_container};
                 docker image rm {runtime_tag};
@@ -93,19 +117,41 @@ class FetchContainerImage(Command):
     A command to fetch a Docker container image.
     This command pulls the specified Docker image from a registry,
     ensuring that the required image is available for the build process.
+    The builds starting together on a host pull the same image once: pulls of an
+    image are serialized through a lock file in state_dir, the registry digest is
+    resolved at most once per digest_ttl and the pull is skipped when the local
+    image already has it.
     Attributes:
         image_url (str): The URL of the Docker image to fetch.
+        platform (str): The platform of the image, empty for the host one.
+        digest_ttl (int): Seconds a resolved registry digest is reused.
+        state_dir (str): Host directory holding the lock and digest files.
     """
 
-    def __init__(self, image_url: str, platform: str):
+    def __init__(
+        self,
+        image_url: str,
+        platform: str,
+        digest_ttl: int = IMAGE_DIGEST_TTL,
+        state_dir: str = IMAGE_PULL_STATE_DIR,
+    ):
         super().__init__(name=f"Fetch container image", workdir=PurePath("."))
         self.image_url = image_url
         self.platform = platform
+        self.digest_ttl = digest_ttl
+        self.state_dir = state_dir
 
     def as_cmd_arg(self) -> list[str]:
-        if self.platform:
-            return ["docker", "pull", "--platform", self.platform, self.image_url]
-        return ["docker", "pull", self.image_url]
+        return [
+            "bash",
+            "-c",
+            load_script(script_name="pull_image.sh"),
+            "--",
+            self.image_url,
+            self.platform or "",
+            str(self.digest_ttl),
+            self.state_dir,
+        ]
 
 
 class TagContainerImage(Command):
@@ -143,6 +189,9 @@ class ContainerCommit(Command):
     This command commits the specified Docker container to a new image
     with a given runtime tag, allowing the current state of the container
     to be saved for future use. After committing, it removes the container.
+    The commit is skipped when the step only changed scratch paths (/tmp,
+    /var/cache, /var/log, ...), the workdir volume is not part of a commit either.
+    The size of the writable layer and the commit time are logged.
     Attributes:
         container_name (str): The name of the Docker container to commit.
         runtime_tag (str): The runtime tag for the new Docker image.
@@ -158,13 +207,12 @@ class ContainerCommit(Command):
     def as_cmd_arg(self) -> list[str]:
         return [
             "bash",
-            "-exc",
-            (
-                "docker container commit "
-                f'--message "{self.step_name}" {self.container_name} '
-                f"{self.runtime_tag} && "
-                f"docker rm {self.container_name}"
-            ),
+            "-c",
+            load_script(script_name="container_commit.sh"),
+            "--",
+            self.container_name,
+            self.runtime_tag,
+            self.step_name,
         ]
 
 
@@ -229,3 +277,256 @@ class CreateDockerSidecar(Command):
                 + f" {self.sidecar.image_url}"
             ),
         ]
+
+
+class LeaseDockerSidecar(Command):
+    """
+    A command to lease a warm sidecar from the pool of its image on the worker host.
+    The host keeps up to sidecar.pool_size sidecars of the image. The lease waits for
+    a free one, starts it when it is not running (or runs an outdated image), else
+    resets it: the schemas and users left by the previous build are dropped and the
+    MARIADB_DATABASE schema is created again. The sidecar joins the sidecar network
+    with the sidecar container name as alias, the SIDECAR_HOST of the steps. The
+    time waited for a free sidecar is logged and kept in state_dir.
+    Attributes:
+        sidecar (Sidecar): The pooled Sidecar.
+        lease_timeout (int): Seconds to wait for a free sidecar before failing.
+        state_dir (str): Host directory holding the lock, lease and wait files.
+    """
+
+    def __init__(
+        self,
+        sidecar: Sidecar,
+        lease_timeout: int = SIDECAR_LEASE_TIMEOUT,
+        state_dir: str = SIDECAR_POOL_STATE_DIR,
+    ):
+        super().__init__(name="Lease Docker Sidecar", workdir=PurePath("."))
+        self.sidecar = sidecar
+        self.lease_timeout = lease_timeout
+        self.state_dir = state_dir
+
+    def as_cmd_arg(self) -> list[str]:
+        return _sidecar_pool_args(
+            "lease", self.sidecar, self.state_dir, self.lease_timeout
+        )
+
+
+class ReleaseDockerSidecar(Command):
+    """
+    A command to release the pooled sidecar leased by a builder.
+    The sidecar leaves the sidecar network and stays up for the next build.
+    Attributes:
+        name (str): The name of the release command.
+        sidecar (Sidecar): The pooled Sidecar.
+        state_dir (str): Host directory holding the lock, lease and wait files.
+    """
+
+    def __init__(
+        self, name: str, sidecar: Sidecar, state_dir: str = SIDECAR_POOL_STATE_DIR
+    ):
+        super().__init__(name=f"Release Docker Sidecar - {name}", workdir=PurePath("."))
+        self.sidecar = sidecar
+        self.state_dir = state_dir
+
+    def as_cmd_arg(self) -> list[str]:
+        return _sidecar_pool_args("release", self.sidecar, self.state_dir, 0)
+
+
+def _sidecar_pool_args(
+    action: str, sidecar: Sidecar, state_dir: str, lease_timeout: int
+) -> list[str]:
+    env_vars = dict(sidecar.env_vars)
+    cmd = [
+        "bash",
+        "-c",
+        load_script(script_name="sidecar_pool.sh"),
+        "--",
+        action,
+        state_dir,
+        sidecar.image_url,
+        str(sidecar.pool_size),
+        sidecar.container_name,
+        sidecar.network,
+        str(sidecar.tmpfs),
+        env_vars.get("MARIADB_DATABASE", ""),
+        str(lease_timeout),
+    ]
+    for variable, value in sidecar.env_vars:
+        cmd.extend(["-e", f"{variable}={value}"])
+    return cmd
+
+
+class StartPersistentContainer(Command):
+    """
+    A command to start the long-lived container of a builder.
+    The container gets the volume, network, bind mounts, environment and limits a
+    docker run of InContainer would get, then idles until the steps reach it through
+    docker exec. A container left with the same name is replaced, since a builder
+    switching docker environments starts a new container on the same volume.
+    Attributes:
+        docker_environment (DockerConfig): The configuration of the container.
+    """
+
+    def __init__(self, docker_environment: DockerConfig):
+        super().__init__(name="Start persistent container", workdir=PurePath("."))
+        self.docker_environment = docker_environment
+
+    def as_cmd_arg(self) -> list:
+        # Read at generation time, the sidecar processor sets the network and env late
+        config = self.docker_environment
+        cmd = [
+            "bash",
+            "-exc",
+            f'docker rm --force {config.container_name} || true; exec "$@"',
+            "bash",
+            "docker",
+            "run",
+            "-d",
+            "--init",
+            "--name",
+            config.container_name,
+            "--mount",
+            config.volume_mount,
+        ]
+        if config.network:
+            cmd.extend(["--network", config.network])
+        for src, dst in config.bind_mounts:
+            cmd.extend(["--mount", f"type=bind,src={src},dst={dst}"])
+        for variable, value in config.env_vars:
+            cmd.extend(["-e", interpolate(f"{variable}={value}")])
+        cmd.extend(
+            [
+                f"--shm-size={config.shm_size}",
+                "--ulimit",
+                f"memlock={config.memlock_limit}",
+                "-w",
+                config.workdir.as_posix(),
+                config.runtime_tag,
+                "sleep",
+                "infinity",
+            ]
+        )
+        return cmd
+
+
+@util.renderer
+@defer.inlineCallbacks
+def build_tree_mode(props) -> str:
+    """
+    "fresh" when the build request of the build already had a build, e.g. one retried
+    after failing over a reused tree, "reuse" otherwise. The trees are per host, a
+    retried build may run on another host than the failed one and must not build
+    over a tree either.
+    """
+    build = props.getBuild()
+    for request in build.requests:
+        builds = yield build.master.data.get(("buildrequests", request.id, "builds"))
+        if any(other["buildid"] != build.buildid for other in builds):
+            return "fresh"
+    return "reuse"
+
+
+class AcquireBuildTree(Command):
+    """
+    A command to pick the workdir volume of a build, see BuildTree.
+    A build of a branch matching build_tree.branches gets the tree the builder keeps
+    for the branch on the host, created when missing, unless another build of the
+    host is using it. Other builds get the volume named after the container, removed
+    by the docker cleanup steps. The tree of a retried build request is emptied
+    first (see build_tree_mode), so a request is retried at most once. The volume
+    and whether the tree was left by a previous build are printed for
+    parse_build_tree.
+    Attributes:
+        container_name (str): The name of the Docker container of the builder.
+        build_tree (BuildTree): The build tree configuration of the builder.
+        state_dir (str): Host directory holding the lock, lease and size files.
+    """
+
+    def __init__(
+        self,
+        container_name: str,
+        build_tree: BuildTree,
+        state_dir: str = BUILD_TREE_STATE_DIR,
+    ):
+        super().__init__(name="Acquire build tree", workdir=PurePath("."))
+        self.container_name = container_name
+        self.build_tree = build_tree
+        self.state_dir = state_dir
+
+    def as_cmd_arg(self) -> list:
+        return [
+            "bash",
+            "-c",
+            load_script(script_name="build_tree.sh"),
+            "--",
+            "acquire",
+            self.state_dir,
+            self.container_name,
+            build_tree_mode,
+            interpolate("%(prop:branch)s"),
+            *self.build_tree.branches,
+        ]
+
+
+class ReleaseBuildTree(Command):
+    """
+    A command to give back the build tree acquired by AcquireBuildTree.
+    A kept tree is measured for the next build, a dropped one (the build did not
+    succeed, its state is not trusted) is removed so that the next build of the
+    branch starts clean. The least recently used trees of the host are then removed until they fit
+    in the quota of build_tree.
+    Attributes:
+        name (str): The name of the release command.
+        container_name (str): The name of the Docker container of the builder.
+        image_url (str): The URL of the Docker image measuring the tree.
+        build_tree (BuildTree): The build tree configuration of the builder.
+        keep (bool): Keep the tree for the next build, else remove it.
+        state_dir (str): Host directory holding the lock, lease and size files.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        container_name: str,
+        image_url: str,
+        build_tree: BuildTree,
+        keep: bool,
+        state_dir: str = BUILD_TREE_STATE_DIR,
+    ):
+        super().__init__(name=f"{name} build tree", workdir=PurePath("."))
+        self.container_name = container_name
+        self.image_url = image_url
+        self.build_tree = build_tree
+        self.keep = keep
+        self.state_dir = state_dir
+
+    def as_cmd_arg(self) -> list:
+        return [
+            "bash",
+            "-c",
+            load_script(script_name="build_tree.sh"),
+            "--",
+            "release",
+            self.state_dir,
+            self.container_name,
+            interpolate("%(prop:build_tree)s"),
+            self.image_url,
+            str(parse_memory(self.build_tree.quota) * 1024**2),
+            "keep" if self.keep else "drop",
+        ]
+
+
+def parse_build_tree(rc: int, stdout: str, stderr: str) -> dict:
+    """
+    Returns the build_tree (the workdir volume) and build_tree_reused properties
+    from the output of AcquireBuildTree. Comparing the durations of the builds
+    with build_tree_reused to the others gives what the tree saves.
+    """
+    properties = {}
+    for line in stdout.splitlines():
+        key, sep, value = line.partition("=")
+        if sep and key in ("build_tree", "build_tree_reused"):
+            properties[key] = value.strip()
+    if "build_tree_reused" in properties:
+        properties["build_tree_reused"] = properties["build_tree_reused"] == "true"
+    return properties
@@ -2,8 +2,11 @@ import os
 from enum import Enum
 from pathlib import PurePath
 
-from buildbot.plugins import util
-from configuration.steps.commands.base import BashScriptCommand, Command
+from configuration.steps.commands.base import (
+    BashScriptCommand,
+    Command,
+    interpolate,
+)
 from configuration.steps.generators.mtr.generator import MTRGenerator
 
 
@@ -142,10 +145,10 @@ class MTRReporter(BashScriptCommand):
         dry_run: bool = False,
     ):
         base_url = self.MTR_LOG_COLLECTOR_BASE_URL
-        branch = util.Interpolate("%(prop:branch)s")
-        revision = util.Interpolate("%(prop:revision)s")
-        platform = util.Interpolate("%(prop:buildername)s")
-        bbnum = util.Interpolate("%(prop:buildnumber)s")
+        branch = interpolate("%(prop:branch)s")
+        revision = interpolate("%(prop:revision)s")
+        platform = interpolate("%(prop:buildername)s")
+        bbnum = interpolate("%(prop:buildnumber)s")
         dir = "."
 
         args = [
@@ -0,0 +1,121 @@
+#!/bin/bash
+set -euo pipefail
+
+# bash build_tree.sh acquire <state_dir> <container_name> <reuse|fresh> <branch> \
+#   <pattern>...
+# bash build_tree.sh release <state_dir> <container_name> <volume> <image_url> \
+#   <quota_bytes> <keep|drop>
+# Keeps the workdir volume of a builder for each branch matching a pattern on the
+# host, the next build of the branch builds over the tree the last one left.
+# acquire: prints build_tree=<volume> and build_tree_reused=<true|false>. The tree
+# of <branch> when no other build of the host is using it, otherwise (or for the
+# other branches) <container_name>, the volume of this build alone. With fresh, a
+# tree left by a previous build is removed and created again, empty.
+# release: frees the tree, or removes it with drop (the next build starts clean),
+# records its size and use time, then removes the least recently used trees of
+# the host until they fit in <quota_bytes>. Trees without a record (lost with
+# the state_dir) are removed first.
+action="$1"
+state_dir="$2"
+container_name="$3"
+# Leases not released for a day are from builds that will never release them
+lease_ttl=86400
+
+mkdir -p "$state_dir"
+exec 9>"$state_dir/lock"
+
+leased() {
+  local leased_at=0
+  [[ -f $state_dir/$1.lease ]] || return 1
+  read -r leased_at <"$state_dir/$1.lease" || true
+  (($(date +%s) - leased_at < lease_ttl))
+}
+
+if [[ $action == acquire ]]; then
+  mode="$4"
+  branch="$5"
+  shift 5
+  volume="$container_name"
+  reused=false
+  tree=""
+  for pattern in "$@"; do
+    # shellcheck disable=SC2053 # The pattern is a glob
+    if [[ -n $branch && $branch == $pattern ]]; then
+      tree="$container_name--tree--$(printf '%s' "$branch" | tr -c 'a-zA-Z0-9_.-' '-')"
+      break
+    fi
+  done
+  if [[ -n $tree ]]; then
+    flock 9
+    if leased "$tree"; then
+      echo "Build tree $tree is in use, building in a clean workdir" >&2
+    else
+      date +%s >"$state_dir/$tree.lease"
+      volume="$tree"
+      if docker volume inspect "$tree" >/dev/null 2>&1; then
+        if [[ $mode != fresh ]]; then
+          reused=true
+        elif docker volume rm "$tree" >/dev/null; then
+          echo "Retried build request, building $tree from scratch" >&2
+          rm -f "$state_dir/$tree.tree"
+        else
+          echo "Build tree $tree cannot be emptied, building in a clean workdir" >&2
+          rm -f "$state_dir/$tree.lease"
+          volume="$container_name"
+        fi
+      fi
+      if [[ $volume == "$tree" && $reused == false ]]; then
+        docker volume create --label "buildbot.build-tree=$container_name" "$tree" >/dev/null
+      fi
+    fi
+    flock -u 9
+  fi
+  echo "build_tree=$volume"
+  echo "build_tree_reused=$reused"
+  exit 0
+fi
+
+volume="$4"
+image_url="$5"
+quota="$6"
+keep="$7"
+
+# Empty when the acquire step did not run
+if [[ -n $volume && $volume != "$container_name" ]]; then
+  if [[ $keep == keep ]]; then
+    size=$(docker run --rm -u root --mount "type=volume,src=$volume,dst=/tree" \
+      "$image_url" du -sb /tree | cut -f1) || size=0
+    flock 9
+    echo "$(date +%s) $size" >"$state_dir/$volume.tree"
+    echo "Kept build tree $volume, $size bytes"
+  else
+    flock 9
+    docker volume rm "$volume" >/dev/null || true
+    rm -f "$state_dir/$volume.tree"
+    echo "Removed build tree $volume, the next build starts clean"
+  fi
+  rm -f "$state_dir/$volume.lease"
+else
+  flock 9
+fi
+
+# <last used> <size> <volume>, least recently used first
+docker volume ls -q --filter label=buildbot.build-tree | while read -r tree; do
+  last_used=0 size=0
+  [[ ! -f $state_dir/$tree.tree ]] || read -r last_used size <"$state_dir/$tree.tree" || true
+  echo "$last_used $size $tree"
+done | sort -n >"$state_dir/lru"
+
+total=$(awk '{ total += $2 } END { print total + 0 }' "$state_dir/lru")
+while read -r last_used size tree; do
+  if ((last_used != 0 && total <= quota)); then
+    break
+  fi
+  if leased "$tree" || ! docker volume rm "$tree" >/dev/null 2>&1; then
+    continue
+  fi
+  rm -f "$state_dir/$tree.tree"
+  total=$((total - size))
+  echo "Evicted build tree $tree, $size bytes"
+done <"$state_dir/lru"
+echo "Build trees of the host: $total of $quota bytes"
@@ -0,0 +1,37 @@
+#!/bin/bash
+set -euo pipefail
+
+# bash cmake_reconfigure.sh <source_path> <builddir> <cmake_command>
+# Runs <cmake_command> unless <builddir> was configured by the same command from
+# the same CMake inputs: the CMake scripts and templates tracked in the git
+# repository of <source_path> and its submodule commits. The inputs of the last
+# configuration are kept in <builddir>/.buildbot-cmake-inputs. Without a git
+# repository the command always runs.
+source_path="$1"
+builddir="$2"
+cmake_cmd="$3"
+stamp="$builddir/.buildbot-cmake-inputs"
+
+inputs() {
+  echo "$cmake_cmd"
+  git -C "$source_path" ls-files -s -- 'CMakeLists.txt' '*/CMakeLists.txt' \
+    '*.cmake' '*.in'
+  git -C "$source_path" submodule status --recursive
+}
+
+if current=$(inputs 2>/dev/null | sha256sum | cut -d' ' -f1); then
+  if [[ -f $builddir/CMakeCache.txt && -f $stamp && $(<"$stamp") == "$current" ]]; then
+    echo "CMake inputs unchanged since the last configuration of $builddir, skipping"
+    exit 0
+  fi
+else
+  current=""
+fi
+
+rm -f "$stamp"
+set -x
+eval "$cmake_cmd"
+{ set +x; } 2>/dev/null
+if [[ -n $current ]]; then
+  echo "$current" >"$stamp"
+fi
@@ -0,0 +1,29 @@
+#!/bin/bash
+set -euo pipefail
+
+# bash container_commit.sh <container_name> <runtime_tag> <step_name>
+# Commits the stopped container of a step to the runtime image of the builder,
+# then removes the container. The commit writes the whole writable layer of the
+# container (its size is logged with the commit time). It is skipped when the
+# step changed nothing but scratch paths, the next steps then run from the
+# current runtime image. The workdir volume is never part of a commit.
+container="$1"
+runtime_tag="$2"
+step_name="$3"
+
+# Parents of the scratch paths show up as changed when anything below changes
+ancestors='^/(var|root)$'
+scratch='^/(tmp|var/tmp|var/log|var/cache|run|root/\.cache)(/|$)'
+changes=$(docker container diff "$container" |
+  awk -v a="$ancestors" -v s="$scratch" '$2 !~ a && $2 !~ s { n++ } END { print n + 0 }')
+size=$(docker container inspect --size --format '{{.SizeRw}}' "$container")
+
+if ((changes == 0)); then
+  echo "$step_name changed only scratch paths, commit of $size bytes skipped"
+else
+  started=$(date +%s%N)
+  docker container commit --message "$step_name" "$container" "$runtime_tag"
+  elapsed=$((($(date +%s%N) - started) / 1000000))
+  echo "Committed $changes changed paths, $size bytes, in ${elapsed}ms"
+fi
+docker rm "$container"
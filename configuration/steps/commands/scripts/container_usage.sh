@@ -0,0 +1,38 @@
+#!/bin/bash
+set -uo pipefail
+
+# bash container_usage.sh <command>...
+# Runs the command of a step in its container, then prints the CPU time the
+# container used meanwhile and its peak memory, read from the cgroup of the
+# container (v2, else v1), for StepMetrics:
+#   buildbot-container-usage cpu_seconds=<seconds> memory_peak_bytes=<bytes>
+# The peak of a persistent container is that of the container so far. Nothing
+# is printed when the cgroup is not readable.
+cpu_usec() {
+  if [[ -r /sys/fs/cgroup/cpu.stat ]]; then
+    awk '$1 == "usage_usec" { print $2 }' /sys/fs/cgroup/cpu.stat
+  elif [[ -r /sys/fs/cgroup/cpuacct/cpuacct.usage ]]; then
+    echo $(($(cat /sys/fs/cgroup/cpuacct/cpuacct.usage) / 1000))
+  fi
+}
+
+memory_peak() {
+  local file
+  for file in /sys/fs/cgroup/memory.peak /sys/fs/cgroup/memory/memory.max_usage_in_bytes; do
+    if [[ -r $file ]]; then
+      cat "$file"
+      return
+    fi
+  done
+}
+
+started=$(cpu_usec)
+"$@"
+rc=$?
+ended=$(cpu_usec)
+if [[ -n $started && -n $ended ]]; then
+  printf 'buildbot-container-usage cpu_seconds=%s memory_peak_bytes=%s\n' \
+    "$(awk -v t=$((ended - started)) 'BEGIN { printf "%.3f", t / 1e6 }')" \
+    "$(memory_peak)"
+fi
+exit "$rc"
@@ -0,0 +1,52 @@
+#!/bin/bash
+set -euo pipefail
+
+# bash ninja_log_report.sh <ninja_log> <top>
+# Reports the last ninja build recorded in <ninja_log>: the targets it built out
+# of all those the log knows (a small share for an incremental rebuild), its wall
+# time and its <top> slowest targets as "<seconds> <target>" lines.
+log="$1"
+top="$2"
+
+if [[ ! -f $log ]]; then
+  echo "No $log, the build did not run ninja"
+  exit 0
+fi
+
+# .ninja_log lines are "<start ms> <end ms> <mtime> <target> <command hash>",
+# tab separated, appended as the targets finish. Each ninja run counts from 0
+# again, a new run starts with an end time below the previous one. A command
+# with several outputs has a line per output, it is counted once.
+awk -F '\t' '
+  /^#/ || NF < 4 { next }
+  { known[$4] = 1 }
+  $2 + 0 < last_end {
+    delete built
+    delete seen
+    first_start = ""
+    targets = 0
+  }
+  {
+    last_end = $2 + 0
+    if (first_start == "" || $1 + 0 < first_start) first_start = $1 + 0
+    command = NF >= 5 ? $5 : $4
+    if (command in seen) next
+    seen[command] = 1
+    built[$4] = $2 - $1
+    targets++
+  }
+  END {
+    n = 0
+    for (target in known) n++
+    printf "Targets built: %d of %d\n", targets, n
+    printf "Build time: %.1fs\n", (last_end - first_start) / 1000
+    for (target in built) printf "%.3f %s\n", built[target] / 1000, target
+  }
+' "$log" | {
+  read -r summary
+  echo "$summary"
+  read -r summary
+  echo "$summary"
+  echo "Slowest targets:"
+  sort -k1,1nr | awk -v top="$top" 'NR <= top'
+}
@@ -0,0 +1,32 @@
+#!/bin/bash
+set -uo pipefail
+
+# bash persistent_exec.sh <container_name> <docker exec option>... -- <command>...
+# Runs a step in the persistent container of the builder through docker exec, in
+# a session of its own whose id is saved in the container. docker exec does not
+# forward signals: when Buildbot interrupts the step (SIGTERM), the process group
+# of the step is killed in the container, instead of living on until the
+# container is removed.
+container="$1"
+shift
+options=()
+while (($#)) && [[ $1 != -- ]]; do
+  options+=("$1")
+  shift
+done
+shift
+pgid_file="/tmp/.buildbot-step-$$.pgid"
+
+interrupt() {
+  trap - TERM INT
+  # shellcheck disable=SC2016 # Expanded in the container
+  docker exec -u root "$container" bash -c \
+    '[[ ! -f $1 ]] || kill -KILL -- "-$(cat "$1")"; rm -f "$1"' bash "$pgid_file"
+  exit 143
+}
+trap interrupt TERM INT
+
+# shellcheck disable=SC2016 # Expanded in the container
+docker exec "${options[@]}" "$container" setsid --wait bash -c \
+  'echo $$ >"$0"; exec "$@"' "$pgid_file" "$@" &
+wait $!
@@ -0,0 +1,55 @@
+#!/bin/bash
+set -euo pipefail
+
+# bash pull_image.sh <image_url> <platform> <digest_ttl_seconds> <state_dir>
+# Pulls an image unless the local copy already has the registry digest.
+# The registry digest is resolved at most once per TTL on a host and the builds
+# of a host wanting the same image wait for each other through a lock file.
+image_url="$1"
+platform="$2"
+ttl="$3"
+state_dir="$4"
+
+mkdir -p "$state_dir"
+state="$state_dir/$(echo "$image_url" | tr -c 'a-zA-Z0-9._-' '_')"
+exec 9>"$state.lock"
+waited=$(date +%s)
+flock 9
+waited=$(($(date +%s) - waited))
+if ((waited > 0)); then
+  echo "Waited ${waited}s for another pull of $image_url on this host"
+fi
+
+# <resolved at> <registry digest> <last pull duration> from the previous pull
+resolved_at=0 remote_digest="" pull_seconds=0
+if [[ -f "$state.digest" ]]; then
+  read -r resolved_at remote_digest pull_seconds <"$state.digest" || true
+  [[ $remote_digest != "-" ]] || remote_digest=""
+fi
+now=$(date +%s)
+if ((now - resolved_at >= ttl)) || [[ -z $remote_digest ]]; then
+  remote_digest=$(docker buildx imagetools inspect "$image_url" \
+    --format '{{.Manifest.Digest}}' 2>/dev/null) || remote_digest=""
+  resolved_at=$now
+else
+  echo "Registry digest of $image_url resolved $((now - resolved_at))s ago"
+fi
+
+local_digests=$(docker image inspect "$image_url" \
+  --format '{{range .RepoDigests}}{{println .}}{{end}}' 2>/dev/null) || true
+if [[ -n $remote_digest ]] && grep -q "@$remote_digest\$" <<<"$local_digests"; then
+  echo "$image_url is up to date ($remote_digest), pull skipped, saved ~${pull_seconds}s"
+else
+  started=$(date +%s)
+  if [[ -n $platform ]]; then
+    docker pull --platform "$platform" "$image_url"
+  else
+    docker pull "$image_url"
+  fi
+  pull_seconds=$(($(date +%s) - started))
+  if [[ -z $remote_digest ]]; then
+    # The registry could not be asked, trust it again only after a lookup
+    resolved_at=0
+  fi
+fi
+echo "$resolved_at ${remote_digest:--} $pull_seconds" >"$state.digest"
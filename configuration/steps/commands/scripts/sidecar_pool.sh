@@ -0,0 +1,145 @@
+#!/bin/bash
+set -euo pipefail
+
+# bash sidecar_pool.sh <lease|release> <state_dir> <image_url> <pool_size> <owner> \
+#   <network> <tmpfs> <database> <lease_timeout_seconds> [-e NAME=VALUE ...]
+# Keeps up to pool_size warm MariaDB sidecars of an image on a host.
+# lease: waits for a free sidecar, starting it if it is not running or runs an
+# older image, resets it (drops the schemas and users the tests created, creates
+# <database> again) and connects it to <network> with the <owner> alias, the
+# SIDECAR_HOST of the build steps.
+# release: disconnects the sidecars leased by <owner> and frees them.
+action="$1"
+state_dir="$2"
+image_url="$3"
+pool_size="$4"
+owner="$5"
+network="$6"
+tmpfs="$7"
+database="$8"
+lease_timeout="$9"
+shift 9
+# Leases not released for a day are from builds that will never release them
+lease_ttl=86400
+
+mkdir -p "$state_dir"
+pool=$(printf '%s' "$image_url" | tr -c 'a-zA-Z0-9._-' '-')
+state="$state_dir/$pool"
+prefix="sidecar-pool-$pool"
+exec 9>"$state.lock"
+
+start_sidecar() {
+  local name="$1"
+  shift
+  docker rm --force "$name" >/dev/null 2>&1 || true
+  docker run -d --name "$name" --label "buildbot.sidecar-pool=$image_url" \
+    --tmpfs "$tmpfs" "$@" "$image_url"
+}
+
+wait_ready() {
+  for ((i = 0; i < 120; i++)); do
+    if docker exec "$1" healthcheck.sh --connect --innodb_initialized 2>/dev/null; then
+      return 0
+    fi
+    sleep 1
+  done
+  echo "Sidecar $1 is not ready after 120s" >&2
+  return 1
+}
+
+reset_sidecar() {
+  local sql="" schemas users schema user
+  schemas=$(docker exec "$1" mariadb -uroot -NBe "SELECT schema_name
+    FROM information_schema.schemata WHERE schema_name NOT IN
+    ('mysql', 'information_schema', 'performance_schema', 'sys')") || return 1
+  users=$(docker exec "$1" mariadb -uroot -NBe "SELECT CONCAT(QUOTE(user), '@',
+    QUOTE(host)) FROM mysql.user WHERE user NOT IN
+    ('root', 'mariadb.sys', 'healthcheck', '')") || return 1
+  while read -r schema; do
+    [[ -z $schema ]] || sql+="DROP DATABASE \`$schema\`;"
+  done <<<"$schemas"
+  while read -r user; do
+    [[ -z $user ]] || sql+="DROP USER $user;"
+  done <<<"$users"
+  if [[ -n $database ]]; then
+    sql+="CREATE DATABASE \`$database\`;"
+  fi
+  [[ -z $sql ]] || docker exec "$1" mariadb -uroot -e "$sql"
+}
+
+release() {
+  local lease holder slot
+  for lease in "$state".*.lease; do
+    [[ -f $lease ]] || continue
+    read -r holder _ <"$lease" || true
+    [[ $holder == "$owner" ]] || continue
+    slot=${lease%.lease}
+    slot=${slot##*.}
+    docker network disconnect --force "$network" "$prefix-$slot" 2>/dev/null || true
+    rm -f "$lease"
+    echo "Released $prefix-$slot"
+  done
+}
+
+if [[ $action == release ]]; then
+  flock 9
+  release
+  exit 0
+fi
+
+started=$(date +%s)
+slot=""
+while [[ -z $slot ]]; do
+  flock 9
+  now=$(date +%s)
+  for ((n = 0; n < pool_size; n++)); do
+    lease="$state.$n.lease"
+    if [[ -f $lease ]]; then
+      holder="" leased_at=0
+      read -r holder leased_at <"$lease" || true
+      if [[ $holder != "$owner" ]] && ((now - leased_at < lease_ttl)); then
+        continue
+      fi
+    fi
+    echo "$owner $now" >"$lease"
+    slot=$n
+    break
+  done
+  flock -u 9
+  if [[ -z $slot ]]; then
+    if ((now - started >= lease_timeout)); then
+      echo "No free sidecar of $image_url after ${lease_timeout}s" >&2
+      exit 1
+    fi
+    sleep 2
+  fi
+done
+waited=$(($(date +%s) - started))
+# Release the sidecar when anything below fails, the build cleanup may not run
+trap 'flock 9; release' ERR
+
+container="$prefix-$slot"
+running=$(docker inspect --format '{{.State.Running}} {{.Image}}' "$container" \
+  2>/dev/null) || running=""
+if [[ $running != "true $(docker image inspect --format '{{.Id}}' "$image_url")" ]]; then
+  echo "Starting $container"
+  start_sidecar "$container" "$@"
+  wait_ready "$container"
+else
+  reset_started=$(date +%s)
+  if ! wait_ready "$container" || ! reset_sidecar "$container"; then
+    echo "Reset of $container failed, starting it again"
+    start_sidecar "$container" "$@"
+    wait_ready "$container"
+  fi
+  echo "Reset $container in $(($(date +%s) - reset_started))s"
+fi
+docker network disconnect --force "$network" "$container" 2>/dev/null || true
+docker network connect --alias "$owner" "$network" "$container"
+trap - ERR
+
+echo "Leased $container after waiting ${waited}s"
+flock 9
+# <leased at> <owner> <seconds waited for a free sidecar>, the last 1000 leases
+echo "$started $owner $waited" >>"$state.waits"
+tail -n 1000 "$state.waits" >"$state.waits.tmp" && mv "$state.waits.tmp" "$state.waits"
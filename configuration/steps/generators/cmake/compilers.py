@@ -1,3 +1,6 @@
+from configuration.steps.generators.cmake.options import LINKER
+
+
 class CompilerCommand:
     def __init__(self, cc: str, cxx: str):
         assert isinstance(cc, str)
@@ -13,14 +16,30 @@ class CompilerCommand:
     def cxx(self):
         return self.cxx_
 
+    def supports_linker(self, linker: LINKER) -> bool:
+        """
+        Whether the compiler driver can link with linker through -fuse-ld.
+        """
+        return True
+
 
 class GCCCompiler(CompilerCommand):
+    # First GCC version accepting -fuse-ld=<linker>, bfd and gold are older
+    LINKER_SINCE = {LINKER.LLD: 9, LINKER.MOLD: 12}
+
     def __init__(self, version: str = None):
+        self.version = version
         if version:
             super().__init__(f"gcc-{version}", f"g++-{version}")
         else:
             super().__init__("gcc", "g++")
 
+    def supports_linker(self, linker: LINKER) -> bool:
+        # The version of the unversioned gcc is the one of the image
+        if not self.version or linker not in self.LINKER_SINCE:
+            return True
+        return int(self.version.split(".")[0]) >= self.LINKER_SINCE[linker]
+
 
 class ClangCompiler(CompilerCommand):
     def __init__(self, version: str = None):
@@ -34,5 +53,8 @@ class MicrosoftCompiler(CompilerCommand):
     def __init__(self):
         super().__init__(cc="cl", cxx="cl++")
 
+    def supports_linker(self, linker: LINKER) -> bool:
+        return False
+
 
 # TODO(cvicentiu) aocc, intel compiler.
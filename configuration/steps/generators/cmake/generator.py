@@ -6,6 +6,7 @@ from configuration.steps.generators.cmake.options import (
     BUILDPLATFORM,
     BUILDTOOLS,
     CMAKE,
+    LINKER,
     OTHER,
     BuildConfig,
     CMakeOption,
@@ -26,6 +27,7 @@ class CMakeGenerator(BaseGenerator):
         build_platform: BUILDPLATFORM = None,
         source_path: str = ".",
         builddir: str = None,
+        linker: LINKER = None,
     ):
         """
         Initializes the CMakeGenerator with an optional list of flags.
@@ -37,7 +39,13 @@ class CMakeGenerator(BaseGenerator):
             source_path: The source path to the base CMakeLists.txt file.
                          Default path is "in source build".
             builddir: The path of the build directory. Default is None.
+            linker: The linker to use instead of the default one of the compiler.
+
+        Raises:
+            ValueError: If the compiler cannot link with linker.
         """
+        self.source_path = source_path
+        self.builddir = builddir
         base_command = ["cmake", "-S", source_path]
         if builddir:
             base_command += ["-B", builddir]
@@ -49,6 +57,9 @@ class CMakeGenerator(BaseGenerator):
         if compiler:
             self._set_compiler(compiler)
 
+        if linker:
+            self._set_linker(linker, compiler)
+
         if build_tool:
             base_command += ["-G", f"""\"{build_tool.value}\""""]
 
@@ -70,9 +81,40 @@ class CMakeGenerator(BaseGenerator):
             ]
         )
 
+    def _set_linker(self, linker: LINKER, compiler: CompilerCommand = None):
+        """
+        Sets -fuse-ld=<linker> in the linker flags of executables, shared
+        libraries and modules, after the linker flags already set.
+
+        Args:
+            linker: The linker to use.
+            compiler: The CompilerCommand, if set explicitly, to validate against.
+        """
+        assert isinstance(linker, LINKER)
+        if compiler and not compiler.supports_linker(linker):
+            raise ValueError(f"{compiler.cxx} cannot link with {linker}")
+        for name in (
+            CMAKE.EXE_LINKER_FLAGS,
+            CMAKE.SHARED_LINKER_FLAGS,
+            CMAKE.MODULE_LINKER_FLAGS,
+        ):
+            value = f"-fuse-ld={linker}"
+            for flag in self.flags:
+                if flag.name == str(name):
+                    existing = flag.value
+                    if existing.startswith('"'):
+                        existing = existing[1:-1].replace('\\"', '"')
+                    value = f"{existing} {value}"
+                    self.flags.remove(flag)
+                    self.flags_names.remove(flag.name)
+                    break
+            self.append_flags([CMakeOption(name, value)])
+
     def _use_ccache(self):
         """
         Configures CMake to use ccache for faster builds.
+        The ccache remote storage, if any, comes from CCACHE_REMOTE_STORAGE in the
+        environment of the build (see docker_config), the launcher stays the same.
         """
         self.append_flags(
             [
@@ -20,6 +20,17 @@ class BUILDPLATFORM(StrEnum):
     X64 = "x64"
 
 
+class LINKER(StrEnum):
+    """
+    Enumerates the linkers the compiler driver can use, through -fuse-ld=<value>.
+    """
+
+    BFD = "bfd"
+    GOLD = "gold"
+    LLD = "lld"
+    MOLD = "mold"
+
+
 # Flag names use UPPER_CASE
 class CMAKE(StrEnum):
     """
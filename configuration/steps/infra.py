@@ -1,6 +1,8 @@
-from configuration.builders.infra.runtime import Sidecar
+from buildbot.process.results import FAILURE, RETRY, SUCCESS, WARNINGS
+from configuration.builders.infra.runtime import BuildTree, DockerConfig, Sidecar
 from configuration.steps.base import StepOptions
 from configuration.steps.commands.infra import (
+    AcquireBuildTree,
     CleanupDockerResources,
     CleanupWorkerDir,
     ContainerCommit,
@@ -8,9 +10,14 @@ from configuration.steps.commands.infra import (
     CreateDockerSidecar,
     CreateDockerWorkdirs,
     FetchContainerImage,
+    LeaseDockerSidecar,
+    ReleaseBuildTree,
+    ReleaseDockerSidecar,
+    StartPersistentContainer,
     TagContainerImage,
+    parse_build_tree,
 )
-from configuration.steps.remote import ShellStep
+from configuration.steps.remote import PropsFromShellStep, ShellStep
 
 
 def add_docker_create_workdirs_step(
@@ -177,3 +184,126 @@ def add_docker_sidecar_step(sidecar: Sidecar) -> ShellStep:
             haltOnFailure=True,
         ),
     )
+
+
+def add_docker_sidecar_lease_step(sidecar: Sidecar) -> ShellStep:
+    """Add a step to lease a warm sidecar from the pool of its image.
+    Attributes:
+        sidecar (Sidecar): The pooled Sidecar.
+    Returns:
+        ShellStep: A configured ShellStep that executes the LeaseDockerSidecar command.
+    """
+    return ShellStep(
+        command=LeaseDockerSidecar(sidecar=sidecar),
+        options=StepOptions(
+            haltOnFailure=True,
+        ),
+    )
+
+
+def add_docker_sidecar_release_step(name: str, sidecar: Sidecar) -> ShellStep:
+    """Add a step to release the pooled sidecar leased by the builder.
+    Attributes:
+        name (str): The name of the release step.
+        sidecar (Sidecar): The pooled Sidecar.
+    Returns:
+        ShellStep: A configured ShellStep that executes the ReleaseDockerSidecar command.
+    """
+    return ShellStep(
+        command=ReleaseDockerSidecar(name=name, sidecar=sidecar),
+        options=StepOptions(
+            alwaysRun=True,
+        ),
+    )
+
+
+def add_docker_persistent_container_step(
+    docker_environment: DockerConfig,
+) -> ShellStep:
+    """Add a step to start the long-lived container of a builder.
+    Attributes:
+        docker_environment (DockerConfig): The configuration of the container.
+    Returns:
+        ShellStep: A configured ShellStep that executes the StartPersistentContainer command.
+    """
+    return ShellStep(
+        command=StartPersistentContainer(docker_environment=docker_environment),
+        options=StepOptions(
+            haltOnFailure=True,
+        ),
+    )
+
+
+def add_build_tree_acquire_step(
+    container_name: str, build_tree: BuildTree
+) -> PropsFromShellStep:
+    """Add a step picking the workdir volume of the build, see AcquireBuildTree.
+    Attributes:
+        container_name (str): The name of the Docker container of the builder.
+        build_tree (BuildTree): The build tree configuration of the builder.
+    Returns:
+        PropsFromShellStep: A step setting the build_tree and build_tree_reused properties.
+    """
+    return PropsFromShellStep(
+        command=AcquireBuildTree(container_name=container_name, build_tree=build_tree),
+        extract_fn=parse_build_tree,
+        options=StepOptions(
+            haltOnFailure=True,
+        ),
+    )
+
+
+def add_build_tree_release_steps(
+    container_name: str, image_url: str, build_tree: BuildTree
+) -> list[ShellStep]:
+    """Add the steps giving back the build tree, see ReleaseBuildTree.
+    The tree is kept when the build succeeded (with or without warnings), removed
+    otherwise so that the next build of the branch starts clean. A failure over a
+    reused tree may come from the tree itself: once the tree is removed, the build
+    ends with RETRY, Buildbot requeues its build request and only the result of the
+    clean build is reported. The retried build never builds over a tree, whatever
+    its host (see build_tree_mode), so a build request is retried at most once.
+    Attributes:
+        container_name (str): The name of the Docker container of the builder.
+        image_url (str): The URL of the Docker image measuring the tree.
+        build_tree (BuildTree): The build tree configuration of the builder.
+    Returns:
+        list[ShellStep]: The release step, run when the build succeeded, the drop
+            step, run when it did not, and the drop step retrying the build, run
+            instead when it failed over a reused tree.
+    """
+    steps = [
+        ShellStep(
+            command=ReleaseBuildTree(
+                name=name,
+                container_name=container_name,
+                image_url=image_url,
+                build_tree=build_tree,
+                keep=keep,
+            ),
+            options=StepOptions(
+                alwaysRun=True,
+                haltOnFailure=False,
+                doStepIf=do_step_if,
+            ),
+        )
+        for name, keep, do_step_if in (
+            ("Release", True, _build_succeeded),
+            ("Drop", False, _drop_tree),
+            ("Retry without", False, _reused_tree_failed),
+        )
+    ]
+    steps[-1].decode_return_code = {0: RETRY}
+    return steps
+
+
+def _build_succeeded(step) -> bool:
+    return step.build.results in (SUCCESS, WARNINGS)
+
+
+def _reused_tree_failed(step) -> bool:
+    return step.build.results == FAILURE and bool(step.getProperty("build_tree_reused"))
+
+
+def _drop_tree(step) -> bool:
+    return not _build_succeeded(step) and not _reused_tree_failed(step)
@@ -1,25 +1,47 @@
-from configuration.builders.infra.runtime import InContainer, Sidecar
-from configuration.steps.base import BaseStep
+from typing import Optional
+
+from configuration.builders.infra.runtime import (
+    BuildTree,
+    InContainer,
+    ParallelGroup,
+    Sidecar,
+)
+from configuration.steps.base import BaseStep, StepOptions
+from configuration.steps.commands.compile import (
+    CCacheStats,
+    CompileCMakeCommand,
+    CompileDebAutobake,
+    CompileMakeCommand,
+    parse_ccache_stats,
+)
 from configuration.steps.infra import (
+    add_build_tree_acquire_step,
+    add_build_tree_release_steps,
     add_docker_cleanup_step,
     add_docker_commit_step,
     add_docker_create_workdirs_step,
     add_docker_fetch_step,
     add_docker_network_step,
+    add_docker_persistent_container_step,
+    add_docker_sidecar_lease_step,
+    add_docker_sidecar_release_step,
     add_docker_sidecar_step,
     add_docker_tag_step,
     add_worker_cleanup_step,
 )
+from configuration.steps.remote import PropsFromShellStep, ShellStep
 
 
-def processor_docker_workdirs(
+def processor_ccache_stats(
     prepare_steps: list[BaseStep],
     active_steps: list[BaseStep],
     cleanup_steps: list[BaseStep],
 ) -> tuple[list[BaseStep], list[BaseStep], list[BaseStep]]:
-    """Prepare Docker work directories for steps that require them.
-    This function checks the active steps for any InContainer steps and adds a
-    Docker work directory creation step for each unique work directory used in those steps.
+    """Collect the ccache statistics of the compile steps as build properties.
+    This function saves the ccache counters before the first InContainer compile
+    step using ccache (CCACHE_DIR set) and adds a step after the last one setting the
+    ccache_* build properties from the counters they changed, see
+    parse_ccache_stats. The collection also runs when compiling failed.
     Args:
         prepare_steps (list[BaseStep]): Steps to be executed before the main steps.
         active_steps (list[BaseStep]): Main steps to be executed.
@@ -27,259 +49,241 @@ def processor_docker_workdirs(
     Returns:
         tuple: Updated lists of prepare_steps, active_steps, and cleanup_steps.
     """
-    prepare_steps = prepare_steps.copy()
-    active_steps = active_steps.copy()
-    cleanup_steps = cleanup_steps.copy()
-    docker_workdirs = []
-    docker_config = None
+    compile_indexes = [
+        i for i, step in enumerate(active_steps) if _is_ccache_compile(step)
+    ]
+    if not compile_indexes:
+        return prepare_steps, active_steps, cleanup_steps
+    first, last = compile_indexes[0], compile_indexes[-1]
+    docker_environment = active_steps[first].docker_environment
+    env_vars = [
+        (k, v) for k, v in active_steps[first].step.env_vars if k == "CCACHE_DIR"
+    ]
+    baseline = InContainer(
+        ShellStep(
+            command=CCacheStats(baseline=True),
+            options=StepOptions(haltOnFailure=False),
+            env_vars=env_vars,
+        ),
+        docker_environment=docker_environment,
+    )
+    collect = InContainer(
+        PropsFromShellStep(
+            command=CCacheStats(baseline=False),
+            extract_fn=parse_ccache_stats,
+            options=StepOptions(alwaysRun=True, haltOnFailure=False),
+            env_vars=env_vars,
+        ),
+        docker_environment=active_steps[last].docker_environment,
+    )
+    processed_steps = [
+        *active_steps[:first],
+        baseline,
+        *active_steps[first : last + 1],
+        collect,
+        *active_steps[last + 1 :],
+    ]
+    return prepare_steps, processed_steps, cleanup_steps
+
+
+def _is_ccache_compile(step: BaseStep) -> bool:
+    if not isinstance(step, InContainer):
+        return False
+    if not isinstance(
+        step.step.command, (CompileCMakeCommand, CompileDebAutobake, CompileMakeCommand)
+    ):
+        return False
+    return any(
+        variable == "CCACHE_DIR"
+        for variable, _ in (*step.docker_environment.env_vars, *step.step.env_vars)
+    )
 
-    relevant_steps = filter(lambda x: isinstance(x, InContainer), active_steps)
-    for step in relevant_steps:
-        if str(step.workdir) not in docker_workdirs and not step.workdir.is_absolute():
-            docker_workdirs.append(str(step.workdir))
-            if not docker_config:
-                docker_config = step.docker_environment
 
-    if docker_config:
-        prepare_steps.append(
-            add_docker_create_workdirs_step(
-                volume_mount=docker_config.volume_mount,
-                image_url=docker_config.image_url,
-                workdirs=docker_workdirs,
-            )
+def _sidecar_steps(sidecar: Sidecar) -> list[BaseStep]:
+    steps = [
+        add_docker_fetch_step(image_url=sidecar.image_url, platform=sidecar.platform)
+    ]
+    if sidecar.pool_size:
+        steps.append(
+            add_docker_sidecar_release_step(name="previous-run", sidecar=sidecar)
         )
+    steps.append(add_docker_network_step(network_name=sidecar.network))
+    if sidecar.pool_size:
+        steps.append(add_docker_sidecar_lease_step(sidecar=sidecar))
+    else:
+        steps.append(add_docker_sidecar_step(sidecar=sidecar))
+    return steps
+
+
+def _tag_step(step: InContainer) -> BaseStep:
+    return add_docker_tag_step(
+        image_url=step.docker_environment.image_url,
+        runtime_tag=step.docker_environment.runtime_tag,
+    )
 
-    return prepare_steps, active_steps, cleanup_steps
 
+def _commit_step(step: InContainer) -> BaseStep:
+    return add_docker_commit_step(
+        container_name=step.docker_environment.container_name,
+        runtime_tag=step.docker_environment.runtime_tag,
+        step_name=step.name,
+        step_options=step.options,
+    )
 
-def processor_docker_cleanup(
-    prepare_steps: list[BaseStep],
+
+def process_steps(
+    builder_name: str,
+    environment: str,
     active_steps: list[BaseStep],
-    cleanup_steps: list[BaseStep],
     sidecar: Sidecar = None,
+    persistent_container: bool = False,
+    build_tree: Optional[BuildTree] = None,
 ) -> tuple[list[BaseStep], list[BaseStep], list[BaseStep]]:
-    """Prepare Docker cleanup steps for the current and previous runs.
-    This function checks the active steps for any InContainer steps and adds cleanup
-    steps for the Docker containers used in those steps. It ensures that the cleanup
-    steps are added for both the current run and the previous run.
+    """Run the step pre and post-processing of a builder in a single pass.
+    After processor_ccache_stats, the active steps are classified once and every list
+    is built by appending:
+    - prepare: worker and docker cleanup of the previous run, image fetch, workdirs
+      creation and the sidecar;
+    - active: the container name of the InContainer steps, a tag step (and the
+      persistent container start) on each environment change and the commits;
+    - cleanup: worker and docker cleanup of the current run.
+    The steps of a ParallelGroup get their container name, image fetch and workdirs
+    like the other InContainer steps, the group is tagged and made persistent as one.
     Args:
-        prepare_steps (list[BaseStep]): Steps to be executed before the main steps.
+        builder_name (str): The name of the builder, used as the container name.
+        environment (str): The deployment environment (PROD, DEV).
         active_steps (list[BaseStep]): Main steps to be executed.
-        cleanup_steps (list[BaseStep]): Steps to be executed after the main steps.
+        sidecar (Sidecar): Optional background container started before the main steps.
+        persistent_container (bool): Run the InContainer steps through docker exec in
+            a long-lived container started after each tag step. The commit steps are
+            then not needed, the container keeps its state between steps. The
+            container is removed by the docker cleanup steps.
+        build_tree (BuildTree): Optional incremental build tree of the builder. The
+            workdir volume is the one picked by AcquireBuildTree, the steps with a
+            reuse_tree attribute (checkout, configure) update the tree in place. It
+            has no processor of its own.
     Returns:
-        tuple: Updated lists of prepare_steps, active_steps, and cleanup_steps.
+        tuple: The prepare_steps, active_steps, and cleanup_steps of the builder.
     """
-    prepare_steps = prepare_steps.copy()
-    active_steps = active_steps.copy()
-    cleanup_steps = cleanup_steps.copy()
+    _, active_steps, _ = processor_ccache_stats([], active_steps, [])
+    container_name = f"dev_{builder_name}" if environment == "DEV" else builder_name
+    processed_steps = []
+    container_steps = []
+    docker_environments = set()
+    fetch_steps = []
+    docker_workdirs = []
+    workdirs_config = None
+    current_docker_environment = None
 
-    relevant_steps = filter(lambda x: isinstance(x, InContainer), active_steps)
-    for step in relevant_steps:
-        cleanup_steps.append(
+    for step in active_steps:
+        if isinstance(step, InContainer):
+            inner_steps = (step,)
+        elif isinstance(step, ParallelGroup):
+            inner_steps = step.steps
+        else:
+            processed_steps.append(step)
+            continue
+        for inner_step in inner_steps:
+            docker_environment = inner_step.docker_environment
+            docker_environment._container_name = container_name
+            docker_environment._build_tree = build_tree is not None
+            if hasattr(inner_step.step.command, "reuse_tree"):
+                inner_step.step.command.reuse_tree = build_tree is not None
+            container_steps.append(inner_step)
+
+            if docker_environment not in docker_environments:
+                fetch_steps.append(
+                    add_docker_fetch_step(
+                        image_url=docker_environment.image_url,
+                        platform=docker_environment.platform,
+                    )
+                )
+                docker_environments.add(docker_environment)
+
+            workdir = str(inner_step.workdir)
+            if workdir not in docker_workdirs and not inner_step.workdir.is_absolute():
+                docker_workdirs.append(workdir)
+                if not workdirs_config:
+                    workdirs_config = docker_environment
+
+        docker_environment = step.docker_environment
+        # Sequences share their DockerConfig, skip the field by field comparison
+        if (
+            current_docker_environment is not docker_environment
+            and current_docker_environment != docker_environment
+        ):
+            processed_steps.append(_tag_step(step))
+            if persistent_container:
+                processed_steps.append(
+                    add_docker_persistent_container_step(
+                        docker_environment=docker_environment
+                    )
+                )
+            current_docker_environment = docker_environment
+
+        step.persistent = step.persistent or persistent_container
+        processed_steps.append(step)
+        if step.container_commit and not step.persistent:
+            processed_steps.append(_commit_step(step))
+
+    prepare_steps = [add_worker_cleanup_step(name="previous-run")]
+    cleanup_steps = [add_worker_cleanup_step(name="current-run")]
+
+    if container_steps:
+        docker_environment = container_steps[0].docker_environment
+        prepare_steps.append(
             add_docker_cleanup_step(
-                name="current-run",
-                container_name=step.docker_environment.container_name,
-                runtime_tag=step.docker_environment.runtime_tag,
+                name="previous-run",
+                container_name=docker_environment.container_name,
+                runtime_tag=docker_environment.runtime_tag,
                 sidecar=sidecar,
             )
         )
-        prepare_steps.append(
+        cleanup_steps.append(
             add_docker_cleanup_step(
-                name="previous-run",
-                container_name=step.docker_environment.container_name,
-                runtime_tag=step.docker_environment.runtime_tag,
+                name="current-run",
+                container_name=docker_environment.container_name,
+                runtime_tag=docker_environment.runtime_tag,
                 sidecar=sidecar,
             )
         )
-        break
-
-    return prepare_steps, active_steps, cleanup_steps
-
-
-def processor_docker_commit(
-    prepare_steps: list[BaseStep],
-    active_steps: list[BaseStep],
-    cleanup_steps: list[BaseStep],
-) -> tuple[list[BaseStep], list[BaseStep], list[BaseStep]]:
-    """Prepare Docker commit steps for active InContainer steps.
-    This function checks the active steps for any InContainer steps that require
-    committing the container state and adds a Docker commit step for each such step.
-    Args:
-        prepare_steps (list[BaseStep]): Steps to be executed before the main steps.
-        active_steps (list[BaseStep]): Main steps to be executed.
-        cleanup_steps (list[BaseStep]): Steps to be executed after the main steps.
-    Returns:
-        tuple: Updated lists of prepare_steps, active_steps, and cleanup_steps.
-    """
-    prepare_steps = prepare_steps.copy()
-    active_steps = active_steps.copy()
-    cleanup_steps = cleanup_steps.copy()
-
-    for id, step in enumerate(active_steps):
-        if not isinstance(step, InContainer):
-            continue
-        if step.container_commit:
-            active_steps.insert(
-                id + 1,
-                add_docker_commit_step(
-                    container_name=step.docker_environment.container_name,
-                    runtime_tag=step.docker_environment.runtime_tag,
-                    step_name=step.name,
-                    step_options=step.options,
-                ),
+        if sidecar is not None and sidecar.pool_size:
+            cleanup_steps.append(
+                add_docker_sidecar_release_step(name="current-run", sidecar=sidecar)
             )
-
-    return prepare_steps, active_steps, cleanup_steps
-
-
-def processor_docker_tag(
-    prepare_steps: list[BaseStep],
-    active_steps: list[BaseStep],
-    cleanup_steps: list[BaseStep],
-) -> tuple[list[BaseStep], list[BaseStep], list[BaseStep]]:
-    """Prepare Docker tagging steps for active InContainer steps.
-    This function checks the active steps for any InContainer steps and adds a
-    tag step whenever an environment change (different docker config) is detected.
-    Args:
-        prepare_steps (list[BaseStep]): Steps to be executed before the main steps.
-        active_steps (list[BaseStep]): Main steps to be executed.
-        cleanup_steps (list[BaseStep]): Steps to be executed after the main steps.
-    Returns:
-        tuple: Updated lists of prepare_steps, active_steps, and cleanup_steps.
-    """
-    prepare_steps = prepare_steps.copy()
-    active_steps = active_steps.copy()
-    cleanup_steps = cleanup_steps.copy()
-    current_docker_environment = None
-
-    for id, step in enumerate(active_steps):
-        if not isinstance(step, InContainer):
-            continue
-            # Changing environments requires deleting the old image/tag and creating a new one
-        if current_docker_environment != step.docker_environment:
-            active_steps.insert(
-                id,
-                add_docker_tag_step(
-                    image_url=step.docker_environment.image_url,
-                    runtime_tag=step.docker_environment.runtime_tag,
-                ),
-            )
-            current_docker_environment = step.docker_environment
-
-    return prepare_steps, active_steps, cleanup_steps
-
-
-def processor_docker_fetch(
-    prepare_steps: list[BaseStep],
-    active_steps: list[BaseStep],
-    cleanup_steps: list[BaseStep],
-) -> tuple[list[BaseStep], list[BaseStep], list[BaseStep]]:
-    """Fetch Docker images for steps that require them.
-    This function checks the active steps for any InContainer steps and adds a
-    Docker fetch step for each unique Docker environment used in those steps.
-    Args:
-        prepare_steps (list[BaseStep]): Steps to be executed before the main steps.
-        active_steps (list[BaseStep]): Main steps to be executed.
-        cleanup_steps (list[BaseStep]): Steps to be executed after the main steps.
-    Returns:
-        tuple: Updated lists of prepare_steps, active_steps, and cleanup_steps.
-    """
-    prepare_steps = prepare_steps.copy()
-    active_steps = active_steps.copy()
-    cleanup_steps = cleanup_steps.copy()
-    docker_environments = set()
-
-    relevant_steps = filter(lambda x: isinstance(x, InContainer), active_steps)
-    for step in relevant_steps:
-        if step.docker_environment not in docker_environments:
+        if build_tree is not None:
             prepare_steps.append(
-                add_docker_fetch_step(
-                    image_url=step.docker_environment.image_url,
-                    platform=step.docker_environment.platform,
+                add_build_tree_acquire_step(
+                    container_name=docker_environment.container_name,
+                    build_tree=build_tree,
                 )
             )
-            docker_environments.add(step.docker_environment)
-
-    return prepare_steps, active_steps, cleanup_steps
-
-
-def processor_worker_cleanup(
-    prepare_steps: list[BaseStep],
-    active_steps: list[BaseStep],
-    cleanup_steps: list[BaseStep],
-) -> tuple[list[BaseStep], list[BaseStep], list[BaseStep]]:
-    """Prepare worker cleanup steps for the current and previous runs.
-    This function adds cleanup steps for the worker used in the current and previous runs.
-    Args:
-        prepare_steps (list[BaseStep]): Steps to be executed before the main steps.
-        active_steps (list[BaseStep]): Main steps to be executed.
-        cleanup_steps (list[BaseStep]): Steps to be executed after the main steps.
-    Returns:
-        tuple: Updated lists of prepare_steps, active_steps, and cleanup_steps.
-    """
-    prepare_steps = prepare_steps.copy()
-    active_steps = active_steps.copy()
-    cleanup_steps = cleanup_steps.copy()
-
-    prepare_steps.append(add_worker_cleanup_step(name="previous-run"))
-    cleanup_steps.append(add_worker_cleanup_step(name="current-run"))
-
-    return prepare_steps, active_steps, cleanup_steps
-
-
-def processor_set_docker_runtime_environment(
-    builder_name: str, active_steps: list[BaseStep], environment: str
-) -> list[BaseStep]:
-    """Set the Docker runtime environment for InContainer steps.
-    This function updates the Docker environment for all InContainer steps in the
-    active steps, setting the container name to the builder name.
-    Args:
-        builder_name (str): The name of the builder to set as the container name.
-        active_steps (list[BaseStep]): The list of active steps to update.
-    Returns:
-        list[BaseStep]: The updated list of active steps with the Docker environment set.
-    """
-    for step in active_steps:
-        if isinstance(step, InContainer):
-            step.docker_environment._container_name = builder_name
-            if environment == "DEV":
-                step.docker_environment._container_name = f"dev_{builder_name}"
-
-    return active_steps
-
-
-def processor_sidecar(
-    builder_name: str,
-    environment: str,
-    sidecar: Sidecar,
-    prepare_steps: list[BaseStep],
-    active_steps: list[BaseStep],
-) -> tuple[list[BaseStep], list[BaseStep]]:
-    """Prepare and manage a background Docker sidecar container for the build steps.
-    This function sets up a Docker sidecar container, including fetching the image,
-    creating the network, and starting the container. It also updates the InContainer steps
-    to join the sidecar network and sets the SIDECAR_HOST environment variable for those steps.
-    """
-
-    prepare_steps = prepare_steps.copy()
-    active_steps = active_steps.copy()
-
-    sidecar._container_name = f"{environment}_{builder_name}_sidecar"
-    sidecar._network = f"{environment}_{builder_name}_network"
-
-    # Fetch the sidecar image, create the network and start the sidecar container in the prepare steps
-    prepare_steps.append(
-        add_docker_fetch_step(image_url=sidecar.image_url, platform=sidecar.platform)
-    )
-    prepare_steps.append(add_docker_network_step(network_name=sidecar.network))
-    prepare_steps.append(add_docker_sidecar_step(sidecar=sidecar))
+            cleanup_steps.extend(
+                add_build_tree_release_steps(
+                    container_name=docker_environment.container_name,
+                    image_url=docker_environment.image_url,
+                    build_tree=build_tree,
+                )
+            )
+    prepare_steps.extend(fetch_steps)
+    if workdirs_config:
+        prepare_steps.append(
+            add_docker_create_workdirs_step(
+                volume_mount=workdirs_config.volume_mount,
+                image_url=workdirs_config.image_url,
+                workdirs=docker_workdirs,
+            )
+        )
 
-    # Join InContainer steps to the sidecar network
-    for step in active_steps:
-        if isinstance(step, InContainer):
+    if sidecar:
+        sidecar._container_name = f"{environment}_{builder_name}_sidecar"
+        sidecar._network = f"{environment}_{builder_name}_network"
+        prepare_steps.extend(_sidecar_steps(sidecar))
+        # After the traversal, the environment comparisons above must not see these
+        for step in container_steps:
             step.docker_environment._network = sidecar.network
-            # Steps can access the sidecar via the SIDECAR_HOST env var
             step.docker_environment.env_vars.append(
                 ("SIDECAR_HOST", sidecar.container_name)
             )
-    return prepare_steps, active_steps
+
+    return prepare_steps, processed_steps, cleanup_steps
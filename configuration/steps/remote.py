@@ -1,8 +1,15 @@
+from typing import Callable
+
 from buildbot.interfaces import IBuildStep
-from buildbot.plugins import steps, util
+from buildbot.plugins import steps
 from buildbot.process.results import SUCCESS, WARNINGS
 from configuration.steps.base import BaseStep, StepOptions
-from configuration.steps.commands.base import URL, Command, ShellCommandWithURL
+from configuration.steps.commands.base import (
+    URL,
+    Command,
+    ShellCommandWithURL,
+    interpolate,
+)
 
 
 class ShellStep(BaseStep):
@@ -18,6 +25,8 @@ class ShellStep(BaseStep):
         urlText (str): Optional text for the URL. Defaults to the url itself.
         timeout (int): Timeout for the command execution in seconds. Defaults to 1200 seconds.
         warn_on_fail (bool): If True, treat non-zero return codes as warnings instead of failures.
+        container_usage (bool): Whether the command prints the usage of its container,
+            set by InContainer, see ShellCommandWithURL.
     Args:
     """
 
@@ -44,25 +53,35 @@ class ShellStep(BaseStep):
         assert isinstance(command, Command)
         super().__init__(command.name, options)
         self.prefix_cmd = []
+        self.container_usage = False
         if warn_on_fail:
             self.decode_return_code = self.WARN_ON_FAIL_DECODE_RC
         else:
             self.decode_return_code = self.DEFAULT_DECODE_RC
 
     def generate(self) -> IBuildStep:
-        workdir = self._set_workdir()
         return ShellCommandWithURL(
             name=self.name,
-            command=[*self.prefix_cmd, *self.command.as_cmd_arg()],
-            interruptSignal=self.interrupt_signal,
             **self.options.getopt,
-            workdir=workdir,
             url=self.url,
-            timeout=self.timeout,
-            env={k: util.Interpolate(v) for k, v in self.env_vars},
-            decodeRC=self.decode_return_code,
+            container_usage=self.container_usage,
+            **self.remote_command_args(),
         )
 
+    def remote_command_args(self) -> dict:
+        """
+        The arguments of the shell command the step runs on the worker, as given to
+        Buildbot's ShellCommand.
+        """
+        return {
+            "command": [*self.prefix_cmd, *self.command.as_cmd_arg()],
+            "interruptSignal": self.interrupt_signal,
+            "workdir": self._set_workdir(),
+            "timeout": self.timeout,
+            "env": {k: interpolate(v) for k, v in self.env_vars},
+            "decodeRC": self.decode_return_code,
+        }
+
     def _set_workdir(self) -> str:
         if self.command.workdir.is_absolute():
             workdir = self.command.workdir
@@ -110,3 +129,43 @@ class PropFromShellStep(ShellStep):
             **self.options.getopt,
             workdir=workdir,
         )
+
+
+class PropsFromShellStep(ShellStep):
+    """
+    A step that sets build properties from the output of a shell command.
+    Attributes:
+        command (Command): The command to be executed.
+        extract_fn (callable): Called with the return code, stdout and stderr of the
+            command, returns the properties to set as a dict.
+        options (StepOptions): Options for the step, such as timeout and retry settings.
+        interrupt_signal (str): The signal to send to interrupt the command (default: "TERM").
+        env_vars (list[tuple]): Environment variables to set for the command.
+    """
+
+    def __init__(
+        self,
+        command: Command,
+        extract_fn: Callable[[int, str, str], dict],
+        options: StepOptions = None,
+        interrupt_signal="TERM",
+        env_vars: list[tuple] = None,
+    ):
+        self.extract_fn = extract_fn
+        super().__init__(
+            command=command,
+            options=options,
+            interrupt_signal=interrupt_signal,
+            env_vars=env_vars,
+        )
+
+    def generate(self) -> IBuildStep:
+        workdir = self._set_workdir()
+        return steps.SetPropertyFromCommand(
+            name=self.name,
+            command=[*self.prefix_cmd, *self.command.as_cmd_arg()],
+            interruptSignal=self.interrupt_signal,
+            extract_fn=self.extract_fn,
+            **self.options.getopt,
+            workdir=workdir,
+        )
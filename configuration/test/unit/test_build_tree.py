@@ -0,0 +1,447 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path, PurePath
+from types import SimpleNamespace
+
+from twisted.internet import defer
+
+from buildbot.process.properties import Interpolate, Properties
+from buildbot.process.results import (
+    CANCELLED,
+    EXCEPTION,
+    FAILURE,
+    RETRY,
+    SUCCESS,
+    WARNINGS,
+    Results,
+)
+from buildbot.util import flatten
+from configuration.builders.infra.runtime import BuildTree, DockerConfig, InContainer
+from configuration.steps.commands.base import Command
+from configuration.steps.commands.configure import ConfigureMariaDBCMake
+from configuration.steps.commands.infra import (
+    AcquireBuildTree,
+    ReleaseBuildTree,
+    build_tree_mode,
+    parse_build_tree,
+)
+from configuration.steps.generators.cmake.generator import CMakeGenerator
+from configuration.steps.generators.cmake.options import CMAKE, BuildType, CMakeOption
+from configuration.steps.processors import process_steps
+from configuration.steps.remote import ShellStep
+
+BUILDER = "amd64-compile-only-minimal"
+
+# Stands in for the docker CLI: a volume is a file of $DOCKER_STATE/volumes holding
+# its size in bytes, those listed in $DOCKER_STATE/in-use cannot be removed.
+FAKE_DOCKER = """#!/bin/bash
+volumes="$DOCKER_STATE/volumes"
+mkdir -p "$volumes"
+case "$1 $2" in
+"volume inspect") [[ -f $volumes/$3 ]] ;;
+"volume create") echo 0 >"$volumes/${*: -1}" ;;
+"volume ls") ls "$volumes" ;;
+"volume rm")
+  ! grep -qx "$3" "$DOCKER_STATE/in-use" 2>/dev/null || exit 1
+  rm "$volumes/$3"
+  ;;
+run*)
+  for arg; do
+    [[ $arg != type=volume,src=* ]] || src="${arg#*src=}"
+  done
+  src="${src%%,*}"
+  printf '%s\\t/tree\\n' "$(cat "$volumes/$src")"
+  ;;
+esac
+"""
+
+
+class Run(Command):
+    def __init__(self, script: str, workdir: PurePath = PurePath("build")):
+        super().__init__(name=f"Run {script}", workdir=workdir)
+        self.script = script
+
+    def as_cmd_arg(self) -> list[str]:
+        return ["bash", "-ec", self.script]
+
+
+def render(args: list, mode: str = "reuse", **properties) -> list[str]:
+    """
+    The arguments of a command, with the build properties it uses rendered and
+    build_tree_mode rendered as `mode`.
+    """
+    rendered = []
+    for arg in flatten(args):
+        if isinstance(arg, Interpolate):
+            arg = arg.fmtstring
+            for name, value in properties.items():
+                arg = arg.replace(f"%(prop:{name})s", value)
+        elif arg is build_tree_mode:
+            arg = mode
+        rendered.append(arg)
+    return rendered
+
+
+class TestBuildTreeSteps(unittest.TestCase):
+    def steps(self) -> list:
+        config = DockerConfig(repository="registry/", image_tag="debian13")
+        configure = ConfigureMariaDBCMake(
+            name="Minimal",
+            cmake_generator=CMakeGenerator(
+                flags=[CMakeOption(CMAKE.BUILD_TYPE, BuildType.DEBUG)]
+            ),
+        )
+        return [
+            InContainer(ShellStep(command=configure), docker_environment=config),
+            InContainer(ShellStep(command=Run("make")), docker_environment=config),
+        ]
+
+    def test_build_tree_steps(self):
+        """Test that a builder with a build tree acquires, mounts and releases it."""
+        build_tree = BuildTree(quota="300g", branches=["1*.*", "main"])
+        prepare_steps, active_steps, cleanup_steps = process_steps(
+            builder_name=BUILDER,
+            environment="PROD",
+            active_steps=self.steps(),
+            build_tree=build_tree,
+        )
+        prepare_names = [step.name for step in prepare_steps]
+        self.assertEqual(
+            prepare_names[1:4],
+            [
+                "Cleanup Docker resources - previous-run",
+                "Acquire build tree",
+                "Fetch container image",
+            ],
+        )
+        self.assertEqual(
+            [step.name for step in cleanup_steps][-3:],
+            ["Release build tree", "Drop build tree", "Retry without build tree"],
+        )
+        acquire = prepare_steps[2].command
+        self.assertIsInstance(acquire, AcquireBuildTree)
+        self.assertEqual(
+            render(acquire.as_cmd_arg(), branch="11.4")[-5:],
+            [BUILDER, "reuse", "11.4", "1*.*", "main"],
+        )
+        release = cleanup_steps[-3].command
+        self.assertIsInstance(release, ReleaseBuildTree)
+        self.assertEqual(
+            render(release.as_cmd_arg(), build_tree="tree")[-5:],
+            [BUILDER, "tree", "registry/debian13", str(300 * 1024**3), "keep"],
+        )
+        for step in cleanup_steps[-2:]:
+            self.assertEqual(step.command.as_cmd_arg()[-1], "drop")
+        self.assertEqual(cleanup_steps[-1].decode_return_code, {0: RETRY})
+
+        for step in [*prepare_steps, *active_steps]:
+            if isinstance(step, InContainer):
+                self.assertIn(
+                    "type=volume,src=%(prop:build_tree)s,dst=/home/buildbot",
+                    [
+                        arg.fmtstring
+                        for arg in flatten(step.wrapped_step().prefix_cmd)
+                        if isinstance(arg, Interpolate)
+                    ],
+                )
+        workdirs = prepare_steps[-1].command.as_cmd_arg()
+        self.assertEqual(
+            workdirs[4].fmtstring,
+            "type=volume,src=%(prop:build_tree)s,dst=/home/buildbot",
+        )
+        configure = active_steps[1].step.command
+        self.assertTrue(configure.reuse_tree)
+        self.assertEqual(configure.as_cmd_arg()[3:5], ["--", "."])
+
+    def test_release_by_result(self):
+        """
+        Test that only a successful build keeps its tree and that a failure over
+        a reused tree drops it and retries the build.
+        """
+        *_, cleanup_steps = process_steps(
+            builder_name=BUILDER,
+            environment="PROD",
+            active_steps=self.steps(),
+            build_tree=BuildTree(quota="300g"),
+        )
+        release, drop, retry = (step.options.doStepIf for step in cleanup_steps[-3:])
+        for result, reused, expected in (
+            (SUCCESS, True, release),
+            (WARNINGS, True, release),
+            (FAILURE, False, drop),
+            (FAILURE, True, retry),
+            (EXCEPTION, True, drop),
+            (CANCELLED, True, drop),
+            (RETRY, True, drop),
+        ):
+            step = SimpleNamespace(
+                build=SimpleNamespace(results=result),
+                getProperty=lambda name, reused=reused: {
+                    "build_tree_reused": reused
+                }.get(name),
+            )
+            with self.subTest(result=Results[result], reused=reused):
+                self.assertEqual(
+                    [do_step_if(step) for do_step_if in (release, drop, retry)],
+                    [do_step_if is expected for do_step_if in (release, drop, retry)],
+                )
+
+    def test_no_build_tree(self):
+        """Test that the volume of the builder is used without a build tree."""
+        prepare_steps, active_steps, cleanup_steps = process_steps(
+            builder_name=BUILDER, environment="PROD", active_steps=self.steps()
+        )
+        names = [step.name for step in prepare_steps + cleanup_steps]
+        self.assertNotIn("Acquire build tree", names)
+        self.assertNotIn("Release build tree", names)
+        self.assertEqual(
+            prepare_steps[-1].command.as_cmd_arg()[4],
+            f"type=volume,src={BUILDER},dst=/home/buildbot",
+        )
+        self.assertFalse(active_steps[1].step.command.reuse_tree)
+
+    def test_build_tree_mode(self):
+        """Test that a build request which already had a build gets a fresh tree."""
+        for builds, expected in (
+            ([{"buildid": 7}], "reuse"),
+            ([{"buildid": 3}, {"buildid": 7}], "fresh"),
+        ):
+            data = SimpleNamespace(
+                get=lambda path, builds=builds: defer.succeed(
+                    builds if path == ("buildrequests", 42, "builds") else None
+                )
+            )
+            build = SimpleNamespace(
+                buildid=7,
+                requests=[SimpleNamespace(id=42)],
+                master=SimpleNamespace(data=data),
+            )
+            props = Properties()
+            props.build = build
+            results = []
+            build_tree_mode.getRenderingFor(props).addBoth(results.append)
+            self.assertEqual(results, [expected])
+
+    def test_parse_build_tree(self):
+        """Test that the volume and its reuse are read from the acquire output."""
+        self.assertEqual(
+            parse_build_tree(
+                0, "build_tree=b--tree--11.4\nbuild_tree_reused=true\n", ""
+            ),
+            {"build_tree": "b--tree--11.4", "build_tree_reused": True},
+        )
+        self.assertEqual(
+            parse_build_tree(0, f"build_tree={BUILDER}\nbuild_tree_reused=false\n", ""),
+            {"build_tree": BUILDER, "build_tree_reused": False},
+        )
+
+
+@unittest.skipUnless(shutil.which("flock"), "flock is not installed")
+class TestBuildTreeScript(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        bin_dir = self.tmp / "bin"
+        bin_dir.mkdir()
+        docker = bin_dir / "docker"
+        docker.write_text(FAKE_DOCKER)
+        docker.chmod(0o755)
+        self.docker_state = self.tmp / "docker"
+        (self.docker_state / "volumes").mkdir(parents=True)
+        self.state_dir = self.tmp / "state"
+        self.env = dict(
+            os.environ,
+            PATH=f"{bin_dir}:{os.environ['PATH']}",
+            DOCKER_STATE=str(self.docker_state),
+        )
+        self.build_tree = BuildTree(quota="1m", branches=["1*.*", "main"])
+
+    def run_script(self, args: list[str]) -> str:
+        result = subprocess.run(args, env=self.env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout
+
+    def acquire(self, branch: str, builder: str = BUILDER, mode: str = "reuse") -> dict:
+        command = AcquireBuildTree(
+            container_name=builder,
+            build_tree=self.build_tree,
+            state_dir=str(self.state_dir),
+        )
+        output = self.run_script(render(command.as_cmd_arg(), mode=mode, branch=branch))
+        return parse_build_tree(0, output, "")
+
+    def release(self, volume: str, keep: bool = True, builder: str = BUILDER) -> str:
+        command = ReleaseBuildTree(
+            name="Release",
+            container_name=builder,
+            image_url="registry/debian13",
+            build_tree=self.build_tree,
+            keep=keep,
+            state_dir=str(self.state_dir),
+        )
+        return self.run_script(render(command.as_cmd_arg(), build_tree=volume))
+
+    def volumes(self) -> set[str]:
+        return {path.name for path in (self.docker_state / "volumes").iterdir()}
+
+    def fill(self, volume: str, size: int):
+        (self.docker_state / "volumes" / volume).write_text(f"{size}\n")
+
+    def test_reuse(self):
+        """Test that the next build of a main branch gets the tree of the last one."""
+        tree = f"{BUILDER}--tree--11.4"
+        self.assertEqual(
+            self.acquire("11.4"), {"build_tree": tree, "build_tree_reused": False}
+        )
+        self.fill(tree, 1000)
+        self.assertIn(f"Kept build tree {tree}, 1000 bytes", self.release(tree))
+        self.assertEqual(
+            self.acquire("11.4"), {"build_tree": tree, "build_tree_reused": True}
+        )
+        self.assertEqual(self.volumes(), {tree})
+
+    def test_tree_in_use(self):
+        """Test that a second build of the branch builds in a clean workdir."""
+        tree = self.acquire("main")["build_tree"]
+        self.assertEqual(tree, f"{BUILDER}--tree--main")
+        self.assertEqual(
+            self.acquire("main"), {"build_tree": BUILDER, "build_tree_reused": False}
+        )
+        self.release(tree)
+        self.assertEqual(self.acquire("main")["build_tree"], tree)
+
+    def test_other_branches(self):
+        """Test that the builds of the other branches do not keep a tree."""
+        self.assertEqual(
+            self.acquire("bb-11.4-feature"),
+            {"build_tree": BUILDER, "build_tree_reused": False},
+        )
+        self.assertEqual(self.volumes(), set())
+
+    def test_drop(self):
+        """Test that the tree of a failed build is removed, the next one is clean."""
+        tree = self.acquire("11.4")["build_tree"]
+        self.assertIn(f"Removed build tree {tree}", self.release(tree, keep=False))
+        self.assertEqual(self.volumes(), set())
+        self.assertFalse(self.acquire("11.4")["build_tree_reused"])
+
+    def test_retried_request(self):
+        """Test that a retried build request does not build over a tree again."""
+        tree = self.acquire("11.4")["build_tree"]
+        self.fill(tree, 1000)
+        self.release(tree)
+        self.assertEqual(
+            self.acquire("11.4", mode="fresh"),
+            {"build_tree": tree, "build_tree_reused": False},
+        )
+        self.assertEqual(self.volumes(), {tree})
+        self.assertEqual(
+            (self.docker_state / "volumes" / tree).read_text().strip(), "0"
+        )
+        self.assertFalse((self.state_dir / f"{tree}.tree").exists())
+
+    def test_lru_eviction(self):
+        """Test that the least recently used trees are removed beyond the quota."""
+        trees = {}
+        for builder in ("minimal", "nopart-debug", "without-server"):
+            trees[builder] = self.acquire("11.4", builder=builder)["build_tree"]
+            self.fill(trees[builder], 400 * 1024)
+            self.release(trees[builder], builder=builder)
+        # Used in the same second, the trees are sorted by size then name
+        self.assertEqual(
+            self.volumes(), {trees["nopart-debug"], trees["without-server"]}
+        )
+
+        # The older tree is evicted, not the one just used
+        (self.state_dir / f"{trees['without-server']}.tree").write_text("1 409600\n")
+        tree = self.acquire("main", builder="minimal")["build_tree"]
+        self.fill(tree, 300 * 1024)
+        output = self.release(tree, builder="minimal")
+        self.assertIn(f"Evicted build tree {trees['without-server']}", output)
+        self.assertEqual(self.volumes(), {trees["nopart-debug"], tree})
+
+    def test_untracked_and_leased_trees(self):
+        """Test that trees lost by the state dir are evicted, leased ones are not."""
+        self.fill(f"{BUILDER}--tree--10.6", 10)
+        leased = self.acquire("10.11")["build_tree"]
+        self.fill(leased, 2 * 1024**2)
+        output = self.release(BUILDER)
+        self.assertIn(f"Evicted build tree {BUILDER}--tree--10.6", output)
+        self.assertEqual(self.volumes(), {leased})
+
+
+@unittest.skipUnless(shutil.which("git"), "git is not installed")
+class TestCMakeReconfigure(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        bin_dir = self.tmp / "bin"
+        bin_dir.mkdir()
+        cmake = bin_dir / "cmake"
+        cmake.write_text(
+            '#!/bin/bash\necho "$*" >>../configured\ntouch CMakeCache.txt\n'
+        )
+        cmake.chmod(0o755)
+        self.source = self.tmp / "src"
+        self.source.mkdir()
+        self.env = dict(
+            os.environ,
+            PATH=f"{bin_dir}:{os.environ['PATH']}",
+            GIT_AUTHOR_NAME="buildbot",
+            GIT_AUTHOR_EMAIL="buildbot@mariadb.org",
+            GIT_COMMITTER_NAME="buildbot",
+            GIT_COMMITTER_EMAIL="buildbot@mariadb.org",
+        )
+        self.git("init", "-q")
+        self.commit("CMakeLists.txt", "project(server)\n")
+        self.commit("sql/sql_parse.cc", "int x;\n")
+
+    def git(self, *args: str):
+        subprocess.run(["git", *args], cwd=self.source, env=self.env, check=True)
+
+    def commit(self, path: str, content: str):
+        (self.source / path).parent.mkdir(parents=True, exist_ok=True)
+        (self.source / path).write_text(content)
+        self.git("add", path)
+        self.git("commit", "-q", "-m", path)
+
+    def configure(self, build_type: BuildType = BuildType.DEBUG) -> int:
+        """Configure the source in place, returns the CMake runs so far."""
+        command = ConfigureMariaDBCMake(
+            name="Minimal",
+            cmake_generator=CMakeGenerator(
+                flags=[CMakeOption(CMAKE.BUILD_TYPE, build_type)]
+            ),
+            reuse_tree=True,
+        )
+        result = subprocess.run(
+            command.as_cmd_arg(),
+            cwd=self.source,
+            env=self.env,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return len((self.tmp / "configured").read_text().splitlines())
+
+    def test_reconfigure_on_input_change(self):
+        """Test that CMake runs again only when its command or inputs changed."""
+        self.assertEqual(self.configure(), 1)
+        self.assertEqual(self.configure(), 1)
+        self.commit("sql/sql_parse.cc", "int y;\n")
+        self.assertEqual(self.configure(), 1)
+        self.commit("sql/CMakeLists.txt", "add_library(sql sql_parse.cc)\n")
+        self.assertEqual(self.configure(), 2)
+        self.commit("cmake/plugin.cmake", "# plugins\n")
+        self.assertEqual(self.configure(), 3)
+        self.assertEqual(self.configure(BuildType.RELWITHDEBUG), 4)
+        self.assertEqual(self.configure(BuildType.RELWITHDEBUG), 4)
+
+    def test_lost_cache(self):
+        """Test that a build directory without its CMake cache is configured again."""
+        self.assertEqual(self.configure(), 1)
+        (self.source / "CMakeCache.txt").unlink()
+        self.assertEqual(self.configure(), 2)
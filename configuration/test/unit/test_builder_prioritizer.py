@@ -0,0 +1,206 @@
+import unittest
+from types import SimpleNamespace
+
+import sqlalchemy as sa
+from twisted.internet import defer, task
+
+from buildbot.db.model import Model
+from configuration.builders.history import BUILD_HISTORY_NAME, BuildDurationHistory
+from configuration.builders.priority import (
+    BuilderPrioritizer,
+    free_workers,
+    oldest_pending_requests,
+)
+from configuration.workers.ledger import JobLedger
+
+STATUS_BUILDERS = ["amd64-debian-12", "amd64-windows"]
+
+
+class FakePool:
+    def __init__(self, engine):
+        self.engine = engine
+        self.calls = 0
+
+    def do(self, fn, *args):
+        self.calls += 1
+        with self.engine.connect() as conn:
+            return defer.succeed(fn(conn, *args))
+
+
+def create_db():
+    engine = sa.create_engine("sqlite://")
+    with engine.begin() as conn:
+        Model.metadata.create_all(
+            conn,
+            tables=[Model.builders, Model.buildrequests, Model.buildrequest_claims],
+        )
+    return engine
+
+
+def add_builders(engine, names: list[str]):
+    with engine.begin() as conn:
+        for builderid, name in enumerate(names, start=1):
+            conn.execute(
+                Model.builders.insert().values(id=builderid, name=name, name_hash=name)
+            )
+
+
+def add_buildrequest(engine, brid, builderid, submitted_at, complete=0, claimed=False):
+    with engine.begin() as conn:
+        conn.execute(
+            Model.buildrequests.insert().values(
+                id=brid,
+                buildsetid=1,
+                builderid=builderid,
+                priority=0,
+                complete=complete,
+                submitted_at=submitted_at,
+            )
+        )
+        if claimed:
+            conn.execute(
+                Model.buildrequest_claims.insert().values(
+                    brid=brid, masterid=1, claimed_at=submitted_at
+                )
+            )
+
+
+def fake_builder(name: str, free: int = 1, jobs: int = 1):
+    wfbs = [SimpleNamespace(worker=SimpleNamespace(properties={})) for _ in range(free)]
+    return SimpleNamespace(
+        name=name,
+        config=SimpleNamespace(properties={"jobs": jobs}),
+        getAvailableWorkers=lambda: wfbs,
+    )
+
+
+class TestBuilderPrioritizer(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_db()
+        self.clock = task.Clock()
+        self.clock.advance(10000)
+        self.master = SimpleNamespace(
+            reactor=self.clock,
+            db=SimpleNamespace(pool=FakePool(self.engine), model=Model),
+            namedServices={},
+        )
+
+    def prioritize(self, prioritizer, builders):
+        results = []
+        prioritizer(self.master, builders).addBoth(results.append)
+        self.assertEqual(len(results), 1)
+        return [builder.name for builder in results[0]]
+
+    def test_oldest_pending_requests(self):
+        """Test that claimed and complete requests are ignored."""
+        add_builders(self.engine, ["a", "b", "c"])
+        add_buildrequest(self.engine, 1, 1, 500)
+        add_buildrequest(self.engine, 2, 1, 100, claimed=True)
+        add_buildrequest(self.engine, 3, 1, 50, complete=1)
+        add_buildrequest(self.engine, 4, 2, 300)
+        add_buildrequest(self.engine, 5, 2, 200)
+        add_buildrequest(self.engine, 6, 3, 10, claimed=True)
+        with self.engine.connect() as conn:
+            self.assertEqual(oldest_pending_requests(conn, Model), {"a": 500, "b": 200})
+
+    def test_order(self):
+        """Test queue age, GitHub status boost and free capacity ordering."""
+        add_builders(
+            self.engine, ["old", "young", "amd64-debian-12", "busy", "idle", "old2"]
+        )
+        add_buildrequest(self.engine, 1, 1, 1000)  # waited 9000s
+        add_buildrequest(self.engine, 2, 2, 9000)  # waited 1000s
+        add_buildrequest(self.engine, 3, 3, 7000)  # waited 3000s + 3600s
+        add_buildrequest(self.engine, 4, 4, 0)  # no free worker
+        add_buildrequest(self.engine, 5, 6, 3000)  # waited 7000s
+        builders = [
+            fake_builder("busy", free=0),
+            fake_builder("idle"),
+            fake_builder("young"),
+            fake_builder("amd64-debian-12"),
+            fake_builder("old2"),
+            fake_builder("old"),
+        ]
+        self.assertEqual(
+            self.prioritize(BuilderPrioritizer(STATUS_BUILDERS), builders),
+            ["old", "old2", "amd64-debian-12", "young", "idle", "busy"],
+        )
+
+    def test_shortest_expected_first(self):
+        """Test that the median build duration is taken off the queue age."""
+        add_builders(self.engine, ["long", "short", "unknown"])
+        add_buildrequest(self.engine, 1, 1, 1000)  # waited 9000s, takes 3h
+        add_buildrequest(self.engine, 2, 2, 6000)  # waited 4000s, takes 10min
+        add_buildrequest(self.engine, 3, 3, 4000)  # waited 6000s, no history
+        history = BuildDurationHistory()
+        history.update({("long", "main"): [3 * 3600], ("short", "main"): [600]})
+        self.master.namedServices[BUILD_HISTORY_NAME] = history
+        builders = [
+            fake_builder("long"),
+            fake_builder("short"),
+            fake_builder("unknown"),
+        ]
+        self.assertEqual(
+            self.prioritize(BuilderPrioritizer([]), builders),
+            ["unknown", "short", "long"],
+        )
+
+    def test_state_is_cached(self):
+        """Test that the pending requests are fetched once per refresh interval."""
+        add_builders(self.engine, ["a", "b"])
+        add_buildrequest(self.engine, 1, 1, 5000)
+        prioritizer = BuilderPrioritizer(STATUS_BUILDERS, refresh_interval=5)
+        builders = [fake_builder("b"), fake_builder("a")]
+        self.assertEqual(self.prioritize(prioritizer, builders), ["a", "b"])
+
+        add_buildrequest(self.engine, 2, 2, 10)
+        self.clock.advance(4)
+        self.assertEqual(self.prioritize(prioritizer, builders), ["a", "b"])
+        self.assertEqual(self.master.db.pool.calls, 1)
+
+        self.clock.advance(1)
+        self.assertEqual(self.prioritize(prioritizer, builders), ["b", "a"])
+        self.assertEqual(self.master.db.pool.calls, 2)
+        self.assertEqual(prioritizer.passes, 3)
+        self.assertGreater(prioritizer.last_pass_duration, 0)
+
+    def test_requests_since_refresh(self):
+        """Test that builders missing from the cache count as submitted now."""
+        add_builders(self.engine, ["old", "busy", "young", "amd64-debian-12"])
+        add_buildrequest(self.engine, 1, 1, 1000)  # waited 9000s
+        add_buildrequest(self.engine, 2, 2, 0)  # no free worker
+        add_buildrequest(self.engine, 3, 3, 9000)  # waited 1000s
+        prioritizer = BuilderPrioritizer(STATUS_BUILDERS, refresh_interval=5)
+        builders = [fake_builder("busy", free=0), fake_builder("old")]
+        self.assertEqual(self.prioritize(prioritizer, builders), ["old", "busy"])
+
+        add_buildrequest(self.engine, 4, 4, 10002)
+        self.clock.advance(2)
+        builders = [
+            fake_builder("busy", free=0),
+            fake_builder("young"),
+            fake_builder("amd64-debian-12"),
+            fake_builder("old"),
+        ]
+        self.assertEqual(
+            self.prioritize(prioritizer, builders),
+            ["old", "amd64-debian-12", "young", "busy"],
+        )
+        self.assertEqual(self.master.db.pool.calls, 1)
+
+    def test_free_workers_uses_ledger(self):
+        """Test that workers without enough free jobs do not count as capacity."""
+        full, roomy = JobLedger(), JobLedger()
+        full.claim("other", 6)
+        roomy.claim("other", 2)
+        wfbs = [
+            SimpleNamespace(
+                worker=SimpleNamespace(job_ledger=ledger, properties={"total_jobs": 8})
+            )
+            for ledger in (full, roomy)
+        ]
+        builder = SimpleNamespace(
+            config=SimpleNamespace(properties={"jobs": 4}),
+            getAvailableWorkers=lambda: wfbs,
+        )
+        self.assertEqual(free_workers(builder), 1)
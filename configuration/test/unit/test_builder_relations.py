@@ -0,0 +1,146 @@
+import os
+import unittest
+
+import yaml
+
+from configuration.builders.relations import (
+    BuilderMap,
+    builders_from_os_info,
+    first_match,
+    first_match_with_rhel_clones,
+    matches_with_rhel_clones,
+)
+
+OS_INFO_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "..", "os_info.yaml")
+BUILDERS_ECO = [
+    "amd64-debian-10-eco-mysqljs",
+    "amd64-debian-10-eco-pymysql",
+]
+BUILDERS_GALERA_MTR = [
+    "aarch64-debian-12",
+    "s390x-ubuntu-2204",
+    "ppc64le-ubuntu-2204",
+    "amd64-freebsd-14",
+]
+
+
+# Substring scans the maps replace, from schedulers_definition.py and utils.py
+def legacy_autobake(builder_name, builders_autobake):
+    for b in builders_autobake:
+        if builder_name in b:
+            return [b]
+    return []
+
+
+def legacy_install(builder_name, builders_install):
+    for b in builders_install:
+        if builder_name in b:
+            builders = [b]
+            if "rhel" in builder_name:
+                builders.append(b.replace("rhel", "almalinux"))
+                builders.append(b.replace("rhel", "rockylinux"))
+            return builders
+    return []
+
+
+def legacy_upgrade(builder_name, builders_upgrade):
+    builders = []
+    for b in builders_upgrade:
+        if builder_name in b:
+            if "rhel" in builder_name:
+                builders.append(b.replace("rhel", "almalinux"))
+                builders.append(b.replace("rhel", "rockylinux"))
+            builders.append(b)
+    return builders
+
+
+def legacy_all(builder_name, builders):
+    return [b for b in builders if builder_name in b]
+
+
+def candidate_names(builders: list[str]) -> set[str]:
+    """Every builder name and every dash-separated part of it, plus a few oddities."""
+    names = {"", "rhel", "autobake", "amd64-rhel-8", "x-amd64-debian-12", "eco"}
+    for builder in builders:
+        parts = builder.split("-")
+        for i in range(len(parts)):
+            for j in range(i + 1, len(parts) + 1):
+                names.add("-".join(parts[i:j]))
+    return names
+
+
+class TestBuilderMaps(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(OS_INFO_PATH) as f:
+            os_info = yaml.safe_load(f)
+        cls.autobake, cls.install, cls.upgrade, _ = builders_from_os_info(os_info)
+        cls.names = candidate_names(
+            cls.autobake
+            + cls.install
+            + cls.upgrade
+            + BUILDERS_ECO
+            + BUILDERS_GALERA_MTR
+            + [
+                "amd64-rhel-8",
+                "amd64-rhel-9",
+                "aarch64-rhel-9",
+                "amd64-debian-12",
+                "amd64-ubuntu-2404",
+            ]
+        )
+
+    def test_os_info_builders(self):
+        """Test that the generated builder names follow os_info.yaml."""
+        self.assertIn("amd64-debian-12-deb-autobake", self.autobake)
+        self.assertIn("amd64-debian-12-deb-autobake-install", self.install)
+        self.assertIn(
+            "amd64-debian-12-deb-autobake-minor-upgrade-columnstore", self.upgrade
+        )
+        self.assertFalse(any(b.startswith("s390x-") for b in self.install))
+
+    def test_same_as_substring_scans(self):
+        """Test that every map gives the same builders as the substring scans."""
+        maps = [
+            (
+                BuilderMap(self.autobake, expand=first_match),
+                legacy_autobake,
+                self.autobake,
+            ),
+            (
+                BuilderMap(self.install, expand=first_match_with_rhel_clones),
+                legacy_install,
+                self.install,
+            ),
+            (
+                BuilderMap(self.upgrade, expand=matches_with_rhel_clones),
+                legacy_upgrade,
+                self.upgrade,
+            ),
+            (BuilderMap(self.autobake), legacy_all, self.autobake),
+            (BuilderMap(BUILDERS_ECO), legacy_all, BUILDERS_ECO),
+            (BuilderMap(BUILDERS_GALERA_MTR), legacy_all, BUILDERS_GALERA_MTR),
+        ]
+        for builder_map, legacy, children in maps:
+            for name in self.names:
+                expected = legacy(name, children)
+                self.assertEqual(builder_map.get(name), expected, name)
+                self.assertEqual(builder_map.has(name), bool(expected), name)
+
+    def test_rhel_expansion(self):
+        """Test that RHEL parents also trigger the AlmaLinux and Rocky Linux clones."""
+        install = BuilderMap(self.install, expand=first_match_with_rhel_clones)
+        self.assertEqual(
+            install.get("amd64-rhel-9"),
+            [
+                "amd64-rhel-9-rpm-autobake-install",
+                "amd64-almalinux-9-rpm-autobake-install",
+                "amd64-rockylinux-9-rpm-autobake-install",
+            ],
+        )
+
+    def test_result_is_a_copy(self):
+        """Test that callers cannot alter the precomputed maps."""
+        eco = BuilderMap(BUILDERS_ECO)
+        eco.get("amd64-debian-10").append("amd64-debian-10-eco-other")
+        self.assertEqual(eco.get("amd64-debian-10"), BUILDERS_ECO)
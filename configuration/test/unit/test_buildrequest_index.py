@@ -0,0 +1,236 @@
+import random
+import unittest
+from types import SimpleNamespace
+
+import sqlalchemy as sa
+from twisted.internet import defer
+
+from buildbot.db.model import Model
+from configuration.steps.buildrequest_index import (
+    RevisionIndex,
+    pending_buildrequest_sourcestamps,
+)
+
+REVISIONS = [f"{i:040x}" for i in range(8)]
+
+
+class FakeBuildbot:
+    """
+    Adds buildsets and completes buildrequests in a sqlite Buildbot database and
+    produces the matching MQ events. Buildbot does not wait for the buildrequests
+    "new" events before producing the buildset one, the consumers (on this master or
+    through the multi-master MQ) get them in any order: shuffle them with rng.
+    Also serves as the master given to RevisionIndex.watch().
+    """
+
+    def __init__(self, rng: random.Random = None):
+        self.rng = rng or random.Random(0)
+        self.engine = sa.create_engine("sqlite://")
+        with self.engine.begin() as conn:
+            Model.metadata.create_all(
+                conn,
+                tables=[
+                    Model.buildrequests,
+                    Model.buildrequest_claims,
+                    Model.buildset_sourcestamps,
+                    Model.sourcestamps,
+                ],
+            )
+        self.consumers = []
+        self.next_id = 1
+        # The incomplete buildrequests of each buildset
+        self.buildsets: dict[int, set[int]] = {}
+        self.mq = SimpleNamespace(startConsuming=self.start_consuming)
+        self.db = SimpleNamespace(model=Model, pool=SimpleNamespace(do=self.pool_do))
+
+    def start_consuming(self, callback, topic):
+        consumer = SimpleNamespace(topic=topic, callback=callback)
+        consumer.stopConsuming = lambda: self.consumers.remove(consumer)
+        self.consumers.append(consumer)
+        return defer.succeed(consumer)
+
+    def pool_do(self, fn, *args):
+        with self.engine.connect() as conn:
+            return defer.succeed(fn(conn, *args))
+
+    def _id(self) -> int:
+        self.next_id += 1
+        return self.next_id
+
+    def produce(self, key, msg):
+        for consumer in list(self.consumers):
+            if all(t is None or t == k for t, k in zip(consumer.topic, key)):
+                consumer.callback(key, msg)
+
+    def add_buildset(self, revision: str, branch: str, builderids: list[int]):
+        bsid = self._id()
+        ssid = self._id()
+        sourcestamp = {
+            "branch": branch,
+            "repository": "https://github.com/MariaDB/server",
+            "revision": revision,
+            "codebase": "",
+        }
+        brids = {builderid: self._id() for builderid in builderids}
+        with self.engine.begin() as conn:
+            conn.execute(
+                Model.sourcestamps.insert().values(
+                    id=ssid, ss_hash=str(ssid), project="", created_at=0, **sourcestamp
+                )
+            )
+            conn.execute(
+                Model.buildset_sourcestamps.insert().values(
+                    buildsetid=bsid, sourcestampid=ssid
+                )
+            )
+            for builderid, brid in brids.items():
+                conn.execute(
+                    Model.buildrequests.insert().values(
+                        id=brid,
+                        buildsetid=bsid,
+                        builderid=builderid,
+                        priority=0,
+                        submitted_at=0,
+                        complete=0,
+                    )
+                )
+        self.buildsets[bsid] = set(brids.values())
+        events = [
+            (
+                ("buildrequests", str(brid), "new"),
+                {"buildrequestid": brid, "buildsetid": bsid, "builderid": builderid},
+            )
+            for builderid, brid in brids.items()
+        ]
+        events.insert(
+            self.rng.randint(0, len(events)),
+            (
+                ("buildsets", str(bsid), "new"),
+                {"bsid": bsid, "sourcestamps": [sourcestamp]},
+            ),
+        )
+        for key, msg in events:
+            self.produce(key, msg)
+        if not brids:
+            del self.buildsets[bsid]
+            self.produce(("buildsets", str(bsid), "complete"), {"bsid": bsid})
+        return brids
+
+    def claim(self, brid: int):
+        with self.engine.begin() as conn:
+            conn.execute(
+                Model.buildrequest_claims.insert().values(
+                    brid=brid, masterid=1, claimed_at=0
+                )
+            )
+        self.produce(("buildrequests", str(brid), "claimed"), {"buildrequestid": brid})
+
+    def complete(self, brid: int):
+        with self.engine.begin() as conn:
+            conn.execute(
+                Model.buildrequests.update()
+                .where(Model.buildrequests.c.id == brid)
+                .values(complete=1)
+            )
+        self.produce(("buildrequests", str(brid), "complete"), {"buildrequestid": brid})
+        bsid = next(bsid for bsid, brids in self.buildsets.items() if brid in brids)
+        self.buildsets[bsid].remove(brid)
+        if not self.buildsets[bsid]:
+            del self.buildsets[bsid]
+            self.produce(("buildsets", str(bsid), "complete"), {"bsid": bsid})
+
+    def pending(self, builderid=None) -> list[dict]:
+        with self.engine.connect() as conn:
+            return pending_buildrequest_sourcestamps(conn, Model, builderid)
+
+
+class TestBuildRequestIndex(unittest.TestCase):
+    def test_batched_query(self):
+        """Test that one query returns the pending buildrequests with sourcestamps."""
+        bb = FakeBuildbot()
+        first = bb.add_buildset(REVISIONS[0], "bb-11.4-someone", [1, 2])
+        second = bb.add_buildset(REVISIONS[1], "bb-11.4-someone", [1])
+        bb.claim(first[1])
+        bb.complete(first[2])
+
+        pending = bb.pending(builderid=1)
+        self.assertEqual(
+            [br["buildrequestid"] for br in pending], [first[1], second[1]]
+        )
+        self.assertTrue(pending[0]["claimed"])
+        self.assertFalse(pending[1]["claimed"])
+        self.assertEqual(pending[1]["sourcestamps"][0]["revision"], REVISIONS[1])
+        self.assertEqual(len(bb.pending()), 2)
+
+    def test_index_matches_query(self):
+        """
+        Test that the index, seeded midway and then fed by MQ events, finds the
+        same buildrequests as filtering the batched query by revision.
+        """
+        rng = random.Random(5)
+        bb = FakeBuildbot(rng)
+        index = RevisionIndex()
+
+        def check():
+            for builderid in (1, 2, 3):
+                revisions = set(rng.sample(REVISIONS, 2))
+                expected = [
+                    br
+                    for br in bb.pending(builderid)
+                    if any(ss["revision"] in revisions for ss in br["sourcestamps"])
+                ]
+                self.assertEqual(index.lookup(builderid, revisions), expected)
+                self.assertEqual(
+                    index.pending_count(builderid), len(bb.pending(builderid))
+                )
+
+        pending = []
+        claimed = set()
+        for step in range(300):
+            if step == 100:
+                index.watch(bb)
+                self.assertTrue(index.ready)
+            if pending and rng.random() < 0.5:
+                brid = pending.pop(rng.randrange(len(pending)))
+                if brid not in claimed and rng.random() < 0.5:
+                    bb.claim(brid)
+                    claimed.add(brid)
+                    pending.append(brid)
+                else:
+                    bb.complete(brid)
+            else:
+                builderids = rng.sample([1, 2, 3], rng.randint(0, 3))
+                brids = bb.add_buildset(
+                    rng.choice(REVISIONS), "bb-11.4-someone", builderids
+                )
+                pending.extend(brids.values())
+            if step >= 100:
+                check()
+
+        for brid in pending:
+            bb.complete(brid)
+        self.assertEqual(index._by_revision, {})
+        self.assertEqual(index._sourcestamps, {})
+
+    def test_buildset_event_first(self):
+        """Test that a buildset event before its buildrequests ones is indexed."""
+        bb = FakeBuildbot()
+        index = RevisionIndex()
+        index.watch(bb)
+        bb.rng = SimpleNamespace(randint=lambda a, b: a)
+        brids = bb.add_buildset(REVISIONS[0], "bb-11.4-someone", [1, 2])
+
+        self.assertEqual(index.lookup(1, [REVISIONS[0]]), bb.pending(1))
+        bb.complete(brids[1])
+        bb.complete(brids[2])
+        self.assertEqual(index.lookup(2, [REVISIONS[0]]), [])
+        self.assertEqual(index._sourcestamps, {})
+
+    def test_buildset_without_buildrequests(self):
+        """Test that a buildset without builders leaves nothing behind."""
+        bb = FakeBuildbot()
+        index = RevisionIndex()
+        index.watch(bb)
+        bb.add_buildset(REVISIONS[0], "bb-11.4-someone", [])
+        self.assertEqual(index._by_revision, {})
+        self.assertEqual(index._sourcestamps, {})
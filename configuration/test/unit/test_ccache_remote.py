@@ -0,0 +1,249 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+from buildbot.process.properties import Interpolate
+from buildbot.util import flatten
+from configuration.builders.infra.docker import docker_config
+from configuration.builders.infra.runtime import InContainer
+from configuration.steps.commands.compile import (
+    CCACHE_STATS_SEPARATOR,
+    parse_ccache_stats,
+)
+from configuration.steps.commands.util import PrintEnvironmentDetails
+from configuration.steps.processors import process_steps
+from configuration.steps.remote import ShellStep
+
+
+class CCacheHTTPStorage(ThreadingHTTPServer):
+    """Stands in for the HTTP server of a ccache remote storage.
+
+    Keeps the entries ccache uploads (PUT) as files of root and serves them back
+    (GET, HEAD), every request is counted by method.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.requests = {"GET": 0, "HEAD": 0, "PUT": 0, "DELETE": 0}
+        super().__init__(("127.0.0.1", 0), CCacheHTTPStorageHandler)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/cache"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class CCacheHTTPStorageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def entry(self) -> Path:
+        self.server.requests[self.command] += 1
+        return self.server.root / self.path.lstrip("/").replace("..", "_")
+
+    def reply(self, status: int, body: bytes = b""):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_GET(self):
+        entry = self.entry()
+        if entry.is_file():
+            self.reply(200, entry.read_bytes())
+        else:
+            self.reply(404)
+
+    do_HEAD = do_GET
+
+    def do_PUT(self):
+        entry = self.entry()
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        entry.write_bytes(self.rfile.read(int(self.headers["Content-Length"])))
+        self.reply(201)
+
+    def do_DELETE(self):
+        entry = self.entry()
+        if entry.is_file():
+            entry.unlink()
+        self.reply(204)
+
+
+def ccache_supports_remote_storage() -> bool:
+    if not shutil.which("ccache") or not shutil.which("cc"):
+        return False
+    version = subprocess.run(
+        ["ccache", "--version"], capture_output=True, text=True
+    ).stdout
+    match = re.search(r"version (\d+)\.(\d+)", version)
+    return bool(match) and (int(match[1]), int(match[2])) >= (4, 8)
+
+
+class CCacheHost:
+    """A host of the worker pool: ccache with a local cache of its own."""
+
+    def __init__(self, ccache_dir: Path, remote_storage: str):
+        self.env = dict(
+            os.environ,
+            CCACHE_DIR=str(ccache_dir),
+            CCACHE_REMOTE_STORAGE=remote_storage,
+        )
+        self.env.pop("CCACHE_DISABLE", None)
+
+    def run(self, args: list[str], cwd: Path) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            args, cwd=cwd, env=self.env, capture_output=True, text=True, check=True
+        )
+
+    def stats(self, args: list[str], cwd: Path) -> dict:
+        """Run args and return the ccache statistics of the run."""
+        before = self.run(["ccache", "--print-stats"], cwd).stdout
+        self.run(args, cwd)
+        after = self.run(["ccache", "--print-stats"], cwd).stdout
+        # The same stdout as the compile step: echo adds the newline after the separator
+        return parse_ccache_stats(0, f"{before}{CCACHE_STATS_SEPARATOR}\n{after}", "")
+
+
+class TestCCacheHTTPStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.storage = CCacheHTTPStorage(self.tmp / "remote")
+        self.storage.__enter__()
+        self.addCleanup(self.storage.__exit__)
+
+    def request(self, method: str, path: str, data: bytes = None) -> tuple:
+        request = urllib.request.Request(
+            f"{self.storage.url}{path}", data=data, method=method
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, b""
+
+    def test_entries(self):
+        """Test that the stand-in serves back the entries uploaded to it."""
+        self.assertEqual(self.request("GET", "/ab/cdef"), (404, b""))
+        self.assertEqual(self.request("PUT", "/ab/cdef", b"result")[0], 201)
+        self.assertEqual(self.request("GET", "/ab/cdef"), (200, b"result"))
+        self.assertEqual(self.request("HEAD", "/ab/cdef"), (200, b""))
+        self.assertEqual(self.request("DELETE", "/ab/cdef")[0], 204)
+        self.assertEqual(self.request("HEAD", "/ab/cdef"), (404, b""))
+        self.assertEqual(
+            self.storage.requests, {"GET": 2, "HEAD": 2, "PUT": 1, "DELETE": 1}
+        )
+
+
+@unittest.skipUnless(
+    ccache_supports_remote_storage(), "ccache 4.8 or later and cc are not installed"
+)
+class TestCCacheRemoteStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.storage = CCacheHTTPStorage(self.tmp / "remote")
+        self.storage.__enter__()
+        self.addCleanup(self.storage.__exit__)
+        self.source = self.tmp / "src"
+        self.source.mkdir()
+        (self.source / "sql.c").write_text("int query(int n) { return n * 2; }\n")
+        self.compile = ["ccache", "cc", "-c", "sql.c", "-o", "sql.o"]
+
+    def host(self, name: str) -> CCacheHost:
+        return CCacheHost(self.tmp / name, self.storage.url)
+
+    def test_local_first_remote_fallback(self):
+        """Test that a second host gets the results of the first through the remote."""
+        first = self.host("bbw1").stats(self.compile, self.source)
+        self.assertEqual((first["ccache_hits"], first["ccache_misses"]), (0, 1))
+        self.assertGreater(self.storage.requests["PUT"], 0)
+
+        second = self.host("bbw2")
+        stats = second.stats(self.compile, self.source)
+        self.assertEqual((stats["ccache_hits"], stats["ccache_remote_hits"]), (1, 1))
+
+        # The remote hit was kept in the local cache, no more remote lookups
+        lookups = self.storage.requests["GET"]
+        stats = second.stats(self.compile, self.source)
+        self.assertEqual((stats["ccache_hits"], stats["ccache_remote_hits"]), (1, 0))
+        self.assertEqual(self.storage.requests["GET"], lookups)
+
+
+class TestDockerConfig(unittest.TestCase):
+    remote_storage = "http://ccache.example.org:8080/pool|connect-timeout=500"
+
+    def container_env(self, persistent: bool) -> list[str]:
+        """The -e options of the docker run starting the container of the builds."""
+        with mock.patch.dict(os.environ, {"CONTAINER_REGISTRY_URL": "registry/"}):
+            config = docker_config(
+                image="debian12",
+                artifacts_url="https://ci.example.org",
+                packages_dir="/srv/packages",
+                ccache_remote_storage=self.remote_storage,
+            )
+        _, steps, _ = process_steps(
+            builder_name="b",
+            environment="PROD",
+            active_steps=[
+                InContainer(
+                    docker_environment=config,
+                    step=ShellStep(command=PrintEnvironmentDetails()),
+                )
+            ],
+            persistent_container=persistent,
+        )
+        command = next(
+            command
+            for command in (flatten(step.generate().command) for step in steps)
+            if "run" in command
+        )
+        return [
+            value.fmtstring
+            for option, value in zip(command, command[1:])
+            if option == "-e" and isinstance(value, Interpolate)
+        ]
+
+    def test_remote_storage_in_container_env(self):
+        """Test that the remote storage is in the env of the containers."""
+        for persistent in (False, True):
+            with self.subTest(persistent=persistent):
+                self.assertIn(
+                    f"CCACHE_REMOTE_STORAGE={self.remote_storage}",
+                    self.container_env(persistent),
+                )
+
+    def test_local_cache_by_default(self):
+        """Test that without remote storage only the local cache is set."""
+        with mock.patch.dict(
+            os.environ, {"CONTAINER_REGISTRY_URL": "registry/"}, clear=True
+        ):
+            config = docker_config(
+                image="debian12",
+                artifacts_url="https://ci.example.org",
+                packages_dir="/srv/packages",
+            )
+        self.assertEqual(
+            [variable for variable, _ in config.env_vars],
+            ["ARTIFACTS_URL", "CCACHE_DIR"],
+        )
@@ -0,0 +1,119 @@
+import unittest
+from pathlib import PurePath
+
+from configuration.builders.infra.runtime import DockerConfig, InContainer
+from configuration.steps.commands.compile import (
+    CCACHE_STATS_SEPARATOR,
+    MAKE,
+    CompileMakeCommand,
+    parse_ccache_stats,
+)
+from configuration.steps.commands.util import PrintEnvironmentDetails
+from configuration.steps.processors import processor_ccache_stats
+from configuration.steps.remote import PropsFromShellStep, ShellStep
+
+CCACHE_4_BEFORE = """\
+stats_updated_timestamp\t1700000000
+direct_cache_hit\t1000
+preprocessed_cache_hit\t200
+cache_miss\t400
+cleanups_performed\t3
+files_in_cache\t5000
+cache_size_kibibyte\t1048576
+remote_storage_hit\t10
+"""
+CCACHE_4_AFTER = """\
+stats_updated_timestamp\t1700000600
+direct_cache_hit\t1700
+preprocessed_cache_hit\t300
+cache_miss\t600
+cleanups_performed\t4
+files_in_cache\t5200
+cache_size_kibibyte\t2097152
+remote_storage_hit\t60
+"""
+
+
+def stats_output(before: str, after: str) -> str:
+    return f"{before}{CCACHE_STATS_SEPARATOR}\n{after}"
+
+
+class TestParseCCacheStats(unittest.TestCase):
+    def test_ccache_4(self):
+        """Test that the statistics are those of the compile steps only."""
+        self.assertEqual(
+            parse_ccache_stats(0, stats_output(CCACHE_4_BEFORE, CCACHE_4_AFTER), ""),
+            {
+                "ccache_hits": 800,
+                "ccache_misses": 200,
+                "ccache_cleanups": 1,
+                "ccache_remote_hits": 50,
+                "ccache_hit_rate": 80.0,
+                "ccache_size": 2 * 1024**3,
+                "ccache_files": 5200,
+            },
+        )
+
+    def test_ccache_3(self):
+        """Test the counter names of ccache 3."""
+        before = "cache_hit_direct\t5\ncache_hit_preprocessed\t1\ncache_miss\t4\n"
+        after = "cache_hit_direct\t8\ncache_hit_preprocessed\t2\ncache_miss\t4\n"
+        stats = parse_ccache_stats(0, stats_output(before, after), "")
+        self.assertEqual(stats["ccache_hits"], 4)
+        self.assertEqual(stats["ccache_hit_rate"], 100.0)
+        self.assertNotIn("ccache_remote_hits", stats)
+
+    def test_no_statistics(self):
+        """Test that no properties are set without a baseline or after a zeroing."""
+        self.assertEqual(parse_ccache_stats(0, "", ""), {})
+        self.assertEqual(
+            parse_ccache_stats(0, stats_output(CCACHE_4_AFTER, CCACHE_4_BEFORE), ""),
+            {},
+        )
+
+
+class TestProcessorCCacheStats(unittest.TestCase):
+    def config(self, env_vars: list) -> DockerConfig:
+        return DockerConfig(
+            repository="quay.io/mariadb-foundation/bb-worker:",
+            image_tag="debian12",
+            workdir=PurePath("/home/buildbot"),
+            env_vars=env_vars,
+        )
+
+    def compile_step(self, config: DockerConfig) -> InContainer:
+        return InContainer(
+            ShellStep(command=CompileMakeCommand(option=MAKE.COMPILE, jobs=7)),
+            docker_environment=config,
+        )
+
+    def test_around_compile_steps(self):
+        """Test that the statistics steps enclose the compile steps using ccache."""
+        config = self.config([("CCACHE_DIR", "/mnt/ccache")])
+        steps = [
+            ShellStep(command=PrintEnvironmentDetails()),
+            self.compile_step(config),
+            self.compile_step(config),
+            ShellStep(command=PrintEnvironmentDetails()),
+        ]
+        _, processed, _ = processor_ccache_stats([], steps, [])
+        self.assertEqual(
+            [step.name for step in processed],
+            [
+                "Print environment details",
+                "Save ccache statistics",
+                "Make - compile",
+                "Make - compile",
+                "Collect ccache statistics",
+                "Print environment details",
+            ],
+        )
+        collect = processed[4]
+        self.assertIsInstance(collect.step, PropsFromShellStep)
+        self.assertTrue(collect.options.alwaysRun)
+        self.assertFalse(processed[1].options.haltOnFailure)
+
+    def test_without_ccache(self):
+        """Test that compile steps without CCACHE_DIR are left alone."""
+        steps = [self.compile_step(self.config([]))]
+        self.assertEqual(processor_ccache_stats([], steps, [])[1], steps)
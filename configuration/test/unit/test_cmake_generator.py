@@ -1,7 +1,12 @@
 import unittest
 
 from configuration.steps.generators.base.exceptions import DuplicateFlagException
-from configuration.steps.generators.cmake.compilers import CompilerCommand
+from configuration.steps.generators.cmake.compilers import (
+    ClangCompiler,
+    CompilerCommand,
+    GCCCompiler,
+    MicrosoftCompiler,
+)
 from configuration.steps.generators.cmake.generator import CMakeGenerator
 from configuration.steps.generators.cmake.options import (
     BUILDPLATFORM,
@@ -9,6 +14,7 @@ from configuration.steps.generators.cmake.options import (
     CMAKE,
     CMAKEDEBUG,
     CMAKEWARN,
+    LINKER,
     PLUGIN,
     WITH,
     BuildConfig,
@@ -239,3 +245,38 @@ class TestCMakeGenerator(unittest.TestCase):
                 "-DCMAKE_INSTALL_PREFIX=/usr/lib/test",
             ],
         )
+
+    def test_set_linker(self):
+        """
+        Test that the linker is set after the linker flags already set.
+        """
+        generator = CMakeGenerator(
+            flags=[CMakeOption(CMAKE.EXE_LINKER_FLAGS, "-L/msan -Wl,-rpath=/msan")],
+            compiler=ClangCompiler(),
+            linker=LINKER.LLD,
+        )
+        command = generator.generate()
+        self.assertEqual(
+            command,
+            [
+                "cmake",
+                "-S",
+                ".",
+                "-DCMAKE_CXX_COMPILER=clang++",
+                "-DCMAKE_C_COMPILER=clang",
+                '-DCMAKE_EXE_LINKER_FLAGS="-L/msan -Wl,-rpath=/msan -fuse-ld=lld"',
+                "-DCMAKE_MODULE_LINKER_FLAGS=-fuse-ld=lld",
+                "-DCMAKE_SHARED_LINKER_FLAGS=-fuse-ld=lld",
+            ],
+        )
+
+    def test_set_linker_unsupported(self):
+        """
+        Test that a linker the compiler cannot use raises an exception.
+        """
+        CMakeGenerator(flags=[], compiler=GCCCompiler("12"), linker=LINKER.MOLD)
+        CMakeGenerator(flags=[], compiler=GCCCompiler(), linker=LINKER.MOLD)
+        with self.assertRaises(ValueError):
+            CMakeGenerator(flags=[], compiler=GCCCompiler("11"), linker=LINKER.MOLD)
+        with self.assertRaises(ValueError):
+            CMakeGenerator(flags=[], compiler=MicrosoftCompiler(), linker=LINKER.LLD)
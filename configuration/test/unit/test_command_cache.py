@@ -0,0 +1,42 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from configuration.steps.commands.base import BashCommand, CommandCache
+
+
+class TestCommandCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.script = self.tmp / "get_tarball.sh"
+        self.script.write_text("echo one\n")
+        self.cache = CommandCache()
+
+    def test_read_once(self):
+        """Test that a script is read from disk once per (re)config."""
+        for _ in range(3):
+            self.assertEqual(self.cache.read(self.script), "echo one\n")
+        self.assertEqual((self.cache.reads, self.cache.hits), (1, 2))
+
+    def test_modified_script(self):
+        """Test that a modified script is read again after the next clear."""
+        self.cache.read(self.script)
+        self.script.write_text("echo two\n")
+        self.assertEqual(self.cache.read(str(self.script)), "echo one\n")
+        self.cache.clear()
+        self.assertEqual(self.cache.read(self.script), "echo two\n")
+        self.assertEqual((self.cache.reads, self.cache.hits), (1, 0))
+
+    def test_shared_interpolate(self):
+        """Test that identical command strings share their Interpolate."""
+        first = self.cache.interpolate("%(prop:buildername)s")
+        self.assertIs(self.cache.interpolate("%(prop:buildername)s"), first)
+        self.assertIsNot(self.cache.interpolate("%(prop:buildnumber)s"), first)
+        self.assertIs(
+            BashCommand(cmd="make -j%(prop:jobs)s").as_cmd_arg()[2],
+            BashCommand(cmd="make -j%(prop:jobs)s").as_cmd_arg()[2],
+        )
+        self.cache.clear()
+        self.assertIsNot(self.cache.interpolate("%(prop:buildername)s"), first)
@@ -0,0 +1,96 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from configuration.steps.commands.infra import ContainerCommit
+
+# Stands in for the docker CLI: docker container diff prints $DOCKER_DIFF, the
+# writable layer is 4096 bytes and the other calls are appended to $DOCKER_CALLS.
+FAKE_DOCKER = """#!/bin/bash
+case "$1 $2" in
+"container diff") cat "$DOCKER_DIFF" ;;
+"container inspect") echo 4096 ;;
+*) echo "$*" >>"$DOCKER_CALLS" ;;
+esac
+"""
+
+
+class TestContainerCommitScript(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        bin_dir = self.tmp / "bin"
+        bin_dir.mkdir()
+        docker = bin_dir / "docker"
+        docker.write_text(FAKE_DOCKER)
+        docker.chmod(0o755)
+        self.diff = self.tmp / "diff"
+        self.calls = self.tmp / "calls"
+        self.env = dict(
+            os.environ,
+            PATH=f"{bin_dir}:{os.environ['PATH']}",
+            DOCKER_DIFF=str(self.diff),
+            DOCKER_CALLS=str(self.calls),
+        )
+
+    def commit(self, *diff: str) -> tuple[str, list[str]]:
+        """Run the checkpoint of a step that changed diff, return its output and calls."""
+        self.diff.write_text("".join(f"{line}\n" for line in diff))
+        command = ContainerCommit(
+            container_name="amd64-debian-12_step",
+            runtime_tag="buildbot:amd64-debian-12",
+            step_name="Install packages",
+        )
+        result = subprocess.run(
+            command.as_cmd_arg(), env=self.env, capture_output=True, text=True
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout, self.calls.read_text().splitlines()
+
+    def test_scratch_only(self):
+        """Test that a step changing only scratch paths is not committed."""
+        output, calls = self.commit(
+            "C /tmp",
+            "A /tmp/build.log",
+            "C /var/tmp/ccache.lock",
+            "C /var/log/apt/history.log",
+            "A /var/cache/apt/pkgcache.bin",
+            "A /run/mysqld",
+            "A /root/.cache/pip/http",
+        )
+        self.assertEqual(
+            output,
+            "Install packages changed only scratch paths, commit of 4096 bytes skipped\n",
+        )
+        self.assertEqual(calls, ["rm amd64-debian-12_step"])
+
+    def test_ancestors_only(self):
+        """Test that the parents of scratch paths alone do not make a commit."""
+        output, calls = self.commit("C /var", "C /root", "C /var/log/dpkg.log")
+        self.assertIn("commit of 4096 bytes skipped", output)
+        self.assertEqual(calls, ["rm amd64-debian-12_step"])
+
+    def test_real_change(self):
+        """Test that a step changing the image is committed to the runtime tag."""
+        output, calls = self.commit(
+            "C /usr",
+            "A /usr/local/bin/mariadb-test-run",
+            "C /var",
+            "C /var/lib",
+            "C /var/lib/dpkg/status",
+            "A /tmp/build.log",
+            "C /root",
+            "A /root/.my.cnf",
+        )
+        self.assertRegex(output, r"^Committed 5 changed paths, 4096 bytes, in \d+ms\n$")
+        self.assertEqual(
+            calls,
+            [
+                "container commit --message Install packages amd64-debian-12_step "
+                "buildbot:amd64-debian-12",
+                "rm amd64-debian-12_step",
+            ],
+        )
@@ -0,0 +1,111 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from configuration.steps.commands.infra import FetchContainerImage
+
+IMAGE = "quay.io/mariadb-foundation/bb-worker:debian12"
+
+# Stands in for the docker CLI and a registry: the registry digest of the image is
+# in $REGISTRY/digest, the local one in $REGISTRY/local, every call is logged.
+FAKE_DOCKER = """#!/bin/bash
+echo "$*" >>"$REGISTRY/calls"
+case "$1 $2" in
+"buildx imagetools") cat "$REGISTRY/digest" ;;
+"image inspect")
+  [[ -f $REGISTRY/local ]] || exit 1
+  echo "quay.io/mariadb-foundation/bb-worker@$(cat "$REGISTRY/local")"
+  ;;
+pull*)
+  sleep 0.2
+  cp "$REGISTRY/digest" "$REGISTRY/local" 2>/dev/null || echo "sha256:0" >"$REGISTRY/local"
+  ;;
+esac
+"""
+
+
+@unittest.skipUnless(shutil.which("flock"), "flock is not installed")
+class TestImagePull(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        bin_dir = self.tmp / "bin"
+        bin_dir.mkdir()
+        docker = bin_dir / "docker"
+        docker.write_text(FAKE_DOCKER)
+        docker.chmod(0o755)
+        self.registry = self.tmp / "registry"
+        self.registry.mkdir()
+        self.push("sha256:aaaa")
+        self.env = dict(
+            os.environ,
+            PATH=f"{bin_dir}:{os.environ['PATH']}",
+            REGISTRY=str(self.registry),
+        )
+
+    def push(self, digest: str):
+        (self.registry / "digest").write_text(f"{digest}\n")
+
+    def calls(self, command: str) -> int:
+        calls = self.registry / "calls"
+        if not calls.exists():
+            return 0
+        return sum(line.startswith(command) for line in calls.read_text().splitlines())
+
+    def fetch(self, digest_ttl: int = 300) -> subprocess.Popen:
+        command = FetchContainerImage(
+            image_url=IMAGE,
+            platform="linux/arm64",
+            digest_ttl=digest_ttl,
+            state_dir=str(self.tmp / "state"),
+        )
+        return subprocess.Popen(
+            command.as_cmd_arg(),
+            env=self.env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+
+    def run_fetch(self, digest_ttl: int = 300) -> str:
+        process = self.fetch(digest_ttl)
+        output, _ = process.communicate()
+        self.assertEqual(process.returncode, 0, output)
+        return output
+
+    def test_pull_skipped_when_digest_matches(self):
+        """Test that an image already pulled is not pulled again."""
+        self.run_fetch()
+        output = self.run_fetch()
+        self.assertEqual(self.calls("pull"), 1)
+        self.assertIn("pull skipped", output)
+
+    def test_digest_resolved_once_per_ttl(self):
+        """Test that the registry is asked again only once the TTL expired."""
+        self.run_fetch()
+        self.push("sha256:bbbb")
+        self.run_fetch()
+        self.assertEqual(self.calls("buildx imagetools"), 1)
+        self.assertEqual(self.calls("pull"), 1)
+        self.run_fetch(digest_ttl=0)
+        self.assertEqual(self.calls("buildx imagetools"), 2)
+        self.assertEqual(self.calls("pull"), 2)
+
+    def test_concurrent_pulls_serialized(self):
+        """Test that builds starting together on a host pull the image once."""
+        processes = [self.fetch() for _ in range(5)]
+        for process in processes:
+            output, _ = process.communicate()
+            self.assertEqual(process.returncode, 0, output)
+        self.assertEqual(self.calls("pull"), 1)
+        self.assertEqual(self.calls("buildx imagetools"), 1)
+
+    def test_registry_unreachable(self):
+        """Test that the image is pulled when the registry digest is unknown."""
+        (self.registry / "digest").unlink()
+        self.run_fetch()
+        self.run_fetch()
+        self.assertEqual(self.calls("pull"), 2)
@@ -0,0 +1,361 @@
+import random
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+
+import sqlalchemy as sa
+from twisted.internet import defer
+from twisted.trial import unittest as trial
+
+from buildbot.process.workerforbuilder import (
+    LatentWorkerForBuilder,
+    WorkerForBuilder,
+)
+from buildbot.test.fake import fakemaster, fakeprotocol
+from buildbot.test.reactor import TestReactorMixin
+from configuration.workers.ledger import (
+    JobLedger,
+    claim_host_jobs,
+    create_shared_ledger_tables,
+    host_job_claims,
+    release_host_jobs,
+    release_master_claims,
+    release_worker_claims,
+    scan_reserved_jobs,
+)
+from configuration.workers.worker import (
+    SHARED_CLAIM_START_TIMEOUT,
+    LedgerWorker,
+    SharedHostDockerLatentWorker,
+)
+
+
+def fake_workerforbuilder(name: str, jobs: int):
+    wfb = SimpleNamespace(
+        builder_name=name,
+        builder=SimpleNamespace(config=SimpleNamespace(properties={"jobs": jobs})),
+        busy=False,
+    )
+    wfb.isBusy = lambda: wfb.busy
+    return wfb
+
+
+class TestJobLedger(unittest.TestCase):
+    def test_claim_and_release(self):
+        """Test that claims are summed and released per builder."""
+        ledger = JobLedger()
+        ledger.claim("amd64-debian-12", 7)
+        ledger.claim("amd64-msan-clang-20", 12)
+        self.assertEqual(ledger.reserved, 19)
+        self.assertEqual(ledger.free(110), 91)
+
+        ledger.release("amd64-debian-12")
+        self.assertEqual(ledger.reserved, 12)
+        self.assertEqual(ledger.claims, {"amd64-msan-clang-20": 12})
+
+    def test_release_unknown_builder(self):
+        """Test that releasing a builder without a claim is a no-op."""
+        ledger = JobLedger()
+        ledger.claim("amd64-debian-12", 7)
+        ledger.release("amd64-fedora-42")
+        self.assertEqual(ledger.reserved, 7)
+
+    def test_claim_twice(self):
+        """Test that a second claim for the same builder replaces the first one."""
+        ledger = JobLedger()
+        ledger.claim("amd64-debian-12", 7)
+        ledger.claim("amd64-debian-12", 10)
+        self.assertEqual(ledger.reserved, 10)
+
+    def test_summary(self):
+        """Test that the debug summary reports reserved, free and claims."""
+        ledger = JobLedger()
+        ledger.claim("amd64-debian-12", 7)
+        self.assertEqual(
+            ledger.summary(total_jobs=10),
+            {
+                "total": 10,
+                "reserved": 7,
+                "free": 3,
+                "claims": {"amd64-debian-12": 7},
+            },
+        )
+
+    def test_matches_scan(self):
+        """
+        Test that the ledger agrees with a scan over the busy builders while
+        builds start and finish on a worker with a few hundred builders.
+        """
+        rng = random.Random(42)
+        wfbs = [
+            fake_workerforbuilder(f"builder-{i}", rng.randint(1, 20))
+            for i in range(300)
+        ]
+        ledger = JobLedger()
+        for _ in range(2000):
+            wfb = rng.choice(wfbs)
+            if wfb.busy:
+                wfb.busy = False
+                ledger.release(wfb.builder_name)
+            else:
+                wfb.busy = True
+                ledger.claim(wfb.builder_name, wfb.builder.config.properties["jobs"])
+            self.assertEqual(ledger.reserved, scan_reserved_jobs(wfbs))
+
+
+class TestSharedJobLedger(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = sa.create_engine(
+            f"sqlite:///{self.tmpdir.name}/state.sqlite",
+            connect_args={"timeout": 30},
+        )
+        with self.engine.connect() as conn:
+            create_shared_ledger_tables(conn)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def test_claim_within_total(self):
+        """Test that claims from several masters are capped by total_jobs."""
+        with self.engine.connect() as conn:
+            self.assertTrue(claim_host_jobs(conn, "hz-bbw8", "m0", "w", "b1", 60, 110))
+            self.assertTrue(claim_host_jobs(conn, "hz-bbw8", "m1", "w", "b2", 50, 110))
+            self.assertFalse(claim_host_jobs(conn, "hz-bbw8", "m1", "w", "b3", 1, 110))
+            self.assertEqual(host_job_claims(conn, "hz-bbw8")["reserved"], 110)
+
+            release_host_jobs(conn, "hz-bbw8", "m0", "w", "b1")
+            self.assertTrue(claim_host_jobs(conn, "hz-bbw8", "m1", "w", "b3", 1, 110))
+            self.assertEqual(
+                host_job_claims(conn, "hz-bbw8"),
+                {
+                    "reserved": 51,
+                    "claims": {("m1", "w", "b2"): 50, ("m1", "w", "b3"): 1},
+                },
+            )
+
+    def test_stale_claim_is_replaced(self):
+        """Test that a new claim of the same builder replaces the stale one."""
+        with self.engine.connect() as conn:
+            self.assertTrue(claim_host_jobs(conn, "hz-bbw8", "m0", "w", "b1", 7, 10))
+            self.assertTrue(claim_host_jobs(conn, "hz-bbw8", "m0", "w", "b1", 7, 10))
+            self.assertEqual(host_job_claims(conn, "hz-bbw8")["reserved"], 7)
+
+    def test_release_master_claims(self):
+        """Test that restarting a master drops only its own claims."""
+        with self.engine.connect() as conn:
+            claim_host_jobs(conn, "hz-bbw8", "m0", "w", "b1", 7, 110)
+            claim_host_jobs(conn, "hz-bbw9", "m0", "w", "b1", 7, 110)
+            claim_host_jobs(conn, "hz-bbw8", "m1", "w", "b2", 5, 110)
+            release_master_claims(conn, "m0")
+            self.assertEqual(host_job_claims(conn, "hz-bbw8")["reserved"], 5)
+            self.assertEqual(host_job_claims(conn, "hz-bbw9")["reserved"], 0)
+
+    def test_claims_per_worker(self):
+        """Test that workers of a master on the same host claim the same builder apart."""
+        with self.engine.connect() as conn:
+            self.assertTrue(claim_host_jobs(conn, "hz-bbw8", "m0", "w1", "b1", 7, 110))
+            self.assertTrue(claim_host_jobs(conn, "hz-bbw8", "m0", "w2", "b1", 7, 110))
+            self.assertEqual(host_job_claims(conn, "hz-bbw8")["reserved"], 14)
+
+            release_host_jobs(conn, "hz-bbw8", "m0", "w1", "b1")
+            self.assertEqual(
+                host_job_claims(conn, "hz-bbw8"),
+                {"reserved": 7, "claims": {("m0", "w2", "b1"): 7}},
+            )
+
+    def test_release_worker_claims(self):
+        """Test that releasing a worker drops all its claims and only those."""
+        with self.engine.connect() as conn:
+            claim_host_jobs(conn, "hz-bbw8", "m0", "w1", "b1", 7, 110)
+            claim_host_jobs(conn, "hz-bbw8", "m0", "w1", "b2", 5, 110)
+            claim_host_jobs(conn, "hz-bbw8", "m0", "w2", "b1", 3, 110)
+            claim_host_jobs(conn, "hz-bbw8", "m1", "w1", "b1", 2, 110)
+            release_worker_claims(conn, "hz-bbw8", "m0", "w1")
+            self.assertEqual(host_job_claims(conn, "hz-bbw8")["reserved"], 5)
+
+    def test_concurrent_masters(self):
+        """
+        Test that masters claiming and releasing concurrently on the same host
+        never exceed total_jobs and leave a consistent ledger behind.
+        """
+        total_jobs = 20
+        errors = []
+
+        def master(master_name):
+            rng = random.Random(master_name)
+            held = set()
+            with self.engine.connect() as conn:
+                for _ in range(50):
+                    builder = f"b{rng.randint(1, 5)}"
+                    if builder in held:
+                        release_host_jobs(conn, "hz-bbw8", master_name, "w", builder)
+                        held.remove(builder)
+                    elif claim_host_jobs(
+                        conn, "hz-bbw8", master_name, "w", builder, 4, total_jobs
+                    ):
+                        held.add(builder)
+                    reserved = host_job_claims(conn, "hz-bbw8")["reserved"]
+                    if reserved > total_jobs:
+                        errors.append(reserved)
+
+        threads = [threading.Thread(target=master, args=(f"m{i}",)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        with self.engine.connect() as conn:
+            summary = host_job_claims(conn, "hz-bbw8")
+        self.assertEqual(summary["reserved"], sum(summary["claims"].values()))
+
+
+class TestLedgerWorker(TestReactorMixin, trial.TestCase):
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.setup_test_reactor()
+        self.master = yield fakemaster.make_master(self, wantData=True)
+        self.worker = LedgerWorker("hz-bbw8", "pass", properties={"total_jobs": 110})
+        yield self.worker.setServiceParent(self.master.workers)
+        yield self.master.startService()
+        self.addCleanup(self.master.stopService)
+
+    @defer.inlineCallbacks
+    def shared_worker(self) -> LedgerWorker:
+        yield self.master.db.pool.do(create_shared_ledger_tables)
+        worker = LedgerWorker(
+            "hz-bbw8-shared",
+            "pass",
+            properties={"total_jobs": 110},
+            shared_host="hz-bbw8",
+        )
+        yield worker.setServiceParent(self.master.workers)
+        yield worker.attached(fakeprotocol.FakeConnection(worker))
+        return worker
+
+    @defer.inlineCallbacks
+    def host_reserved(self) -> int:
+        summary = yield self.master.db.pool.do(host_job_claims, "hz-bbw8")
+        return summary["reserved"]
+
+    @defer.inlineCallbacks
+    def start_build(
+        self, builder_name: str, jobs: int, worker: LedgerWorker = None
+    ) -> WorkerForBuilder:
+        builder = SimpleNamespace(
+            name=builder_name, config=SimpleNamespace(properties={"jobs": jobs})
+        )
+        wfb = WorkerForBuilder(builder)
+        yield wfb.attached(worker or self.worker, {})
+        wfb.buildStarted()
+        return wfb
+
+    @defer.inlineCallbacks
+    def test_worker_lost_mid_build(self):
+        """Test that the claims of the builds lost with the worker are released."""
+        yield self.worker.attached(fakeprotocol.FakeConnection(self.worker))
+        wfbs = [
+            (yield self.start_build("amd64-debian-12", 7)),
+            (yield self.start_build("amd64-msan-clang-20", 12)),
+        ]
+        self.assertEqual(self.worker.job_ledger.reserved, 19)
+
+        yield self.worker.detached()
+        # What BotMaster.workerLost does, the builds then finish without the worker
+        for wfb in wfbs:
+            wfb.detached()
+            wfb.buildFinished()
+        self.assertEqual(self.worker.job_ledger.claims, {})
+
+        yield self.worker.attached(fakeprotocol.FakeConnection(self.worker))
+        yield self.start_build("amd64-debian-12", 7)
+        self.assertEqual(self.worker.job_ledger.reserved, 7)
+
+    @defer.inlineCallbacks
+    def test_attached_drops_stale_claims(self):
+        """Test that a worker connecting again keeps only the claims of busy builders."""
+        self.worker.job_ledger.claim("amd64-debian-12", 7)
+        yield self.worker.attached(fakeprotocol.FakeConnection(self.worker))
+        self.assertEqual(self.worker.job_ledger.claims, {})
+
+    @defer.inlineCallbacks
+    def test_unstarted_shared_claim_released(self):
+        """Test that the shared claim of a build that never starts is released."""
+        worker = yield self.shared_worker()
+        claimed = yield worker.claim_shared_jobs("amd64-debian-12", 7, 110)
+        self.assertTrue(claimed)
+        self.assertEqual((yield self.host_reserved()), 7)
+
+        self.reactor.advance(SHARED_CLAIM_START_TIMEOUT)
+        self.assertEqual((yield self.host_reserved()), 0)
+
+    @defer.inlineCallbacks
+    def test_started_shared_claim_kept(self):
+        """Test that the shared claim of a started build lasts until it finishes."""
+        worker = yield self.shared_worker()
+        yield worker.claim_shared_jobs("amd64-debian-12", 7, 110)
+        wfb = yield self.start_build("amd64-debian-12", 7, worker)
+
+        self.reactor.advance(SHARED_CLAIM_START_TIMEOUT)
+        self.assertEqual((yield self.host_reserved()), 7)
+
+        wfb.buildFinished()
+        self.assertEqual((yield self.host_reserved()), 0)
+
+    @defer.inlineCallbacks
+    def test_late_start_claims_again(self):
+        """Test that a build starting after its claim timed out is claimed again."""
+        worker = yield self.shared_worker()
+        yield worker.claim_shared_jobs("amd64-debian-12", 7, 110)
+        self.reactor.advance(SHARED_CLAIM_START_TIMEOUT)
+        yield self.start_build("amd64-debian-12", 7, worker)
+        self.assertEqual((yield self.host_reserved()), 7)
+
+        yield worker.detached()
+        self.assertEqual((yield self.host_reserved()), 0)
+
+    @defer.inlineCallbacks
+    def test_detached_releases_worker_claims(self):
+        """Test that a lost worker drops its claims, also those unknown locally."""
+        worker = yield self.shared_worker()
+        yield self.start_build("amd64-debian-12", 7, worker)
+        for worker_name in (worker.name, "hz-bbw8-other"):
+            yield self.master.db.pool.do(
+                claim_host_jobs,
+                "hz-bbw8",
+                self.master.name,
+                worker_name,
+                "amd64-fedora-42",
+                5,
+                110,
+            )
+        self.assertEqual((yield self.host_reserved()), 17)
+
+        yield worker.detached()
+        self.assertEqual((yield self.host_reserved()), 5)
+
+    @defer.inlineCallbacks
+    def test_latent_worker_claims_its_jobs(self):
+        """Test that a shared latent worker claims its jobs property for a build."""
+        yield self.master.db.pool.do(create_shared_ledger_tables)
+        worker = SharedHostDockerLatentWorker(
+            "hz-bbw8-docker-debian-12",
+            None,
+            docker_host="tcp://127.0.0.1:2375",
+            image="debian12",
+            properties={"jobs": 7, "total_jobs": 110},
+            shared_host="hz-bbw8",
+        )
+        yield worker.setServiceParent(self.master.workers)
+        builder = SimpleNamespace(
+            name="amd64-debian-12", config=SimpleNamespace(properties={})
+        )
+        wfb = LatentWorkerForBuilder(worker, builder)
+        wfb.buildStarted()
+        self.assertEqual((yield self.host_reserved()), 7)
+
+        wfb.buildFinished()
+        self.assertEqual((yield self.host_reserved()), 0)
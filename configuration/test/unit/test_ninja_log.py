@@ -0,0 +1,69 @@
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from configuration.steps.commands.compile import NinjaLogReport, parse_ninja_report
+
+# A full build, then an incremental one rebuilding sql_parse.cc and relinking
+NINJA_LOG = """\
+# ninja log v5
+0\t1200\t0\tmysys/CMakeFiles/mysys.dir/my_init.c.o\taaaa
+30\t5000\t0\tsql/sql_yacc.hh\teeee
+30\t5000\t0\tsql/sql_yacc.cc\teeee
+20\t61000\t0\tsql/CMakeFiles/sql.dir/sql_parse.cc.o\tcccc
+5010\t95000\t0\tsql/CMakeFiles/sql.dir/sql_yacc.cc.o\tbbbb
+95100\t99000\t0\tsql/mariadbd\tdddd
+0\t42000\t0\tsql/CMakeFiles/sql.dir/sql_parse.cc.o\tcccc
+42100\t45000\t0\tsql/mariadbd\tdddd
+"""
+
+
+class TestNinjaLogReport(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def report(self, top: int = 20) -> str:
+        result = subprocess.run(
+            NinjaLogReport(builddir=str(self.tmp), top=top).as_cmd_arg(),
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout
+
+    def test_last_build(self):
+        """Test that only the targets of the last ninja run are reported."""
+        (self.tmp / ".ninja_log").write_text(NINJA_LOG)
+        self.assertEqual(
+            parse_ninja_report(0, self.report(), ""),
+            {
+                "ninja_targets_built": 2,
+                "ninja_targets_known": 6,
+                "ninja_build_seconds": 45.0,
+                "ninja_slowest_targets": [
+                    ["sql/CMakeFiles/sql.dir/sql_parse.cc.o", 42.0],
+                    ["sql/mariadbd", 2.9],
+                ],
+            },
+        )
+
+    def test_slowest_first(self):
+        """Test that a single run reports its slowest targets, once per command."""
+        (self.tmp / ".ninja_log").write_text(NINJA_LOG.rsplit("0\t42000", 1)[0])
+        report = parse_ninja_report(0, self.report(top=2), "")
+        self.assertEqual(report["ninja_targets_built"], 5)
+        self.assertEqual(report["ninja_build_seconds"], 99.0)
+        self.assertEqual(
+            report["ninja_slowest_targets"],
+            [
+                ["sql/CMakeFiles/sql.dir/sql_yacc.cc.o", 89.99],
+                ["sql/CMakeFiles/sql.dir/sql_parse.cc.o", 60.98],
+            ],
+        )
+
+    def test_not_ninja(self):
+        """Test that a build without ninja reports nothing."""
+        self.assertEqual(parse_ninja_report(0, self.report(), ""), {})
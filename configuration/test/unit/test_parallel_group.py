@@ -0,0 +1,285 @@
+import unittest as pyunittest
+from pathlib import PurePath
+from types import SimpleNamespace
+
+from twisted.internet import defer, task
+from twisted.trial import unittest
+
+from buildbot.process.results import EXCEPTION, FAILURE, SUCCESS, WARNINGS
+from buildbot.test.reactor import TestReactorMixin
+from buildbot.test.steps import ExpectShell, TestBuildStepMixin
+from buildbot.util import flatten
+from configuration.builders.infra.runtime import (
+    DockerConfig,
+    InContainer,
+    ParallelGroup,
+)
+from configuration.reporters.step_metrics import STEP_METRICS_NAME
+from configuration.steps.base import StepOptions
+from configuration.steps.commands.base import (
+    CONTAINER_USAGE_PREFIX,
+    ParallelShellCommands,
+    format_timeline,
+)
+from configuration.steps.commands.util import FindFiles, PrintEnvironmentDetails
+from configuration.steps.processors import process_steps
+from configuration.steps.remote import PropFromShellStep, ShellStep
+
+
+def docker_config() -> DockerConfig:
+    return DockerConfig(
+        repository="quay.io/mariadb-foundation/bb-worker:",
+        image_tag="debian12",
+        workdir=PurePath("/home/buildbot"),
+    )
+
+
+def suite(config: DockerConfig, name: str, **kwargs) -> InContainer:
+    command = PrintEnvironmentDetails()
+    command.name = name
+    return InContainer(
+        ShellStep(command=command, options=StepOptions(haltOnFailure=False)),
+        docker_environment=config,
+        **kwargs,
+    )
+
+
+def command(name: str, halt_on_failure: bool = False) -> dict:
+    return {
+        "name": name,
+        "haltOnFailure": halt_on_failure,
+        "command": ["mtr", name],
+        "workdir": "build",
+        "env": {},
+        "timeout": 1200,
+        "interruptSignal": "TERM",
+        "decodeRC": {0: SUCCESS, 1: WARNINGS, 2: FAILURE},
+    }
+
+
+def expect(name: str, rc: int) -> ExpectShell:
+    return ExpectShell(
+        workdir="build", command=["mtr", name], interrupt_signal="TERM"
+    ).exit(rc)
+
+
+class TestParallelGroup(pyunittest.TestCase):
+    def setUp(self):
+        self.config = docker_config()
+        self.group = ParallelGroup(name="MTR suites")
+
+    def test_add_branch_validation(self):
+        """Test that branches only take shared container steps, after their dependencies."""
+        self.group.add_branch("normal", [suite(self.config, "normal")])
+        invalid = [
+            ("normal", [suite(self.config, "again")], ()),
+            ("s3", [], ()),
+            ("s 3", [suite(self.config, "s3")], ()),
+            ("s3", [suite(self.config, "s3")], ("galera",)),
+            ("s3", [suite(self.config, "normal")], ()),
+            ("s3", [ShellStep(command=PrintEnvironmentDetails())], ()),
+            ("s3", [suite(self.config, "s3", container_commit=True)], ()),
+            (
+                "s3",
+                [
+                    InContainer(
+                        PropFromShellStep(command=FindFiles(include="*"), property="p"),
+                        docker_environment=self.config,
+                    )
+                ],
+                (),
+            ),
+        ]
+        other = DockerConfig(repository="quay.io/", image_tag="ubuntu2404")
+        invalid.append(("s3", [suite(other, "s3")], ()))
+        for name, steps, depends_on in invalid:
+            with self.subTest(branch=name, steps=[s.name for s in steps]):
+                with self.assertRaises(ValueError):
+                    self.group.add_branch(name, steps, depends_on)
+        self.group.add_branch("s3", [suite(self.config, "s3")], ("normal",))
+        self.assertEqual(list(self.group.branches), ["normal", "s3"])
+
+    def test_generate(self):
+        """Test that each branch runs in a container of its own on the builder volume."""
+        self.group.add_branch(
+            "normal", [suite(self.config, "normal"), suite(self.config, "report")]
+        )
+        self.group.add_branch("galera", [suite(self.config, "galera")])
+        _, active_steps, _ = process_steps("amd64-debian-12", "PROD", [self.group])
+        self.assertIs(active_steps[-1], self.group)
+        buildstep = self.group.generate()
+        self.assertIsInstance(buildstep, ParallelShellCommands)
+        branches = buildstep._factory.kwargs["branches"]
+        self.assertEqual([b["name"] for b in branches], ["normal", "galera"])
+        self.assertEqual(
+            [c["name"] for c in branches[0]["commands"]], ["normal", "report"]
+        )
+        self.assertTrue(branches[0]["commands"][0]["container_usage"])
+        galera = flatten(branches[1]["commands"][0]["command"])
+        self.assertEqual(
+            galera[:5], ["docker", "run", "--init", "--name", "amd64-debian-12--galera"]
+        )
+        self.assertIn("type=volume,src=amd64-debian-12,dst=/home/buildbot", galera)
+        self.assertIn("buildbot:amd64-debian-12", galera)
+
+    def test_persistent(self):
+        """Test that a persistent group runs its steps in the builder container."""
+        self.group.add_branch("normal", [suite(self.config, "normal")])
+        self.group.add_branch("galera", [suite(self.config, "galera")])
+        process_steps(
+            "amd64-debian-12", "PROD", [self.group], persistent_container=True
+        )
+        self.assertTrue(all(step.persistent for step in self.group.steps))
+        branches = self.group.generate()._factory.kwargs["branches"]
+        for branch in branches:
+            run = flatten(branch["commands"][0]["command"])
+            # docker exec through persistent_exec.sh
+            self.assertEqual(run[:2], ["bash", "-c"])
+            self.assertEqual(run[3:5], ["--", "amd64-debian-12"])
+
+    def test_format_timeline(self):
+        """Test that the timeline shows when each command ran."""
+        timeline = format_timeline(
+            [
+                ("normal", "normal", 0, 600, SUCCESS),
+                ("galera", "galera", 0, 1200, FAILURE),
+                ("galera", "report", 1200, 1215, SUCCESS),
+            ],
+            width=8,
+        )
+        self.assertEqual(
+            timeline.splitlines(),
+            [
+                "normal: normal 0:00:00 - 0:10:00 0:10:00 success   |###     |",
+                "galera: galera 0:00:00 - 0:20:00 0:20:00 failure   |####### |",
+                "galera: report 0:20:00 - 0:20:15 0:00:15 success   |       #|",
+            ],
+        )
+        self.assertEqual(format_timeline([]), "")
+
+
+class TestParallelShellCommands(
+    TestBuildStepMixin, TestReactorMixin, unittest.TestCase
+):
+    def setUp(self):
+        self.setup_test_reactor()
+        return self.setup_test_build_step()
+
+    def test_results_merged(self):
+        """Test that the branches start together and their worst result is kept."""
+        self.setup_step(
+            ParallelShellCommands(
+                branches=[
+                    {
+                        "name": "normal",
+                        "depends_on": [],
+                        "commands": [command("normal")],
+                    },
+                    {"name": "s3", "depends_on": [], "commands": [command("s3")]},
+                    {
+                        "name": "report",
+                        "depends_on": ["normal", "s3"],
+                        "commands": [command("report")],
+                    },
+                ]
+            )
+        )
+        self.expect_commands(expect("normal", 0), expect("s3", 1), expect("report", 0))
+        self.expect_outcome(result=WARNINGS)
+        return self.run_step()
+
+    @defer.inlineCallbacks
+    def test_container_usage(self):
+        """Test that the container usage a command prints goes to StepMetrics."""
+        usage = command("normal")
+        usage["container_usage"] = True
+        self.setup_step(
+            ParallelShellCommands(
+                branches=[{"name": "normal", "depends_on": [], "commands": [usage]}]
+            )
+        )
+        self.build.getWorkerName = lambda: "hz-bbw1"
+        recorded = []
+        self.master.namedServices[STEP_METRICS_NAME] = SimpleNamespace(
+            record_container_usage=lambda **kwargs: recorded.append(kwargs)
+        )
+        self.expect_commands(
+            expect("normal", 0).log(
+                "normal",
+                stdout=f"{CONTAINER_USAGE_PREFIX}cpu_seconds=12.5 memory_peak_bytes=1024\n",
+            )
+        )
+        self.expect_outcome(result=SUCCESS)
+        yield self.run_step()
+        self.assertEqual(len(recorded), 1)
+        self.assertEqual(recorded[0]["step"], "normal")
+        self.assertEqual(recorded[0]["worker"], "hz-bbw1")
+        self.assertEqual(recorded[0]["cpu_seconds"], 12.5)
+        self.assertEqual(recorded[0]["memory_peak_bytes"], 1024)
+
+    def test_halt_on_failure(self):
+        """Test that a halting failure skips its branch and the dependent branches."""
+        self.setup_step(
+            ParallelShellCommands(
+                branches=[
+                    {
+                        "name": "galera",
+                        "depends_on": [],
+                        "commands": [command("galera", True), command("galera-3")],
+                    },
+                    {
+                        "name": "normal",
+                        "depends_on": [],
+                        "commands": [command("normal")],
+                    },
+                    {
+                        "name": "report",
+                        "depends_on": ["galera"],
+                        "commands": [command("report")],
+                    },
+                ]
+            )
+        )
+        # The second branch starts while the first one runs
+        self.expect_commands(expect("galera", 2), expect("normal", 0))
+        self.expect_outcome(result=FAILURE)
+        self.expect_log_file("galera", "")
+        return self.run_step()
+
+    @defer.inlineCallbacks
+    def test_exception_interrupts_branches(self):
+        """
+        Test that an exception in a branch interrupts the running commands of the
+        other branches and that the step ends once they all stopped.
+        """
+
+        def run_until_interrupted(command):
+            self.conn.set_expect_interrupt()
+            return task.deferLater(self.reactor, 60, lambda: None)
+
+        self.setup_step(
+            ParallelShellCommands(
+                branches=[
+                    {
+                        "name": "normal",
+                        "depends_on": [],
+                        "commands": [command("normal"), command("normal-2")],
+                    },
+                    {"name": "s3", "depends_on": [], "commands": [command("s3")]},
+                    {
+                        "name": "report",
+                        "depends_on": ["s3"],
+                        "commands": [command("report")],
+                    },
+                ]
+            )
+        )
+        self.expect_commands(
+            expect("normal", -1).behavior(run_until_interrupted),
+            expect("s3", 0).error(RuntimeError("worker lost")),
+        )
+        self.expect_exception(RuntimeError)
+        d = self.run_step()
+        self.assertFalse(d.called)
+        self.reactor.advance(60)
+        yield d
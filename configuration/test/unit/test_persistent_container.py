@@ -0,0 +1,222 @@
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+import unittest
+from pathlib import Path, PurePath
+
+from buildbot.process.properties import Interpolate
+from buildbot.util import flatten
+from configuration.builders.infra.runtime import DockerConfig, InContainer
+from configuration.steps.commands.base import CONTAINER_USAGE_PREFIX, Command
+from configuration.steps.commands.infra import ContainerCommit, StartPersistentContainer
+from configuration.steps.processors import process_steps
+from configuration.steps.remote import ShellStep
+
+
+class Run(Command):
+    def __init__(self, script: str, workdir: PurePath = PurePath("build")):
+        super().__init__(name=f"Run {script}", workdir=workdir)
+        self.script = script
+
+    def as_cmd_arg(self) -> list[str]:
+        return ["bash", "-ec", self.script]
+
+
+def config(image: str = "debian12", env_vars=None) -> DockerConfig:
+    return DockerConfig(
+        repository="registry/",
+        image_tag=image,
+        env_vars=env_vars or [],
+        bind_mounts=[("/srv/buildbot/ccache", "/mnt/ccache")],
+    )
+
+
+def deb_autobake_like(
+    docker_config: DockerConfig, script: str = "true", step_env: bool = True
+) -> list:
+    """
+    The container steps of the deb_autobake sequence: fetch, compile, find packages,
+    create the repository and install (both committed), the MTR suites and the saves.
+    """
+    names = ["fetch", "compile", "packages", "repo", "install"]
+    names += ["mtr-normal", "mtr-galera", "mtr-rocksdb", "mtr-s3"]
+    names += ["save-mtr-logs", "save-packages"]
+    return [
+        InContainer(
+            docker_environment=docker_config,
+            container_commit=name in ("repo", "install"),
+            step=ShellStep(
+                command=Run(script), env_vars=[("STEP", name)] if step_env else []
+            ),
+        )
+        for name in names
+    ]
+
+
+def process(steps: list, builder_name: str, persistent: bool) -> list:
+    """The active steps, as processed for the builder."""
+    _, steps, _ = process_steps(
+        builder_name=builder_name,
+        environment="PROD",
+        active_steps=steps,
+        persistent_container=persistent,
+    )
+    return steps
+
+
+def command_of(step) -> list:
+    return flatten(step.generate().command)
+
+
+# Stands in for the docker CLI: docker exec runs the command on the host, every
+# call is logged in $DOCKER_CALLS.
+FAKE_DOCKER = """#!/bin/bash
+echo "$*" >>"$DOCKER_CALLS"
+[[ $1 == exec ]] || exit 1
+shift
+while [[ $1 == -* ]]; do shift 2; done
+shift
+exec "$@"
+"""
+
+
+def alive(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat", encoding="utf-8") as f:
+            # Killed processes stay zombies until something reaps them
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+class TestPersistentContainer(unittest.TestCase):
+    def test_process_steps(self):
+        """Test that the container starts after each tag step and commits are dropped."""
+        debian, ubuntu = config("debian12"), config("ubuntu2404")
+        steps = process(
+            deb_autobake_like(debian)[:5] + deb_autobake_like(ubuntu)[:2],
+            builder_name="amd64-debian-12-deb-autobake",
+            persistent=True,
+        )
+        kinds = [
+            type(step.command).__name__ if isinstance(step, ShellStep) else "exec"
+            for step in steps
+        ]
+        self.assertEqual(
+            kinds,
+            ["TagContainerImage", "StartPersistentContainer"]
+            + ["exec"] * 5
+            + ["TagContainerImage", "StartPersistentContainer"]
+            + ["exec"] * 2,
+        )
+        self.assertIs(steps[1].command.docker_environment, debian)
+        self.assertIs(steps[8].command.docker_environment, ubuntu)
+
+    def test_run_mode_unchanged(self):
+        """Test that builders not opting in still commit and docker run."""
+        steps = process(deb_autobake_like(config()), builder_name="b", persistent=False)
+        commits = [
+            step
+            for step in steps
+            if isinstance(step, ShellStep) and isinstance(step.command, ContainerCommit)
+        ]
+        self.assertEqual(len(commits), 2)
+        self.assertEqual(command_of(steps[1])[:2], ["docker", "run"])
+
+    def test_exec_command(self):
+        """Test the docker exec options: user, workdir, step env, container."""
+        docker_config = config(env_vars=[("CCACHE_DIR", "/mnt/ccache")])
+        steps = process(
+            deb_autobake_like(docker_config), builder_name="b", persistent=True
+        )
+        command = command_of(steps[2])
+        self.assertEqual(command[:2], ["bash", "-c"])
+        self.assertEqual(
+            command[3:10],
+            ["--", "b", "-u", "buildbot", "-w", "/home/buildbot/build", "-e"],
+        )
+        self.assertIsInstance(command[10], Interpolate)
+        self.assertEqual(command[11:14], ["--", "bash", "-c"])
+        self.assertEqual(command[15:], ["--", "bash", "-ec", "true"])
+        # Global variables were set once, when the container started
+        self.assertEqual(sum(arg == "-e" for arg in command if isinstance(arg, str)), 1)
+
+    def test_start_command_reads_late_settings(self):
+        """Test that the network and env set by the sidecar processor are used."""
+        docker_config = config()
+        docker_config._container_name = "b"
+        start = StartPersistentContainer(docker_config)
+        docker_config._network = "PROD_b_network"
+        docker_config.env_vars.append(("SIDECAR_HOST", "PROD_b_sidecar"))
+        command = flatten(start.as_cmd_arg())
+        self.assertIn("PROD_b_network", command)
+        self.assertEqual(command[-3:], ["buildbot:b", "sleep", "infinity"])
+        self.assertIn("--init", command)
+        self.assertIn("--shm-size=15g", command)
+
+
+@unittest.skipUnless(shutil.which("setsid"), "setsid is not installed")
+class TestPersistentExec(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        bin_dir = self.tmp / "bin"
+        bin_dir.mkdir()
+        docker = bin_dir / "docker"
+        docker.write_text(FAKE_DOCKER)
+        docker.chmod(0o755)
+        self.env = dict(
+            os.environ,
+            PATH=f"{bin_dir}:{os.environ['PATH']}",
+            DOCKER_CALLS=str(self.tmp / "calls"),
+            CHILD=str(self.tmp / "child"),
+        )
+
+    def exec_command(self, script: str) -> list:
+        step = deb_autobake_like(config(), script=script, step_env=False)[0]
+        return command_of(process([step], builder_name="b", persistent=True)[2])
+
+    def test_exit_status(self):
+        """Test that the step fails with the status of its command."""
+        result = subprocess.run(
+            self.exec_command("echo step output; exit 3"),
+            env=self.env,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 3)
+        output, *usage = result.stdout.splitlines()
+        self.assertEqual(output, "step output")
+        # Followed by the container usage, when the cgroup is readable
+        for line in usage:
+            self.assertTrue(line.startswith(CONTAINER_USAGE_PREFIX), line)
+
+    def test_interrupt_kills_step_processes(self):
+        """Test that interrupting the step kills its processes in the container."""
+        # The worker runs the step in a process group of its own and signals it
+        process = subprocess.Popen(
+            self.exec_command('sleep 300 & echo $! >"$CHILD"; wait'),
+            env=self.env,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        child = self.tmp / "child"
+        for _ in range(100):
+            if child.exists() and child.read_text():
+                break
+            time.sleep(0.05)
+        child_pid = int(child.read_text())
+        self.assertTrue(alive(child_pid))
+
+        os.killpg(process.pid, signal.SIGTERM)
+        self.assertEqual(process.wait(timeout=10), 143)
+        for _ in range(100):
+            if not alive(child_pid):
+                break
+            time.sleep(0.05)
+        self.assertFalse(alive(child_pid))
+        calls = (self.tmp / "calls").read_text().splitlines()
+        self.assertTrue(calls[-1].startswith("exec -u root b bash -c"))
@@ -0,0 +1,136 @@
+import fnmatch
+import random
+import unittest
+from types import SimpleNamespace
+
+from configuration.builders.priority import (
+    BranchClassifier,
+    BuildRequestQueue,
+    PriorityNextBuild,
+    glob_match_any,
+)
+
+RELEASE_BRANCHES = ["bb-*-release", "preview-*"]
+SAVED_PACKAGE_BRANCHES = [
+    "10.6",
+    "10.11",
+    "11.4",
+    "11.8",
+    "main",
+    "bb-*-release",
+    "bb-10.2-compatibility",
+    "preview-*",
+    "*pkgtest*",
+]
+BRANCHES = [
+    "main",
+    "10.6",
+    "11.4",
+    "bb-11.4-release",
+    "preview-12.0-vector",
+    "bb-10.6-pkgtest",
+    "bb-10.2-compatibility",
+    "MDEV-12345",
+    "bb-11.8-someone",
+    "st-10.11-foo",
+]
+
+
+def fnmatch_any(branch: str, patterns: list[str]) -> bool:
+    return any(fnmatch.fnmatch(branch, pattern) for pattern in patterns)
+
+
+def legacy_next_build(builder, requests):
+    def build_request_sort_key(request):
+        branch = request.sources[""].branch
+        return (
+            not fnmatch_any(branch, RELEASE_BRANCHES),
+            not fnmatch_any(branch, SAVED_PACKAGE_BRANCHES),
+            request.getSubmitTime(),
+        )
+
+    return min(requests, key=build_request_sort_key)
+
+
+def fake_request(brid: int, branch: str, submitted_at: float):
+    return SimpleNamespace(
+        id=brid,
+        sources={"": SimpleNamespace(branch=branch)},
+        getSubmitTime=lambda: submitted_at,
+    )
+
+
+def random_requests(rng: random.Random, count: int, start: int = 0) -> list:
+    return [
+        fake_request(brid, rng.choice(BRANCHES), float(brid))
+        for brid in range(start, start + count)
+    ]
+
+
+class TestBranchClassifier(unittest.TestCase):
+    def test_matches_fnmatch(self):
+        """Test that the compiled patterns agree with fnmatch on every branch."""
+        classifier = BranchClassifier(RELEASE_BRANCHES, SAVED_PACKAGE_BRANCHES)
+        for branch in BRANCHES + ["", "preview-", "xbb-11.4-release", "10.6.1"]:
+            self.assertEqual(
+                classifier.tier(branch),
+                (
+                    not fnmatch_any(branch, RELEASE_BRANCHES),
+                    not fnmatch_any(branch, SAVED_PACKAGE_BRANCHES),
+                ),
+                branch,
+            )
+            self.assertEqual(
+                glob_match_any(branch, SAVED_PACKAGE_BRANCHES),
+                fnmatch_any(branch, SAVED_PACKAGE_BRANCHES),
+            )
+
+    def test_empty_tier(self):
+        """Test that a tier without patterns matches nothing."""
+        classifier = BranchClassifier([], ["main"])
+        self.assertEqual(classifier.tier("main"), (True, False))
+        self.assertFalse(glob_match_any("main", []))
+
+
+class TestPriorityNextBuild(unittest.TestCase):
+    def test_matches_legacy_selection(self):
+        """
+        Test that the queue selects the same request as the min() based selection
+        while requests are added, picked and cancelled between calls.
+        """
+        rng = random.Random(7)
+        builder = SimpleNamespace(name="amd64-debian-12")
+        next_build = PriorityNextBuild(
+            BranchClassifier(RELEASE_BRANCHES, SAVED_PACKAGE_BRANCHES)
+        )
+        pending = random_requests(rng, 50)
+        next_id = len(pending)
+        for _ in range(500):
+            selected = next_build(builder, pending)
+            self.assertIs(selected, legacy_next_build(builder, pending))
+
+            pending.remove(selected)
+            if rng.random() < 0.3:  # Cancelled, or picked by another master
+                pending.remove(rng.choice(pending))
+            new = random_requests(rng, rng.randint(0, 3), start=next_id)
+            next_id += len(new)
+            pending.extend(new)
+            if not pending:
+                pending = random_requests(rng, 5, start=next_id)
+                next_id += 5
+
+    def test_queue_is_compacted(self):
+        """Test that requests handled elsewhere do not accumulate in the heap."""
+        queue = BuildRequestQueue(key=lambda r: -r.getSubmitTime())
+        rng = random.Random(3)
+        for start in range(0, 10000, 100):
+            queue.select(random_requests(rng, 100, start=start))
+        self.assertLessEqual(len(queue), 2 * 100 + 64 + 100)
+
+    def test_queues_per_builder(self):
+        """Test that each builder selects among its own requests."""
+        next_build = PriorityNextBuild(BranchClassifier(RELEASE_BRANCHES))
+        a = [fake_request(1, "main", 1.0), fake_request(2, "preview-x", 2.0)]
+        b = [fake_request(3, "main", 3.0)]
+        self.assertEqual(next_build(SimpleNamespace(name="a"), a).id, 2)
+        self.assertEqual(next_build(SimpleNamespace(name="b"), b).id, 3)
@@ -0,0 +1,331 @@
+import heapq
+import random
+import statistics
+import unittest
+from types import SimpleNamespace
+
+import sqlalchemy as sa
+from twisted.internet import defer
+from twisted.trial import unittest as trial
+
+from buildbot.db.model import Model
+from buildbot.process.results import FAILURE, SUCCESS
+from buildbot.test.fake import fakemaster
+from buildbot.test.reactor import TestReactorMixin
+from configuration.builders.history import (
+    BUILD_HISTORY_NAME,
+    BuildDurationHistory,
+    build_durations,
+)
+from configuration.builders.priority import (
+    BranchClassifier,
+    PriorityNextBuild,
+    ShortestJobNextBuild,
+)
+
+RELEASE_BRANCHES = ["bb-*-release", "preview-*"]
+SAVED_PACKAGE_BRANCHES = ["10.6", "11.4", "main", "bb-*-release", "preview-*"]
+# Non-nullable columns added to the builds table by newer Buildbot versions
+BUILD_EXTRA_COLUMNS = {
+    name: 0 for name in ("locks_duration_s",) if name in Model.builds.c
+}
+
+
+def fake_request(brid: int, branch: str, submitted_at: float):
+    return SimpleNamespace(
+        id=brid,
+        sources={"": SimpleNamespace(branch=branch)},
+        getSubmitTime=lambda: submitted_at,
+    )
+
+
+def shortest_job(history: BuildDurationHistory, aging: float = 1.0):
+    return ShortestJobNextBuild(
+        BranchClassifier(RELEASE_BRANCHES, SAVED_PACKAGE_BRANCHES), history, aging
+    )
+
+
+def replay(records: list[tuple], next_build, slots: int) -> list[float]:
+    """
+    Replays recorded build requests of one builder on `slots` workers.
+    Args:
+        records (list[tuple]): (submit time, branch, duration) of each request.
+        next_build: The nextBuild callable.
+        slots (int): How many builds of the builder can run at once.
+    Returns:
+        list[float]: The queue time of each request.
+    """
+    builder = SimpleNamespace(name="amd64-debian-12")
+    arrivals = sorted(records)
+    durations = {}
+    pending = []
+    running = []  # heap of finish times
+    waits = []
+    now = 0.0
+    i = 0
+    while i < len(arrivals) or pending:
+        next_arrival = arrivals[i][0] if i < len(arrivals) else float("inf")
+        next_finish = running[0] if len(running) == slots else now
+        now = max(now, min(next_arrival, next_finish))
+        while running and running[0] <= now:
+            heapq.heappop(running)
+        while i < len(arrivals) and arrivals[i][0] <= now:
+            submitted_at, branch, duration = arrivals[i]
+            request = fake_request(i, branch, submitted_at)
+            durations[i] = duration
+            pending.append(request)
+            i += 1
+        while pending and len(running) < slots:
+            request = next_build(builder, pending)
+            pending.remove(request)
+            waits.append(now - request.getSubmitTime())
+            heapq.heappush(running, now + durations[request.id])
+        if not pending and i < len(arrivals):
+            now = max(now, arrivals[i][0])
+        elif pending and len(running) == slots:
+            now = running[0]
+    return waits
+
+
+def recorded_history(seed: int = 1, count: int = 400) -> tuple[list, dict]:
+    """
+    Builds an arrival trace where most pushes are on short feature branches (quick
+    failure, compile-only changes) and some on branches running the full test suite.
+    """
+    rng = random.Random(seed)
+    branch_durations = {
+        "bb-11.4-compile-fix": 900,
+        "bb-11.8-typo": 600,
+        "bb-10.6-mdev-1": 1200,
+        "bb-11.4-fulltest": 3 * 3600,
+        "bb-10.6-galera": 2 * 3600,
+    }
+    weights = [30, 30, 20, 10, 10]
+    records = []
+    t = 0.0
+    for _ in range(count):
+        t += rng.expovariate(1 / 1500)
+        branch = rng.choices(list(branch_durations), weights)[0]
+        duration = branch_durations[branch] * rng.uniform(0.8, 1.2)
+        records.append((t, branch, duration))
+    history = {
+        ("amd64-debian-12", branch): [d] for branch, d in branch_durations.items()
+    }
+    return records, history
+
+
+class TestShortestJobNextBuild(unittest.TestCase):
+    def setUp(self):
+        self.history = BuildDurationHistory()
+        self.history.update(
+            {
+                ("amd64-debian-12", "bb-11.4-fulltest"): [10000, 11000, 12000],
+                ("amd64-debian-12", "bb-11.4-quick"): [600, 700, 80000],
+                ("amd64-debian-12", "11.4"): [9000],
+            }
+        )
+        self.builder = SimpleNamespace(name="amd64-debian-12")
+
+    def test_medians(self):
+        """Test the medians per (builder, branch) and the per-builder fallback."""
+        self.assertEqual(self.history.expected("amd64-debian-12", "bb-11.4-quick"), 700)
+        self.assertEqual(self.history.expected("amd64-debian-12", "bb-unknown"), 10000)
+        self.assertIsNone(self.history.expected("amd64-fedora-42", "main"))
+
+    def test_shortest_first_within_tier(self):
+        """Test that a shorter job submitted later goes first in the same tier."""
+        requests = [
+            fake_request(1, "bb-11.4-fulltest", 1000.0),
+            fake_request(2, "bb-11.4-quick", 2000.0),
+        ]
+        self.assertEqual(shortest_job(self.history)(self.builder, requests).id, 2)
+
+    def test_tier_still_wins(self):
+        """Test that a saved package branch goes before shorter feature branches."""
+        requests = [
+            fake_request(1, "bb-11.4-quick", 1000.0),
+            fake_request(2, "11.4", 2000.0),
+        ]
+        self.assertEqual(shortest_job(self.history)(self.builder, requests).id, 2)
+
+    def test_aging(self):
+        """Test that a long job that waited longer than the difference goes first."""
+        requests = [
+            fake_request(1, "bb-11.4-fulltest", 1000.0),
+            fake_request(2, "bb-11.4-quick", 1000.0 + 11000 - 700 + 1),
+        ]
+        self.assertEqual(shortest_job(self.history)(self.builder, requests).id, 1)
+
+    def test_no_history_is_fifo(self):
+        """Test that without history the selection is the default one."""
+        rng = random.Random(2)
+        requests = [
+            fake_request(i, rng.choice(["bb-11.4-a", "main", "preview-x"]), i * 10.0)
+            for i in range(50)
+        ]
+        fifo = PriorityNextBuild(
+            BranchClassifier(RELEASE_BRANCHES, SAVED_PACKAGE_BRANCHES)
+        )
+        sjf = shortest_job(BuildDurationHistory())
+        while requests:
+            selected = sjf(self.builder, requests)
+            self.assertIs(selected, fifo(self.builder, requests))
+            requests.remove(selected)
+
+    def test_refresh_invalidates_queues(self):
+        """Test that new medians apply to requests already queued."""
+        next_build = shortest_job(self.history)
+        requests = [
+            fake_request(1, "bb-11.4-fulltest", 1000.0),
+            fake_request(2, "bb-11.4-quick", 2000.0),
+        ]
+        self.assertEqual(next_build(self.builder, requests).id, 2)
+        self.history.update(
+            {
+                ("amd64-debian-12", "bb-11.4-fulltest"): [60],
+                ("amd64-debian-12", "bb-11.4-quick"): [6000],
+            }
+        )
+        self.assertEqual(next_build(self.builder, requests).id, 1)
+
+    def test_history_of_the_master(self):
+        """Test that without a history the one of the builder's master is used."""
+        builder = SimpleNamespace(
+            name="amd64-debian-12",
+            master=SimpleNamespace(namedServices={BUILD_HISTORY_NAME: self.history}),
+        )
+        requests = [
+            fake_request(1, "bb-11.4-fulltest", 1000.0),
+            fake_request(2, "bb-11.4-quick", 2000.0),
+        ]
+        next_build = ShortestJobNextBuild(
+            BranchClassifier(RELEASE_BRANCHES, SAVED_PACKAGE_BRANCHES)
+        )
+        self.assertEqual(next_build(self.builder, requests).id, 1)
+        self.assertEqual(next_build(builder, requests).id, 2)
+
+    def test_replay_reduces_queue_time(self):
+        """Test that replaying a recorded trace reduces the mean queue time."""
+        records, durations = recorded_history()
+        history = BuildDurationHistory()
+        history.update(durations)
+        fifo = replay(records, PriorityNextBuild(BranchClassifier([])), slots=2)
+        sjf = replay(records, shortest_job(history), slots=2)
+        self.assertEqual(len(fifo), len(sjf))
+        self.assertLess(statistics.mean(sjf), statistics.mean(fifo))
+
+
+class TestBuildDurationHistoryService(TestReactorMixin, trial.TestCase):
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.setup_test_reactor()
+        self.master = yield fakemaster.make_master(self, wantData=True)
+        self.history = BuildDurationHistory(refresh_interval=60)
+        self.refreshes = 0
+
+        def refresh():
+            self.refreshes += 1
+
+        self.history._refresh = refresh
+        yield self.history.setServiceParent(self.master)
+        yield self.master.startService()
+        self.addCleanup(self.master.stopService)
+
+    @defer.inlineCallbacks
+    def test_refresh_while_running(self):
+        """Test that the history is refreshed while the service runs, not after."""
+        self.assertEqual(self.refreshes, 1)
+        self.reactor.advance(60)
+        self.assertEqual(self.refreshes, 2)
+        yield self.history.disownServiceParent()
+        self.reactor.advance(600)
+        self.assertEqual(self.refreshes, 2)
+
+    @defer.inlineCallbacks
+    def test_reconfig(self):
+        """Test that a reconfig restarts the refresh with the new interval."""
+        yield self.history.reconfigServiceWithSibling(
+            BuildDurationHistory(refresh_interval=300)
+        )
+        self.assertEqual(self.refreshes, 2)
+        self.reactor.advance(60)
+        self.assertEqual(self.refreshes, 2)
+        self.reactor.advance(240)
+        self.assertEqual(self.refreshes, 3)
+
+
+class TestBuildDurations(unittest.TestCase):
+    def test_query(self):
+        """Test that only finished successful builds in the window are used."""
+        engine = sa.create_engine("sqlite://")
+        with engine.begin() as conn:
+            Model.metadata.create_all(
+                conn,
+                tables=[
+                    Model.builders,
+                    Model.builds,
+                    Model.buildrequests,
+                    Model.buildset_sourcestamps,
+                    Model.sourcestamps,
+                ],
+            )
+            conn.execute(
+                Model.builders.insert().values(
+                    id=1, name="amd64-debian-12", name_hash="h"
+                )
+            )
+            conn.execute(
+                Model.sourcestamps.insert().values(
+                    id=1,
+                    ss_hash="s",
+                    branch="main",
+                    repository="",
+                    codebase="",
+                    project="",
+                    created_at=0,
+                )
+            )
+            conn.execute(
+                Model.buildset_sourcestamps.insert().values(
+                    buildsetid=1, sourcestampid=1
+                )
+            )
+            for brid, (started_at, complete_at, results) in enumerate(
+                [
+                    (1000, 1600, SUCCESS),
+                    (2000, 2900, SUCCESS),
+                    (3000, 3100, FAILURE),
+                    (4000, None, None),
+                    (10, 20, SUCCESS),
+                ],
+                start=1,
+            ):
+                conn.execute(
+                    Model.buildrequests.insert().values(
+                        id=brid,
+                        buildsetid=1,
+                        builderid=1,
+                        priority=0,
+                        submitted_at=0,
+                    )
+                )
+                conn.execute(
+                    Model.builds.insert().values(
+                        id=brid,
+                        number=brid,
+                        builderid=1,
+                        buildrequestid=brid,
+                        workerid=1,
+                        masterid=1,
+                        started_at=started_at,
+                        complete_at=complete_at,
+                        results=results,
+                        state_string="",
+                        **BUILD_EXTRA_COLUMNS,
+                    )
+                )
+        with engine.connect() as conn:
+            self.assertEqual(
+                build_durations(conn, Model, since=500),
+                {("amd64-debian-12", "main"): [600, 900]},
+            )
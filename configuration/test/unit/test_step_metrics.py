@@ -0,0 +1,179 @@
+import unittest
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from twisted.internet import defer, task
+
+from configuration.reporters.step_metrics import (
+    CCACHE_COUNTERS,
+    STEP_METRICS_NAME,
+    StepMetrics,
+)
+from configuration.steps.commands.base import ContainerUsageObserver
+
+GIB = 1024**3
+STARTED = datetime(2024, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+
+class FakeHistogram:
+    def __init__(self):
+        self.observed = defaultdict(list)
+
+    def labels(self, **labels):
+        key = tuple(sorted(labels.items()))
+        return SimpleNamespace(
+            observe=self.observed[key].append,
+            inc=self.observed[key].append,
+            set=self.observed[key].append,
+        )
+
+
+class FakeStepMetrics(StepMetrics):
+    """StepMetrics without prometheus_client."""
+
+    def checkConfig(self, *args, **kwargs):
+        pass
+
+    def _create_metrics(self):
+        self.registry = object()
+        self.step_duration = FakeHistogram()
+        self.container_cpu = FakeHistogram()
+        self.container_memory = FakeHistogram()
+        self.ccache_counters = {prop: FakeHistogram() for prop in CCACHE_COUNTERS}
+        self.ccache_size = FakeHistogram()
+
+
+class FakeData:
+    def __init__(self):
+        self.resources = {}
+        self.waiting = None
+
+    def get(self, path):
+        if self.waiting is not None:
+            return self.waiting
+        return defer.succeed(self.resources[path])
+
+
+class TestStepMetrics(unittest.TestCase):
+    def setUp(self):
+        self.master = SimpleNamespace(reactor=task.Clock(), data=FakeData())
+        data = self.master.data.resources
+        data[("builds", 7)] = {"builderid": 2, "workerid": 3}
+        data[("builders", 2)] = {"name": "amd64-compile-only"}
+        data[("workers", 3)] = {"name": "amd64-bbw1-docker-debian-12"}
+        data[("builds", 8)] = {"builderid": 2, "workerid": 4}
+        data[("workers", 4)] = {"name": "aix"}
+        self.metrics = FakeStepMetrics()
+        self.metrics.parent = SimpleNamespace(master=self.master)
+        self.metrics.reconfigService()
+
+    def step(self, stepid: int, buildid: int, seconds: int = None) -> dict:
+        step = {
+            "stepid": stepid,
+            "buildid": buildid,
+            "name": "Create Docker Workdirs",
+            "started_at": STARTED,
+        }
+        if seconds is not None:
+            step["complete_at"] = STARTED + timedelta(seconds=seconds)
+        return step
+
+    def labels(self, worker: str) -> tuple:
+        return tuple(
+            sorted(
+                {
+                    "builder": "amd64-compile-only",
+                    "step": "Create Docker Workdirs",
+                    "worker": worker,
+                }.items()
+            )
+        )
+
+    def test_step_duration(self):
+        """Test that finished steps are recorded by builder, step and worker."""
+        self.metrics._on_step_started(("steps", 1, "started"), self.step(1, 8))
+        self.metrics._on_step_finished(("steps", 1, "finished"), self.step(1, 8, 42))
+        self.metrics._on_step_started(("steps", 2, "started"), self.step(2, 7))
+        self.metrics._on_step_finished(("steps", 2, "finished"), self.step(2, 7, 30))
+        self.assertEqual(
+            dict(self.metrics.step_duration.observed),
+            {
+                self.labels("aix"): [42.0],
+                self.labels("amd64-bbw1-docker-debian-12"): [30.0],
+            },
+        )
+        self.assertEqual(self.metrics._steps, {})
+
+    def test_finished_while_described(self):
+        """Test that a step finishing before its labels are known is still recorded."""
+        self.master.data.waiting = defer.Deferred()
+        self.metrics._on_step_started(("steps", 1, "started"), self.step(1, 8))
+        self.metrics._on_step_finished(("steps", 1, "finished"), self.step(1, 8, 3))
+        self.assertEqual(dict(self.metrics.step_duration.observed), {})
+        waiting, self.master.data.waiting = self.master.data.waiting, None
+        waiting.callback({"builderid": 2, "workerid": 4})
+        self.assertEqual(
+            dict(self.metrics.step_duration.observed), {self.labels("aix"): [3.0]}
+        )
+        self.assertEqual(self.metrics._steps, {})
+
+    def test_container_usage(self):
+        """Test that the container usage printed by a step is recorded."""
+        step = SimpleNamespace(
+            master=SimpleNamespace(namedServices={STEP_METRICS_NAME: self.metrics}),
+            build=SimpleNamespace(
+                builder=SimpleNamespace(name="amd64-compile-only"),
+                getWorkerName=lambda: "aix",
+            ),
+        )
+        observer = ContainerUsageObserver()
+        observer.outLineReceived(
+            "[ 10%] Building CXX object sql/CMakeFiles/sql.dir/sql_parse.cc.o"
+        )
+        observer.report(step, "Create Docker Workdirs")
+        self.assertIsNone(observer.usage)
+
+        # Without a readable memory peak, the CPU time is still recorded
+        observer.outLineReceived(
+            "buildbot-container-usage cpu_seconds=12.5 memory_peak_bytes="
+        )
+        observer.report(step, "Create Docker Workdirs")
+        observer.outLineReceived(
+            f"buildbot-container-usage cpu_seconds=3 memory_peak_bytes={2 * GIB}"
+        )
+        observer.report(step, "Create Docker Workdirs")
+        self.assertEqual(
+            dict(self.metrics.container_cpu.observed),
+            {self.labels("aix"): [12.5, 3.0]},
+        )
+        self.assertEqual(
+            dict(self.metrics.container_memory.observed),
+            {self.labels("aix"): [2 * GIB]},
+        )
+
+    def test_ccache_stats(self):
+        """Test that the ccache statistics of the builds are counted by host."""
+        data = self.master.data.resources
+        data[("builds", 7, "properties")] = {
+            "ccache_hits": (90, "Collect ccache statistics"),
+            "ccache_misses": (10, "Collect ccache statistics"),
+            "ccache_cleanups": (1, "Collect ccache statistics"),
+            "ccache_size": (5 * GIB, "Collect ccache statistics"),
+        }
+        data[("builds", 8, "properties")] = {"buildername": ("aix", "Builder")}
+        for buildid in (7, 7, 8):
+            self.metrics._on_build_finished(
+                ("builds", buildid, "finished"),
+                {"buildid": buildid, "builderid": 2, "workerid": 3},
+            )
+        labels = (("builder", "amd64-compile-only"), ("host", "amd64-bbw1"))
+        counters = self.metrics.ccache_counters
+        self.assertEqual(counters["ccache_hits"].observed[labels], [90, 90])
+        self.assertEqual(counters["ccache_misses"].observed[labels], [10, 10])
+        self.assertEqual(counters["ccache_cleanups"].observed[labels], [1, 1])
+        self.assertEqual(dict(counters["ccache_remote_hits"].observed), {})
+        self.assertEqual(
+            self.metrics.ccache_size.observed[(("host", "amd64-bbw1"),)],
+            [5 * GIB, 5 * GIB],
+        )
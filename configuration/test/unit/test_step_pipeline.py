@@ -0,0 +1,268 @@
+import json
+import os
+import unittest
+from pathlib import Path, PurePath
+
+from configuration.builders.infra.runtime import (
+    DockerConfig,
+    InContainer,
+    ParallelGroup,
+    Sidecar,
+)
+from configuration.steps.base import StepOptions
+from configuration.steps.commands.compile import MAKE, CompileMakeCommand
+from configuration.steps.commands.configure import ConfigureMariaDBCMake
+from configuration.steps.commands.mtr import MTRTest
+from configuration.steps.commands.packages import CreateDebRepo, InstallDEB
+from configuration.steps.commands.util import FindFiles, PrintEnvironmentDetails
+from configuration.steps.generators.cmake.generator import CMakeGenerator
+from configuration.steps.generators.mtr.generator import MTRGenerator
+from configuration.steps.generators.mtr.options import MTR, MTROption
+from configuration.steps.processors import process_steps
+from configuration.steps.remote import PropFromShellStep, ShellStep
+
+# After an intended change of the generated steps, record them again with:
+# UPDATE_GOLDEN=1 python -m unittest configuration.test.unit.test_step_pipeline
+GOLDEN_PATH = Path(__file__).parent / "golden" / "step_pipeline.json"
+
+
+def docker_config(image: str) -> DockerConfig:
+    return DockerConfig(
+        repository="quay.io/mariadb-foundation/bb-worker:",
+        image_tag=image,
+        workdir=PurePath("/home/buildbot"),
+        bind_mounts=[("/srv/buildbot/packages/", "/packages")],
+        env_vars=[("CCACHE_DIR", "/mnt/ccache")],
+    )
+
+
+def compile_steps(config: DockerConfig, jobs: int = 7) -> list:
+    return [
+        InContainer(
+            ShellStep(
+                command=ConfigureMariaDBCMake(
+                    name="Minimal",
+                    cmake_generator=CMakeGenerator(flags=[], use_ccache=True),
+                )
+            ),
+            docker_environment=config,
+        ),
+        InContainer(
+            ShellStep(
+                command=CompileMakeCommand(option=MAKE.COMPILE, jobs=jobs),
+                env_vars=[("CCACHE_MAXSIZE", "20G")],
+            ),
+            docker_environment=config,
+        ),
+    ]
+
+
+def mtr_step(config: DockerConfig, name: str, jobs: int = 7) -> InContainer:
+    return InContainer(
+        ShellStep(
+            command=MTRTest(
+                name=name,
+                workdir=PurePath("/usr/share/mariadb/mariadb-test"),
+                testcase=MTRGenerator(
+                    flags=[
+                        MTROption(MTR.PARALLEL, jobs * 2),
+                        MTROption(MTR.VARDIR, f"/dev/shm/{name}"),
+                    ]
+                ),
+            ),
+            options=StepOptions(haltOnFailure=False, descriptionDone=f"MTR {name}"),
+        ),
+        docker_environment=config,
+    )
+
+
+def deb_autobake_steps(config: DockerConfig) -> list:
+    return [
+        ShellStep(command=PrintEnvironmentDetails()),
+        *compile_steps(config),
+        InContainer(
+            PropFromShellStep(
+                command=FindFiles(include="*", workdir=PurePath("build")),
+                property="packages",
+            ),
+            docker_environment=config,
+        ),
+        InContainer(
+            ShellStep(
+                command=CreateDebRepo(url="http://ci", workdir=PurePath("build"))
+            ),
+            docker_environment=config,
+            container_commit=True,
+        ),
+        InContainer(
+            ShellStep(
+                command=InstallDEB(
+                    workdir=PurePath("build/debs"), packages_file="Packages"
+                )
+            ),
+            docker_environment=config,
+            container_commit=True,
+        ),
+        *(mtr_step(config, name) for name in ("normal", "galera", "rocksdb", "s3")),
+    ]
+
+
+def parallel_mtr_steps(config: DockerConfig) -> list:
+    group = ParallelGroup(name="MTR suites", options=StepOptions(haltOnFailure=False))
+    group.add_branch("normal", [mtr_step(config, "normal")])
+    group.add_branch("galera", [mtr_step(config, "galera")])
+    group.add_branch("s3", [mtr_step(config, "s3")], depends_on=["normal"])
+    return [group]
+
+
+def scenarios() -> dict:
+    """
+    Builders covering the post-processing paths, built fresh on every call since
+    process_steps and generate() mutate the steps.
+    Returns:
+        dict: name -> (builder_name, environment, active steps, sidecar, persistent)
+    """
+    debian, ubuntu = docker_config("debian12"), docker_config("ubuntu2404")
+    # The sidecar processing adds to the env of the DockerConfig
+    codbc = docker_config("debian12")
+    return {
+        "compile_only": (
+            "amd64-compile-only-minimal",
+            "PROD",
+            [ShellStep(command=PrintEnvironmentDetails()), *compile_steps(debian)],
+            None,
+            False,
+        ),
+        "deb_autobake": (
+            "amd64-debian-12-deb-autobake",
+            "PROD",
+            deb_autobake_steps(debian),
+            None,
+            False,
+        ),
+        "environment_changes": (
+            "amd64-ubuntu-2404-upgrade",
+            "PROD",
+            compile_steps(debian)
+            + [mtr_step(ubuntu, "upgrade")]
+            + compile_steps(debian)
+            + [ShellStep(command=PrintEnvironmentDetails()), mtr_step(ubuntu, "end")],
+            None,
+            False,
+        ),
+        "dev_environment": (
+            "amd64-debian-12",
+            "DEV",
+            compile_steps(debian),
+            None,
+            False,
+        ),
+        "sidecar": (
+            "amd64-debian-12-sidecar",
+            "PROD",
+            compile_steps(debian) + [mtr_step(debian, "s3")],
+            Sidecar(
+                repository="quay.io/minio/",
+                image_tag="minio",
+                env_vars=[("MINIO_ROOT_USER", "minio")],
+            ),
+            False,
+        ),
+        "pooled_sidecar": (
+            "amd64-debian-12-codbc",
+            "PROD",
+            compile_steps(codbc) + [mtr_step(codbc, "odbc")],
+            Sidecar(
+                repository="docker.io/library/",
+                image_tag="mariadb:lts",
+                env_vars=[("MARIADB_DATABASE", "test")],
+                tmpfs=PurePath("/var/lib/mysql"),
+                pool_size=4,
+            ),
+            False,
+        ),
+        "persistent": (
+            "amd64-debian-12-deb-autobake",
+            "PROD",
+            deb_autobake_steps(debian) + [mtr_step(ubuntu, "upgrade")],
+            None,
+            True,
+        ),
+        "parallel": (
+            "amd64-debian-12-deb-autobake",
+            "PROD",
+            compile_steps(debian) + parallel_mtr_steps(debian),
+            None,
+            False,
+        ),
+        "parallel_persistent": (
+            "amd64-debian-12-deb-autobake",
+            "PROD",
+            compile_steps(debian) + parallel_mtr_steps(debian),
+            None,
+            True,
+        ),
+        "no_containers": (
+            "aix",
+            "PROD",
+            [ShellStep(command=PrintEnvironmentDetails())],
+            None,
+            False,
+        ),
+    }
+
+
+def serialize(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [serialize(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): serialize(item) for key, item in value.items()}
+    if callable(value):
+        return "<callable>"
+    return repr(value)
+
+
+def factory_steps(processed: tuple[list, list, list]) -> list:
+    """Generates the Buildbot steps of a builder, as a JSON friendly list."""
+    prepare_steps, active_steps, cleanup_steps = processed
+    generated = []
+    for step in prepare_steps + active_steps + cleanup_steps:
+        buildstep = step.generate()
+        generated.append(
+            {
+                "class": type(buildstep).__name__,
+                "kwargs": serialize(buildstep._factory.kwargs),
+            }
+        )
+    return generated
+
+
+def generate_all(process) -> dict:
+    return {
+        name: factory_steps(
+            process(builder_name, environment, steps, sidecar, persistent)
+        )
+        for name, (builder_name, environment, steps, sidecar, persistent) in (
+            scenarios().items()
+        )
+    }
+
+
+class TestStepPipeline(unittest.TestCase):
+    maxDiff = None
+
+    def test_golden(self):
+        """Test that the single pass pipeline generates the recorded factories."""
+        generated = generate_all(process_steps)
+        if os.environ.get("UPDATE_GOLDEN"):
+            with open(GOLDEN_PATH, "w", encoding="utf-8") as f:
+                json.dump(generated, f, indent=1, sort_keys=True)
+                f.write("\n")
+        with open(GOLDEN_PATH, encoding="utf-8") as f:
+            golden = json.load(f)
+        self.assertEqual(sorted(generated), sorted(golden))
+        for name in golden:
+            with self.subTest(scenario=name):
+                self.assertEqual(generated[name], golden[name])
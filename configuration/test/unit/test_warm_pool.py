@@ -0,0 +1,263 @@
+import unittest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from twisted.internet import defer, task
+from twisted.trial import unittest as trial
+
+from buildbot.process.workerforbuilder import WorkerForBuilder
+from buildbot.test.fake import fakemaster, fakeprotocol
+from buildbot.test.reactor import TestReactorMixin
+from buildbot.worker.latent import States
+from configuration.workers.base import worker_host
+from configuration.workers.warm_pool import (
+    WarmDockerLatentWorker,
+    WarmPool,
+    prefer_warm_workers,
+)
+
+DEBIAN = "aarch64-bbw-docker-debian-12"
+UBUNTU = "aarch64-bbw-docker-ubuntu-2404"
+
+
+class FakeWorker(WarmDockerLatentWorker):
+    """A pool worker whose container starts and stops at once."""
+
+    master = None
+
+    def __init__(self, name: str, master):
+        self.name = name
+        self.master = master
+        self.state = States.NOT_SUBSTANTIATED
+        self.conn = None
+        self.workerforbuilders = {}
+        self.busy = False
+        self.starts = 0
+        self.stops = 0
+
+    @property
+    def building(self):
+        return {self} if self.busy else set()
+
+    def substantiate(self, wfb, build):
+        pool = self.warm_pool
+        if build is not None and pool is not None:
+            pool.build_requested(self)
+        self.starts += self.state == States.NOT_SUBSTANTIATED
+        self.state, self.conn = States.SUBSTANTIATED, object()
+        return defer.succeed(True)
+
+    def stop_container(self):
+        self.stops += 1
+        self.state, self.conn = States.NOT_SUBSTANTIATED, None
+        return defer.succeed(None)
+
+    def run_build(self):
+        self.substantiate(None, build=object())
+        self.busy = True
+        self.idle_since = None
+
+    def finish_build(self):
+        self.busy = False
+        self.idle_since = self.master.reactor.seconds()
+        self.warm_pool.maintain()
+
+
+class DockerlessWorker(WarmDockerLatentWorker):
+    """A pool worker going through the Buildbot latent worker states, without Docker."""
+
+    stops = 0
+
+    def start_instance(self, build):
+        return defer.succeed(True)
+
+    def stop_instance(self, fast=False):
+        self.stops += 1
+        return defer.succeed(None)
+
+
+class FakeData:
+    def __init__(self):
+        self.resources = {}
+
+    def get(self, path):
+        return defer.succeed(self.resources[path])
+
+
+class TestWarmPool(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.master = SimpleNamespace(
+            reactor=self.clock,
+            namedServices={},
+            workers=SimpleNamespace(workers={}),
+            data=FakeData(),
+        )
+        names = {
+            DEBIAN: [f"aarch64-bbw{i}-docker-debian-12" for i in (1, 2, 3)],
+            UBUNTU: [f"aarch64-bbw{i}-docker-ubuntu-2404" for i in (1, 2, 3)],
+        }
+        for name in names[DEBIAN] + names[UBUNTU]:
+            self.master.workers.workers[name] = FakeWorker(name, self.master)
+        self.pool = self.create_pool({DEBIAN: 2, UBUNTU: 0}, names, {"aarch64-bbw1": 2})
+
+    def create_pool(self, sizes, names, host_capacity) -> WarmPool:
+        pool = WarmPool(sizes=sizes, workers=names, host_capacity=host_capacity)
+        pool.parent = SimpleNamespace(master=self.master)
+        pool.reconfigService(sizes=sizes, workers=names, host_capacity=host_capacity)
+        self.master.namedServices[WarmPool.name] = pool
+        return pool
+
+    def worker(self, host: int, os_name: str = "debian-12") -> FakeWorker:
+        return self.master.workers.workers[f"aarch64-bbw{host}-docker-{os_name}"]
+
+    def running(self) -> set[str]:
+        return {
+            name
+            for name, w in self.master.workers.workers.items()
+            if w.state == States.SUBSTANTIATED
+        }
+
+    def test_worker_host(self):
+        self.assertEqual(worker_host("aarch64-bbw5-docker-debian-12"), "aarch64-bbw5")
+        self.assertEqual(worker_host("hz-bbw2-docker-ubuntu-2404-i386"), "hz-bbw2")
+
+    def test_fill(self):
+        """Test that the pool starts the wanted number of idle containers."""
+        self.pool.maintain()
+        warm = self.running()
+        self.assertEqual(len(warm), 2)
+        self.assertTrue(all("debian" in name for name in warm))
+        self.pool.maintain()
+        self.assertEqual(self.running(), warm)
+
+    def test_recycle_after_build(self):
+        """Test that a warm container runs the build and stays for the next one."""
+        self.pool.maintain()
+        warm = next(self.master.workers.workers[name] for name in self.running())
+        warm.run_build()
+        self.assertEqual(self.pool.warm_starts[DEBIAN], 1)
+        # The pool tops up the idle containers while the build runs
+        self.pool.maintain()
+        self.assertEqual(len(self.running()), 3)
+        self.clock.advance(10)
+        warm.finish_build()
+        # Three idle for a size of two: the longest idle is stopped
+        self.assertEqual(len(self.running()), 2)
+        self.assertIn(warm.name, self.running())
+        self.assertEqual(warm.starts, 1)
+
+    def test_size_zero(self):
+        """Test that workers of types without warm containers stop after builds."""
+        ubuntu = self.worker(2, "ubuntu-2404")
+        ubuntu.run_build()
+        self.assertEqual(self.pool.cold_starts[UBUNTU], 1)
+        ubuntu.finish_build()
+        self.assertEqual(ubuntu.state, States.NOT_SUBSTANTIATED)
+        self.assertEqual(ubuntu.stops, 1)
+
+    def test_eviction(self):
+        """Test that idle containers make room for a build on a full host."""
+        debian = self.worker(1)
+        debian.substantiate(None, None)
+        debian.idle_since = self.clock.seconds()
+        self.worker(2).substantiate(None, None)
+        # aarch64-bbw1 has room for two containers
+        self.worker(1, "ubuntu-2404").run_build()
+        self.assertEqual(self.pool.evictions, {})
+        self.worker(1, "ubuntu-2404").finish_build()
+        self.worker(1, "ubuntu-2404").run_build()
+        self.assertEqual(debian.state, States.SUBSTANTIATED)
+
+        other = FakeWorker("aarch64-bbw1-docker-debian-11", self.master)
+        self.master.workers.workers[other.name] = other
+        self.pool.worker_types[other.name] = "aarch64-bbw-docker-debian-11"
+        other.run_build()
+        self.assertEqual(self.pool.evictions, {DEBIAN: 1})
+        self.assertEqual(debian.state, States.NOT_SUBSTANTIATED)
+        # The pool refills on the hosts with room
+        self.pool.maintain()
+        self.assertNotIn(debian.name, self.running())
+        self.assertEqual(
+            {name for name in self.running() if "debian-12" in name},
+            {self.worker(2).name, self.worker(3).name},
+        )
+
+    def test_request_to_first_step(self):
+        """Test that the delay from request to first step is recorded by type."""
+        data = self.master.data.resources
+        data[("builds", 7)] = {"buildrequestid": 11, "workerid": 3}
+        data[("buildrequests", 11)] = {
+            "submitted_at": datetime(2024, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+        }
+        data[("workers", 3)] = {"name": "aarch64-bbw2-docker-debian-12"}
+        started = datetime(2024, 1, 1, 12, 0, 42, tzinfo=timezone.utc)
+        self.pool._on_step_started(
+            ("steps", 70, "started"), {"number": 1, "buildid": 7, "started_at": started}
+        )
+        self.assertEqual(dict(self.pool.delays), {})
+        self.pool._on_step_started(
+            ("steps", 69, "started"), {"number": 0, "buildid": 7, "started_at": started}
+        )
+        self.assertEqual(list(self.pool.delays[DEBIAN]), [42.0])
+
+    def test_prefer_warm_workers(self):
+        """Test that builders pick an idle started container first."""
+        self.worker(2).substantiate(None, None)
+        workers = [SimpleNamespace(worker=self.worker(i)) for i in (1, 2, 3)]
+        for _ in range(10):
+            self.assertIs(
+                prefer_warm_workers(None, workers, None).worker, self.worker(2)
+            )
+        self.worker(2).busy = True
+        self.worker(3).state = States.SUBSTANTIATING
+        self.assertIs(prefer_warm_workers(None, workers, None).worker, self.worker(3))
+        self.assertIsNone(prefer_warm_workers(None, [], None))
+
+
+class TestWarmDockerLatentWorker(TestReactorMixin, trial.TestCase):
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.setup_test_reactor()
+        self.master = yield fakemaster.make_master(self, wantData=True)
+        self.worker = DockerlessWorker(
+            "aarch64-bbw1-docker-debian-12",
+            "pass",
+            docker_host="tcp://aarch64-bbw1:2375",
+            image="debian:12",
+        )
+        yield self.worker.setServiceParent(self.master.workers)
+        # What the worker manager does on reconfig
+        self.master.workers.workers[self.worker.name] = self.worker
+        yield self.master.startService()
+        self.addCleanup(self.master.stopService)
+
+    @defer.inlineCallbacks
+    def substantiate(self):
+        d = self.worker.substantiate(None, None)
+        yield self.worker.attached(fakeprotocol.FakeConnection(self.worker))
+        yield d
+        self.assertEqual(self.worker.state, States.SUBSTANTIATED)
+
+    @defer.inlineCallbacks
+    def test_stopped_after_build_without_pool(self):
+        """Test that the container stops after a build when there is no pool."""
+        yield self.substantiate()
+        builder = SimpleNamespace(name="aarch64-debian-12", config=None)
+        wfb = WorkerForBuilder(builder)
+        yield wfb.attached(self.worker, {})
+        wfb.buildStarted()
+        wfb.buildFinished()
+        self.reactor.advance(0)
+        self.assertEqual(self.worker.state, States.NOT_SUBSTANTIATED)
+        self.assertEqual(self.worker.stops, 1)
+
+    @defer.inlineCallbacks
+    def test_pool_stops_container(self):
+        """Test that a container stopped by the pool is insubstantiated."""
+        pool = WarmPool(sizes={DEBIAN: 0}, workers={DEBIAN: [self.worker.name]})
+        yield pool.setServiceParent(self.master)
+        yield self.substantiate()
+        pool.maintain()
+        self.assertEqual(self.worker.state, States.NOT_SUBSTANTIATED)
+        self.assertEqual(self.worker.stops, 1)
@@ -0,0 +1,165 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from twisted.internet import defer
+from twisted.python import log
+from twisted.trial import unittest as trial
+
+from buildbot.locks import RealMasterLock
+from buildbot.test.fake import fakemaster
+from buildbot.test.reactor import TestReactorMixin
+from buildbot.util import service
+from configuration.workers.locks import PrefixTrie, WorkerLocks, WorkerLocksWatcher
+
+WORKER_LOCKS_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "..", "worker_locks.yaml"
+)
+
+
+def first_startswith(locks: dict, worker_name: str):
+    for worker_base_name in locks:
+        if worker_name.startswith(worker_base_name):
+            return locks[worker_base_name]
+    return None
+
+
+class TestPrefixTrie(unittest.TestCase):
+    def test_first_inserted_prefix_wins(self):
+        """Test that overlapping prefixes resolve like an ordered startswith scan."""
+        trie = PrefixTrie()
+        trie.insert("hz-bbw1-docker-dev", "dev")
+        trie.insert("hz-bbw1", "short")
+        trie.insert("hz-bbw1-docker", "long")
+        self.assertEqual(trie.lookup("hz-bbw1-docker-dev-ubuntu"), "dev")
+        self.assertEqual(trie.lookup("hz-bbw1-docker-ubuntu"), "short")
+        self.assertEqual(trie.lookup("hz-bbw1"), "short")
+        self.assertIsNone(trie.lookup("hz-bbw"))
+        self.assertIsNone(trie.lookup(""))
+        self.assertEqual(len(trie), 3)
+
+
+class TestWorkerLocks(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "worker_locks.yaml")
+        shutil.copy(WORKER_LOCKS_PATH, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, content: str):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(content)
+        # Make sure the mtime changes even on coarse-grained filesystems
+        stat = os.stat(self.path)
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + 1))
+
+    def test_lookup_matches_scan(self):
+        """Test that the trie finds the same lock as the startswith scan."""
+        worker_locks = WorkerLocks(self.path)
+        rng = random.Random(11)
+        names = list(worker_locks.locks) + ["hz-bbw", "unknown-docker", ""]
+        for base_name in worker_locks.locks:
+            names.append(f"{base_name}-ubuntu-2404")
+            names.append(base_name[: rng.randint(0, len(base_name))])
+        for name in names:
+            self.assertIs(
+                worker_locks.lookup(name), first_startswith(worker_locks.locks, name)
+            )
+
+    def test_reload_keeps_lock_ids(self):
+        """Test that a reload updates maxCount in place and reports the changes."""
+        self.write("hz-bbw5-docker: 9\nhz-bbw1-docker: 6\n")
+        worker_locks = WorkerLocks(self.path)
+        bbw5 = worker_locks.lookup("hz-bbw5-docker-debian-12")
+
+        self.write("hz-bbw5-docker: 3\nhz-bbw1-docker: 6\nhz-bbw8-docker: 2\n")
+        self.assertEqual(worker_locks.load(), {"hz-bbw5-docker_lock": 3})
+        self.assertIs(worker_locks.lookup("hz-bbw5-docker-debian-12"), bbw5)
+        self.assertEqual(bbw5.maxCount, 3)
+        self.assertEqual(worker_locks.lookup("hz-bbw8-docker-x").maxCount, 2)
+
+        self.write("hz-bbw1-docker: 6\n")
+        worker_locks.load()
+        self.assertIsNone(worker_locks.lookup("hz-bbw5-docker-debian-12"))
+
+    def test_check_updates_real_lock(self):
+        """Test that a check applies a new limit to the running lock."""
+        self.write("hz-bbw5-docker: 9\n")
+        worker_locks = WorkerLocks(self.path)
+        master = SimpleNamespace(botmaster=service.AsyncMultiService())
+        real_lock = self.result_of(
+            RealMasterLock.getService(master.botmaster, "hz-bbw5-docker_lock")
+        )
+        real_lock.updateFromLockId(worker_locks.lookup("hz-bbw5-docker-a"), 1)
+        self.assertEqual(real_lock.maxCount, 9)
+
+        self.write("hz-bbw5-docker: 2\n")
+        self.result_of(worker_locks.check(master))
+        self.assertEqual(real_lock.maxCount, 2)
+
+        # A broken file keeps the current limits
+        errors = []
+        log.addObserver(errors.append)
+        try:
+            self.write("hz-bbw5-docker: [\n")
+            self.result_of(worker_locks.check(master))
+        finally:
+            log.removeObserver(errors.append)
+        self.assertEqual(real_lock.maxCount, 2)
+        self.assertTrue(any(e.get("isError") for e in errors))
+
+    def result_of(self, d):
+        results = []
+        d.addBoth(results.append)
+        self.assertEqual(len(results), 1)
+        return results[0]
+
+
+class TestWorkerLocksWatcher(TestReactorMixin, trial.TestCase):
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.setup_test_reactor()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, "worker_locks.yaml")
+        self.write(9)
+        self.worker_locks = WorkerLocks(self.path)
+        self.master = yield fakemaster.make_master(self, wantData=True)
+        self.real_lock = yield RealMasterLock.getService(
+            self.master.botmaster, "hz-bbw5-docker_lock"
+        )
+        self.real_lock.updateFromLockId(self.worker_locks.lookup("hz-bbw5-docker-a"), 1)
+        self.watcher = WorkerLocksWatcher(self.worker_locks, interval=10)
+        yield self.watcher.setServiceParent(self.master)
+        yield self.master.startService()
+        self.addCleanup(self.master.stopService)
+
+    def write(self, max_count: int):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(f"hz-bbw5-docker: {max_count}\n")
+        stat = os.stat(self.path)
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + max_count))
+
+    def test_polls_while_running(self):
+        """Test that the watcher applies new limits until the service stops."""
+        self.write(2)
+        self.reactor.advance(10)
+        self.assertEqual(self.real_lock.maxCount, 2)
+
+        self.write(3)
+        self.reactor.advance(10)
+        self.assertEqual(self.real_lock.maxCount, 3)
+
+    @defer.inlineCallbacks
+    def test_stopped_with_the_master(self):
+        """Test that a stopped watcher no longer polls the file."""
+        yield self.watcher.disownServiceParent()
+        self.write(2)
+        self.reactor.advance(10)
+        self.assertEqual(self.real_lock.maxCount, 9)
+        self.assertEqual(self.reactor.getDelayedCalls(), [])
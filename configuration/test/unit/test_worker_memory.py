@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from configuration.reporters import github_summary
+from configuration.workers.ledger import JobLedger, free_worker_memory
+from configuration.workers.memory import memory_claim, parse_memory
+
+
+def fake_workerforbuilder(name: str, memory: int, busy: bool):
+    wfb = SimpleNamespace(
+        builder_name=name,
+        builder=SimpleNamespace(
+            config=SimpleNamespace(properties={"jobs": 1, "memory": memory})
+        ),
+    )
+    wfb.isBusy = lambda: busy
+    return wfb
+
+
+class TestParseMemory(unittest.TestCase):
+    def test_units(self):
+        """Test the docker --shm-size formats."""
+        self.assertEqual(parse_memory("15g"), 15 * 1024)
+        self.assertEqual(parse_memory("1G"), 1024)
+        self.assertEqual(parse_memory("512m"), 512)
+        self.assertEqual(parse_memory("1.5GB"), 1536)
+        self.assertEqual(parse_memory("1"), 1)  # bytes, rounded up
+        self.assertEqual(parse_memory(2048), 2048)
+        with self.assertRaises(ValueError):
+            parse_memory("lots")
+
+    def test_memory_claim(self):
+        """Test that the largest shm_size counts once, plus the baseline."""
+        self.assertEqual(memory_claim(["15g", "1G", None], "4g"), 19 * 1024)
+        self.assertEqual(memory_claim([], "4g"), 4 * 1024)
+
+
+class TestMemoryAdmission(unittest.TestCase):
+    def test_ledger(self):
+        """Test that memory claims are summed and released with the jobs."""
+        ledger = JobLedger()
+        ledger.claim("amd64-debian-12", 7, 19456)
+        ledger.claim("amd64-msan-clang-20", 12, 8192)
+        self.assertEqual(ledger.reserved_memory, 27648)
+        ledger.claim("amd64-msan-clang-20", 12, 4096)
+        self.assertEqual(ledger.free_memory(32768), 32768 - 23552)
+        ledger.release("amd64-debian-12")
+        self.assertEqual(ledger.reserved_memory, 4096)
+        self.assertEqual(
+            ledger.summary(total_jobs=20, total_memory=8192)["memory"],
+            {
+                "total": 8192,
+                "reserved": 4096,
+                "free": 4096,
+                "claims": {"amd64-msan-clang-20": 4096},
+            },
+        )
+
+    def test_free_worker_memory(self):
+        """Test the ledger and scan paths, and workers without total_memory."""
+        ledger = JobLedger()
+        ledger.claim("a", 1, 20000)
+        ledger_worker = SimpleNamespace(
+            job_ledger=ledger, properties={"total_jobs": 8, "total_memory": 65536}
+        )
+        self.assertEqual(free_worker_memory(ledger_worker), 45536)
+
+        scan_worker = SimpleNamespace(
+            properties={"total_jobs": 8, "total_memory": 65536},
+            workerforbuilders={
+                "a": fake_workerforbuilder("a", 20000, busy=True),
+                "b": fake_workerforbuilder("b", 30000, busy=False),
+            },
+        )
+        self.assertEqual(free_worker_memory(scan_worker), 45536)
+
+        self.assertIsNone(free_worker_memory(SimpleNamespace(properties={})))
+
+
+class TestWorkersLoad(unittest.TestCase):
+    def test_memory_oversubscription(self):
+        """Test that the summary flags memory oversubscription next to CPU."""
+        worker = SimpleNamespace(
+            name="hz-bbw8",
+            total_jobs=110,
+            requested_jobs=20,
+            total_memory=32768,
+            requested_memory=38912,
+            builders={"amd64-debian-12": 10, "amd64-fedora-42": 10},
+            builders_memory={"amd64-debian-12": 19456, "amd64-fedora-42": 19456},
+        )
+        pool = SimpleNamespace(workers={"amd64": [worker]})
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.chdir(tmpdir)
+            try:
+                github_summary.workers_load(pool)
+                with open(github_summary.SUMMARY_FILE_NAME) as f:
+                    summary = f.read()
+            finally:
+                os.chdir(cwd)
+        self.assertIn("| hz-bbw8 | 110 | 20 | 32G | ⚠️ 38G |", summary)
+        self.assertIn("| hz-bbw8 | amd64-debian-12 | 10 | 19G |", summary)
@@ -0,0 +1,226 @@
+import json
+import threading
+import time
+import unittest
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from twisted.internet import defer
+from twisted.trial import unittest as trial
+
+from buildbot.test.fake import fakemaster
+from buildbot.test.reactor import TestReactorMixin
+from zabbix_client import (
+    ACCEPT_NEW_BUILD_METRIC,
+    ZabbixClient,
+    ZabbixMetricCache,
+    ZabbixNoHostFound,
+    ZabbixNoItemFound,
+    ZabbixTooOldData,
+    ZabbixToManyItems,
+    last_value,
+    metric_cache,
+)
+
+TOKEN = "secret-token"
+
+
+class FakeZabbix(ThreadingHTTPServer):
+    """Minimal Zabbix JSON-RPC server: apiinfo.version, host.get and item.get."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeZabbixHandler)
+        self.calls = Counter()
+        self.hosts = {"1": "s390x-rhel-8", "2": "s390x-sles-15"}
+        self.items = [
+            {"hostid": "1", "name": "BB_accept_new_build", "lastvalue": "12"},
+            {"hostid": "2", "name": "BB_accept_new_build", "lastvalue": "75"},
+        ]
+        self.token = TOKEN
+        self.delay = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def handle_call(self, method: str, params: dict, authorization: str):
+        self.calls[method] += 1
+        time.sleep(self.delay)
+        if method == "apiinfo.version":
+            return "7.0.0"
+        if authorization != f"Bearer {self.token}":
+            raise PermissionError("Not authorised.")
+        if method == "host.get":
+            return [{"hostid": i, "host": h} for i, h in self.hosts.items()]
+        if method == "item.get":
+            now = str(int(time.time()))
+            return [
+                {**item, "lastclock": item.get("lastclock", now)}
+                for item in self.items
+                if item["hostid"] in params["hostids"]
+                and item["name"] == params["filter"]["name"]
+            ]
+        raise NotImplementedError(method)
+
+
+class FakeZabbixHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        response = {"jsonrpc": "2.0", "id": request["id"]}
+        try:
+            response["result"] = self.server.handle_call(
+                request["method"],
+                request.get("params", {}),
+                self.headers.get("Authorization"),
+            )
+        except Exception as e:
+            response["error"] = {"code": -32602, "message": str(e), "data": ""}
+        body = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestZabbixClient(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeZabbix()
+        threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+        self.client = ZabbixClient(self.server.url, TOKEN)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_session_and_host_index_reused(self):
+        """Test that login and host.get happen once for many metric reads."""
+        for _ in range(5):
+            self.assertEqual(
+                self.client.get_metric("s390x-rhel-8", "BB_accept_new_build"), "12"
+            )
+        self.assertEqual(self.server.calls["apiinfo.version"], 1)
+        self.assertEqual(self.server.calls["host.get"], 1)
+        self.assertEqual(self.server.calls["item.get"], 5)
+
+    def test_batched_items(self):
+        """Test that several hosts are fetched with a single item.get."""
+        items = self.client.get_items(
+            ["s390x-rhel-8", "s390x-sles-15", "s390x-unknown"], "BB_accept_new_build"
+        )
+        self.assertEqual(self.server.calls["item.get"], 1)
+        self.assertEqual(last_value(items["s390x-rhel-8"]), "12")
+        self.assertEqual(last_value(items["s390x-sles-15"]), "75")
+        self.assertIsInstance(items["s390x-unknown"], ZabbixNoHostFound)
+
+    def test_lookup_errors(self):
+        """Test that missing, duplicated and stale items raise as before."""
+        self.server.hosts["3"] = "s390x-ubuntu-22"
+        self.server.hosts["4"] = "s390x-ubuntu-24"
+        self.server.items.append(dict(self.server.items[0]))
+        self.server.items.append(
+            {"hostid": "4", "name": "BB_accept_new_build", "lastvalue": "1"}
+        )
+        self.server.items[-1]["lastclock"] = str(int(time.time()) - 600)
+
+        with self.assertRaises(ZabbixToManyItems):
+            self.client.get_metric("s390x-rhel-8", "BB_accept_new_build")
+        with self.assertRaises(ZabbixNoItemFound):
+            self.client.get_metric("s390x-ubuntu-22", "BB_accept_new_build")
+        with self.assertRaises(ZabbixTooOldData):
+            self.client.get_metric("s390x-ubuntu-24", "BB_accept_new_build")
+        with self.assertRaises(ZabbixNoHostFound):
+            self.client.get_metric("s390x-unknown", "BB_accept_new_build")
+
+    def test_new_host_refreshes_index(self):
+        """Test that an unknown hostname refreshes the host index once."""
+        self.client.get_metric("s390x-rhel-8", "BB_accept_new_build")
+        self.server.hosts["3"] = "s390x-ubuntu-22"
+        self.server.items.append(
+            {"hostid": "3", "name": "BB_accept_new_build", "lastvalue": "5"}
+        )
+        self.assertEqual(
+            self.client.get_metric("s390x-ubuntu-22", "BB_accept_new_build"), "5"
+        )
+        self.assertEqual(self.server.calls["host.get"], 2)
+
+    def test_relogin_on_api_error(self):
+        """Test that an API error drops the session and retries once."""
+        self.client.get_metric("s390x-rhel-8", "BB_accept_new_build")
+        self.server.token = "rotated-token"
+        self.client.api_token = "rotated-token"
+        self.assertEqual(
+            self.client.get_metric("s390x-rhel-8", "BB_accept_new_build"), "12"
+        )
+        self.assertEqual(self.server.calls["apiinfo.version"], 2)
+
+    def test_close(self):
+        """Test that a closed client logs in again on its next call."""
+        self.client.get_metric("s390x-rhel-8", "BB_accept_new_build")
+        self.client.close()
+        self.client.get_metric("s390x-rhel-8", "BB_accept_new_build")
+        self.assertEqual(self.server.calls["apiinfo.version"], 2)
+
+
+class TestZabbixMetricCache(TestReactorMixin, trial.TestCase):
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.setup_test_reactor()
+        self.server = FakeZabbix()
+        threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = ZabbixClient(self.server.url, TOKEN)
+        self.master = yield fakemaster.make_master(self, wantData=True)
+        self.cache = ZabbixMetricCache(self.client, ACCEPT_NEW_BUILD_METRIC, ttl=60)
+        self.refreshes = 0
+        self.cache._refresh = self.count_refresh
+        yield self.cache.setServiceParent(self.master)
+        yield self.master.startService()
+        self.addCleanup(self.master.stopService)
+
+    def count_refresh(self):
+        self.refreshes += 1
+
+    def test_named_service(self):
+        """Test that the cache of a metric is found on the master."""
+        self.assertIs(metric_cache(self.master, ACCEPT_NEW_BUILD_METRIC), self.cache)
+        self.assertIsNone(metric_cache(self.master, "BB_other"))
+
+    def test_cache(self):
+        """Test that cached values are served from memory until they expire."""
+        self.assertIsNone(self.cache.cached("s390x-rhel-8"))
+
+        self.cache.fetch(["s390x-rhel-8", "s390x-sles-15"])
+        self.assertEqual(self.server.calls["item.get"], 1)
+        for _ in range(100):
+            self.assertEqual(last_value(self.cache.cached("s390x-rhel-8")), "12")
+            self.assertEqual(last_value(self.cache.cached("s390x-sles-15")), "75")
+        self.assertEqual(self.server.calls["item.get"], 1)
+
+        fetched_at, item = self.cache._entries["s390x-rhel-8"]
+        self.cache._entries["s390x-rhel-8"] = (fetched_at - 61, item)
+        self.assertIsNone(self.cache.cached("s390x-rhel-8"))
+
+    def test_polls_while_running(self):
+        """Test that the poller refreshes the cache every interval."""
+        self.reactor.advance(15)
+        self.reactor.advance(15)
+        self.assertEqual(self.refreshes, 2)
+
+    @defer.inlineCallbacks
+    def test_stopped_with_the_master(self):
+        """Test that a stopped cache no longer polls and closes its session."""
+        self.cache.fetch(["s390x-rhel-8"])
+        yield self.cache.disownServiceParent()
+        self.reactor.advance(15)
+        self.assertEqual(self.refreshes, 0)
+        self.assertEqual(self.reactor.getDelayedCalls(), [])
+        self.assertIsNone(self.client._api)
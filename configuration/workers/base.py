@@ -1,6 +1,14 @@
 from typing import Union
 
 
+def worker_host(worker_name: str) -> str:
+    """
+    The host of a worker created by createWorker, e.g.
+    aarch64-bbw5-docker-debian-12 -> aarch64-bbw5.
+    """
+    return worker_name.split("-docker", 1)[0]
+
+
 class WorkerBase:
     ALLOWED_OS_TYPES = ["debian", "redhat", "macos", "windows", "freebsd", "aix"]
     ALLOWED_ARCHS = ["amd64", "aarch64", "ppc64le", "s390x"]
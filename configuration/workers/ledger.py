@@ -0,0 +1,337 @@
+import sys
+from typing import Iterable, Optional
+
+import sqlalchemy as sa
+from twisted.internet import defer
+
+# Tables living next to the Buildbot tables, shared by all masters using the same DB.
+# They are not part of the Buildbot schema and its migrations (buildbot upgrade-master
+# neither creates nor drops them), create them once per database before enabling
+# shared_host workers:
+#   python -m configuration.workers.ledger <db_url of master.cfg>
+# The claims only live as long as the builds, when the columns change drop both tables
+# (masters stopped) and create them again.
+SHARED_LEDGER_METADATA = sa.MetaData()
+
+HOST_JOBS_TABLE = sa.Table(
+    "mdb_host_jobs",
+    SHARED_LEDGER_METADATA,
+    sa.Column("host", sa.String(100), primary_key=True),
+    sa.Column("reserved", sa.Integer, nullable=False, default=0),
+)
+
+HOST_JOB_CLAIMS_TABLE = sa.Table(
+    "mdb_host_job_claims",
+    SHARED_LEDGER_METADATA,
+    sa.Column("host", sa.String(100), primary_key=True),
+    sa.Column("master", sa.String(255), primary_key=True),
+    sa.Column("worker", sa.String(255), primary_key=True),
+    sa.Column("builder", sa.String(255), primary_key=True),
+    sa.Column("jobs", sa.Integer, nullable=False),
+)
+
+
+class JobLedger:
+    """
+    Keeps track of the jobs (CPU's) and memory claimed by the builds running on a worker.
+    The ledger is updated when a build starts or finishes on the worker, so
+    canStartBuild() can read the reserved jobs without scanning every builder
+    assigned to the worker.
+    Attributes:
+        claims (dict[str, int]): A copy of the jobs claimed by each busy builder.
+        reserved (int): The sum of all claimed jobs.
+        reserved_memory (int): The sum of all claimed memory, in MiB.
+    """
+
+    def __init__(self):
+        self._claims: dict[str, int] = {}
+        self._reserved = 0
+        self._memory_claims: dict[str, int] = {}
+        self._reserved_memory = 0
+
+    @property
+    def claims(self) -> dict[str, int]:
+        return dict(self._claims)
+
+    @property
+    def reserved(self) -> int:
+        return self._reserved
+
+    @property
+    def reserved_memory(self) -> int:
+        return self._reserved_memory
+
+    def free(self, total_jobs: int) -> int:
+        return total_jobs - self._reserved
+
+    def free_memory(self, total_memory: int) -> int:
+        return total_memory - self._reserved_memory
+
+    def claim(self, builder_name: str, jobs: int, memory: int = 0):
+        # A builder runs at most one build per worker, a second claim replaces the first
+        self._reserved += jobs - self._claims.get(builder_name, 0)
+        self._claims[builder_name] = jobs
+        self._reserved_memory += memory - self._memory_claims.get(builder_name, 0)
+        self._memory_claims[builder_name] = memory
+
+    def release(self, builder_name: str):
+        self._reserved -= self._claims.pop(builder_name, 0)
+        self._reserved_memory -= self._memory_claims.pop(builder_name, 0)
+
+    def summary(self, total_jobs: int, total_memory: Optional[int] = None) -> dict:
+        """
+        Returns the state of the ledger, meant for debugging.
+        Args:
+            total_jobs (int): The total jobs available on the worker.
+            total_memory (int, optional): The total memory of the worker in MiB.
+        Returns:
+            dict: reserved, free and total jobs, plus the per-builder claims.
+                The same for memory under "memory" when total_memory is given.
+        """
+        summary = {
+            "total": total_jobs,
+            "reserved": self.reserved,
+            "free": self.free(total_jobs),
+            "claims": self.claims,
+        }
+        if total_memory is not None:
+            summary["memory"] = {
+                "total": total_memory,
+                "reserved": self.reserved_memory,
+                "free": self.free_memory(total_memory),
+                "claims": dict(self._memory_claims),
+            }
+        return summary
+
+
+def scan_reserved_jobs(workerforbuilders: Iterable) -> int:
+    """
+    Computes the reserved jobs by summing the job claim of every busy builder.
+    This is the fallback for workers that do not keep a JobLedger.
+    Args:
+        workerforbuilders (Iterable): The worker-for-builder instances of a worker.
+    Returns:
+        int: The jobs claimed by the busy builders.
+    """
+    reserved_jobs = 0
+    for wfb in workerforbuilders:
+        if wfb.isBusy():
+            # This property (config-time) must exist at Builder level
+            reserved_jobs += wfb.builder.config.properties["jobs"]
+    return reserved_jobs
+
+
+def scan_reserved_memory(workerforbuilders: Iterable) -> int:
+    """
+    Computes the reserved memory (MiB) by summing the memory claim of every busy builder.
+    This is the fallback for workers that do not keep a JobLedger.
+    """
+    reserved_memory = 0
+    for wfb in workerforbuilders:
+        if wfb.isBusy():
+            reserved_memory += wfb.builder.config.properties.get("memory", 0)
+    return reserved_memory
+
+
+def free_worker_memory(worker) -> Optional[int]:
+    """
+    Computes the memory (MiB) not claimed by the builds running on a worker.
+    Args:
+        worker: The Buildbot worker.
+    Returns:
+        int: The free memory, None if the worker does not declare a total_memory
+            property, in which case memory is not admitted.
+    """
+    if "total_memory" not in worker.properties:
+        return None
+    total_memory = worker.properties["total_memory"]
+    job_ledger = getattr(worker, "job_ledger", None)
+    if job_ledger is not None:
+        return job_ledger.free_memory(total_memory)
+    return total_memory - scan_reserved_memory(worker.workerforbuilders.values())
+
+
+def create_shared_ledger_tables(conn):
+    """Creates the shared ledger tables missing in the database, see the top of the file."""
+    with conn.begin():
+        SHARED_LEDGER_METADATA.create_all(bind=conn, checkfirst=True)
+
+
+def _release_claim(conn, host: str, master: str, worker: str, builder: str):
+    claims = HOST_JOB_CLAIMS_TABLE.c
+    condition = (
+        (claims.host == host)
+        & (claims.master == master)
+        & (claims.worker == worker)
+        & (claims.builder == builder)
+    )
+    row = conn.execute(HOST_JOB_CLAIMS_TABLE.select().where(condition)).fetchone()
+    if row is None:
+        return
+    conn.execute(HOST_JOB_CLAIMS_TABLE.delete().where(condition))
+    conn.execute(
+        HOST_JOBS_TABLE.update()
+        .where(HOST_JOBS_TABLE.c.host == host)
+        .values(reserved=HOST_JOBS_TABLE.c.reserved - row.jobs)
+    )
+
+
+def claim_host_jobs(
+    conn,
+    host: str,
+    master: str,
+    worker: str,
+    builder: str,
+    jobs: int,
+    total_jobs: Optional[int],
+) -> bool:
+    """
+    Atomically claims jobs on a physical host shared by several masters.
+    The reserved counter is only incremented if the result stays within total_jobs,
+    which a single conditional UPDATE guarantees even with concurrent masters.
+    A previous claim of the same (host, master, worker, builder) is stale, since a
+    builder runs at most one build per worker, and is replaced.
+    Args:
+        conn: A SQLAlchemy connection to the Buildbot database.
+        host (str): The physical host name.
+        master (str): The name of the claiming master.
+        worker (str): The name of the worker running the build.
+        builder (str): The name of the claiming builder.
+        jobs (int): The jobs claimed by the builder.
+        total_jobs (int): The total jobs available on the host. None records the
+            claim of a build already running, whatever the host has left.
+    Returns:
+        bool: True if the jobs were claimed, False if the host is full.
+    """
+    try:
+        with conn.begin():
+            conn.execute(HOST_JOBS_TABLE.insert().values(host=host, reserved=0))
+    except sa.exc.IntegrityError:
+        pass  # Another master already added the host
+
+    with conn.begin():
+        _release_claim(conn, host, master, worker, builder)
+        condition = HOST_JOBS_TABLE.c.host == host
+        if total_jobs is not None:
+            condition &= HOST_JOBS_TABLE.c.reserved + jobs <= total_jobs
+        result = conn.execute(
+            HOST_JOBS_TABLE.update()
+            .where(condition)
+            .values(reserved=HOST_JOBS_TABLE.c.reserved + jobs)
+        )
+        if result.rowcount != 1:
+            return False
+        conn.execute(
+            HOST_JOB_CLAIMS_TABLE.insert().values(
+                host=host, master=master, worker=worker, builder=builder, jobs=jobs
+            )
+        )
+    return True
+
+
+def release_host_jobs(conn, host: str, master: str, worker: str, builder: str):
+    with conn.begin():
+        _release_claim(conn, host, master, worker, builder)
+
+
+def _release_claims(conn, condition):
+    rows = conn.execute(HOST_JOB_CLAIMS_TABLE.select().where(condition)).fetchall()
+    for row in rows:
+        _release_claim(conn, row.host, row.master, row.worker, row.builder)
+
+
+def release_worker_claims(conn, host: str, master: str, worker: str):
+    """Releases every claim of a worker, e.g. of the builds lost with it."""
+    claims = HOST_JOB_CLAIMS_TABLE.c
+    with conn.begin():
+        _release_claims(
+            conn,
+            (claims.host == host)
+            & (claims.master == master)
+            & (claims.worker == worker),
+        )
+
+
+def release_master_claims(conn, master: str):
+    """Releases every claim of a master, e.g. left over after a crash."""
+    with conn.begin():
+        _release_claims(conn, HOST_JOB_CLAIMS_TABLE.c.master == master)
+
+
+def host_job_claims(conn, host: str) -> dict:
+    """Returns the reserved jobs and the claims of all masters on a host."""
+    with conn.begin():
+        row = conn.execute(
+            HOST_JOBS_TABLE.select().where(HOST_JOBS_TABLE.c.host == host)
+        ).fetchone()
+        claims = conn.execute(
+            HOST_JOB_CLAIMS_TABLE.select().where(HOST_JOB_CLAIMS_TABLE.c.host == host)
+        ).fetchall()
+    return {
+        "reserved": row.reserved if row else 0,
+        "claims": {(c.master, c.worker, c.builder): c.jobs for c in claims},
+    }
+
+
+class SharedJobLedger:
+    """
+    Job ledger stored in the Buildbot database, for physical hosts that serve workers
+    of several masters (multiMaster). Every master claims the jobs of a build on the
+    host before starting it, which makes the host total_jobs a global cap.
+    The first call of a master releases the claims the master may have left behind
+    before a restart. The tables must exist, see create_shared_ledger_tables.
+    """
+
+    def __init__(self):
+        self._prepared = False
+        self._prepare_lock = defer.DeferredLock()
+
+    @defer.inlineCallbacks
+    def _prepare(self, master):
+        if self._prepared:
+            return
+        yield master.db.pool.do(release_master_claims, master.name)
+        self._prepared = True
+
+    @defer.inlineCallbacks
+    def claim(
+        self,
+        master,
+        host: str,
+        worker: str,
+        builder: str,
+        jobs: int,
+        total_jobs: Optional[int],
+    ):
+        yield self._prepare_lock.run(self._prepare, master)
+        claimed = yield master.db.pool.do(
+            claim_host_jobs, host, master.name, worker, builder, jobs, total_jobs
+        )
+        return claimed
+
+    @defer.inlineCallbacks
+    def release(self, master, host: str, worker: str, builder: str):
+        yield self._prepare_lock.run(self._prepare, master)
+        yield master.db.pool.do(release_host_jobs, host, master.name, worker, builder)
+
+    @defer.inlineCallbacks
+    def release_worker(self, master, host: str, worker: str):
+        yield self._prepare_lock.run(self._prepare, master)
+        yield master.db.pool.do(release_worker_claims, host, master.name, worker)
+
+    @defer.inlineCallbacks
+    def summary(self, master, host: str):
+        yield self._prepare_lock.run(self._prepare, master)
+        summary = yield master.db.pool.do(host_job_claims, host)
+        return summary
+
+
+SHARED_JOB_LEDGER = SharedJobLedger()
+
+
+if __name__ == "__main__":
+    # python -m configuration.workers.ledger <db_url>
+    engine = sa.create_engine(sys.argv[1])
+    with engine.connect() as conn:
+        create_shared_ledger_tables(conn)
+    engine.dispose()
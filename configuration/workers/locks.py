@@ -0,0 +1,175 @@
+import os
+from typing import Optional
+
+import yaml
+from twisted.internet import defer, task
+from twisted.python import log
+
+from buildbot import config
+from buildbot.plugins import util
+from buildbot.util import service
+
+WORKER_LOCKS_WATCHER_NAME = "worker_locks_watcher"
+# Seconds between two checks of the worker locks file
+WORKER_LOCKS_POLL_INTERVAL = 10
+
+
+class PrefixTrie:
+    """
+    Maps key prefixes to values. lookup() walks the trie along the searched string,
+    so its cost depends on the length of the string, not on the number of keys.
+    When several keys are prefixes of the string, the first inserted one wins, like
+    iterating the keys in order and returning the first `startswith` match.
+    """
+
+    _END = None  # Children are keyed by character, the terminal entry by None
+
+    def __init__(self):
+        self._root: dict = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def insert(self, key: str, value):
+        node = self._root
+        for char in key:
+            node = node.setdefault(char, {})
+        if self._END not in node:
+            node[self._END] = (self._size, value)
+            self._size += 1
+
+    def lookup(self, string: str):
+        node = self._root
+        best = node.get(self._END)
+        for char in string:
+            node = node.get(char)
+            if node is None:
+                break
+            entry = node.get(self._END)
+            if entry is not None and (best is None or entry[0] < best[0]):
+                best = entry
+        return best[1] if best is not None else None
+
+
+class WorkerLocks:
+    """
+    The per-host concurrent build limits of worker_locks.yaml.
+    Each worker base name gets a MasterLock, found by prefix match on the worker name.
+    check() applies the limits changed in the file to the running master without a
+    reconfig, by updating the real locks, which wakes up the waiting builds when a
+    limit is raised. WorkerLocksWatcher calls it periodically.
+    Attributes:
+        path (str): The path of worker_locks.yaml.
+        locks (dict[str, util.MasterLock]): The lock of each worker base name.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.locks: dict[str, util.MasterLock] = {}
+        self._trie = PrefixTrie()
+        self._mtime = None
+        self.load()
+
+    def load(self) -> dict[str, int]:
+        """
+        (Re)reads the worker locks file.
+        Returns:
+            dict[str, int]: The lock names whose maxCount changed, with the new maxCount.
+        """
+        self._mtime = os.stat(self.path).st_mtime
+        with open(self.path, encoding="utf-8") as file:
+            limits = yaml.safe_load(file) or {}
+
+        changed = {}
+        locks = {}
+        trie = PrefixTrie()
+        for worker_base_name, max_count in limits.items():
+            lock = self.locks.get(worker_base_name)
+            if lock is None:
+                lock = util.MasterLock(f"{worker_base_name}_lock", maxCount=max_count)
+            elif lock.maxCount != max_count:
+                # The same lock id is kept, so reconfigs keep the live value
+                lock.maxCount = max_count
+                changed[lock.name] = max_count
+            locks[worker_base_name] = lock
+            trie.insert(worker_base_name, lock)
+
+        # Updated in place, the dict may be referenced elsewhere (locks.LOCKS)
+        self.locks.clear()
+        self.locks.update(locks)
+        self._trie = trie
+        return changed
+
+    def lookup(self, worker_name: str) -> Optional[util.MasterLock]:
+        return self._trie.lookup(worker_name)
+
+    @defer.inlineCallbacks
+    def check(self, master):
+        """Reloads the file if it changed and applies the new limits to master."""
+        try:
+            if os.stat(self.path).st_mtime == self._mtime:
+                return
+            changed = self.load()
+        except Exception as e:
+            log.err(e, f"while reloading {self.path}, keeping the current limits")
+            return
+        for lock_name, max_count in changed.items():
+            try:
+                real_lock = yield util.MasterLock.lockClass.getService(
+                    master.botmaster, lock_name
+                )
+                real_lock.setMaxCount(max_count)
+            except Exception as e:
+                log.err(e, f"while setting {lock_name} maxCount to {max_count}")
+                continue
+            log.msg(f"{lock_name} maxCount set to {max_count}")
+
+
+class WorkerLocksWatcher(service.BuildbotService):
+    """
+    Polls the worker locks file while the master runs, see WorkerLocks.check().
+    Args:
+        worker_locks (WorkerLocks): The locks given to the builders of the master.
+        interval (int, optional): Seconds between two checks of the file.
+    """
+
+    name = WORKER_LOCKS_WATCHER_NAME
+
+    def __init__(self, *args, **kwargs):
+        self._loop: Optional[task.LoopingCall] = None
+        super().__init__(*args, **kwargs)
+
+    def checkConfig(
+        self, worker_locks: WorkerLocks, interval: int = WORKER_LOCKS_POLL_INTERVAL
+    ):
+        if interval <= 0:
+            config.error(
+                f"WorkerLocksWatcher: interval must be positive, not {interval}"
+            )
+
+    def reconfigService(
+        self, worker_locks: WorkerLocks, interval: int = WORKER_LOCKS_POLL_INTERVAL
+    ):
+        self.worker_locks = worker_locks
+        self.interval = interval
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        if self.running:
+            self._start_loop()
+
+    @defer.inlineCallbacks
+    def startService(self):
+        yield super().startService()
+        self._start_loop()
+
+    def stopService(self):
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        return super().stopService()
+
+    def _start_loop(self):
+        self._loop = task.LoopingCall(self.worker_locks.check, self.master)
+        self._loop.clock = self.master.reactor
+        d = self._loop.start(self.interval, now=False)
+        d.addErrback(log.err, "while watching the worker locks file")
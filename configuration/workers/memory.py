@@ -0,0 +1,50 @@
+import re
+from typing import Iterable, Optional, Union
+
+# Memory used by a build outside of /dev/shm (compiler, mariadbd, mtr), added to the
+# largest shm_size of the builder containers to get its memory claim
+DEFAULT_MEMORY_BASELINE = "4g"
+
+_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+_SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([bkmgt]?)b?\s*$", re.IGNORECASE)
+
+
+def parse_memory(size: Union[str, int]) -> int:
+    """
+    Converts a memory size to MiB.
+    Args:
+        size (Union[str, int]): Either an int, already in MiB, or a string in the format
+            of docker --shm-size, e.g. "15g", "512m", "1G". Without unit, bytes.
+    Returns:
+        int: The size in MiB, rounded up.
+    Raises:
+        ValueError: If the size cannot be parsed.
+    """
+    if isinstance(size, int):
+        return size
+    match = _SIZE_RE.match(size)
+    if not match:
+        raise ValueError(f"Invalid memory size: {size}")
+    value, unit = match.groups()
+    size_bytes = float(value) * _UNITS[unit.lower()]
+    return -int(-size_bytes // 1024**2)
+
+
+def memory_claim(
+    shm_sizes: Iterable[Optional[str]],
+    baseline: Union[str, int] = DEFAULT_MEMORY_BASELINE,
+) -> int:
+    """
+    Computes the memory a build claims on its worker, in MiB.
+    The containers of a build run one after the other, so only the largest /dev/shm counts.
+    Args:
+        shm_sizes (Iterable[Optional[str]]): The shm_size of each container step, or
+            the MiB of the containers a step runs at the same time.
+        baseline (Union[str, int]): Memory used outside of /dev/shm.
+    Returns:
+        int: The memory claim in MiB.
+    """
+    largest_shm = max(
+        (parse_memory(shm_size) for shm_size in shm_sizes if shm_size), default=0
+    )
+    return largest_shm + parse_memory(baseline)
@@ -0,0 +1,322 @@
+import random
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Optional
+
+from twisted.internet import defer, task
+from twisted.python import log
+
+from buildbot import config
+from buildbot.plugins import worker
+from buildbot.process import metrics
+from buildbot.process.properties import Properties
+from buildbot.util import service
+from buildbot.worker.latent import States
+from configuration.workers.base import worker_host
+
+WARM_POOL_NAME = "warm_pool"
+# Seconds between two passes refilling the pool and stopping surplus containers
+WARM_POOL_INTERVAL = 30
+# Request to first step delays kept per worker type
+WARM_POOL_DELAYS = 100
+
+STARTING_STATES = (States.SUBSTANTIATING, States.SUBSTANTIATING_STARTING)
+
+
+def _epoch(value) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+class WarmDockerLatentWorker(worker.DockerLatentWorker):
+    """
+    A Docker latent worker whose container can outlive its builds.
+    The worker never stops its container by itself (build_wait_timeout=-1). After
+    a build, the WarmPool of the master decides whether the container stays, warm
+    and connected, for the next build of its type or is stopped with
+    stop_container(). Without a pool the container is stopped after every build,
+    like with build_wait_timeout=0.
+    Attributes:
+        idle_since (float): When the last build finished, None while building or
+            stopped.
+    """
+
+    idle_since: Optional[float] = None
+
+    def checkConfig(self, name, password, *args, **kwargs):
+        kwargs["build_wait_timeout"] = -1
+        return super().checkConfig(name, password, *args, **kwargs)
+
+    def reconfigService(self, name, password, *args, **kwargs):
+        kwargs["build_wait_timeout"] = -1
+        return super().reconfigService(name, password, *args, **kwargs)
+
+    @property
+    def warm_pool(self) -> Optional["WarmPool"]:
+        if self.master is None:
+            return None
+        return self.master.namedServices.get(WARM_POOL_NAME)
+
+    def renderWorkerProps(self, build):
+        if build is None:
+            # Started by the pool ahead of any build, the worker properties are
+            # rendered the same way a build would
+            build = Properties()
+        return super().renderWorkerProps(build)
+
+    def substantiate(self, wfb, build):
+        pool = self.warm_pool
+        if build is not None and pool is not None:
+            pool.build_requested(self)
+        return super().substantiate(wfb, build)
+
+    def buildStarted(self, wfb):
+        super().buildStarted(wfb)
+        self.idle_since = None
+
+    def buildFinished(self, wfb):
+        super().buildFinished(wfb)
+        if self.building:
+            return
+        self.idle_since = self.master.reactor.seconds()
+        pool = self.warm_pool
+        if pool is None:
+            self.master.reactor.callLater(0, self.stop_container)
+        else:
+            pool.maintain()
+
+    def stop_container(self) -> defer.Deferred:
+        """
+        Disconnects the worker and stops its container. _soft_disconnect() only
+        disconnects a worker with a negative build_wait_timeout, unless the worker
+        service is stopping.
+        """
+        return self._soft_disconnect(stopping_service=True)
+
+    @property
+    def idle(self) -> bool:
+        return self.substantiated and not self.building
+
+
+class WarmPool(service.BuildbotService):
+    """
+    Keeps, per worker type, a number of WarmDockerLatentWorker containers started,
+    connected and idle, so that builds skip the container creation, image pull and
+    worker handshake. The pool starts containers ahead of builds, keeps them after
+    their builds and stops the idle ones beyond the wanted number.
+    When a build needs a new container on a host already running host_capacity
+    containers, the idle ones of that host are stopped, longest idle first, and no
+    container is started ahead of builds on a full host.
+    The time from build request to first step is recorded per worker type, as the
+    WarmPool.request_to_first_step.<worker type> metric and in delays, to tune the
+    sizes.
+    Args:
+        sizes (dict[str, int]): Idle containers wanted per worker type, the base
+            names createWorker returns.
+        workers (dict[str, list[str]]): Worker names per worker type.
+        host_capacity (dict[str, int], optional): Containers a host can run at
+            once, hosts not listed are not limited.
+        interval (int, optional): Seconds between two passes of the pool.
+    Attributes:
+        warm_starts (dict[str, int]): Builds that got an already started container.
+        cold_starts (dict[str, int]): Builds that had to start a container.
+        evictions (dict[str, int]): Idle containers stopped to make room on a host.
+        delays (dict[str, deque]): Latest request to first step delays, in seconds.
+    """
+
+    name = WARM_POOL_NAME
+
+    def __init__(self, *args, **kwargs):
+        self.warm_starts = defaultdict(int)
+        self.cold_starts = defaultdict(int)
+        self.evictions = defaultdict(int)
+        self.delays = defaultdict(lambda: deque(maxlen=WARM_POOL_DELAYS))
+        self._prestarting: set[str] = set()
+        self._loop = None
+        self._consumer = None
+        super().__init__(*args, **kwargs)
+
+    def checkConfig(
+        self,
+        sizes: dict[str, int],
+        workers: dict[str, list[str]],
+        host_capacity: dict[str, int] = None,
+        interval: int = WARM_POOL_INTERVAL,
+    ):
+        for worker_type, size in sizes.items():
+            if size < 0:
+                config.error(f"WarmPool: negative size {size} for {worker_type}")
+            if worker_type not in workers:
+                config.error(f"WarmPool: no workers of type {worker_type}")
+
+    def reconfigService(
+        self,
+        sizes: dict[str, int],
+        workers: dict[str, list[str]],
+        host_capacity: dict[str, int] = None,
+        interval: int = WARM_POOL_INTERVAL,
+    ):
+        self.sizes = dict(sizes)
+        self.worker_types = {
+            name: worker_type
+            for worker_type, names in workers.items()
+            for name in names
+        }
+        self.host_capacity = dict(host_capacity or {})
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        self.interval = interval
+        if self.running:
+            self._start_loop()
+
+    @defer.inlineCallbacks
+    def startService(self):
+        yield super().startService()
+        self._consumer = yield self.master.mq.startConsuming(
+            self._on_step_started, ("steps", None, "started")
+        )
+        self._start_loop()
+
+    def stopService(self):
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        if self._consumer is not None:
+            self._consumer.stopConsuming()
+            self._consumer = None
+        return super().stopService()
+
+    def _start_loop(self):
+        self._loop = task.LoopingCall(self.maintain)
+        self._loop.clock = self.master.reactor
+        self._loop.start(self.interval, now=True)
+
+    def _workers(self) -> dict[str, list]:
+        """The live pool workers, by worker type."""
+        live = self.master.workers.workers
+        by_type = defaultdict(list)
+        for name, worker_type in self.worker_types.items():
+            if isinstance(live.get(name), WarmDockerLatentWorker):
+                by_type[worker_type].append(live[name])
+        return by_type
+
+    def _running_on(self, host: str) -> list:
+        """The pool workers with a container started or starting on a host."""
+        return [
+            w
+            for workers in self._workers().values()
+            for w in workers
+            if worker_host(w.name) == host and w.state != States.NOT_SUBSTANTIATED
+        ]
+
+    def _has_room(self, host: str, running: int) -> bool:
+        return host not in self.host_capacity or running < self.host_capacity[host]
+
+    def maintain(self):
+        """Stops the surplus idle containers and starts the missing ones."""
+        try:
+            self._maintain()
+        except Exception as e:
+            log.err(e, "while maintaining the warm pool")
+
+    def _maintain(self):
+        for worker_type, workers in self._workers().items():
+            size = self.sizes.get(worker_type, 0)
+            idle = sorted(
+                (w for w in workers if w.idle), key=lambda w: w.idle_since or 0
+            )
+            # Longest idle first, the most recently used stay warm
+            for surplus in idle[: max(len(idle) - size, 0)]:
+                self._stop(surplus)
+            missing = (
+                size
+                - len(idle)
+                - len([w for w in workers if w.name in self._prestarting])
+            )
+            stopped = [w for w in workers if w.state == States.NOT_SUBSTANTIATED]
+            random.shuffle(stopped)
+            for candidate in stopped:
+                if missing <= 0:
+                    break
+                host = worker_host(candidate.name)
+                if self._has_room(host, len(self._running_on(host))):
+                    self._prestart(candidate)
+                    missing -= 1
+
+    def build_requested(self, worker: WarmDockerLatentWorker):
+        """
+        Called when a build wants a pool worker. A container not running yet
+        first gets room on its host.
+        """
+        worker_type = self.worker_types.get(worker.name)
+        if worker.substantiated or worker.name in self._prestarting:
+            self.warm_starts[worker_type] += 1
+            return
+        self.cold_starts[worker_type] += 1
+        if worker.state != States.NOT_SUBSTANTIATED:
+            return
+        host = worker_host(worker.name)
+        running = self._running_on(host)
+        idle = sorted((w for w in running if w.idle), key=lambda w: w.idle_since or 0)
+        while idle and not self._has_room(host, len(running)):
+            evicted = idle.pop(0)
+            running.remove(evicted)
+            self.evictions[self.worker_types[evicted.name]] += 1
+            self._stop(evicted)
+
+    def _prestart(self, worker: WarmDockerLatentWorker):
+        self._prestarting.add(worker.name)
+        d = worker.substantiate(None, None)
+
+        @d.addBoth
+        def started(result):
+            self._prestarting.discard(worker.name)
+            if worker.idle_since is None and worker.idle:
+                worker.idle_since = self.master.reactor.seconds()
+            return result
+
+        d.addErrback(log.err, f"while starting {worker.name} for the warm pool")
+
+    def _stop(self, worker: WarmDockerLatentWorker):
+        worker.idle_since = None
+        d = worker.stop_container()
+        d.addErrback(log.err, f"while stopping {worker.name} of the warm pool")
+
+    @defer.inlineCallbacks
+    def _on_step_started(self, key: tuple, step: dict):
+        if step.get("number") != 0:
+            return
+        try:
+            build = yield self.master.data.get(("builds", step["buildid"]))
+            buildrequest = yield self.master.data.get(
+                ("buildrequests", build["buildrequestid"])
+            )
+            worker_data = yield self.master.data.get(("workers", build["workerid"]))
+        except Exception as e:
+            log.err(e, "while measuring the request to first step delay")
+            return
+        worker_type = self.worker_types.get(worker_data["name"])
+        if worker_type is None:
+            return
+        delay = _epoch(step["started_at"]) - _epoch(buildrequest["submitted_at"])
+        self.delays[worker_type].append(delay)
+        metrics.MetricTimeEvent.log(
+            f"WarmPool.request_to_first_step.{worker_type}", delay
+        )
+
+
+def prefer_warm_workers(builder, workers: list, buildrequest):
+    """
+    nextWorker for the builders of pool workers: an idle started container first,
+    then one being started for the pool, then any.
+    """
+    if not workers:
+        return None
+    for wanted in (
+        lambda w: getattr(w.worker, "idle", False),
+        lambda w: getattr(w.worker, "state", None) in STARTING_STATES,
+    ):
+        candidates = [wfb for wfb in workers if wanted(wfb)]
+        if candidates:
+            return random.choice(candidates)
+    return random.choice(workers)
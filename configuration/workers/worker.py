@@ -1,7 +1,21 @@
 from collections import defaultdict
 
+from twisted.internet import defer
+from twisted.python import log
+
 from buildbot.plugins import worker
 from configuration.workers.base import WorkerBase
+from configuration.workers.ledger import SHARED_JOB_LEDGER, JobLedger
+from configuration.workers.memory import parse_memory
+from configuration.workers.warm_pool import WarmDockerLatentWorker
+
+# Seconds before a worker rejected by the shared ledger asks the botmaster again.
+# Builds finishing on other masters do not wake up this master's botmaster.
+SHARED_HOST_RETRY_DELAY = 60
+# Seconds a shared claim made by canStartBuild() waits for its build to start.
+# The botmaster may still lose the build request to another master, or not start
+# the build, after canStartBuild() accepted the worker.
+SHARED_CLAIM_START_TIMEOUT = 60
 
 
 class WorkerPool:
@@ -60,6 +74,206 @@ class WorkerPool:
             )
 
 
+class SharedHostMixin:
+    """
+    Claims the jobs of the builds of a worker running on a physical host shared with
+    workers of other masters in the SHARED_JOB_LEDGER (Buildbot database), which
+    makes the total_jobs property of the worker a cap across all masters.
+    canStartBuild() makes the claim with claim_shared_jobs(), it is released again
+    when the build does not start within SHARED_CLAIM_START_TIMEOUT, when it
+    finishes, and with every other claim of the worker when the worker is detached.
+    Attributes:
+        shared_host (str): The physical host name used in the shared ledger, None if
+            the host is not shared with other masters.
+    """
+
+    def __init__(self, *args, shared_host: str = None, **kwargs):
+        self.shared_host = shared_host
+        self._shared_host_retry = None
+        # Shared claims waiting for their build to start, by builder name
+        self._unstarted_claims = {}
+        # Claims and releases of this worker must reach the database in order
+        self._shared_host_lock = defer.DeferredLock()
+        super().__init__(*args, **kwargs)
+
+    def reconfigServiceWithSibling(self, sibling):
+        self.shared_host = sibling.shared_host
+        return super().reconfigServiceWithSibling(sibling)
+
+    def build_jobs(self, wfb) -> int:
+        """The jobs claimed by a build of the builder of wfb."""
+        # This property (config-time) must exist at Builder level
+        return wfb.builder.config.properties["jobs"]
+
+    def claim_shared_jobs(self, builder_name: str, jobs: int, total_jobs: int):
+        d = self._shared_host_lock.run(
+            SHARED_JOB_LEDGER.claim,
+            self.master,
+            self.shared_host,
+            self.name,
+            builder_name,
+            jobs,
+            total_jobs,
+        )
+
+        @d.addCallback
+        def retry_if_rejected(claimed):
+            if not claimed:
+                self._retry_shared_host_later()
+            else:
+                self._cancel_unstarted_claim(builder_name)
+                self._unstarted_claims[builder_name] = self.master.reactor.callLater(
+                    SHARED_CLAIM_START_TIMEOUT,
+                    self._release_unstarted_claim,
+                    builder_name,
+                )
+            return claimed
+
+        @d.addErrback
+        def let_build_start(failure):
+            # The local job ledger still applies, don't block builds on DB errors
+            log.err(failure, f"while claiming shared jobs on {self.shared_host}")
+            return True
+
+        return d
+
+    def _retry_shared_host_later(self):
+        if self._shared_host_retry and self._shared_host_retry.active():
+            return
+        self._shared_host_retry = self.master.reactor.callLater(
+            SHARED_HOST_RETRY_DELAY,
+            self.botmaster.maybeStartBuildsForWorker,
+            self.name,
+        )
+
+    def _cancel_unstarted_claim(self, builder_name: str) -> bool:
+        timeout = self._unstarted_claims.pop(builder_name, None)
+        if timeout is None or not timeout.active():
+            return False
+        timeout.cancel()
+        return True
+
+    def _release_unstarted_claim(self, builder_name: str):
+        del self._unstarted_claims[builder_name]
+        self._release_shared_jobs(builder_name)
+
+    def buildStarted(self, wfb):
+        super().buildStarted(wfb)
+        if self.shared_host and not self._cancel_unstarted_claim(wfb.builder_name):
+            # The claim timed out (or failed) but the build runs, record it again
+            # whatever the host has left so the other masters see it.
+            d = self._shared_host_lock.run(
+                SHARED_JOB_LEDGER.claim,
+                self.master,
+                self.shared_host,
+                self.name,
+                wfb.builder_name,
+                self.build_jobs(wfb),
+                None,
+            )
+            d.addErrback(log.err, f"while claiming shared jobs of {wfb.builder_name}")
+
+    def buildFinished(self, wfb):
+        self._release_shared_jobs(wfb.builder_name)
+        super().buildFinished(wfb)
+
+    @defer.inlineCallbacks
+    def detached(self):
+        # The builds are lost with the connection, and with them every claim of the
+        # worker, including those this master no longer knows about
+        for builder_name in list(self._unstarted_claims):
+            self._cancel_unstarted_claim(builder_name)
+        if self.shared_host:
+            d = self._shared_host_lock.run(
+                SHARED_JOB_LEDGER.release_worker,
+                self.master,
+                self.shared_host,
+                self.name,
+            )
+            d.addErrback(log.err, f"while releasing shared jobs of {self.name}")
+        yield super().detached()
+
+    def _release_shared_jobs(self, builder_name: str):
+        self._cancel_unstarted_claim(builder_name)
+        if not self.shared_host:
+            return
+        d = self._shared_host_lock.run(
+            SHARED_JOB_LEDGER.release,
+            self.master,
+            self.shared_host,
+            self.name,
+            builder_name,
+        )
+        d.addCallback(lambda _: self.botmaster.maybeStartBuildsForWorker(self.name))
+        d.addErrback(log.err, f"while releasing shared jobs of {builder_name}")
+
+
+class LedgerWorker(SharedHostMixin, worker.Worker):
+    """
+    A Buildbot worker that records the jobs claimed by each build in a JobLedger.
+    buildStarted() and buildFinished() are called synchronously by Buildbot when a
+    worker-for-builder becomes busy or available again, so the ledger always matches
+    what a scan over the busy builders would return. The builds lost with the
+    connection of the worker never reach buildFinished(), their claims are released
+    when the worker is detached.
+    When the worker runs on a physical host shared with workers of other masters,
+    the jobs are also claimed in the SHARED_JOB_LEDGER, see SharedHostMixin.
+    Attributes:
+        job_ledger (JobLedger): The jobs claimed by the builds running on this worker.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.job_ledger = JobLedger()
+        super().__init__(*args, **kwargs)
+
+    def buildStarted(self, wfb):
+        super().buildStarted(wfb)
+        properties = wfb.builder.config.properties
+        self.job_ledger.claim(
+            wfb.builder_name, properties["jobs"], properties.get("memory", 0)
+        )
+
+    def buildFinished(self, wfb):
+        self.job_ledger.release(wfb.builder_name)
+        super().buildFinished(wfb)
+
+    @defer.inlineCallbacks
+    def attached(self, conn):
+        # Nothing runs on a worker that just connected, claims of idle builders are stale
+        for builder_name in self.job_ledger.claims:
+            wfb = self.workerforbuilders.get(builder_name)
+            if wfb is None or not wfb.isBusy():
+                self.job_ledger.release(builder_name)
+                self._release_shared_jobs(builder_name)
+        yield super().attached(conn)
+
+    @defer.inlineCallbacks
+    def detached(self):
+        # The builds are lost with the connection. Their worker-for-builders are
+        # detached from the worker, buildFinished() is not called for them.
+        for builder_name in self.job_ledger.claims:
+            self.job_ledger.release(builder_name)
+        yield super().detached()
+
+
+class SharedHostDockerLatentWorker(SharedHostMixin, worker.DockerLatentWorker):
+    """
+    A Docker latent worker on a physical host shared with the workers of other
+    masters, see SharedHostMixin. It runs one build at a time, which claims the
+    jobs property of the worker.
+    """
+
+    def build_jobs(self, wfb) -> int:
+        return self.properties["jobs"]
+
+
+class SharedHostWarmDockerLatentWorker(SharedHostMixin, WarmDockerLatentWorker):
+    """A WarmDockerLatentWorker on a shared host, see SharedHostDockerLatentWorker."""
+
+    def build_jobs(self, wfb) -> int:
+        return self.properties["jobs"]
+
+
 class NonLatent(WorkerBase):
     """
     Represents a non-latent worker for the buildbot system.
@@ -72,12 +286,15 @@ class NonLatent(WorkerBase):
         config (dict[str, dict]): Configuration dictionary containing worker-specific settings.
         max_builds (int): Maximum number of builds the worker can handle concurrently.
         total_jobs (int): Total number of jobs assigned to the worker.
+        total_memory (int): Total memory of the worker in MiB, None if not declared.
 
     Args:
         name (str): The name of the worker.
         config (dict[str, dict]): Configuration dictionary containing worker-specific settings.
         total_jobs (int): Total number of jobs assigned to the worker.
         max_builds (int, optional): Maximum number of builds the worker can handle concurrently. Defaults to 999 because the builder-to-worker allocation is handled by canStartBuild() based on how many jobs a builder is requesting.
+        shared_host (str, optional): Physical host name, when the host also runs workers of other masters. total_jobs then becomes a cap across all masters.
+        total_memory (str, optional): Total memory of the worker, e.g. "256g". When set, canStartBuild() also admits builds on their memory claim.
     """
 
     def __init__(
@@ -88,24 +305,34 @@ class NonLatent(WorkerBase):
         arch: str,
         total_jobs: int,
         max_builds=999,
+        shared_host: str = None,
+        total_memory: str = None,
     ):
         self.instance = None
         self.requested_jobs = 0
         self.builders = {}
+        self.requested_memory = 0
+        self.builders_memory = {}
         self.config = config
         self.max_builds = max_builds
         self.total_jobs = total_jobs
-        super().__init__(
-            name, properties={"total_jobs": total_jobs}, os_type=os_type, arch=arch
+        self.shared_host = shared_host
+        self.total_memory = (
+            parse_memory(total_memory) if total_memory is not None else None
         )
+        properties = {"total_jobs": total_jobs}
+        if self.total_memory is not None:
+            properties["total_memory"] = self.total_memory
+        super().__init__(name, properties=properties, os_type=os_type, arch=arch)
         self.__define()
 
     def __define(self):
-        self.instance = worker.Worker(
+        self.instance = LedgerWorker(
             self.name,
             password=self._get_password(),
             max_builds=self.max_builds,
             properties=self.properties,
+            shared_host=self.shared_host,
         )
 
     def _get_password(self) -> str:
@@ -2,6 +2,14 @@ import os
 
 import yaml
 
+from configuration.builders.relations import (
+    BuilderMap,
+    builders_from_os_info,
+    first_match,
+    first_match_with_rhel_clones,
+    matches_with_rhel_clones,
+)
+
 DEVELOPMENT_BRANCH = "11.3"
 
 # Used to trigger the appropriate main branch
@@ -295,32 +303,17 @@ with open("/srv/buildbot/master/os_info.yaml") as f:
     OS_INFO = yaml.safe_load(f)
 
 # Generate install builders based on the os_info data
-BUILDERS_INSTALL = []
-BUILDERS_UPGRADE = []
-BUILDERS_AUTOBAKE = []
-ALL_PLATFORMS = set()
-for os_i in OS_INFO:
-    for arch in OS_INFO[os_i]["arch"]:
-        builder_name_autobake = (
-            arch + "-" + os_i + "-" + OS_INFO[os_i]["type"] + "-autobake"
-        )
-        if not ("install_only" in OS_INFO[os_i] and OS_INFO[os_i]["install_only"]):
-            ALL_PLATFORMS.add(arch)
-            BUILDERS_AUTOBAKE.append(builder_name_autobake)
-        # No VM install for opensuse16.0.0 yet
-        if os_i == "opensuse-1600":
-            continue
-        # Currently there are no VMs for x86 and s390x
-        if arch not in ["s390x", "x86"]:
-            BUILDERS_INSTALL.append(builder_name_autobake + "-install")
-            BUILDERS_UPGRADE.append(builder_name_autobake + "-minor-upgrade-all")
-            BUILDERS_UPGRADE.append(builder_name_autobake + "-major-upgrade")
-            BUILDERS_UPGRADE.append(builder_name_autobake + "-distro-upgrade")
-
-        if arch in ["amd64", "aarch64"]:
-            BUILDERS_UPGRADE.append(
-                builder_name_autobake + "-minor-upgrade-columnstore"
-            )
+BUILDERS_AUTOBAKE, BUILDERS_INSTALL, BUILDERS_UPGRADE, ALL_PLATFORMS = (
+    builders_from_os_info(OS_INFO)
+)
 BUILDERS_GALERA = list(
     map(lambda x: "gal-" + "-".join(x.split("-")[:3]), BUILDERS_AUTOBAKE)
 )
+
+# Parent builder name -> triggered builders, precomputed once for the scheduler
+# renderers and the has*() doStepIf callables
+AUTOBAKE_TRIGGERS = BuilderMap(BUILDERS_AUTOBAKE, expand=first_match)
+INSTALL_TRIGGERS = BuilderMap(BUILDERS_INSTALL, expand=first_match_with_rhel_clones)
+UPGRADE_TRIGGERS = BuilderMap(BUILDERS_UPGRADE, expand=matches_with_rhel_clones)
+ECO_TRIGGERS = BuilderMap(BUILDERS_ECO)
+GALERA_MTR_BUILDERS = BuilderMap(BUILDERS_GALERA_MTR)
@@ -51,6 +51,10 @@ for arch in platforms:
             "workers": master_variables["workers"][arch],
             "log_name": f"master-docker-{arch}-{master_id}.log",
         }
+        if arch in master_variables.get("warm_pool", {}):
+            master_config["warm_pool"] = master_variables["warm_pool"][arch]
+        if arch in master_variables.get("shared_hosts", {}):
+            master_config["shared_hosts"] = master_variables["shared_hosts"][arch]
 
         with open(f"{dir_path}/master-config.yaml", mode="w", encoding="utf-8") as file:
             yaml.dump(master_config, file)
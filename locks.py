@@ -1,25 +1,26 @@
 import os
 
-import yaml
-
 from buildbot.plugins import util
 
 # Local
+from configuration.workers.locks import WorkerLocks, WorkerLocksWatcher
 from constants import BUILDERS_INSTALL, BUILDERS_UPGRADE, GITHUB_STATUS_BUILDERS
 
-LOCKS: dict[str, util.MasterLock] = {}
 # worker_locks.yaml currently is in the same folder as locks.py.
 # TODO: re-evaluate if this is the right place after multi-master
 # is refactored to use a single base master.cfg.
-with open(
-    os.path.join(os.path.dirname(os.path.realpath(__file__)), "worker_locks.yaml"),
-    encoding="utf-8",
-) as file:
-    locks = yaml.safe_load(file)
-    for worker_base_name in locks:
-        LOCKS[worker_base_name] = util.MasterLock(
-            f"{worker_base_name}_lock", maxCount=locks[worker_base_name]
-        )
+WORKER_LOCKS = WorkerLocks(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "worker_locks.yaml")
+)
+LOCKS: dict[str, util.MasterLock] = WORKER_LOCKS.locks
+
+
+def workerLocksWatcher() -> WorkerLocksWatcher:
+    """
+    Returns the service applying the limits changed in worker_locks.yaml to the
+    running master, for the c["services"] of the masters using getLocks.
+    """
+    return WorkerLocksWatcher(WORKER_LOCKS)
 
 
 @util.renderer
@@ -36,7 +37,7 @@ def getLocks(props):
     ):
         return []
 
-    for worker_base_name in LOCKS:
-        if worker_name.startswith(worker_base_name):
-            return [LOCKS[worker_base_name].access("counting")]
+    lock = WORKER_LOCKS.lookup(worker_name)
+    if lock is not None:
+        return [lock.access("counting")]
     return []
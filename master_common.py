@@ -2,8 +2,12 @@ import os
 import sys
 
 from buildbot.plugins import reporters, secrets, util
+from configuration.builders.history import BuildDurationHistory
+from configuration.reporters.step_metrics import StepMetrics
+from configuration.steps.commands.base import COMMAND_CACHE
 from constants import GITHUB_STATUS_BUILDERS
 from schedulers_definition import SCHEDULERS
+from zabbix_client import ACCEPT_NEW_BUILD_METRIC, ZabbixClient, ZabbixMetricCache
 
 IS_CHECKCONFIG = any("checkconfig" in arg for arg in sys.argv)
 
@@ -16,12 +20,42 @@ def base_master_config(
     secrets_provider_file=os.environ["MASTER_CREDENTIALS_DIR"],
     master_port=os.environ["PORT"],
     mq_router_url=os.environ["MQ_ROUTER_URL"],
+    step_metrics_port=os.environ.get("STEP_METRICS_PORT"),
 ):
+    # Scripts and interpolations are cached for the builders of this (re)config
+    COMMAND_CACHE.clear()
+
     # TODO(cvicentiu) either move this to environ or all other params to config
     # file.
     github_access_token = config["private"]["gh_mdbci"]["access_token"]
     db_url = config["private"]["db_url"]
 
+    services = [
+        reporters.GitHubStatusPush(
+            token=github_access_token,
+            context=util.Interpolate("buildbot/%(prop:buildername)s"),
+            startDescription="Build started.",
+            endDescription="Build done.",
+            verbose=True,
+            builders=GITHUB_STATUS_BUILDERS,
+        ),
+        # Median build durations, for nextBuildShortestJob and prioritizeBuilders
+        BuildDurationHistory(),
+    ]
+    # Per-step durations, container CPU and peak memory, and ccache statistics on
+    # http://<master>:<port>/metrics
+    if step_metrics_port:
+        services.append(StepMetrics(port=int(step_metrics_port)))
+    # Load of the s390x hosts, polled while the master runs, for canStartBuild
+    zabbix_server = config["private"].get("zabbix_server")
+    zabbix_token = config["private"].get("zabbix_token")
+    if zabbix_server and zabbix_token:
+        services.append(
+            ZabbixMetricCache(
+                ZabbixClient(zabbix_server, zabbix_token), ACCEPT_NEW_BUILD_METRIC
+            )
+        )
+
     return {
         #######
         # PROJECT IDENTITY
@@ -40,16 +74,7 @@ def base_master_config(
         # 'services' is a list of BuildbotService items like reporter targets.
         # The status of each build will be pushed to these targets.
         # buildbot/reporters/*.py has a variety to choose from, like IRC bots.
-        "services": [
-            reporters.GitHubStatusPush(
-                token=github_access_token,
-                context=util.Interpolate("buildbot/%(prop:buildername)s"),
-                startDescription="Build started.",
-                endDescription="Build done.",
-                verbose=True,
-                builders=GITHUB_STATUS_BUILDERS,
-            )
-        ],
+        "services": services,
         "secretsProviders": [secrets.SecretInAFile(dirname=secrets_provider_file)],
         # 'protocols' contains information about protocols which master will
         # use for communicating with workers. You must define at least 'port'
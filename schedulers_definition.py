@@ -1,14 +1,14 @@
 from buildbot.interfaces import IProperties
 from buildbot.plugins import schedulers, util
 from constants import (
-    BUILDERS_AUTOBAKE,
+    AUTOBAKE_TRIGGERS,
     BUILDERS_DOCKERLIBRARY,
-    BUILDERS_ECO,
-    BUILDERS_INSTALL,
-    BUILDERS_UPGRADE,
     BUILDERS_WORDPRESS,
+    ECO_TRIGGERS,
     GITHUB_STATUS_BUILDERS,
+    INSTALL_TRIGGERS,
     SUPPORTED_PLATFORMS,
+    UPGRADE_TRIGGERS,
 )
 
 
@@ -39,47 +39,22 @@ def protectedBranchBuilders(props: IProperties) -> list[str]:
 
 @util.renderer
 def autobakeBuilders(props: IProperties) -> list[str]:
-    builder_name = props.getProperty("parentbuildername")
-    for b in BUILDERS_AUTOBAKE:
-        if builder_name in b:
-            return [b]
-    return []
+    return AUTOBAKE_TRIGGERS.get(props.getProperty("parentbuildername"))
 
 
 @util.renderer
 def installBuilders(props: IProperties) -> list[str]:
-    builder_name = props.getProperty("parentbuildername")
-    for b in BUILDERS_INSTALL:
-        if builder_name in b:
-            builders = [b]
-            if "rhel" in builder_name:
-                builders.append(b.replace("rhel", "almalinux"))
-                builders.append(b.replace("rhel", "rockylinux"))
-            return builders
-    return []
+    return INSTALL_TRIGGERS.get(props.getProperty("parentbuildername"))
 
 
 @util.renderer
 def upgradeBuilders(props: IProperties) -> list[str]:
-    builder_name = props.getProperty("parentbuildername")
-    builders = []
-    for b in BUILDERS_UPGRADE:
-        if builder_name in b:
-            if "rhel" in builder_name:
-                builders.append(b.replace("rhel", "almalinux"))
-                builders.append(b.replace("rhel", "rockylinux"))
-            builders.append(b)
-    return builders
+    return UPGRADE_TRIGGERS.get(props.getProperty("parentbuildername"))
 
 
 @util.renderer
 def ecoBuilders(props: IProperties) -> list[str]:
-    builder_name = props.getProperty("parentbuildername")
-    builders = []
-    for b in BUILDERS_ECO:
-        if builder_name in b:
-            builders.append(b)
-    return builders
+    return ECO_TRIGGERS.get(props.getProperty("parentbuildername"))
 
 
 @util.renderer
@@ -1,37 +1,58 @@
 import fnmatch
 import os
 import re
-from datetime import datetime
-from typing import Any, Generator, Tuple
+from typing import Generator, Tuple
 
 import docker
-from pyzabbix import ZabbixAPI
-from twisted.internet import defer, threads
+from twisted.internet import defer
 from twisted.python import log
 
 from buildbot.buildrequest import BuildRequest
-from buildbot.data.resultspec import Filter
 from buildbot.interfaces import IProperties
-from buildbot.master import BuildMaster
 from buildbot.plugins import steps, util, worker
 from buildbot.process.builder import Builder
 from buildbot.process.buildstep import BuildStep
 from buildbot.process.results import FAILURE, SUCCESS
 from buildbot.process.workerforbuilder import AbstractWorkerForBuilder
 from buildbot.worker import AbstractWorker
+from configuration.builders.priority import (
+    BranchClassifier,
+    BuilderPrioritizer,
+    PriorityNextBuild,
+    glob_match_any,
+)
+from configuration.steps.buildrequest_index import (
+    REVISION_INDEX,
+    pending_buildrequest_sourcestamps,
+)
+from configuration.steps.commands.base import interpolate, read_script
+from configuration.workers.warm_pool import WarmDockerLatentWorker
+from configuration.workers.worker import (
+    SharedHostDockerLatentWorker,
+    SharedHostWarmDockerLatentWorker,
+)
 from constants import (
     ALL_BB_TEST_BRANCHES,
-    BUILDERS_AUTOBAKE,
-    BUILDERS_ECO,
-    BUILDERS_GALERA_MTR,
-    BUILDERS_INSTALL,
+    AUTOBAKE_TRIGGERS,
     BUILDERS_S3_MTR,
-    BUILDERS_UPGRADE,
     DEVELOPMENT_BRANCH,
+    ECO_TRIGGERS,
+    GALERA_MTR_BUILDERS,
+    GITHUB_STATUS_BUILDERS,
+    INSTALL_TRIGGERS,
     MTR_ENV,
     RELEASE_BRANCHES,
     SAVED_PACKAGE_BRANCHES,
     STAGING_PROT_TEST_BRANCHES,
+    UPGRADE_TRIGGERS,
+)
+from zabbix_client import (
+    ACCEPT_NEW_BUILD_METRIC,
+    ZabbixNoHostFound,
+    ZabbixNoItemFound,
+    ZabbixTooOldData,
+    ZabbixToManyItems,
+    metric_cache,
 )
 
 private_config = {"private": {}}
@@ -84,7 +105,14 @@ def createWorker(
         "/srv/buildbot/packages:/mnt/packages",
         MASTER_PACKAGES + "/:/packages",
     ],
+    warm: bool = False,
+    shared_host: str = None,
+    host_jobs: int = None,
 ) -> Tuple[str, str, worker.DockerLatentWorker]:
+    # warm workers keep their container between builds while the WarmPool
+    # of the master (configuration.workers.warm_pool) wants them
+    # shared_host workers claim their jobs on a physical host shared by several
+    # masters, host_jobs at most (configuration.workers.worker.SharedHostMixin)
     worker_name = f"{worker_name_prefix}{worker_id}-docker"
     name = f"{worker_name}-{worker_type}{worker_name_suffix}"
 
@@ -110,7 +138,20 @@ def createWorker(
     dockerfile_url = "docker pull " + dockerfile
     need_pull = True
 
-    worker_instance = worker.DockerLatentWorker(
+    worker_class = WarmDockerLatentWorker if warm else worker.DockerLatentWorker
+    properties = {
+        "jobs": jobs,
+        "save_packages": save_packages,
+        "dockerfile": dockerfile_url,
+    }
+    shared_host_kwargs = {}
+    if shared_host:
+        worker_class = (
+            SharedHostWarmDockerLatentWorker if warm else SharedHostDockerLatentWorker
+        )
+        properties["total_jobs"] = host_jobs
+        shared_host_kwargs["shared_host"] = shared_host
+    worker_instance = worker_class(
         name,
         None,
         docker_host=private_config["private"]["docker_workers"][worker_name],
@@ -131,11 +172,8 @@ def createWorker(
             ],
         },
         volumes=volumes,
-        properties={
-            "jobs": jobs,
-            "save_packages": save_packages,
-            "dockerfile": dockerfile_url,
-        },
+        properties=properties,
+        **shared_host_kwargs,
     )
     return (base_name, name, worker_instance)
 
@@ -170,7 +208,7 @@ def getSourceTarball() -> steps.ShellCommand:
         command=[
             "bash",
             "-ec",
-            util.Interpolate(read_template("get_tarball")),
+            interpolate(read_template("get_tarball")),
         ],
     )
 
@@ -186,7 +224,7 @@ def saveLogs() -> steps.ShellCommand:
         command=[
             "bash",
             "-ec",
-            util.Interpolate(read_template("save_logs")),
+            interpolate(read_template("save_logs")),
         ],
     )
 
@@ -266,7 +304,7 @@ EOF
 
 
 def fnmatch_any(branch: str, patterns: list[str]) -> bool:
-    return any(fnmatch.fnmatch(branch, pattern) for pattern in patterns)
+    return glob_match_any(branch, patterns)
 
 
 def upstream_branch_fn(branch):
@@ -278,19 +316,11 @@ def staging_branch_fn(branch: str) -> bool:
 
 
 # Priority filter based on saved package branches
-def nextBuild(builder: Builder, requests: list[BuildRequest]) -> BuildRequest:
-    def build_request_sort_key(request: BuildRequest):
-        branch = request.sources[""].branch
-        # Booleans are sorted False first.
-        # Priority is given to releaseBranches, savePackageBranches
-        # then it's first come, first serve.
-        return (
-            not fnmatch_any(branch, RELEASE_BRANCHES),
-            not fnmatch_any(branch, SAVED_PACKAGE_BRANCHES),
-            request.getSubmitTime(),
-        )
-
-    return min(requests, key=build_request_sort_key)
+# Booleans are sorted False first.
+# Priority is given to releaseBranches, savePackageBranches
+# then it's first come, first serve.
+BRANCH_PRIORITY = BranchClassifier(RELEASE_BRANCHES, SAVED_PACKAGE_BRANCHES)
+nextBuild = PriorityNextBuild(BRANCH_PRIORITY)
 
 
 @defer.inlineCallbacks
@@ -298,16 +328,40 @@ def canStartBuild(
     builder: Builder, wfb: AbstractWorkerForBuilder, request: BuildRequest
 ) -> Generator[defer.Deferred, None, bool]:
     worker: AbstractWorker = wfb.worker
-    if "s390x" not in worker.name:
-        return True
+    if "s390x" in worker.name:
+        accepted = yield zabbixAcceptsBuild(worker)
+        if not accepted:
+            return False
+
+    # Physical host shared with the other masters of the arch, its total_jobs is a
+    # global cap
+    if getattr(worker, "shared_host", None):
+        claimed = yield worker.claim_shared_jobs(
+            builder_name=builder.name,
+            jobs=worker.build_jobs(wfb),
+            total_jobs=worker.properties["total_jobs"],
+        )
+        return claimed
+
+    return True
 
+
+@defer.inlineCallbacks
+def zabbixAcceptsBuild(
+    worker: AbstractWorker,
+) -> Generator[defer.Deferred, None, bool]:
     worker_prefix = "-".join(worker.name.split("-")[0:2])
     worker_name = private_config["private"]["worker_name_mapping"][worker_prefix]
 
+    # Service of base_master_config, missing without zabbix_server/zabbix_token
+    cache = metric_cache(worker.master, ACCEPT_NEW_BUILD_METRIC)
+    if cache is None:
+        log.msg(f"Zabbix Error: No Zabbix configured to check {worker_name}")
+        return True
+
     try:
-        load = yield threads.deferToThread(
-            getMetric, worker_name, "BB_accept_new_build"
-        )
+        # Refreshed in the background, only the first check of a worker waits on Zabbix
+        load = yield cache.get(worker_name)
     except (ZabbixNoHostFound, ZabbixToManyItems, ZabbixNoItemFound) as e:
         log.err(e, f"Zabbix Error: Check configuration for {worker_name}")
         return True  # This is clearly a Zabbix misconfiguration, let the build start
@@ -460,27 +514,15 @@ def hasPackagesGenerated(step: BuildStep) -> bool:
 
 
 def hasInstall(step: BuildStep) -> bool:
-    builder_name = step.getProperty("buildername")
-    for b in BUILDERS_INSTALL:
-        if builder_name in b:
-            return True
-    return False
+    return INSTALL_TRIGGERS.has(step.getProperty("buildername"))
 
 
 def hasUpgrade(step: BuildStep) -> bool:
-    builder_name = step.getProperty("buildername")
-    for b in BUILDERS_UPGRADE:
-        if builder_name in b:
-            return True
-    return False
+    return UPGRADE_TRIGGERS.has(step.getProperty("buildername"))
 
 
 def hasEco(step: BuildStep) -> bool:
-    builder_name = step.getProperty("buildername")
-    for b in BUILDERS_ECO:
-        if builder_name in b:
-            return True
-    return False
+    return ECO_TRIGGERS.has(step.getProperty("buildername"))
 
 
 def hasCompat(step: BuildStep) -> bool:
@@ -541,19 +583,11 @@ def waitIfStaging(step: BuildStep) -> bool:
 
 
 def hasAutobake(step: BuildStep) -> bool:
-    builder_name = step.getProperty("buildername")
-    for b in BUILDERS_AUTOBAKE:
-        if builder_name in b:
-            return True
-    return False
+    return AUTOBAKE_TRIGGERS.has(step.getProperty("buildername"))
 
 
 def hasGalera(step: BuildStep) -> bool:
-    builder_name = step.getProperty("buildername")
-    for b in BUILDERS_GALERA_MTR:
-        if builder_name in b:
-            return True
-    return False
+    return GALERA_MTR_BUILDERS.has(step.getProperty("buildername"))
 
 
 def hasS3(props):
@@ -579,78 +613,14 @@ def getArch(props: IProperties) -> str:
 
 # Builder priority
 #
-# Prioritize builders. At this point, only the Windows builders need a higher
-# priority since the others run on dedicated machines.
-def prioritizeBuilders(
-    buildmaster: BuildMaster, builders: list[Builder]
-) -> list[Builder]:
-    """amd64-windows-* builders should have the highest priority since they are
-    used for protected branches"""
-    builderPriorities = {
-        "amd64-windows": 0,
-        "amd64-windows-packages": 1,
-    }
-    builders.sort(key=lambda b: builderPriorities.get(b.name, 2))
-    return builders
-
-
-class ZabbixTooOldData(Exception):
-    pass
-
-
-class ZabbixToManyItems(Exception):
-    pass
-
-
-class ZabbixNoItemFound(Exception):
-    pass
-
-
-class ZabbixNoHostFound(Exception):
-    pass
-
-
-# Zabbix helper
-def getMetric(hostname: str, metric: str) -> Any:
-    # set API
-    zapi = ZabbixAPI(private_config["private"]["zabbix_server"])
-    zapi.session.verify = True
-    zapi.timeout = 3
-
-    zapi.login(api_token=private_config["private"]["zabbix_token"])
-
-    host_id = None
-    for h in zapi.host.get(output="extend"):
-        if h["host"] == hostname:
-            host_id = h["hostid"]
-            break
-
-    if host_id is None:
-        raise ZabbixNoHostFound
-
-    hostitems = zapi.item.get(filter={"hostid": host_id, "name": metric})
-
-    if len(hostitems) > 1:
-        raise ZabbixToManyItems
-    if len(hostitems) == 0:
-        raise ZabbixNoItemFound
-
-    hostitem = hostitems[0]
-
-    last_value = hostitem["lastvalue"]
-    last_time = datetime.fromtimestamp(int(hostitem["lastclock"]))
-
-    elapsed_from_last = (datetime.now() - last_time).total_seconds()
-
-    if elapsed_from_last >= 80:
-        raise ZabbixTooOldData
-
-    return last_value
+# Prioritize builders. Builders with the oldest waiting requests and free workers
+# are visited first, those reporting status to GitHub (protected branches) get a
+# head start and those with long builds wait their median build duration longer.
+prioritizeBuilders = BuilderPrioritizer(GITHUB_STATUS_BUILDERS)
 
 
 def read_template(template_name: str) -> str:
-    with open(f"/srv/buildbot/master/script_templates/{template_name}.sh") as f:
-        return f.read()
+    return read_script(f"/srv/buildbot/master/script_templates/{template_name}.sh")
 
 
 def isJepsenBranch(step: BuildStep) -> bool:
@@ -794,22 +764,33 @@ class CancelDuplicateBuildRequests(BuildStep):
             lines.append(f"    [{i}] {self._fmt_ss(ss)}")
         lines.append("")
 
-        filters = [
-            Filter("complete", "eq", [False]),
-            Filter("builderid", "eq", [current_builderid]),
-        ]
-
-        buildrequests = yield self.master.data.get(
-            ("buildrequests",),
-            filters=filters,
-            fields=[
-                "buildrequestid",
-                "buildsetid",
-                "builderid",
-                "claimed",
-                "complete",
-            ],
+        # The pending buildrequests of the builder come with their sourcestamps, from the
+        # in-memory revision index, or from a single query until the index is seeded
+        yield REVISION_INDEX.watch(self.master)
+        if REVISION_INDEX.ready:
+            lookup = "revision index"
+            buildrequests = REVISION_INDEX.lookup(current_builderid, current_revisions)
+            pending_count = REVISION_INDEX.pending_count(current_builderid)
+            round_trips = 0
+        else:
+            lookup = "batched query"
+            buildrequests = yield self.master.db.pool.do(
+                pending_buildrequest_sourcestamps,
+                self.master.db.model,
+                current_builderid,
+            )
+            pending_count = len(buildrequests)
+            round_trips = 1
+
+        # One buildrequests get plus one buildsets get per other pending buildrequest
+        unbatched_round_trips = 1 + max(pending_count - 1, 0)
+        lines.append(
+            f"Lookup: {lookup}, data API round trips: {round_trips} "
+            f"(saved {unbatched_round_trips - round_trips} "
+            f"for {pending_count} pending buildrequests)"
         )
+        lines.append("")
+        self.setStatistic("round_trips_saved", unbatched_round_trips - round_trips)
 
         matches = []
         actions = []
@@ -822,8 +803,7 @@ class CancelDuplicateBuildRequests(BuildStep):
                 continue
 
             other_buildsetid = br["buildsetid"]
-            other_buildset = yield self.master.data.get(("buildsets", other_buildsetid))
-            other_sourcestamps = other_buildset.get("sourcestamps", [])
+            other_sourcestamps = br["sourcestamps"]
 
             matched_revision = None
             matched_branch = None
@@ -0,0 +1,249 @@
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Iterable, Optional, Union
+
+from pyzabbix import ZabbixAPI, ZabbixAPIException
+from twisted.internet import defer, task, threads
+from twisted.python import log
+
+from buildbot.util import service
+
+# Zabbix data older than this (seconds) is not trusted for build admission
+MAX_DATA_AGE = 80
+
+# Metric of the s390x hosts, a build starts only while it is at most 60
+ACCEPT_NEW_BUILD_METRIC = "BB_accept_new_build"
+
+
+class ZabbixTooOldData(Exception):
+    pass
+
+
+class ZabbixToManyItems(Exception):
+    pass
+
+
+class ZabbixNoItemFound(Exception):
+    pass
+
+
+class ZabbixNoHostFound(Exception):
+    pass
+
+
+class ZabbixClient:
+    """
+    Long-lived Zabbix API client.
+    The API session is logged in once and reused, and the hostname to hostid index is
+    kept in memory and only refreshed when an unknown hostname is requested.
+    The client is thread safe, calls are serialized on the underlying session.
+    Attributes:
+        server (str): The Zabbix server URL.
+        api_token (str): The Zabbix API token.
+        timeout (int): The HTTP timeout of each API call, in seconds.
+    """
+
+    def __init__(self, server: str, api_token: str, timeout: int = 3):
+        self.server = server
+        self.api_token = api_token
+        self.timeout = timeout
+        self._api: Optional[ZabbixAPI] = None
+        self._host_ids: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _connect(self) -> ZabbixAPI:
+        if self._api is None:
+            api = ZabbixAPI(self.server)
+            api.session.verify = True
+            api.timeout = self.timeout
+            api.login(api_token=self.api_token)
+            self._api = api
+        return self._api
+
+    def _call(self, request: Callable[[ZabbixAPI], Any]) -> Any:
+        try:
+            return request(self._connect())
+        except ZabbixAPIException:
+            # The session may have expired, retry once with a new one
+            self._api = None
+            return request(self._connect())
+
+    def _refresh_hosts(self):
+        hosts = self._call(lambda api: api.host.get(output=["hostid", "host"]))
+        self._host_ids = {h["host"]: h["hostid"] for h in hosts}
+
+    def _host_id(self, hostname: str) -> str:
+        if hostname not in self._host_ids:
+            self._refresh_hosts()
+        if hostname not in self._host_ids:
+            raise ZabbixNoHostFound(hostname)
+        return self._host_ids[hostname]
+
+    def get_items(
+        self, hostnames: Iterable[str], metric: str
+    ) -> dict[str, Union[dict, Exception]]:
+        """
+        Fetches a metric for several hosts with a single item.get call.
+        Args:
+            hostnames (Iterable[str]): The Zabbix host names.
+            metric (str): The Zabbix item name.
+        Returns:
+            dict: For each host name, the Zabbix item (lastvalue, lastclock) or the
+                exception describing why it could not be found.
+        """
+        with self._lock:
+            results = {}
+            hosts_by_id = {}
+            for hostname in hostnames:
+                try:
+                    hosts_by_id[self._host_id(hostname)] = hostname
+                except ZabbixNoHostFound as e:
+                    results[hostname] = e
+
+            if not hosts_by_id:
+                return results
+
+            items = self._call(
+                lambda api: api.item.get(
+                    hostids=list(hosts_by_id),
+                    filter={"name": metric},
+                    output=["hostid", "lastvalue", "lastclock"],
+                )
+            )
+
+        items_by_host = {hostname: [] for hostname in hosts_by_id.values()}
+        for item in items:
+            items_by_host[hosts_by_id[item["hostid"]]].append(item)
+
+        for hostname, host_items in items_by_host.items():
+            if len(host_items) > 1:
+                results[hostname] = ZabbixToManyItems(hostname)
+            elif len(host_items) == 0:
+                results[hostname] = ZabbixNoItemFound(hostname)
+            else:
+                results[hostname] = host_items[0]
+        return results
+
+    def get_metric(self, hostname: str, metric: str) -> Any:
+        return last_value(self.get_items([hostname], metric)[hostname])
+
+    def close(self):
+        """Closes the API session, the next call logs in again."""
+        with self._lock:
+            if self._api is not None:
+                self._api.session.close()
+                self._api = None
+
+
+def last_value(item: Union[dict, Exception]) -> Any:
+    """
+    Returns the last value of a Zabbix item, raising the lookup error if there is no
+    item, or ZabbixTooOldData if the value is older than MAX_DATA_AGE.
+    """
+    if isinstance(item, Exception):
+        raise item
+
+    last_time = datetime.fromtimestamp(int(item["lastclock"]))
+    elapsed_from_last = (datetime.now() - last_time).total_seconds()
+
+    if elapsed_from_last >= MAX_DATA_AGE:
+        raise ZabbixTooOldData
+
+    return item["lastvalue"]
+
+
+def metric_cache(master, metric: str) -> Optional["ZabbixMetricCache"]:
+    """Returns the ZabbixMetricCache service of a metric on a master, if any."""
+    return master.namedServices.get(f"zabbix_{metric}")
+
+
+class ZabbixMetricCache(service.BuildbotService):
+    """
+    In-memory TTL cache of one Zabbix metric for a set of hosts, a service of the
+    master named zabbix_<metric>, see metric_cache().
+    Hosts are registered on their first lookup. A background poller then refreshes
+    all of them with one API call every `interval` seconds while the service runs,
+    so lookups in the build start path only read memory. A host is fetched directly
+    only if it has no cached value yet or its value expired (e.g. the poller is
+    stuck). Stopping the service stops the poller and closes the API session.
+    Args:
+        client (ZabbixClient): The client used to fetch the metric.
+        metric (str): The Zabbix item name.
+        interval (int, optional): Seconds between two background refreshes.
+        ttl (int, optional): Seconds after which a cached value is fetched again on
+            lookup.
+    """
+
+    def __init__(self, client: ZabbixClient, metric: str, *args, **kwargs):
+        kwargs.setdefault("name", f"zabbix_{metric}")
+        self._hosts: set[str] = set()
+        self._entries: dict[str, tuple[float, Union[dict, Exception]]] = {}
+        self._poller: Optional[task.LoopingCall] = None
+        super().__init__(client, metric, *args, **kwargs)
+
+    def reconfigService(
+        self, client: ZabbixClient, metric: str, interval: int = 15, ttl: int = 60
+    ):
+        if getattr(self, "client", None) not in (None, client):
+            self.client.close()
+        self.client = client
+        self.metric = metric
+        self.interval = interval
+        self.ttl = ttl
+        if self._poller is not None and self._poller.running:
+            self._poller.stop()
+        if self.running:
+            self._start_poller()
+
+    @defer.inlineCallbacks
+    def startService(self):
+        yield super().startService()
+        self._start_poller()
+
+    def stopService(self):
+        if self._poller is not None and self._poller.running:
+            self._poller.stop()
+        self.client.close()
+        return super().stopService()
+
+    def fetch(self, hostnames: Iterable[str]):
+        """Fetches the metric for the given hosts and stores it. Blocking."""
+        results = self.client.get_items(hostnames, self.metric)
+        fetched_at = time.monotonic()
+        for hostname, result in results.items():
+            self._entries[hostname] = (fetched_at, result)
+
+    def cached(self, hostname: str) -> Optional[Union[dict, Exception]]:
+        """Returns the cached item of a host, None if missing or expired."""
+        entry = self._entries.get(hostname)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def _refresh(self):
+        if not self._hosts:
+            return None
+        d = threads.deferToThread(self.fetch, sorted(self._hosts))
+        d.addErrback(log.err, f"Zabbix Error: background refresh of {self.metric}")
+        return d
+
+    def _start_poller(self):
+        self._poller = task.LoopingCall(self._refresh)
+        self._poller.clock = self.master.reactor
+        d = self._poller.start(self.interval, now=False)
+        d.addErrback(log.err, f"Zabbix Error: poller of {self.metric}")
+
+    @defer.inlineCallbacks
+    def get(self, hostname: str):
+        """
+        Returns the last value of the metric for a host, raising the same exceptions
+        as last_value().
+        """
+        self._hosts.add(hostname)
+
+        item = self.cached(hostname)
+        if item is None:
+            yield threads.deferToThread(self.fetch, [hostname])
+            item = self._entries[hostname][1]
+        return last_value(item)